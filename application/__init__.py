@@ -1,4 +1,5 @@
 import os
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -6,27 +7,70 @@ from flask_admin import Admin
 from flask_security import Security, SQLAlchemyUserDatastore
 from flask_wtf.csrf import CSRFProtect
 from flask_mail import Mail
+from flask_session import Session
 from dotenv import load_dotenv
+from application.services.redis_store import RedisStore
+from application.services.permissions import PermissionCache
+from application.services.hashing import PasswordHasher
+from application.services.db_routing import RoutingSession, configure_engines
+from application.services.metrics import Metrics
+from application.services.health import HealthChecker
+from application.services.login_cache import LoginCache
+from application.services.sheet_index import SheetIndexCache
+from application.services.formulas import SheetCalculator
+from application.services.sheet_history import SheetHistory
+from application.services.collaboration import Collaboration
+from application.services.sheet_access import SheetAccess
+from application.services.jobs import Jobs
+from application.services.mail_outbox import MailOutbox, OutboxMailUtil
+from application.services.search import SearchIndex
+from application.services.rate_limit import RateLimiter
+from application.services.page_cache import PageCache
+from application.services.assets import AssetPipeline
 
 # 加载环境变量
 load_dotenv()
 
 # 初始化扩展
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 admin = Admin(name='Flask-CMS', template_mode='bootstrap4')
 mail = Mail()
 csrf = CSRFProtect()
 security = Security()
+redis_store = RedisStore()
+permission_cache = PermissionCache()
+password_hasher = PasswordHasher()
+metrics = Metrics()
+health = HealthChecker()
+server_session = Session()
+login_cache = LoginCache()
+sheet_indexes = SheetIndexCache()
+sheet_history = SheetHistory()
+sheet_calculator = SheetCalculator()
+collaboration = Collaboration()
+sheet_access = SheetAccess()
+jobs = Jobs()
+mail_outbox = MailOutbox()
+search = SearchIndex()
+rate_limiter = RateLimiter()
+page_cache = PageCache()
+assets = AssetPipeline()
 
 # 用户数据存储
 user_datastore = None
 
+def _env_int(name, default=None):
+    """读取整数环境变量，未设置时返回default"""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
 def init_db():
     """确保数据库表已创建"""
     try:
         # 检查数据库连接
-        db.engine.connect()
+        with db.engine.connect():
+            pass
         
         # 检查users表是否存在
         from sqlalchemy import inspect
@@ -53,6 +97,115 @@ def create_app(config=None, register_admin=True):
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_key'),
         SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL', 'sqlite:///app.db'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # 是否在create_app中检查/创建表结构（默认关闭，保持启动无副作用）
+        STARTUP_DB_CHECK=os.environ.get('STARTUP_DB_CHECK', 'false').lower() == 'true',
+        
+        # 数据库连接池（未设置的项使用SQLAlchemy默认值）
+        DB_POOL_SIZE=_env_int('DB_POOL_SIZE'),
+        DB_MAX_OVERFLOW=_env_int('DB_MAX_OVERFLOW'),
+        DB_POOL_TIMEOUT=_env_int('DB_POOL_TIMEOUT'),
+        DB_POOL_RECYCLE=_env_int('DB_POOL_RECYCLE'),
+        DB_POOL_PRE_PING=os.environ.get('DB_POOL_PRE_PING', 'false').lower() == 'true',
+        DB_STATEMENT_TIMEOUT_MS=_env_int('DB_STATEMENT_TIMEOUT_MS'),
+        
+        # 只读副本（逗号分隔的连接串），写入后在该秒数内读主库
+        DATABASE_REPLICA_URLS=[url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url],
+        DB_REPLICA_STICKY_SECONDS=_env_int('DB_REPLICA_STICKY_SECONDS', 5),
+        
+        # Redis配置（未设置时缓存退化为进程内实现）
+        REDIS_URL=os.environ.get('REDIS_URL'),
+        
+        # 服务端会话（仅在配置了REDIS_URL时启用，否则使用签名Cookie会话）
+        SESSION_KEY_PREFIX='session:',
+        SESSION_USE_SIGNER=True,
+        
+        # 登录用户缓存：Flask-Security按fs_uniquifier加载用户时先查缓存（需要REDIS_URL）
+        LOGIN_CACHE_TTL=int(os.environ.get('LOGIN_CACHE_TTL', 300)),
+        
+        # 权限缓存配置
+        PERMISSION_CACHE_SIZE=int(os.environ.get('PERMISSION_CACHE_SIZE', 4096)),
+        PERMISSION_CACHE_TTL=int(os.environ.get('PERMISSION_CACHE_TTL', 86400)),
+        
+        # 请求指标：Prometheus导出路径，超过该毫秒数的请求记录慢日志及耗时最长的SQL
+        METRICS_ENABLED=os.environ.get('METRICS_ENABLED', 'true').lower() == 'true',
+        METRICS_PATH=os.environ.get('METRICS_PATH', '/metrics'),
+        METRICS_SLOW_REQUEST_MS=int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500)),
+        METRICS_SLOW_QUERY_TOP=5,
+        METRICS_ALLOCATION_SAMPLE_RATE=float(os.environ.get('METRICS_ALLOCATION_SAMPLE_RATE', 0.01)),
+        
+        # 就绪检查：探测结果缓存秒数、单个探针超时秒数、连接池饱和阈值
+        HEALTH_CACHE_TTL=float(os.environ.get('HEALTH_CACHE_TTL', 2.0)),
+        HEALTH_PROBE_TIMEOUT=float(os.environ.get('HEALTH_PROBE_TIMEOUT', 1.0)),
+        HEALTH_POOL_SATURATION=0.9,
+        
+        # 用户列表分页配置
+        USER_LIST_PAGE_SIZE=50,
+        USER_LIST_MAX_PAGE_SIZE=500,
+        
+        # 批量导入用户配置（WORKERS为密码哈希进程数，0表示在当前进程计算）
+        USER_IMPORT_BATCH_SIZE=int(os.environ.get('USER_IMPORT_BATCH_SIZE', 500)),
+        USER_IMPORT_WORKERS=int(os.environ.get('USER_IMPORT_WORKERS', os.cpu_count() or 1)),
+        
+        # 合成数据（flask seed）：每批生成和写入的用户数、生成数据的进程数（0表示在当前进程生成）
+        SEED_BATCH_SIZE=int(os.environ.get('SEED_BATCH_SIZE', 5000)),
+        SEED_WORKERS=int(os.environ.get('SEED_WORKERS', os.cpu_count() or 1)),
+        
+        # 表格导入：每批写入的行数（对齐到块的行数），导入在后台任务（cpu队列）中执行
+        SHEET_IMPORT_BATCH_ROWS=int(os.environ.get('SHEET_IMPORT_BATCH_ROWS', 1024)),
+        # 范围读取：单次最多返回的单元格数，进程内缓存的列索引和查询视图条数
+        SHEET_RANGE_MAX_CELLS=int(os.environ.get('SHEET_RANGE_MAX_CELLS', 20000)),
+        SHEET_INDEX_CACHE_SIZE=int(os.environ.get('SHEET_INDEX_CACHE_SIZE', 32)),
+        # 进程内缓存的公式引擎（每个表格一个）数量
+        SHEET_FORMULA_CACHE_SIZE=int(os.environ.get('SHEET_FORMULA_CACHE_SIZE', 8)),
+        # 操作历史：每隔多少条操作保存一次快照，数据库中保留最近几个快照之后的操作，
+        # 更早的操作归档到该目录（默认instance/sheet-history）
+        SHEET_SNAPSHOT_INTERVAL=int(os.environ.get('SHEET_SNAPSHOT_INTERVAL', 10000)),
+        SHEET_HISTORY_HOT_SNAPSHOTS=int(os.environ.get('SHEET_HISTORY_HOT_SNAPSHOTS', 2)),
+        SHEET_HISTORY_ARCHIVE_DIR=os.environ.get('SHEET_HISTORY_ARCHIVE_DIR'),
+        # 表格访问控制：进程内缓存的访问决策条数和Redis中的保留秒数；读写所需的角色权限，
+        # 以及对全部表格具有所有者级别的权限
+        SHEET_ACCESS_CACHE_SIZE=int(os.environ.get('SHEET_ACCESS_CACHE_SIZE', 65536)),
+        SHEET_ACCESS_CACHE_TTL=int(os.environ.get('SHEET_ACCESS_CACHE_TTL', 86400)),
+        SHEET_ROLE_PERMISSIONS={'read': 'view_content', 'write': 'edit_content'},
+        SHEET_ADMIN_PERMISSION='manage_sheets',
+        # 协作编辑：缓冲编辑的写入间隔（0表示提交时立即写入）、单次提交的操作数上限、
+        # 单元格版本号在Redis中的保留秒数、每个推送连接的队列长度和心跳间隔
+        COLLAB_FLUSH_INTERVAL_MS=int(os.environ.get('COLLAB_FLUSH_INTERVAL_MS', 200)),
+        COLLAB_MAX_OPS=500,
+        COLLAB_VERSION_TTL=int(os.environ.get('COLLAB_VERSION_TTL', 86400)),
+        COLLAB_QUEUE_SIZE=1000,
+        COLLAB_HEARTBEAT_SECONDS=15,
+        
+        # 后台任务(Celery)：是否在提交任务的进程内同步执行（未设置时取决于是否配置了broker）；
+        # 瞬时故障的重试次数和指数退避的基数秒数
+        CELERY_BROKER_URL=os.environ.get('CELERY_BROKER_URL'),
+        CELERY_TASK_ALWAYS_EAGER=(os.environ['CELERY_TASK_ALWAYS_EAGER'].lower() == 'true'
+                                  if os.environ.get('CELERY_TASK_ALWAYS_EAGER') else None),
+        JOB_MAX_RETRIES=int(os.environ.get('JOB_MAX_RETRIES', 3)),
+        JOB_RETRY_BACKOFF=int(os.environ.get('JOB_RETRY_BACKOFF', 2)),
+        
+        # 页面和模板片段缓存（Flask-Caching，配置了REDIS_URL时存放在Redis中，否则只缓存匿名页面）：默认超时秒数、
+        # 并发未命中时等待持锁者渲染的秒数
+        CACHE_DEFAULT_TIMEOUT=int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300)),
+        CACHE_LOCK_WAIT=float(os.environ.get('CACHE_LOCK_WAIT', 2.0)),
+        
+        # 静态资源：flask assets-build 的输出目录（默认instance/assets），存在清单时启用指纹和预压缩
+        ASSETS_ENABLED=os.environ.get('ASSETS_ENABLED', 'true').lower() == 'true',
+        ASSETS_BUILD_DIR=os.environ.get('ASSETS_BUILD_DIR'),
+        
+        # 认证端点限流：{端点: {维度(ip/account/endpoint): (次数, 秒数)}}，只计POST请求；
+        # 本地计数每隔该毫秒数同步到Redis（0表示不自动同步）；
+        # 部署在反向代理之后时设置可信代理层数，按X-Forwarded-For识别客户端IP
+        RATE_LIMIT_ENABLED=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+        RATE_LIMITS={
+            'security.login': {'ip': (30, 60), 'account': (10, 300)},
+            'security.register': {'ip': (10, 3600)},
+            'security.forgot_password': {'ip': (10, 3600), 'account': (3, 3600)},
+            'security.reset_password': {'ip': (20, 3600)},
+            'security.change_password': {'ip': (20, 3600)},
+        },
+        RATE_LIMIT_SYNC_MS=int(os.environ.get('RATE_LIMIT_SYNC_MS', 100)),
+        RATE_LIMIT_TRUSTED_PROXIES=int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0)),
         
         # Flask-Security配置
         SECURITY_PASSWORD_SALT=os.environ.get('SECURITY_PASSWORD_SALT', 'secure_salt'),
@@ -67,6 +220,13 @@ def create_app(config=None, register_admin=True):
         SECURITY_SEND_PASSWORD_CHANGE_EMAIL=False,
         SECURITY_SEND_PASSWORD_RESET_NOTICE_EMAIL=False,
         
+        # 密码哈希服务：按目标耗时(毫秒)校准轮数，并在有界池(thread/process/none)中计算
+        PASSWORD_HASH_TARGET_MS=int(os.environ.get('PASSWORD_HASH_TARGET_MS', 0)) or None,
+        PASSWORD_HASH_POOL=os.environ.get('PASSWORD_HASH_POOL', 'thread'),
+        PASSWORD_HASH_POOL_SIZE=int(os.environ.get('PASSWORD_HASH_POOL_SIZE', 0)) or None,
+        # 固定轮数（由 flask calibrate-hash 得出），设置后启动时不再校准
+        PASSWORD_HASH_ROUNDS=int(os.environ.get('PASSWORD_HASH_ROUNDS', 0)) or None,
+        
         # 邮件配置
         MAIL_SERVER=os.environ.get('MAIL_SERVER', 'localhost'),
         MAIL_PORT=int(os.environ.get('MAIL_PORT', 25)),
@@ -75,6 +235,16 @@ def create_app(config=None, register_admin=True):
         MAIL_USERNAME=os.environ.get('MAIL_USERNAME'),
         MAIL_PASSWORD=os.environ.get('MAIL_PASSWORD'),
         MAIL_DEFAULT_SENDER=os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@flask-cms.com'),
+        MAIL_TIMEOUT=int(os.environ.get('MAIL_TIMEOUT', 30)),
+        # 发件箱：发送者（auto/celery/thread/none，auto在配置了Celery broker时用celery）、
+        # 每批（每个SMTP连接）发送的邮件数、每秒发送上限、最多尝试次数和重试退避基数秒数
+        MAIL_OUTBOX_SENDER=os.environ.get('MAIL_OUTBOX_SENDER', 'auto'),
+        MAIL_OUTBOX_BATCH_SIZE=int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', 100)),
+        MAIL_RATE_LIMIT=float(os.environ.get('MAIL_RATE_LIMIT', 10)),
+        MAIL_MAX_ATTEMPTS=int(os.environ.get('MAIL_MAX_ATTEMPTS', 5)),
+        MAIL_RETRY_BACKOFF=int(os.environ.get('MAIL_RETRY_BACKOFF', 30)),
+        MAIL_OUTBOX_POLL_SECONDS=int(os.environ.get('MAIL_OUTBOX_POLL_SECONDS', 30)),
+        MAIL_OUTBOX_LEASE_SECONDS=300,
         
         # 配置Flask-Migrate
         SQLALCHEMY_MIGRATE_REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations'),
@@ -86,18 +256,40 @@ def create_app(config=None, register_admin=True):
         app.config.from_object(config)
     
     # 初始化扩展
+    configure_engines(app)
     db.init_app(app)
-    migrate.init_app(app, db, directory=app.config.get('SQLALCHEMY_MIGRATE_REPO'), compare_type=True)
+    metrics.init_app(app, db)
+    migrate.init_app(app, db, directory=app.config.get('SQLALCHEMY_MIGRATE_REPO'), compare_type=True,
+                     include_object=search.include_object)
     mail.init_app(app)
     csrf.init_app(app)
     admin.init_app(app)
+    redis_store.init_app(app)
+    if app.extensions['redis'] is not None:
+        app.config.setdefault('SESSION_TYPE', 'redis')
+        app.config.setdefault('SESSION_REDIS', app.extensions['redis'])
+        server_session.init_app(app)
+    permission_cache.init_app(app, db, redis_store)
+    health.init_app(app, db, redis_store)
+    sheet_indexes.init_app(app, db)
+    sheet_history.init_app(app, db)
+    sheet_access.init_app(app, db, redis_store)
+    sheet_calculator.init_app(app, db, sheet_history)
+    collaboration.init_app(app, db, redis_store, sheet_calculator)
+    jobs.init_app(app, db)
+    mail_outbox.init_app(app, db, metrics)
+    search.init_app(app, db)
+    rate_limiter.init_app(app, redis_store, metrics)
+    page_cache.init_app(app, db)
     
-    # 初始化数据库
-    with app.app_context():
-        init_db()
+    # 启动时不访问数据库；表结构检查由 flask check-db 执行，或在gunicorn预加载时于master中执行一次
+    if app.config['STARTUP_DB_CHECK']:
+        with app.app_context():
+            init_db()
     
     # 初始化Flask-Security
     from application.models.user import User, Role, Permission
+    from application.models import sheet, job, mail as mail_models  # noqa: F401  注册表格、后台任务和发件箱的表
     from application.forms import ExtendedRegisterForm
     global user_datastore
     user_datastore = SQLAlchemyUserDatastore(db, User, Role)
@@ -115,9 +307,12 @@ def create_app(config=None, register_admin=True):
     user_registered.connect(user_registered_sighandler)
     
     security.init_app(app, user_datastore,
+                     mail_util_cls=OutboxMailUtil,
                      register_form=ExtendedRegisterForm,
                      confirm_register_form=ExtendedRegisterForm,
                      register_user_template='security/register_user.html')
+    password_hasher.init_app(app)
+    login_cache.init_app(app, db, redis_store, permission_cache)
     
     # 注册回调函数，在注册过程中保存username字段
     @security.context_processor
@@ -127,15 +322,22 @@ def create_app(config=None, register_admin=True):
     # 注册蓝图
     from application.controllers.main import main_bp
     from application.controllers.auth import auth_bp
+    from application.controllers.sheets import sheets_bp
+    from application.controllers.jobs import jobs_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
+    app.register_blueprint(sheets_bp)
+    app.register_blueprint(jobs_bp)
     
     # 注册管理后台视图
     if register_admin:
         from application.controllers.admin import register_admin_views
         register_admin_views()
     
+    # 静态资源指纹和预压缩（需在各蓝图注册之后，接管其静态视图）
+    assets.init_app(app)
+    
     # 注册错误处理器
     register_error_handlers(app)
     
@@ -163,6 +365,50 @@ def register_commands(app):
             db.create_all()
             print('数据库表结构初始化成功!')
     
+    @app.cli.command('check-db')
+    def check_db():
+        """检查数据库连接，未使用迁移且缺表时创建表结构"""
+        init_db()
+    
+    @app.cli.command('calibrate-hash')
+    @click.option('--target-ms', type=int, default=None, help='单次哈希目标耗时，默认取PASSWORD_HASH_TARGET_MS')
+    def calibrate_hash(target_ms):
+        """校准密码哈希轮数，输出可写入环境变量的PASSWORD_HASH_ROUNDS"""
+        from application.services.hashing import CALIBRATABLE_SCHEMES, calibrate_rounds
+        
+        scheme = app.config['SECURITY_PASSWORD_HASH']
+        target_ms = target_ms or app.config['PASSWORD_HASH_TARGET_MS'] or 100
+        if scheme not in CALIBRATABLE_SCHEMES:
+            print(f'{scheme} 不支持按耗时校准轮数')
+            return
+        print(f'PASSWORD_HASH_ROUNDS={calibrate_rounds(scheme, target_ms)}  # {scheme}, 目标{target_ms}ms')
+    
+    @app.cli.command('send-mail')
+    def send_mail_command():
+        """立即发送发件箱中到期的邮件"""
+        sent = mail_outbox.send_all()
+        depth = mail_outbox.depth()
+        print(f'处理{sent}封邮件，待发送{depth["pending"]}封，失败{depth["failed"]}封')
+    
+    @app.cli.command('search-index')
+    @click.option('--drop', is_flag=True, help='先删除已有的检索索引')
+    def search_index(drop):
+        """为声明了检索列的表创建检索索引并按现有数据重建"""
+        with db.engine.begin() as connection:
+            if drop:
+                search.drop_indexes(connection)
+            search.create_indexes(connection)
+        print(f'检索索引已重建: {", ".join(m.__table__.name for m in search.models())}')
+    
+    @app.cli.command('assets-build')
+    @click.option('--quality', type=click.IntRange(0, 11), default=11, help='brotli压缩级别')
+    @click.option('--endpoint', multiple=True, help='只构建这些静态端点（如static、admin.static），默认全部')
+    def assets_build(quality, endpoint):
+        """为静态资源加指纹并预压缩（gzip/brotli），重启后生效"""
+        count, size, compressed, gzipped = assets.build(app, quality=quality, endpoints=endpoint or None)
+        print(f'{count}个文件，{size / 1024:.0f}KB，预压缩后{compressed / 1024:.0f}KB'
+              f'（gzip {gzipped / 1024:.0f}KB） -> {app.config["ASSETS_BUILD_DIR"]}')
+    
     @app.cli.command('create-roles')
     def create_roles():
         """创建初始角色和权限"""
@@ -176,7 +422,8 @@ def register_commands(app):
             'delete_content': '删除内容',
             'approve_content': '审核内容',
             'manage_users': '管理用户',
-            'manage_roles': '管理角色'
+            'manage_roles': '管理角色',
+            'manage_sheets': '管理全部表格'
         }
         
         # 创建角色并分配权限
@@ -255,4 +502,49 @@ def register_commands(app):
         db.session.add(admin)
         db.session.commit()
         
-        print(f'管理员用户创建成功! 邮箱: {admin_email}, 密码: {admin_password}') 
\ No newline at end of file
+        print(f'管理员用户创建成功! 邮箱: {admin_email}, 密码: {admin_password}')
+
+    @app.cli.command('seed')
+    @click.option('--users', type=int, default=10000, help='生成的用户数')
+    @click.option('--roles', type=int, default=30, help='生成的角色数（按部门分viewer/editor/manager）')
+    @click.option('--permissions', type=int, default=60, help='生成的权限数（资源.操作）')
+    @click.option('--seed', 'seed_value', type=int, default=0, help='随机数种子，相同种子在空库上生成相同的数据')
+    @click.option('--batch-size', type=int, default=None, help='每批生成和写入的用户数')
+    @click.option('--workers', type=int, default=None, help='生成数据的进程数，0表示在当前进程生成')
+    @click.option('--password', default='password', help='所有生成用户的密码')
+    def seed_command(users, roles, permissions, seed_value, batch_size, workers, password):
+        """生成合成的用户、角色和权限数据，用于在本地复现生产规模"""
+        from application.services.seed import seed_data
+        
+        result = seed_data(users, roles, permissions, seed=seed_value, batch_size=batch_size,
+                           workers=workers, password=password)
+        print(f'生成{result.permissions}个权限、{result.roles}个角色、{result.users}个用户'
+              f'（{result.user_roles}条角色关联），耗时{result.elapsed:.1f}秒，'
+              f'{result.users_per_minute:.0f}用户/分钟')
+
+    @app.cli.command('import-users')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+                  help='输入格式，默认按扩展名判断')
+    @click.option('--batch-size', type=int, default=None, help='每批插入的行数')
+    @click.option('--workers', type=int, default=None, help='密码哈希进程数，0表示在当前进程计算')
+    @click.option('--default-role', default=None, help='记录未指定角色时分配的角色')
+    @click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False), default=None,
+                  help='被拒绝行的输出文件，默认为<输入文件>.rejects.<格式>')
+    def import_users_command(path, fmt, batch_size, workers, default_role, rejects_path):
+        """从CSV/JSONL文件批量导入用户"""
+        from application.services.user_import import detect_format, import_users
+        
+        fmt = fmt or detect_format(path)
+        rejects_path = rejects_path or f'{path}.rejects.{fmt}'
+        with open(path, 'rb') as stream, \
+                open(rejects_path, 'w', newline='', encoding='utf-8') as rejects:
+            result = import_users(stream, fmt, rejects, batch_size=batch_size,
+                                  workers=workers, default_role=default_role)
+        
+        if not result.rejected:
+            os.remove(rejects_path)
+        print(f'导入完成: 共{result.total}行, 成功{result.imported}行, 拒绝{result.rejected}行, '
+              f'耗时{result.elapsed:.2f}秒 ({result.rows_per_second:.0f} 行/秒)')
+        if result.rejected:
+            print(f'被拒绝的行已写入 {rejects_path}')
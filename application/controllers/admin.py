@@ -1,12 +1,24 @@
-from flask import redirect, url_for
+import os
+import time
+import uuid
+from flask import (redirect, url_for, flash, request, current_app, Response,
+                   stream_with_context, send_from_directory, abort)
 from flask_admin.contrib.sqla import ModelView
 from flask_admin import BaseView, expose
+from flask_admin.helpers import get_redirect_target
 from flask_security import current_user
-from application import db, admin
+from sqlalchemy.orm import joinedload
+from werkzeug.utils import secure_filename
+from application import db, admin, jobs, search
+from application.models.job import Job
 from application.models.user import User, Role, Permission
+from application.services.db_routing import replica_reads
+from application.services.search import searchable_columns
+from application.services.export import EXPORT_MIMETYPES, EXPORT_WRITERS
+from application.services.user_import import detect_format, import_users_job
 
-# 基础管理视图（需要认证）
-class AuthenticatedModelView(ModelView):
+# 管理后台访问控制（仅管理员）
+class AdminAccessMixin:
     def is_accessible(self):
         return (current_user.is_active and
                 current_user.is_authenticated and
@@ -15,12 +27,95 @@ class AuthenticatedModelView(ModelView):
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for('security.login', next=url_for(admin.endpoint, **kwargs)))
 
+# 基础管理视图（需要认证）
+class AuthenticatedModelView(AdminAccessMixin, ModelView):
+    can_export = True
+    export_types = ['csv', 'jsonl', 'xlsx']
+    # 流式导出时每批从游标读取的行数
+    export_batch_size = 1000
+    
+    def get_export_name(self, export_type='csv'):
+        """导出文件名使用端点名，避免中文视图名被secure_filename清空"""
+        return '%s_%s.%s' % (self.endpoint, time.strftime('%Y-%m-%d_%H-%M-%S'), export_type)
+    
+    def get_export_query(self):
+        """按当前列表页的筛选、搜索和排序构造不分页、不计数的导出查询
+
+        步骤与get_list相同，只是不构造计数查询也不分页。视图实例在所有请求间
+        共享，不能通过临时修改simple_list_pager等属性来跳过计数。
+        """
+        view_args = self._get_list_extra_args()
+        sort_column = self._get_column_by_idx(view_args.sort)
+        if sort_column is not None:
+            sort_column = sort_column[0]
+        
+        joins = {}
+        query = self.get_query()
+        if hasattr(query, '_join_entities'):
+            for entity in query._join_entities:
+                for table in entity.tables:
+                    joins[table] = None
+        if self._search_supported and view_args.search:
+            query, _, joins, _ = self._apply_search(query, None, joins, {}, view_args.search)
+        if view_args.filters and self._filters:
+            query, _, joins, _ = self._apply_filters(query, None, joins, {}, view_args.filters)
+        for path in self._auto_joins:
+            query = query.options(joinedload(path))
+        query, _ = self._apply_sorting(query, joins, sort_column, view_args.sort_desc)
+        return query
+    
+    def iter_export_rows(self, query):
+        """通过服务端游标分批读取并格式化导出行（走只读副本）"""
+        columns = [c[0] for c in self._export_columns]
+        with replica_reads():
+            for row in query.yield_per(self.export_batch_size):
+                yield [self.get_export_value(row, name) for name in columns]
+    
+    def _apply_search(self, query, count_query, joins, count_joins, search_text):
+        """模型声明了检索列时通过检索索引搜索，否则使用Flask-Admin的逐列ILIKE"""
+        if not searchable_columns(self.model):
+            return super()._apply_search(query, count_query, joins, count_joins, search_text)
+        query = search.filter(query, self.model, search_text)
+        if count_query is not None:
+            count_query = search.filter(count_query, self.model, search_text)
+        return query, count_query, joins, count_joins
+    
+    @expose('/')
+    def index_view(self):
+        """列表页的查询和计数走只读副本
+
+        列表模板总会生成CSRF令牌（删除按钮的表单），整页不可缓存。
+        """
+        with replica_reads():
+            return super().index_view()
+    
+    @expose('/export/<export_type>/')
+    def export(self, export_type):
+        """流式导出：内存占用与导出行数无关"""
+        return_url = get_redirect_target() or self.get_url('.index_view')
+        
+        if not self.can_export or export_type not in self.export_types:
+            flash('没有导出权限或不支持的导出格式', 'error')
+            return redirect(return_url)
+        
+        headers = [str(c[1]) for c in self._export_columns]
+        rows = self.iter_export_rows(self.get_export_query())
+        filename = secure_filename(self.get_export_name(export_type))
+        
+        return Response(
+            stream_with_context(EXPORT_WRITERS[export_type](headers, rows)),
+            headers={'Content-Disposition': 'attachment;filename=%s' % filename},
+            mimetype=EXPORT_MIMETYPES[export_type]
+        )
+
 # 用户管理视图
 class UserModelView(AuthenticatedModelView):
     can_create = True
     can_edit = True
     can_delete = True
     column_exclude_list = ['password']
+    # column_exclude_list只作用于列表页；导出不包含密码哈希、会话标识和登录IP
+    column_export_exclude_list = ['password', 'fs_uniquifier', 'last_login_ip', 'current_login_ip']
     column_searchable_list = ['username', 'email']
     column_filters = ['active', 'created_at', 'roles']
     form_excluded_columns = ['password', 'fs_uniquifier', 'created_at', 'updated_at', 
@@ -46,6 +141,8 @@ class RoleModelView(AuthenticatedModelView):
     can_edit = True
     can_delete = True
     column_searchable_list = ['name', 'description']
+    # 角色成员在用户表单中维护；表单中列出全部用户在用户量大时无法使用
+    form_excluded_columns = ['users']
     column_labels = {
         'name': '角色名称',
         'description': '描述',
@@ -65,9 +162,65 @@ class PermissionModelView(AuthenticatedModelView):
         'roles': '角色'
     }
 
+# 批量导入用户视图
+class UserImportView(AdminAccessMixin, BaseView):
+    @staticmethod
+    def _instance_dir(name):
+        path = os.path.join(current_app.instance_path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    @classmethod
+    def upload_dir(cls):
+        """上传文件的存放目录（含明文密码，从不对外提供下载）"""
+        return cls._instance_dir('uploads')
+    
+    @classmethod
+    def rejects_dir(cls):
+        """被拒绝行文件的存放目录"""
+        return cls._instance_dir('imports')
+    
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        """上传CSV/JSONL文件，在后台任务中批量导入用户，页面轮询任务结果"""
+        job = None
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('请选择要导入的文件', 'error')
+            else:
+                fmt = detect_format(upload.filename)
+                name = '%s-%s' % (time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+                path = os.path.join(self.upload_dir(), 'upload-%s.%s' % (name, fmt))
+                upload.save(path)
+                job = jobs.submit(import_users_job, path, fmt,
+                                  os.path.join(self.rejects_dir(), 'rejects-%s.%s' % (name, fmt)),
+                                  request.form.get('default_role') or None, user=current_user)
+                if job.status not in Job.FINISHED:
+                    return redirect(url_for('.index', job=job.id))
+        elif request.args.get('job'):
+            job = db.session.get(Job, request.args['job'])
+            if job is None or job.user_id != current_user.id:
+                abort(404)
+        roles = [name for (name,) in db.session.query(Role.name).order_by(Role.name)]
+        return self.render('admin/user_import.html', job=job, roles=roles,
+                           result=job.result if job is not None and job.status == Job.DONE else None)
+    
+    @expose('/rejects/<job_id>')
+    def rejects(self, job_id):
+        """下载当前管理员自己的导入任务的被拒绝行文件"""
+        job = db.session.get(Job, job_id)
+        if job is None or job.user_id != current_user.id or job.status != Job.DONE:
+            abort(404)
+        filename = (job.result or {}).get('rejects_path')
+        if not filename or filename != secure_filename(filename) or not filename.startswith('rejects-'):
+            abort(404)
+        return send_from_directory(self.rejects_dir(), filename, as_attachment=True)
+
 # 注册管理视图
 def register_admin_views():
     """注册管理后台视图"""
     admin.add_view(UserModelView(User, db.session, name='用户管理'))
     admin.add_view(RoleModelView(Role, db.session, name='角色管理'))
-    admin.add_view(PermissionModelView(Permission, db.session, name='权限管理')) 
\ No newline at end of file
+    admin.add_view(PermissionModelView(Permission, db.session, name='权限管理'))
+    admin.add_view(UserImportView(name='批量导入', endpoint='user_import')) 
\ No newline at end of file
@@ -1,6 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+import json
+from flask import (Blueprint, render_template, redirect, url_for, flash, request, current_app,
+                   abort, jsonify, Response, stream_with_context)
 from flask_security import login_required, current_user, roles_required
-from application import user_datastore, db
+from sqlalchemy.orm import load_only, selectinload
+from application import user_datastore, db, sheet_access, search, page_cache
+from application.services.db_routing import read_replica, replica_reads
+from application.services.pagination import encode_cursor, keyset_page, keyset_query
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -21,21 +26,112 @@ def permission_required(permission):
         return decorated_function
     return decorator
 
+def sheet_permission_required(level='read'):
+    """检查当前用户对URL中sheet_id表格的访问权限的装饰器
+
+    表格的所有权或授权（read/write/owner）与角色权限组合判断，见SheetAccess。
+    通过后把表格对象以sheet参数传给视图。没有任何访问权限时返回404，不暴露
+    表格是否存在；有访问权限但级别或角色不足时返回403。
+    """
+    from application.services.sheet_access import LEVELS
+    required = LEVELS[level]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return current_app.login_manager.unauthorized()
+
+            from application.models.sheet import Sheet
+            sheet = db.session.get(Sheet, kwargs.pop('sheet_id'))
+            allowed = sheet_access.allowed(current_user, sheet, required) if sheet is not None else None
+            if allowed is None:
+                abort(404)
+            if not allowed:
+                return jsonify({'error': '您没有权限执行此操作'}), 403
+            return f(*args, sheet=sheet, **kwargs)
+        return decorated_function
+    return decorator
+
 # 扩展Flask-Security视图
 @auth_bp.route('/profile')
 @login_required
+@page_cache.cached_page(per_user=True)
 def profile():
     """用户个人资料页面"""
     return render_template('auth/profile.html', user=current_user)
 
+def _user_list_query(q=None):
+    """用户列表查询：只加载模板用到的列，角色用selectinload一次性批量加载；
+    q按用户名、邮箱检索（走检索索引）
+    """
+    from application.models.user import User, Role
+    query = User.query.options(
+        load_only(User.id, User.username, User.email, User.active, User.created_at),
+        selectinload(User.roles).load_only(Role.name)
+    )
+    return search.filter(query, User, q)
+
+def _user_list_args():
+    """解析分页和检索参数，返回(游标, 每页条数, 检索词)"""
+    config = current_app.config
+    limit = request.args.get('limit', config['USER_LIST_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, config['USER_LIST_MAX_PAGE_SIZE']))
+    return request.args.get('after'), limit, request.args.get('q', '').strip()
+
 @auth_bp.route('/user_list')
 @login_required
 @roles_required('admin')  # 只允许管理员访问
+@read_replica
 def user_list():
-    """用户列表页面 - 仅管理员可访问"""
+    """用户列表页面 - 仅管理员可访问，按(created_at, id)键集分页"""
     from application.models.user import User
-    users = User.query.all()
-    return render_template('auth/user_list.html', users=users)
+    cursor, limit, q = _user_list_args()
+    try:
+        page = keyset_page(_user_list_query(q), [User.created_at, User.id], cursor, limit)
+    except ValueError:
+        abort(400)
+    return render_template('auth/user_list.html', users=page.items,
+                           next_cursor=page.next_cursor, limit=limit, cursor=cursor, q=q)
+
+@auth_bp.route('/user_list.json')
+@login_required
+@roles_required('admin')
+@read_replica
+def user_list_json():
+    """用户列表JSON接口 - 逐行流式输出，末尾附带下一页游标"""
+    from application.models.user import User
+    cursor, limit, q = _user_list_args()
+    columns = [User.created_at, User.id]
+    try:
+        query = keyset_query(_user_list_query(q), columns, cursor, limit)
+    except ValueError:
+        abort(400)
+
+    def generate():
+        # 生成器在视图返回后才执行，需重新进入副本读取范围
+        with replica_reads():
+            yield '{"users":['
+            last = None
+            next_cursor = None
+            for i, user in enumerate(query.yield_per(200)):
+                if i == limit:
+                    # 多取的一行只用于判断是否存在下一页
+                    next_cursor = encode_cursor([last.created_at, last.id])
+                    break
+                row = {
+                    'id': user.id,
+                    'username': user.username,
+                    'email': user.email,
+                    'active': user.active,
+                    'created_at': user.created_at.isoformat() if user.created_at else None,
+                    'roles': [role.name for role in user.roles]
+                }
+                yield (',' if last is not None else '') + json.dumps(row, ensure_ascii=False)
+                last = user
+            yield '],"next":' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 # 组合权限装饰器示例
 def admin_permission_required(f):
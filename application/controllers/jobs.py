@@ -0,0 +1,17 @@
+from flask import Blueprint, abort, jsonify
+from flask_security import login_required, current_user
+from application import db
+from application.models.job import Job
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+@jobs_bp.route('/<job_id>')
+@login_required
+def job_status(job_id):
+    """后台任务的状态、进度和结果，仅提交者可查看"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    response = jsonify(job.to_dict())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
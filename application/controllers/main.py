@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, jsonify
+from application import health, page_cache
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
+@page_cache.cached_page()
 def index():
     """首页路由"""
     return render_template('index.html', title='Flask-CMS')
@@ -13,4 +15,18 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'message': 'Flask-CMS is running'
-    }) 
\ No newline at end of file
+    })
+
+@main_bp.route('/api/health/live')
+def health_live():
+    """存活检查：进程能处理请求即可，不访问任何依赖"""
+    return jsonify({'status': 'ok'})
+
+@main_bp.route('/api/health/ready')
+def health_ready():
+    """就绪检查：并发探测数据库、连接池、Redis和邮件服务，关键依赖失败时返回503"""
+    result, cached = health.check()
+    status_code = 503 if result['status'] == 'fail' else 200
+    response = jsonify(dict(result, cached=cached))
+    response.headers['Cache-Control'] = 'no-store'
+    return response, status_code
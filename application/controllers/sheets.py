@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import uuid
+from flask import Blueprint, current_app, jsonify, request, abort, url_for
+from flask_security import login_required, current_user
+from werkzeug.utils import secure_filename
+from application import collaboration, db, jobs, sheet_access, sheet_history, sheet_indexes
+from application.controllers.auth import sheet_permission_required
+from application.models.job import Job
+from application.models.sheet import Sheet, SheetHistorySegment, SheetImport, SheetPermission, SheetSnapshot
+from application.models.user import User
+from application.services.sheet_access import READ, grant, revoke
+from application.services.sheet_import import detect_format, submit_import
+from application.services.sheet_index import column_label, format_range, parse_filter, parse_range, parse_sort
+from application.services.sheet_storage import SheetStorage
+
+sheets_bp = Blueprint('sheets', __name__, url_prefix='/api/sheets')
+
+def _upload_dir():
+    """上传文件在导入完成前的存放目录"""
+    path = os.path.join(current_app.instance_path, 'imports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _parse_op(op):
+    """解析协作编辑操作{"cell": "B7", "value": 值, "base": 基础版本}，返回(行, 列, 值, 基础版本)"""
+    row, col, row_stop, col_stop = parse_range(op['cell'])
+    if row_stop - row != 1 or col_stop - col != 1:
+        raise ValueError(f'操作只能针对单个单元格: {op["cell"]}')
+    value = op.get('value')
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        raise ValueError(f'不支持的单元格值: {op["cell"]}')
+    base = op.get('base', 0)
+    if not isinstance(base, int) or base < 0:
+        raise ValueError(f'无效的基础版本: {op["cell"]}')
+    return row, col, value, base
+
+@sheets_bp.route('/import', methods=['POST'])
+@login_required
+def import_sheet():
+    """上传CSV/XLSX文件创建表格，返回导入任务，进度通过import_status轮询
+
+    带Idempotency-Key请求头重复提交时返回第一次创建的导入任务。
+    """
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        key = f'sheet-import:{current_user.id}:{key[:200]}'
+        job = jobs.find(key)
+        if job is not None and job.status != Job.FAILED:
+            sheet_import = SheetImport.query.filter_by(job_id=job.id).first()
+            if sheet_import is not None:
+                return _import_response(sheet_import)
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': '请选择要导入的文件'}), 400
+    filename = secure_filename(upload.filename) or 'upload'
+    fmt = detect_format(upload.filename)
+    # 上传内容已由Werkzeug写入临时文件，这里按块复制到导入目录，不整体读入内存
+    path = os.path.join(_upload_dir(), f'sheet-{uuid.uuid4().hex}.{fmt}')
+    upload.save(path)
+
+    name = request.form.get('name') or os.path.splitext(upload.filename)[0] or filename
+    sheet = Sheet(name=name[:255], owner_id=current_user.id)
+    sheet_import = SheetImport(sheet=sheet, filename=upload.filename[:255], format=fmt,
+                               bytes_total=os.path.getsize(path), job_id=uuid.uuid4().hex)
+    db.session.add(sheet_import)
+    db.session.commit()
+
+    job = submit_import(sheet_import, path, user=current_user, key=key)
+    if job.id != sheet_import.job_id:
+        # 并发的同键请求已经提交了导入，丢弃本次创建的表格
+        db.session.delete(sheet)
+        db.session.commit()
+        os.remove(path)
+        sheet_import = SheetImport.query.filter_by(job_id=job.id).first_or_404()
+    return _import_response(sheet_import)
+
+def _import_response(sheet_import):
+    response = jsonify(sheet_import.to_dict())
+    response.headers['Location'] = url_for('sheets.import_status', import_id=sheet_import.id)
+    return response, 202
+
+@sheets_bp.route('/imports/<int:import_id>')
+@login_required
+def import_status(import_id):
+    """导入进度，可读取该表格的用户可查看"""
+    sheet_import = db.session.get(SheetImport, import_id)
+    if sheet_import is None or not sheet_access.allowed(current_user, sheet_import.sheet, READ):
+        abort(404)
+    response = jsonify(sheet_import.to_dict())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@sheets_bp.route('')
+@login_required
+def list_sheets():
+    """当前用户拥有或被授权的表格（一条查询），q按名称检索"""
+    rows = sheet_access.accessible_sheets(current_user, request.args.get('q', '').strip())
+    response = jsonify({'sheets': [{
+        'id': sheet.id,
+        'name': sheet.name,
+        'owner_id': sheet.owner_id,
+        'permission_type': permission_type,
+        'n_rows': sheet.n_rows,
+        'n_cols': sheet.n_cols,
+        'updated_at': sheet.updated_at.isoformat() if sheet.updated_at else None,
+    } for sheet, permission_type in rows]})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@sheets_bp.route('/<int:sheet_id>/permissions')
+@sheet_permission_required('owner')
+def list_permissions(sheet):
+    """表格的授权列表，仅所有者（或有管理全部表格权限的用户）可查看"""
+    permissions = SheetPermission.query.filter_by(sheet_id=sheet.id).order_by(SheetPermission.id).all()
+    return jsonify({'permissions': [permission.to_dict() for permission in permissions]})
+
+@sheets_bp.route('/<int:sheet_id>/permissions', methods=['POST'])
+@sheet_permission_required('owner')
+def grant_permission(sheet):
+    """授予或修改用户的权限，请求体为{"user_id" 或 "email", "permission_type": "read"/"write"}"""
+    payload = request.get_json(silent=True) or {}
+    if payload.get('user_id') is not None:
+        user = db.session.get(User, payload['user_id'])
+    else:
+        user = User.query.filter_by(email=payload.get('email')).first() if payload.get('email') else None
+    if user is None:
+        return jsonify({'error': '用户不存在'}), 400
+    if user.id == sheet.owner_id:
+        return jsonify({'error': '所有者无需授权'}), 400
+    try:
+        permission = grant(sheet, user, payload.get('permission_type', SheetPermission.READ), current_user)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(permission.to_dict())
+
+@sheets_bp.route('/<int:sheet_id>/permissions/<int:user_id>', methods=['DELETE'])
+@sheet_permission_required('owner')
+def revoke_permission(sheet, user_id):
+    """撤销用户的权限"""
+    if not revoke(sheet, user_id):
+        abort(404)
+    db.session.commit()
+    return '', 204
+
+@sheets_bp.route('/<int:sheet_id>/range')
+@sheet_permission_required('read')
+def read_range(sheet):
+    """按A1范围读取单元格（默认A1:Z200），供表格组件按视口分页加载
+
+    指定sort（如-B）或filter（可重复，如B>10、A=苹果、C~关键字）时，范围的行号
+    指筛选排序后视图中的位置，header行数之前的行不参与排序筛选；响应中的rows
+    为对应的表格行号（从1开始）。ETag由表格版本和查询参数构成，未变化时返回304，
+    不读取任何数据块。
+    """
+    query = hashlib.md5(request.query_string).hexdigest()[:16]
+    etag = f'{sheet.revision}-{query}'
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        row_start, col_start, row_stop, col_stop = parse_range(request.args.get('range', 'A1:Z200'))
+        sort = parse_sort(request.args['sort']) if request.args.get('sort') else None
+        filters = [parse_filter(f) for f in request.args.getlist('filter') if f]
+        header = max(0, request.args.get('header', 0, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    max_cells = current_app.config['SHEET_RANGE_MAX_CELLS']
+    if (row_stop - row_start) * (col_stop - col_start) > max_cells:
+        return jsonify({'error': f'单次最多读取{max_cells}个单元格'}), 400
+
+    storage = SheetStorage(sheet)
+    col_stop = min(col_stop, sheet.n_cols)
+    view = sheet_indexes.view(sheet, header, sort, filters)
+    rows = view[row_start:row_stop]
+    row_stop = row_start + len(rows)
+    if row_start >= row_stop or col_start >= col_stop:
+        values, address = [], None
+    elif isinstance(rows, range):
+        values = storage.read_range(rows.start, col_start, rows.stop, col_stop)
+        address = format_range(rows.start, col_start, rows.stop, col_stop)
+    else:
+        values = storage.read_rows(list(rows), col_start, col_stop)
+        address = format_range(row_start, col_start, row_stop, col_stop)
+
+    body = {
+        'sheet_id': sheet.id,
+        'version': sheet.version,
+        'range': address,
+        'values': values,
+        'total_rows': len(view),
+        'n_cols': sheet.n_cols,
+        'column_types': sheet.column_types,
+    }
+    if not isinstance(rows, range):
+        body['rows'] = [row + 1 for row in rows]
+    response = jsonify(body)
+    response.set_etag(etag)
+    # 允许浏览器缓存，但每次都带If-None-Match重新验证
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@sheets_bp.route('/<int:sheet_id>/history')
+@sheet_permission_required('read')
+def history_index(sheet):
+    """操作历史概况：当前序号、各快照的序号和已归档的日志段"""
+    snapshots = db.session.execute(
+        db.select(SheetSnapshot.seq, SheetSnapshot.created_at)
+        .where(SheetSnapshot.sheet_id == sheet.id).order_by(SheetSnapshot.seq)).all()
+    segments = db.session.execute(
+        db.select(SheetHistorySegment.seq_start, SheetHistorySegment.seq_stop, SheetHistorySegment.bytes)
+        .where(SheetHistorySegment.sheet_id == sheet.id).order_by(SheetHistorySegment.seq_start)).all()
+    response = jsonify({
+        'sheet_id': sheet.id,
+        'seq': sheet.history_seq,
+        'snapshots': [{'seq': seq, 'created_at': created_at.isoformat() if created_at else None}
+                      for seq, created_at in snapshots],
+        'archived': [{'seq_start': start, 'seq_stop': stop, 'bytes': size} for start, stop, size in segments],
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@sheets_bp.route('/<int:sheet_id>/history/<int:seq>')
+@sheet_permission_required('read')
+def read_history(sheet, seq):
+    """读取表格在历史序号seq（执行完第seq条操作后）时的A1范围，不支持排序和筛选
+
+    历史内容不会再变化，响应可由浏览器长期缓存。
+    """
+    try:
+        row_start, col_start, row_stop, col_stop = parse_range(request.args.get('range', 'A1:Z200'))
+        version = sheet_history.restore(sheet, seq)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    max_cells = current_app.config['SHEET_RANGE_MAX_CELLS']
+    if (row_stop - row_start) * (col_stop - col_start) > max_cells:
+        return jsonify({'error': f'单次最多读取{max_cells}个单元格'}), 400
+
+    row_stop, col_stop = min(row_stop, version.n_rows), min(col_stop, version.n_cols)
+    if row_start >= row_stop or col_start >= col_stop:
+        values, address = [], None
+    else:
+        values = version.read_range(row_start, col_start, row_stop, col_stop)
+        address = format_range(row_start, col_start, row_stop, col_stop)
+    response = jsonify({
+        'sheet_id': sheet.id,
+        'seq': seq,
+        'range': address,
+        'values': values,
+        'formulas': {f'{column_label(col)}{row + 1}': source for (row, col), source in version.formulas.items()
+                     if row_start <= row < row_stop and col_start <= col < col_stop},
+        'n_rows': version.n_rows,
+        'n_cols': version.n_cols,
+    })
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@sheets_bp.route('/<int:sheet_id>/ops', methods=['POST'])
+@sheet_permission_required('write')
+def submit_ops(sheet):
+    """提交协作编辑操作，请求体为{"client": 客户端id, "ops": [{"cell", "value", "base"}]}
+
+    base为客户端看到的单元格版本（未见过的单元格为0），与当前版本不一致的
+    操作被拒绝，响应中附带单元格的当前值和版本。被接受的操作立即广播给
+    表格的所有推送连接，稍后批量写入表格存储。
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        ops = [_parse_op(op) for op in payload.get('ops') or []]
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'error': str(e) or '无效的操作'}), 400
+    max_ops = current_app.config['COLLAB_MAX_OPS']
+    if not ops or len(ops) > max_ops:
+        return jsonify({'error': f'每次提交1到{max_ops}个操作'}), 400
+    origin = payload.get('client')
+    result = collaboration.submit(sheet, ops, origin=str(origin)[:64] if origin else None,
+                                  user_id=current_user.id)
+    return jsonify(result)
+
+@sheets_bp.route('/<int:sheet_id>/events')
+@sheet_permission_required('read')
+def sheet_events(sheet):
+    """表格的协作消息推送（Server-Sent Events）
+
+    每条消息的data为JSON：type为ops时是被接受的编辑（含单元格新版本），
+    为values时是公式重算的结果。连接建立时先推送hello（含表格版本），
+    客户端应以此为基准读取数据；收到resync表示消息积压被丢弃，需要重新读取。
+    """
+    subscription = collaboration.subscribe(sheet)
+    heartbeat = current_app.config['COLLAB_HEARTBEAT_SECONDS']
+    hello = json.dumps({'type': 'hello', 'sheet_id': sheet.id, 'version': sheet.version})
+
+    def stream():
+        try:
+            yield f'event: hello\ndata: {hello}\n\n'
+            while True:
+                message = subscription.get(heartbeat)
+                if subscription.overflowed:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                # 心跳注释保持连接，代理和浏览器不会因空闲断开
+                yield f'data: {message}\n\n' if message is not None else ': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    response = current_app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    # 禁止nginx缓冲推送流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -4,14 +4,19 @@ from flask_security.utils import hash_password, get_message
 from flask_security.forms import get_form_field_label
 from flask import current_app
 
+# 用户名规则，注册表单与批量导入共用
+USERNAME_MIN_LENGTH = 3
+USERNAME_MAX_LENGTH = 80
+USERNAME_PATTERN = '^[A-Za-z0-9_-]+$'
+
 class ExtendedRegisterForm(RegisterForm):
     """扩展Flask-Security注册表单，添加username字段"""
     username = StringField(
         '用户名', 
         validators=[
             DataRequired('用户名不能为空'),
-            Length(min=3, max=80, message='用户名长度必须在3-80个字符之间'),
-            Regexp('^[A-Za-z0-9_-]+$', message='用户名只能包含字母、数字、下划线和连字符')
+            Length(min=USERNAME_MIN_LENGTH, max=USERNAME_MAX_LENGTH, message='用户名长度必须在3-80个字符之间'),
+            Regexp(USERNAME_PATTERN, message='用户名只能包含字母、数字、下划线和连字符')
         ]
     )
     
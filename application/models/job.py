@@ -0,0 +1,64 @@
+from datetime import datetime
+from application import db
+
+class Job(db.Model):
+    """后台任务记录：状态、进度和结果，供前端轮询
+
+    id同时用作Celery任务id。idempotency_key唯一，重复提交同一键的任务
+    返回已有记录而不再次入队。
+    """
+    __tablename__ = 'jobs'
+
+    PENDING, RUNNING, RETRYING, DONE, FAILED = 'pending', 'running', 'retrying', 'done', 'failed'
+    FINISHED = (DONE, FAILED)
+
+    id = db.Column(db.String(32), primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    queue = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    idempotency_key = db.Column(db.String(255), unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), index=True)
+    # 进度：已完成/总量（单位由任务决定，如字节、行数）
+    progress_done = db.Column(db.BigInteger, nullable=False, default=0)
+    progress_total = db.Column(db.BigInteger, nullable=False, default=0)
+    message = db.Column(db.String(255))
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    user = db.relationship('User')
+
+    def set_progress(self, done, total=None, message=None):
+        """更新进度（不提交事务，随任务的批量写入一起提交）"""
+        self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+        if message is not None:
+            self.message = message[:255]
+
+    @property
+    def progress(self):
+        if self.status == self.DONE:
+            return 1.0
+        return min(1.0, self.progress_done / self.progress_total) if self.progress_total else 0.0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'queue': self.queue,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
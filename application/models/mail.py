@@ -0,0 +1,43 @@
+from datetime import datetime
+from application import db
+
+class OutboxMessage(db.Model):
+    """发件箱中的邮件
+
+    与业务数据在同一事务中写入，提交后由后台发送者批量发送。发送者认领
+    一批邮件时把状态置为sending并记下认领标记，超过租期未完成的认领视为
+    发送者已退出，重新可被认领。
+    """
+    __tablename__ = 'mail_outbox'
+
+    PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    template = db.Column(db.String(100))
+    sender = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.JSON, nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # 认领到期邮件按(status, next_attempt_at)扫描
+        db.Index('ix_mail_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def to_message(self):
+        """转换为Flask-Mail的Message"""
+        from flask_mail import Message
+        return Message(self.subject, sender=self.sender, recipients=list(self.recipients),
+                       body=self.body, html=self.html)
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.status}>'
@@ -0,0 +1,229 @@
+from datetime import datetime
+from sqlalchemy import event
+from application import db
+
+# 分块尺寸：每块覆盖CHUNK_ROWS行 × CHUNK_COLS列
+CHUNK_ROWS = 256
+CHUNK_COLS = 16
+
+class Sheet(db.Model):
+    """表格模型
+
+    单元格不保存在本表中，而是按固定尺寸切分为SheetChunk，
+    编辑单元格只读写其所在的块。
+    """
+    __tablename__ = 'sheets'
+    # 检索列：表格名称按子串匹配
+    __searchable__ = ('name',)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 已写入数据的行列范围
+    n_rows = db.Column(db.Integer, nullable=False, default=0)
+    n_cols = db.Column(db.Integer, nullable=False, default=0)
+    # 创建时的分块尺寸，调整常量不影响已有表格
+    chunk_rows = db.Column(db.Integer, nullable=False, default=CHUNK_ROWS)
+    chunk_cols = db.Column(db.Integer, nullable=False, default=CHUNK_COLS)
+    # 每次写入递增，用于缓存校验
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # 各列推断出的类型（integer/number/bool/date/text），导入时写入
+    column_types = db.Column(db.JSON)
+    # 操作历史中最后一条操作的序号
+    history_seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+    owner = db.relationship('User', backref=db.backref('sheets', lazy='dynamic'))
+
+    @property
+    def key(self):
+        """标识表格本身（不含版本）的字符串
+
+        包含创建时间，避免删除后重用的id（SQLite）与旧表格的缓存混淆。
+        """
+        return f'{self.id}-{int(self.created_at.timestamp() * 1e6):x}'
+
+    @property
+    def revision(self):
+        """标识表格当前内容的字符串，用于缓存键和ETag"""
+        return f'{self.key}-{self.version}'
+
+    def __repr__(self):
+        return f'<Sheet {self.name}>'
+
+class SheetPermission(db.Model):
+    """表格的访问授权：授予用户对表格的读或写权限（所有者无需授权）"""
+    __tablename__ = 'sheet_permissions'
+
+    READ, WRITE = 'read', 'write'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    permission_type = db.Column(db.String(10), nullable=False, default=READ)
+    granted_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 按用户查询可访问的表格、检查单个授权都走该索引
+        db.UniqueConstraint('user_id', 'sheet_id', name='uq_sheet_permissions_user_sheet'),
+    )
+
+    sheet = db.relationship('Sheet')
+    user = db.relationship('User', foreign_keys=[user_id])
+
+    def to_dict(self):
+        return {
+            'sheet_id': self.sheet_id,
+            'user_id': self.user_id,
+            'permission_type': self.permission_type,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f'<SheetPermission {self.sheet_id}:{self.user_id} {self.permission_type}>'
+
+class SheetChunk(db.Model):
+    """表格数据块：以紧凑二进制保存的一块单元格（编码见services/sheet_storage.py）"""
+    __tablename__ = 'sheet_chunks'
+
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), primary_key=True)
+    row_block = db.Column(db.Integer, primary_key=True)
+    col_block = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<SheetChunk {self.sheet_id}:{self.row_block},{self.col_block}>'
+
+class SheetFormula(db.Model):
+    """单元格公式的源文本；计算结果作为普通值保存在数据块中"""
+    __tablename__ = 'sheet_formulas'
+
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), primary_key=True)
+    row = db.Column(db.Integer, primary_key=True)
+    col = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f'<SheetFormula {self.sheet_id}:{self.row},{self.col} {self.source}>'
+
+class SheetColumnIndex(db.Model):
+    """预计算的列排序索引（编码见services/sheet_index.py），version与表格不一致即失效"""
+    __tablename__ = 'sheet_column_indexes'
+
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), primary_key=True)
+    col = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<SheetColumnIndex {self.sheet_id}:{self.col}@{self.version}>'
+
+class SheetImport(db.Model):
+    """表格导入任务，记录状态和进度供前端轮询"""
+    __tablename__ = 'sheet_imports'
+
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    bytes_total = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_read = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_imported = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    # 执行导入的后台任务（jobs.id）
+    job_id = db.Column(db.String(32), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    sheet = db.relationship('Sheet')
+
+    @property
+    def progress(self):
+        if self.status == self.DONE:
+            return 1.0
+        return min(1.0, self.bytes_read / self.bytes_total) if self.bytes_total else 0.0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sheet_id': self.sheet_id,
+            'filename': self.filename,
+            'job_id': self.job_id,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'rows_imported': self.rows_imported,
+            'column_types': self.sheet.column_types,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return f'<SheetImport {self.id} {self.status}>'
+
+class SheetOperation(db.Model):
+    """单元格操作日志（只追加）：每条记录一个单元格在该序号处的新值
+
+    value为计算后的值（公式的结果、错误值的文本），formula为单元格此时的公式
+    源文本（非公式为空）。回放操作只需按序号覆盖单元格，不必重新计算公式。
+    """
+    __tablename__ = 'sheet_operations'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.BigInteger, nullable=False)
+    row = db.Column(db.Integer, nullable=False)
+    col = db.Column(db.Integer, nullable=False)
+    value = db.Column(db.JSON)
+    formula = db.Column(db.Text)
+    user_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('sheet_id', 'seq', name='uq_sheet_operations_sheet_seq'),)
+
+    def __repr__(self):
+        return f'<SheetOperation {self.sheet_id}#{self.seq} {self.row},{self.col}>'
+
+class SheetSnapshot(db.Model):
+    """表格在某个操作序号处的完整快照：各数据块的编码拼接，以及压缩的公式表"""
+    __tablename__ = 'sheet_snapshots'
+
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), primary_key=True)
+    seq = db.Column(db.BigInteger, primary_key=True)
+    n_rows = db.Column(db.Integer, nullable=False)
+    n_cols = db.Column(db.Integer, nullable=False)
+    chunks = db.Column(db.LargeBinary, nullable=False)
+    formulas = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SheetSnapshot {self.sheet_id}@{self.seq}>'
+
+class SheetHistorySegment(db.Model):
+    """已归档到压缩文件的操作日志段，覆盖序号 (seq_start, seq_stop]"""
+    __tablename__ = 'sheet_history_segments'
+
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id', ondelete='CASCADE'), primary_key=True)
+    seq_start = db.Column(db.BigInteger, primary_key=True)
+    seq_stop = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.String(512), nullable=False)
+    operations = db.Column(db.Integer, nullable=False)
+    bytes = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SheetHistorySegment {self.sheet_id} ({self.seq_start}, {self.seq_stop}]>'
+
+@event.listens_for(Sheet, 'before_delete')
+def _delete_chunks(mapper, connection, target):
+    """删除表格时一并删除数据块、公式、索引、导入记录、操作历史和授权（SQLite默认不执行外键级联），不把它们加载到会话"""
+    connection.execute(SheetChunk.__table__.delete().where(SheetChunk.sheet_id == target.id))
+    connection.execute(SheetFormula.__table__.delete().where(SheetFormula.sheet_id == target.id))
+    connection.execute(SheetColumnIndex.__table__.delete().where(SheetColumnIndex.sheet_id == target.id))
+    connection.execute(SheetImport.__table__.delete().where(SheetImport.sheet_id == target.id))
+    for model in (SheetOperation, SheetSnapshot, SheetHistorySegment, SheetPermission):
+        connection.execute(model.__table__.delete().where(model.sheet_id == target.id))
@@ -17,6 +17,8 @@ role_permissions = db.Table('role_permissions',
 class Permission(db.Model, RoleMixin):
     """权限模型"""
     __tablename__ = 'permissions'
+    # 检索列（见application.services.search）
+    __searchable__ = {'name': 'trigram', 'description': 'text'}
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
@@ -28,6 +30,8 @@ class Permission(db.Model, RoleMixin):
 class Role(db.Model, RoleMixin):
     """角色模型"""
     __tablename__ = 'roles'
+    # 检索列（见application.services.search）
+    __searchable__ = {'name': 'trigram', 'description': 'text'}
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
@@ -43,6 +47,12 @@ class Role(db.Model, RoleMixin):
 class User(db.Model, UserMixin):
     """用户模型"""
     __tablename__ = 'users'
+    __table_args__ = (
+        # 用户列表按(created_at, id)键集分页
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
+    # 检索列：用户名和邮箱按子串匹配
+    __searchable__ = ('username', 'email')
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -75,10 +85,14 @@ class User(db.Model, UserMixin):
         return super(User, self).has_role(role)
     
     def has_permission(self, permission):
-        """检查用户是否拥有指定权限"""
-        if isinstance(permission, str):
-            for role in self.roles:
-                if permission in [p.name for p in role.permissions]:
-                    return True
-            return False
-        return any(permission in role.permissions for role in self.roles) 
\ No newline at end of file
+        """检查用户是否拥有指定权限（经权限位图缓存）"""
+        from application import permission_cache
+        name = permission if isinstance(permission, str) else permission.name
+        return permission_cache.has_permission(self, name)
+
+    def _has_permission_uncached(self, name):
+        """逐个角色遍历权限，仅用于未持久化或权限变更尚未提交的用户"""
+        for role in self.roles:
+            if name in [p.name for p in role.permissions]:
+                return True
+        return False 
\ No newline at end of file
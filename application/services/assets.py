@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成gzip
+    brotli = None
+
+# 参与构建的静态文件类型，其中TEXT_TYPES预压缩
+ASSET_TYPES = frozenset(['.css', '.js', '.svg', '.woff', '.woff2', '.ttf', '.eot', '.otf',
+                         '.png', '.gif', '.jpg', '.jpeg', '.ico', '.webp'])
+TEXT_TYPES = frozenset(['.css', '.js', '.svg', '.ttf', '.eot', '.otf'])
+
+# 带指纹的文件内容不会改变，浏览器缓存一年且不再验证
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(filename, data):
+    """css/style.css -> css/style.<内容摘要>.css"""
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+class AssetPipeline:
+    """静态资源：构建时加指纹并预压缩，运行时改写url_for并以immutable缓存返回
+
+    flask assets-build 把应用和各蓝图（包括Flask-Admin的bootstrap4资源）静态
+    目录中的资源复制到ASSETS_BUILD_DIR，文件名带内容摘要，文本资源另存gzip和
+    brotli版本，并写出manifest.json。
+
+    应用启动时读取清单：url_for('static', filename=...)（以及'admin.static'等）
+    经url_defaults改写为带指纹的文件名；对应的静态视图对带指纹的文件按
+    Accept-Encoding返回预压缩版本，Cache-Control为immutable，其他文件仍由原视图
+    处理。未构建（没有清单）时行为与原来一致。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_ENABLED', True)
+        build_dir = app.config.get('ASSETS_BUILD_DIR') or os.path.join(app.instance_path, 'assets')
+        app.config['ASSETS_BUILD_DIR'] = build_dir
+        app.config.setdefault('ASSETS_COMPRESS_MIN_SIZE', 1024)
+        state = {'manifest': {}, 'files': {}}
+        app.extensions['assets'] = state
+        manifest_path = os.path.join(build_dir, 'manifest.json')
+        if not app.config['ASSETS_ENABLED'] or not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        state['manifest'] = {endpoint: files for endpoint, files in manifest.items()
+                             if endpoint in app.view_functions}
+        for endpoint, files in state['manifest'].items():
+            state['files'][endpoint] = {entry['path']: entry for entry in files.values()}
+            app.view_functions[endpoint] = self._make_view(endpoint, app.view_functions[endpoint])
+        app.url_defaults(self._url_defaults)
+
+    # 运行时
+
+    @staticmethod
+    def _url_defaults(endpoint, values):
+        manifest = current_app.extensions['assets']['manifest'].get(endpoint)
+        if manifest is not None:
+            entry = manifest.get(values.get('filename'))
+            if entry is not None:
+                values['filename'] = entry['path']
+
+    def _make_view(self, endpoint, fallback):
+        def view(filename):
+            entry = current_app.extensions['assets']['files'][endpoint].get(filename)
+            if entry is None:
+                return fallback(filename=filename)
+            return self._send(endpoint, entry)
+        view.__name__ = fallback.__name__
+        return view
+
+    @staticmethod
+    def _send(endpoint, entry):
+        build_dir = current_app.config['ASSETS_BUILD_DIR']
+        path = os.path.join(build_dir, endpoint, entry['path'])
+        encoding = None
+        for name, suffix in ENCODINGS:
+            if name in entry['encodings'] and request.accept_encodings[name]:
+                encoding, path = name, path + suffix
+                break
+        response = send_file(path, mimetype=entry['mimetype'], max_age=IMMUTABLE_MAX_AGE, conditional=True,
+                             etag=entry['hash'] + (f'-{encoding}' if encoding else ''))
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        return response
+
+    # 构建
+
+    @staticmethod
+    def sources(app):
+        """{静态端点: 目录}：应用和各蓝图的静态目录"""
+        result = {}
+        if app.static_folder and os.path.isdir(app.static_folder):
+            result['static'] = app.static_folder
+        for name, blueprint in app.blueprints.items():
+            if blueprint.static_folder and os.path.isdir(blueprint.static_folder) \
+                    and f'{name}.static' in app.view_functions:
+                result[f'{name}.static'] = blueprint.static_folder
+        return result
+
+    def build(self, app, quality=11, endpoints=None):
+        """构建静态资源（endpoints为静态端点列表，默认全部），返回(文件数, 原始字节数,
+        最优压缩字节数, gzip字节数)
+
+        带指纹的文件名随内容变化，旧版本的文件保留在构建目录中，部署期间仍在
+        运行的旧进程引用的资源不会失效；清单最后原子替换。只构建部分端点时
+        合并到已有清单中。
+        """
+        build_dir = app.config['ASSETS_BUILD_DIR']
+        min_size = app.config['ASSETS_COMPRESS_MIN_SIZE']
+        manifest_path = os.path.join(build_dir, 'manifest.json')
+        manifest = {}
+        if endpoints is not None and os.path.exists(manifest_path):
+            # 只构建部分端点时保留清单中其他端点的条目
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        totals = [0, 0, 0, 0]
+        for endpoint, folder in self.sources(app).items():
+            if endpoints is not None and endpoint not in endpoints:
+                continue
+            files = manifest[endpoint] = {}
+            for root, _, names in os.walk(folder):
+                for name in sorted(names):
+                    ext = os.path.splitext(name)[1].lower()
+                    if ext not in ASSET_TYPES:
+                        continue
+                    source = os.path.join(root, name)
+                    filename = os.path.relpath(source, folder).replace(os.sep, '/')
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                    hashed = fingerprint(filename, data)
+                    target = os.path.join(build_dir, endpoint, hashed)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target, 'wb') as f:
+                        f.write(data)
+                    encodings = {}
+                    if ext in TEXT_TYPES and len(data) >= min_size:
+                        compressed = {'gzip': gzip.compress(data, 9, mtime=0)}
+                        if brotli is not None:
+                            compressed['br'] = brotli.compress(data, quality=quality)
+                        for encoding, suffix in ENCODINGS:
+                            blob = compressed.get(encoding)
+                            # 压缩后没有变小的不保存
+                            if blob is not None and len(blob) < len(data):
+                                with open(target + suffix, 'wb') as f:
+                                    f.write(blob)
+                                encodings[encoding] = len(blob)
+                    files[filename] = {
+                        'path': hashed,
+                        'hash': hashed.rsplit('.', 2)[-2],
+                        'mimetype': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                        'size': len(data),
+                        'encodings': encodings,
+                    }
+                    totals[0] += 1
+                    totals[1] += len(data)
+                    totals[2] += encodings.get('br', encodings.get('gzip', len(data)))
+                    totals[3] += encodings.get('gzip', len(data))
+        os.makedirs(build_dir, exist_ok=True)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        return tuple(totals)
@@ -0,0 +1,403 @@
+import json
+import queue
+import threading
+import time
+import uuid
+
+from flask import current_app
+from redis import RedisError
+
+from application.services.formulas import FormulaError, is_formula
+from application.services.sheet_index import column_label
+
+# 写入提交后从缓冲中删除已写入的单元格：只删除值未变的字段，期间有更新编辑的单元格保留。
+# ARGV按(字段, 读取时的值)成对排列
+ACK_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return 0
+"""
+
+
+class Subscription:
+    """一个推送连接（SSE）的消息队列
+
+    队列有界；消费过慢导致队列溢出时标记overflowed，连接应通知客户端重新
+    拉取数据后断开，而不是无限积压。
+    """
+
+    def __init__(self, hub, key, maxsize):
+        self.hub = hub
+        self.key = key
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Collaboration:
+    """表格的多人协作编辑
+
+    编辑以操作(行, 列, 值, 基础版本)提交。每个单元格有自己的版本号，操作的
+    基础版本等于单元格当前版本时才被接受，版本加一；否则说明有并发编辑先被
+    接受，操作被拒绝并返回单元格的当前值和版本，由客户端合并后重新提交。
+    客户端为每个看到的单元格记录版本（即按单元格的版本向量），不同单元格的
+    编辑互不冲突。
+
+    配置了Redis时，版本检查、写入缓冲和广播在同一个WATCH/MULTI事务中完成，
+    所有worker看到一致的顺序；每个worker只用一个模式订阅接收全部表格的消息，
+    再分发给本进程的推送连接。未配置Redis时退化为单进程实现。
+
+    被接受的操作先进入按单元格合并的缓冲区，同一单元格的连续输入只保留最后
+    的值；每COLLAB_FLUSH_INTERVAL_MS毫秒由后台线程经SheetCalculator批量写入
+    表格存储并提交，公式重算的结果再广播给所有连接。缓冲中的单元格在提交成功
+    后才删除，写入过程中进程被终止时编辑仍留在缓冲中，由下一次写入补上。
+    """
+
+    CHANNEL = 'collab:sheet:{key}'
+    CHANNEL_PATTERN = 'collab:sheet:*'
+    VERSION_KEY = 'collab:{key}:v:{row}:{col}'
+    PENDING_KEY = 'collab:{key}:pending'
+    LOCK_KEY = 'collab:{key}:flush'
+
+    def __init__(self, app=None, db=None, redis_store=None, calculator=None):
+        self.db = None
+        self.redis_store = None
+        self.calculator = None
+        self._lock = threading.RLock()
+        self._subscribers = {}
+        self._listener = None
+        self._flusher = None
+        # 需要本进程写入的表格：{表格键: (应用, 表格id)}
+        self._dirty = {}
+        # 未配置Redis时的进程内状态
+        self._versions = {}
+        self._pending = {}
+        self._flush_locks = {}
+        self._ack_script = None
+        if app is not None:
+            self.init_app(app, db, redis_store, calculator)
+
+    def init_app(self, app, db, redis_store=None, calculator=None):
+        self.db = db
+        self.redis_store = redis_store
+        self.calculator = calculator
+        app.config.setdefault('COLLAB_FLUSH_INTERVAL_MS', 200)
+        app.config.setdefault('COLLAB_MAX_OPS', 500)
+        app.config.setdefault('COLLAB_VERSION_TTL', 86400)
+        app.config.setdefault('COLLAB_QUEUE_SIZE', 1000)
+        app.config.setdefault('COLLAB_HEARTBEAT_SECONDS', 15)
+        app.extensions['collaboration'] = self
+
+    @property
+    def redis(self):
+        return self.redis_store.client if self.redis_store is not None else None
+
+    # 提交编辑
+
+    def submit(self, sheet, ops, origin=None, user_id=None):
+        """提交[(行, 列, 值, 基础版本)]，返回{'accepted': [...], 'rejected': [...]}
+
+        同一批中对同一单元格的多次编辑合并为一次（取最后的值、最早的基础版本）。
+        """
+        merged = {}
+        for row, col, value, base in ops:
+            previous = merged.pop((row, col), None)
+            merged[row, col] = (value, base if previous is None else previous[1])
+        ops = [(row, col, value, base) for (row, col), (value, base) in merged.items()]
+        if not ops:
+            return {'accepted': [], 'rejected': []}
+
+        client = self.redis
+        if client is not None:
+            accepted, rejected = self._submit_shared(client, sheet, ops, origin, user_id)
+        else:
+            accepted, rejected = self._submit_local(sheet, ops, origin, user_id)
+
+        if accepted:
+            self._schedule_flush(sheet)
+        if rejected:
+            current = self._current_values(sheet, [(op['row'], op['col']) for op in rejected])
+            for op in rejected:
+                op['value'] = current[op['row'], op['col']]
+        return {'accepted': accepted, 'rejected': rejected}
+
+    @staticmethod
+    def _resolve(ops, versions):
+        accepted, rejected = [], []
+        for (row, col, value, base), version in zip(ops, versions):
+            entry = {'cell': f'{column_label(col)}{row + 1}', 'row': row, 'col': col}
+            if base == version:
+                accepted.append(dict(entry, value=value, version=version + 1))
+            else:
+                rejected.append(dict(entry, version=version))
+        return accepted, rejected
+
+    @staticmethod
+    def _message(accepted, origin, user_id):
+        return json.dumps({'type': 'ops', 'origin': origin, 'user': user_id,
+                           'ops': accepted}, ensure_ascii=False, separators=(',', ':'))
+
+    def _submit_shared(self, client, sheet, ops, origin, user_id):
+        key = sheet.key
+        ttl = current_app.config['COLLAB_VERSION_TTL']
+        version_keys = [self.VERSION_KEY.format(key=key, row=row, col=col) for row, col, _, _ in ops]
+        result = []
+
+        def transaction(pipe):
+            versions = [int(value or 0) for value in pipe.mget(version_keys)]
+            accepted, rejected = self._resolve(ops, versions)
+            pipe.multi()
+            if accepted:
+                for op in accepted:
+                    pipe.set(self.VERSION_KEY.format(key=key, row=op['row'], col=op['col']),
+                             op['version'], ex=ttl)
+                pipe.hset(self.PENDING_KEY.format(key=key), mapping={
+                    f"{op['row']}:{op['col']}": json.dumps([op['value'], op['version'], user_id]) for op in accepted})
+                # 在同一事务中广播，各单元格的消息顺序与版本顺序一致
+                pipe.publish(self.CHANNEL.format(key=key), self._message(accepted, origin, user_id))
+            result[:] = [accepted, rejected]
+
+        # 只监视本批涉及的单元格，编辑不同单元格的并发提交互不重试
+        client.transaction(transaction, *version_keys)
+        return result
+
+    def _submit_local(self, sheet, ops, origin, user_id):
+        key = sheet.key
+        with self._lock:
+            versions = [self._versions.get((key, row, col), 0) for row, col, _, _ in ops]
+            accepted, rejected = self._resolve(ops, versions)
+            pending = self._pending.setdefault(key, {})
+            for op in accepted:
+                self._versions[key, op['row'], op['col']] = op['version']
+                pending[op['row'], op['col']] = (op['value'], op['version'], user_id)
+            if accepted:
+                # 持有锁时分发，各单元格的消息顺序与版本顺序一致
+                self._dispatch(key, self._message(accepted, origin, user_id))
+        return accepted, rejected
+
+    def _current_values(self, sheet, cells):
+        """单元格的当前值：尚未写入的缓冲值，其次是公式源文本，最后是存储的值"""
+        from application.models.sheet import SheetFormula
+        from application.services.sheet_storage import SheetStorage
+        pending = self._peek_pending(sheet.key, cells)
+        storage = SheetStorage(sheet)
+        result = {}
+        for row, col in cells:
+            if (row, col) in pending:
+                result[row, col] = pending[row, col]
+                continue
+            formula = self.db.session.get(SheetFormula, (sheet.id, row, col))
+            result[row, col] = formula.source if formula is not None else storage.get_cell(row, col)
+        return result
+
+    # 写入缓冲
+
+    def _peek_pending(self, key, cells):
+        client = self.redis
+        if client is None:
+            with self._lock:
+                pending = self._pending.get(key, {})
+                return {cell: pending[cell][0] for cell in cells if cell in pending}
+        values = client.hmget(self.PENDING_KEY.format(key=key), [f'{row}:{col}' for row, col in cells])
+        return {cell: json.loads(value)[0] for cell, value in zip(cells, values) if value is not None}
+
+    def _read_pending(self, key):
+        """读取表格的写入缓冲（不删除），返回{(行, 列): (值, 版本, 用户id)}"""
+        client = self.redis
+        if client is None:
+            with self._lock:
+                return dict(self._pending.get(key, {}))
+        result = {}
+        for field, value in client.hgetall(self.PENDING_KEY.format(key=key)).items():
+            row, col = map(int, field.split(b':'))
+            result[row, col] = tuple(json.loads(value))
+        return result
+
+    def _ack_pending(self, key, pending):
+        """写入提交后从缓冲中删除这些单元格；期间有更新的编辑时保留更新的值"""
+        client = self.redis
+        if client is None:
+            with self._lock:
+                current = self._pending.get(key, {})
+                for cell, entry in pending.items():
+                    if current.get(cell) == entry:
+                        del current[cell]
+                if not current:
+                    self._pending.pop(key, None)
+            return
+        if self._ack_script is None or self._ack_script.registered_client is not client:
+            self._ack_script = client.register_script(ACK_SCRIPT)
+        args = []
+        for (row, col), entry in pending.items():
+            args.extend((f'{row}:{col}', json.dumps(list(entry))))
+        self._ack_script(keys=[self.PENDING_KEY.format(key=key)], args=args)
+
+    def _acquire(self, key):
+        """获取表格的写入锁，防止两个worker交错写入同一单元格的新旧值"""
+        client = self.redis
+        token = uuid.uuid4().hex
+        if client is None:
+            with self._lock:
+                lock = self._flush_locks.setdefault(key, threading.Lock())
+            return token if lock.acquire(blocking=False) else None
+        if client.set(self.LOCK_KEY.format(key=key), token, nx=True, px=30000):
+            return token
+        return None
+
+    def _release(self, key, token):
+        client = self.redis
+        if client is None:
+            self._flush_locks[key].release()
+            return
+        lock_key = self.LOCK_KEY.format(key=key)
+
+        def transaction(pipe):
+            if pipe.get(lock_key) == token.encode():
+                pipe.multi()
+                pipe.delete(lock_key)
+
+        client.transaction(transaction, lock_key)
+
+    def flush(self, key, sheet_id):
+        """把缓冲的编辑写入表格存储并提交
+
+        返回写入的单元格数；其他进程正在写入该表格时返回None，稍后重试。
+        """
+        from application.models.sheet import Sheet
+        token = self._acquire(key)
+        if token is None:
+            return None
+        try:
+            pending = self._read_pending(key)
+            if not pending:
+                return 0
+            session = self.db.session
+            sheet = session.get(Sheet, sheet_id)
+            if sheet is None or sheet.key != key:
+                # 表格已删除
+                self._ack_pending(key, pending)
+                return 0
+            cells = {cell: entry[0] for cell, entry in pending.items()}
+            authors = {cell: entry[2] for cell, entry in pending.items()}
+            try:
+                changed = self.calculator.apply(sheet, cells, authors)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            self._ack_pending(key, pending)
+            # 公式及其下游单元格的计算结果由服务端产生，需要另行广播
+            computed = [{'cell': f'{column_label(col)}{row + 1}', 'row': row, 'col': col,
+                         'value': str(value) if isinstance(value, FormulaError) else value}
+                        for (row, col), value in changed.items()
+                        if (row, col) not in cells or is_formula(cells[row, col])]
+            if computed:
+                self.publish(key, json.dumps({'type': 'values', 'version': sheet.version, 'cells': computed},
+                                             ensure_ascii=False, separators=(',', ':')))
+            return len(cells)
+        finally:
+            self._release(key, token)
+
+    def _schedule_flush(self, sheet):
+        interval = current_app.config['COLLAB_FLUSH_INTERVAL_MS']
+        if not interval:
+            self.flush(sheet.key, sheet.id)
+            return
+        with self._lock:
+            self._dirty[sheet.key] = (current_app._get_current_object(), sheet.id)
+            if self._flusher is None:
+                # 延迟启动，避免gunicorn预加载后fork出的worker继承失效的线程
+                self._flusher = threading.Thread(target=self._flush_loop, args=(interval / 1000,),
+                                                 name='collab-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            for key, (app, sheet_id) in dirty.items():
+                with app.app_context():
+                    try:
+                        if self.flush(key, sheet_id) is None:
+                            with self._lock:
+                                self._dirty.setdefault(key, (app, sheet_id))
+                    except Exception:
+                        app.logger.exception('协作编辑写入失败: 表格%s', sheet_id)
+                        with self._lock:
+                            self._dirty.setdefault(key, (app, sheet_id))
+                    finally:
+                        self.db.session.remove()
+
+    # 广播与订阅
+
+    def publish(self, key, message):
+        client = self.redis
+        if client is None:
+            self._dispatch(key, message)
+            return
+        try:
+            client.publish(self.CHANNEL.format(key=key), message)
+        except RedisError:
+            current_app.logger.warning('协作消息广播失败: %s', key)
+
+    def subscribe(self, sheet):
+        subscription = Subscription(self, sheet.key, current_app.config['COLLAB_QUEUE_SIZE'])
+        client = self.redis
+        with self._lock:
+            self._subscribers.setdefault(subscription.key, set()).add(subscription)
+            if client is not None and self._listener is None:
+                self._listener = threading.Thread(target=self._listen, args=(client, current_app.logger),
+                                                  name='collab-listen', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _dispatch(self, key, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def _listen(self, client, logger):
+        """每个进程一个模式订阅，接收所有表格的消息后分发给本进程的连接"""
+        prefix = len(self.CHANNEL.format(key=''))
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.CHANNEL_PATTERN)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._dispatch(message['channel'][prefix:].decode(), message['data'].decode())
+            except RedisError:
+                logger.warning('协作消息订阅中断，1秒后重连', exc_info=True)
+                time.sleep(1)
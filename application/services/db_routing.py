@@ -0,0 +1,123 @@
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# 写入后在用户会话中记录的“只读主库”截止时间
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+# (配置项, create_engine参数)
+POOL_OPTIONS = (
+    ('DB_POOL_SIZE', 'pool_size'),
+    ('DB_MAX_OVERFLOW', 'max_overflow'),
+    ('DB_POOL_TIMEOUT', 'pool_timeout'),
+    ('DB_POOL_RECYCLE', 'pool_recycle'),
+)
+
+
+def engine_options(uri, config):
+    """根据DB_*配置生成create_engine参数"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    options = {}
+
+    # 内存SQLite使用StaticPool，不接受连接池大小类参数
+    if not (backend == 'sqlite' and url.database in (None, '', ':memory:')):
+        for key, option in POOL_OPTIONS:
+            if config.get(key) is not None:
+                options[option] = config[key]
+    if config.get('DB_POOL_PRE_PING'):
+        options['pool_pre_ping'] = True
+
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout:
+        if backend == 'postgresql':
+            options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+        elif backend == 'mysql':
+            options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={int(timeout)}'}
+    return options
+
+
+def configure_engines(app):
+    """在db.init_app之前生成主库引擎参数并注册只读副本bind"""
+    config = app.config
+    options = engine_options(config['SQLALCHEMY_DATABASE_URI'], config)
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    replica_keys = []
+    for i, url in enumerate(config.get('DATABASE_REPLICA_URLS') or []):
+        key = f'replica_{i}'
+        binds[key] = dict(engine_options(url, config), url=url)
+        replica_keys.append(key)
+    config['SQLALCHEMY_BINDS'] = binds
+    config['DB_REPLICA_BINDS'] = replica_keys
+
+
+class RoutingSession(Session):
+    """按读写路由的会话
+
+    在replica_reads()范围内的查询发往只读副本（每个会话固定一个副本）；
+    flush始终走主库。会话内一旦写入，之后的读取都留在主库（read-your-writes），
+    并在用户会话中记录一个粘滞窗口，使后续请求在副本追上之前也读主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        if bind is None and self.uses_replica():
+            engines = self._db.engines
+            if engine is engines.get(None):
+                return engines[self.info['replica_key']]
+        return engine
+
+    def uses_replica(self):
+        """当前读取是否会被路由到只读副本"""
+        if not self.info.get('read_replica') or self._flushing or self.info.get('wrote'):
+            return False
+        keys = current_app.config.get('DB_REPLICA_BINDS')
+        if not keys:
+            return False
+        if has_request_context() and flask_session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+            return False
+        self.info.setdefault('replica_key', random.choice(keys))
+        return True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if not session.info.get('wrote') or not has_request_context():
+        return
+    if current_app.config.get('DB_REPLICA_BINDS'):
+        flask_session[PRIMARY_UNTIL_KEY] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+
+
+@contextmanager
+def replica_reads():
+    """在此范围内把只读查询路由到副本"""
+    session = current_app.extensions['sqlalchemy'].session()
+    previous = session.info.get('read_replica', False)
+    session.info['read_replica'] = True
+    try:
+        yield session
+    finally:
+        session.info['read_replica'] = previous
+
+
+def read_replica(f):
+    """视图装饰器：视图内的只读查询使用副本"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with replica_reads():
+            return f(*args, **kwargs)
+    return decorated_function
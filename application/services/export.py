@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import tempfile
+
+# 每个响应块的目标大小（字节），避免逐行产生过多的小块
+CHUNK_SIZE = 64 * 1024
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def iter_csv(headers, rows, chunk_size=CHUNK_SIZE):
+    """逐行写CSV，按chunk_size分块产出文本"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(headers, rows, chunk_size=CHUNK_SIZE):
+    """每行输出一个JSON对象，按chunk_size分块产出文本"""
+    parts = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(headers, row)), ensure_ascii=False, default=str) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    yield ''.join(parts)
+
+
+def iter_xlsx(headers, rows, chunk_size=CHUNK_SIZE):
+    """以write_only模式写XLSX
+
+    XLSX是zip容器，无法边写边发；openpyxl的write_only模式把行流式写入
+    临时文件，工作簿落盘后再分块读出，内存占用与行数无关。
+    """
+    # openpyxl导入较慢，只在实际导出XLSX时加载
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+
+EXPORT_WRITERS = {
+    'csv': iter_csv,
+    'jsonl': iter_jsonl,
+    'xlsx': iter_xlsx,
+}
@@ -0,0 +1,842 @@
+import fnmatch
+import math
+import operator
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+from sqlalchemy import delete, event, insert, select, tuple_
+
+# 整列引用（A:A）的行上界
+MAX_ROWS = 1048576
+# 有界区域引用按行分桶登记，查找依赖某单元格的区域公式时只扫描一个桶
+RANGE_BUCKET_ROWS = 256
+
+
+class FormulaError(str):
+    """公式错误值，以Excel的错误文本保存"""
+
+
+DIV0 = FormulaError('#DIV/0!')
+VALUE = FormulaError('#VALUE!')
+NAME = FormulaError('#NAME?')
+NA = FormulaError('#N/A')
+CIRCULAR = FormulaError('#CIRC!')
+ERRORS = {error: error for error in (DIV0, VALUE, NAME, NA, CIRCULAR)}
+
+
+class FormulaSyntaxError(ValueError):
+    pass
+
+
+# 词法分析
+
+TOKEN_RE = re.compile(r'''
+    \s*(?:
+      (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<string>"(?:[^"]|"")*")
+    | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d+|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3})
+    | (?P<func>[A-Za-z_][A-Za-z0-9_.]*(?=\s*\())
+    | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)
+    | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+    | (?P<op><>|<=|>=|[-+*/^&=<>(),%])
+    )''', re.X)
+REF_RE = re.compile(r'^\$?([A-Za-z]{1,3})\$?(\d+)?$')
+
+
+def _column(label):
+    index = 0
+    for ch in label.upper():
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def _ref(text):
+    label, row = REF_RE.match(text).groups()
+    return (int(row) - 1 if row else None), _column(label)
+
+
+def tokenize(source):
+    tokens = []
+    pos = 0
+    source = source.rstrip()
+    while pos < len(source):
+        match = TOKEN_RE.match(source, pos)
+        if match is None or match.end() == pos:
+            raise FormulaSyntaxError(f'无法识别的字符: {source[pos:pos + 10]}')
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    tokens.append(('end', None))
+    return tokens
+
+
+# 语法分析：优先级爬升，生成元组形式的语法树
+
+BINARY_PRECEDENCE = {
+    '=': 1, '<>': 1, '<': 1, '>': 1, '<=': 1, '>=': 1,
+    '&': 2,
+    '+': 3, '-': 3,
+    '*': 4, '/': 4,
+    '^': 5,
+}
+UNARY_PRECEDENCE = 6
+
+
+class _Parser:
+    def __init__(self, source):
+        self.tokens = tokenize(source)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        kind, text = self.next()
+        if text != value:
+            raise FormulaSyntaxError(f'缺少 {value}')
+
+    def parse(self):
+        node = self.expression(0)
+        if self.peek()[0] != 'end':
+            raise FormulaSyntaxError(f'多余的内容: {self.peek()[1]}')
+        return node
+
+    def expression(self, min_precedence):
+        left = self.unary()
+        while True:
+            kind, text = self.peek()
+            precedence = BINARY_PRECEDENCE.get(text) if kind == 'op' else None
+            if precedence is None or precedence < min_precedence:
+                return left
+            self.next()
+            # 二元运算符均为左结合（Excel中^也是左结合）
+            right = self.expression(precedence + 1)
+            left = ('binop', text, left, right)
+
+    def unary(self):
+        kind, text = self.peek()
+        if kind == 'op' and text in ('-', '+'):
+            self.next()
+            operand = self.expression(UNARY_PRECEDENCE)
+            return ('neg', operand) if text == '-' else operand
+        node = self.primary()
+        while self.peek() == ('op', '%'):
+            self.next()
+            node = ('binop', '/', node, ('num', 100.0))
+        return node
+
+    def primary(self):
+        kind, text = self.next()
+        if kind == 'number':
+            return ('num', float(text))
+        if kind == 'string':
+            return ('str', text[1:-1].replace('""', '"'))
+        if kind == 'ref':
+            return ('ref',) + _ref(text)
+        if kind == 'range':
+            start, stop = text.split(':')
+            (r0, c0), (r1, c1) = _ref(start), _ref(stop)
+            if r0 is None:
+                r0, r1 = 0, MAX_ROWS - 1
+            return ('range', min(r0, r1), min(c0, c1), max(r0, r1) + 1, max(c0, c1) + 1)
+        if kind == 'func':
+            self.expect('(')
+            args = []
+            if self.peek() != ('op', ')'):
+                args.append(self.expression(0))
+                while self.peek() == ('op', ','):
+                    self.next()
+                    args.append(self.expression(0))
+            self.expect(')')
+            return ('call', text.upper(), args)
+        if kind == 'name':
+            upper = text.upper()
+            if upper in ('TRUE', 'FALSE'):
+                return ('bool', upper == 'TRUE')
+            return ('error', NAME)
+        if kind == 'op' and text == '(':
+            node = self.expression(0)
+            self.expect(')')
+            return node
+        raise FormulaSyntaxError('公式不完整' if kind == 'end' else f'意外的 {text}')
+
+
+# 编译：语法树 -> 以引擎为参数的闭包
+
+class RangeRef:
+    """求值中的区域引用，由区域函数向量化处理"""
+    __slots__ = ('row_start', 'col_start', 'row_stop', 'col_stop')
+
+    def __init__(self, row_start, col_start, row_stop, col_stop):
+        self.row_start = row_start
+        self.col_start = col_start
+        self.row_stop = row_stop
+        self.col_stop = col_stop
+
+
+def _to_number(value):
+    if value is None:
+        return 0.0
+    if isinstance(value, FormulaError):
+        return value
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, RangeRef):
+        return VALUE
+    try:
+        return float(value)
+    except ValueError:
+        return VALUE
+
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _to_bool(value):
+    if isinstance(value, str) and not isinstance(value, FormulaError):
+        upper = value.upper()
+        if upper in ('TRUE', 'FALSE'):
+            return upper == 'TRUE'
+        return VALUE
+    number = _to_number(value)
+    return number if isinstance(number, FormulaError) else number != 0
+
+
+def _power(a, b):
+    try:
+        return math.pow(a, b)
+    except (OverflowError, ValueError):
+        return VALUE
+
+
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul, '^': _power}
+COMPARISON = {'=': operator.eq, '<>': operator.ne, '<': operator.lt, '>': operator.gt,
+              '<=': operator.le, '>=': operator.ge}
+
+
+def _compare_key(value):
+    """Excel比较顺序：数值 < 文本（不区分大小写）< 布尔"""
+    if value is None:
+        return (0, 0.0)
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    return (1, str(value).casefold())
+
+
+def _binop(op, left, right):
+    if op in COMPARISON:
+        def evaluate(engine):
+            a, b = left(engine), right(engine)
+            for value in (a, b):
+                if isinstance(value, FormulaError):
+                    return value
+            return COMPARISON[op](_compare_key(a), _compare_key(b))
+    elif op == '&':
+        def evaluate(engine):
+            a, b = left(engine), right(engine)
+            for value in (a, b):
+                if isinstance(value, FormulaError):
+                    return value
+            return _to_text(a) + _to_text(b)
+    elif op == '/':
+        def evaluate(engine):
+            a, b = _to_number(left(engine)), _to_number(right(engine))
+            for value in (a, b):
+                if isinstance(value, FormulaError):
+                    return value
+            return DIV0 if b == 0 else a / b
+    else:
+        func = ARITHMETIC[op]
+
+        def evaluate(engine):
+            a, b = _to_number(left(engine)), _to_number(right(engine))
+            for value in (a, b):
+                if isinstance(value, FormulaError):
+                    return value
+            return func(a, b)
+    return evaluate
+
+
+def _compile(node):
+    kind = node[0]
+    if kind in ('num', 'str', 'bool', 'error'):
+        value = node[1]
+        return lambda engine: value
+    if kind == 'ref':
+        row, col = node[1], node[2]
+        return lambda engine: engine.get(row, col)
+    if kind == 'range':
+        ref = RangeRef(*node[1:])
+        return lambda engine: ref
+    if kind == 'neg':
+        operand = _compile(node[1])
+
+        def negate(engine):
+            value = _to_number(operand(engine))
+            return value if isinstance(value, FormulaError) else -value
+        return negate
+    if kind == 'binop':
+        return _binop(node[1], _compile(node[2]), _compile(node[3]))
+    if kind == 'call':
+        name, args = node[1], [_compile(arg) for arg in node[2]]
+        if name == 'IF':
+            return _compile_if(args)
+        func = FUNCTIONS.get(name)
+        if func is None:
+            return lambda engine: NAME
+        return lambda engine: func(engine, [arg(engine) for arg in args])
+    raise FormulaSyntaxError(f'未知节点 {kind}')
+
+
+def _compile_if(args):
+    if not 2 <= len(args) <= 3:
+        return lambda engine: VALUE
+    condition, then = args[0], args[1]
+    otherwise = args[2] if len(args) == 3 else (lambda engine: False)
+
+    def evaluate(engine):
+        # 只计算被选中的分支
+        value = _to_bool(condition(engine))
+        if isinstance(value, FormulaError):
+            return value
+        return then(engine) if value else otherwise(engine)
+    return evaluate
+
+
+# 函数：区域参数在引擎的列数组上向量化计算（numpy在首次计算时才导入，不计入应用启动耗时）
+
+def _numeric_parts(engine, args):
+    """把参数展开为数值数组列表；区域中的文本和布尔被忽略，直接参数中的按数值转换"""
+    import numpy as np
+    parts = []
+    for arg in args:
+        if isinstance(arg, RangeRef):
+            parts.extend(engine.range_numbers(arg))
+        else:
+            value = _to_number(arg)
+            if isinstance(value, FormulaError):
+                return value
+            parts.append(np.array([value], dtype=float))
+    return parts
+
+
+def _range_errors(engine, args):
+    for arg in args:
+        if isinstance(arg, RangeRef):
+            error = engine.range_error(arg)
+            if error is not None:
+                return error
+    return None
+
+
+def _aggregate(reducer):
+    def func(engine, args):
+        error = _range_errors(engine, args)
+        if error is not None:
+            return error
+        parts = _numeric_parts(engine, args)
+        if isinstance(parts, FormulaError):
+            return parts
+        return reducer(parts)
+    return func
+
+
+def _sum(parts):
+    import numpy as np
+    return float(sum(np.nansum(part) for part in parts))
+
+
+def _count(parts):
+    import numpy as np
+    return float(sum(np.count_nonzero(~np.isnan(part)) for part in parts))
+
+
+def _average(parts):
+    count = _count(parts)
+    return DIV0 if not count else _sum(parts) / count
+
+
+def _extreme(name):
+    def func(parts):
+        import numpy as np
+        reduce = getattr(np, name)
+        values = [reduce(part) for part in parts if part.size and not np.isnan(part).all()]
+        return float(reduce(values)) if values else 0.0
+    return func
+
+
+CRITERIA_RE = re.compile(r'^(<>|<=|>=|=|<|>)?(.*)$', re.S)
+
+
+def _countif(engine, args):
+    import numpy as np
+    if len(args) != 2 or not isinstance(args[0], RangeRef):
+        return VALUE
+    ref, criteria = args
+    if isinstance(criteria, FormulaError):
+        return criteria
+    if isinstance(criteria, (int, float)) and not isinstance(criteria, bool):
+        op, operand = '=', criteria
+    else:
+        op, operand = CRITERIA_RE.match(_to_text(criteria)).groups()
+        op = op or '='
+        try:
+            operand = float(operand)
+        except ValueError:
+            pass
+    if isinstance(operand, float):
+        # 数值条件：在列数组上比较，NaN（非数值单元格）不满足任何比较
+        compare = {'=': np.equal, '<>': np.not_equal, '<': np.less, '>': np.greater,
+                   '<=': np.less_equal, '>=': np.greater_equal}[op]
+        # <>还匹配非数值单元格，NaN在not_equal中为真
+        with np.errstate(invalid='ignore'):
+            return float(sum(int(np.count_nonzero(compare(part, operand)))
+                             for part in engine.range_numbers(ref)))
+    # 文本条件：只遍历区域内的非数值单元格，支持*和?通配符
+    pattern = operand.casefold()
+    wildcard = '*' in pattern or '?' in pattern
+    count = 0
+    for value in engine.range_others(ref):
+        if isinstance(value, bool):
+            text = 'true' if value else 'false'
+        else:
+            text = str(value).casefold()
+        hit = fnmatch.fnmatchcase(text, pattern) if wildcard else text == pattern
+        if hit == (op != '<>'):
+            count += 1
+    return float(count)
+
+
+def _scalar(func, arity):
+    def wrapper(engine, args):
+        if len(args) not in arity:
+            return VALUE
+        numbers = [_to_number(arg) for arg in args]
+        for number in numbers:
+            if isinstance(number, FormulaError):
+                return number
+        return func(*numbers)
+    return wrapper
+
+
+def _logical(reducer):
+    def func(engine, args):
+        values = []
+        for arg in args:
+            value = _to_bool(arg)
+            if isinstance(value, FormulaError):
+                return value
+            values.append(value)
+        return reducer(values)
+    return func
+
+
+def _round(value, digits=0.0):
+    # 按十进制表示四舍五入（远离零），与Excel一致：ROUND(2.345,2)为2.35
+    exponent = Decimal(1).scaleb(-int(digits))
+    return float(Decimal(repr(float(value))).quantize(exponent, rounding=ROUND_HALF_UP))
+
+
+FUNCTIONS = {
+    'SUM': _aggregate(_sum),
+    'AVERAGE': _aggregate(_average),
+    'AVG': _aggregate(_average),
+    'COUNT': _aggregate(_count),
+    'MIN': _aggregate(_extreme('nanmin')),
+    'MAX': _aggregate(_extreme('nanmax')),
+    'COUNTIF': _countif,
+    'ABS': _scalar(abs, (1,)),
+    'ROUND': _scalar(_round, (1, 2)),
+    'AND': _logical(all),
+    'OR': _logical(any),
+    'NOT': _logical(lambda values: not values[0] if len(values) == 1 else VALUE),
+}
+
+
+class Formula:
+    """编译后的公式：求值闭包及其引用的单元格和区域"""
+    __slots__ = ('source', 'evaluate', 'cells', 'ranges')
+
+    def __init__(self, source, evaluate, cells, ranges):
+        self.source = source
+        self.evaluate = evaluate
+        self.cells = cells
+        self.ranges = ranges
+
+
+def _references(node, cells, ranges):
+    kind = node[0]
+    if kind == 'ref':
+        cells.add((node[1], node[2]))
+    elif kind == 'range':
+        ranges.append(node[1:])
+    elif kind == 'neg':
+        _references(node[1], cells, ranges)
+    elif kind == 'binop':
+        _references(node[2], cells, ranges)
+        _references(node[3], cells, ranges)
+    elif kind == 'call':
+        for arg in node[2]:
+            _references(arg, cells, ranges)
+
+
+@lru_cache(maxsize=65536)
+def compile_formula(source):
+    """解析并编译公式（以=开头的文本），相同的公式文本只编译一次"""
+    if not source.startswith('='):
+        raise FormulaSyntaxError('公式必须以=开头')
+    node = _Parser(source[1:]).parse()
+    cells, ranges = set(), []
+    _references(node, cells, ranges)
+    return Formula(source, _compile(node), frozenset(cells), tuple(ranges))
+
+
+def is_formula(value):
+    return isinstance(value, str) and value.startswith('=') and len(value) > 1
+
+
+# 引擎
+
+class _Column:
+    """引擎内的一列：数值数组（非数值为NaN）和非数值单元格{行: 值}"""
+    __slots__ = ('numbers', 'others')
+
+    def __init__(self, numbers=None, others=None):
+        import numpy as np
+        self.numbers = numbers if numbers is not None else np.full(0, np.nan)
+        self.others = others if others is not None else {}
+
+    def get(self, row):
+        if row < len(self.numbers):
+            value = self.numbers[row]
+            if not math.isnan(value):
+                value = float(value)
+                return int(value) if value.is_integer() and abs(value) < 2 ** 53 else value
+        return self.others.get(row)
+
+    def set(self, row, value):
+        import numpy as np
+        if isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and not (isinstance(value, float) and math.isnan(value)):
+            if row >= len(self.numbers):
+                grown = np.full(max(row + 1, len(self.numbers) * 2, 1024), np.nan)
+                grown[:len(self.numbers)] = self.numbers
+                self.numbers = grown
+            self.numbers[row] = value
+            self.others.pop(row, None)
+            return
+        if row < len(self.numbers):
+            self.numbers[row] = np.nan
+        if value is None or value == '':
+            self.others.pop(row, None)
+        else:
+            self.others[row] = value
+
+
+class FormulaEngine:
+    """增量重算引擎
+
+    公式在设置时编译一次，引用关系构成依赖图：单元格引用记入dependents，
+    有界区域按RANGE_BUCKET_ROWS行分桶登记，整列引用按列登记。编辑后只从
+    被修改的单元格出发沿依赖边找出受影响的公式，按拓扑顺序重算；成环的
+    公式得到#CIRC!。单元格值按列保存为NumPy数组，SUM/AVERAGE/COUNT/MIN/
+    MAX/COUNTIF对区域的计算直接作用在数组切片上。
+
+    load_column(col)返回该列的(数值数组, {行: 非数值})，用于按需加载未编辑过的列。
+    """
+
+    def __init__(self, load_column=None):
+        self.load_column = load_column
+        self.columns = {}
+        self.formulas = {}
+        self.dependents = defaultdict(set)
+        self.range_buckets = defaultdict(list)
+        self.column_ranges = defaultdict(list)
+
+    # 读取
+
+    def column(self, col):
+        column = self.columns.get(col)
+        if column is None:
+            column = _Column(*self.load_column(col)) if self.load_column else _Column()
+            self.columns[col] = column
+        return column
+
+    def get(self, row, col):
+        return self.column(col).get(row)
+
+    def range_numbers(self, ref):
+        return [self.column(col).numbers[ref.row_start:ref.row_stop]
+                for col in range(ref.col_start, ref.col_stop)]
+
+    def range_others(self, ref):
+        for col in range(ref.col_start, ref.col_stop):
+            for row, value in self.column(col).others.items():
+                if ref.row_start <= row < ref.row_stop:
+                    yield value
+
+    def range_error(self, ref):
+        """区域内的第一个错误值（错误在区域函数中传播）"""
+        for value in self.range_others(ref):
+            if isinstance(value, FormulaError):
+                return value
+        return None
+
+    # 编辑
+
+    def set_cells(self, cells):
+        """写入{(行, 列): 值或公式文本}，返回值发生变化的{(行, 列): 新值}（含重算的公式）"""
+        changed = {}
+        for (row, col), value in cells.items():
+            cell = (row, col)
+            if cell in self.formulas:
+                self._unregister(cell)
+            if is_formula(value):
+                try:
+                    formula = compile_formula(value)
+                except FormulaSyntaxError:
+                    self.column(col).set(row, VALUE)
+                    changed[cell] = VALUE
+                    continue
+                self._register(cell, formula)
+            else:
+                self.column(col).set(row, value)
+                changed[cell] = self.get(row, col)
+        changed.update(self._recalculate(cells.keys()))
+        return changed
+
+    def recalculate_all(self):
+        return self._recalculate(list(self.formulas))
+
+    def _register(self, cell, formula):
+        self.formulas[cell] = formula
+        for ref in formula.cells:
+            self.dependents[ref].add(cell)
+        for row_start, col_start, row_stop, col_stop in formula.ranges:
+            for col in range(col_start, col_stop):
+                if row_stop - row_start >= MAX_ROWS:
+                    self.column_ranges[col].append((row_start, row_stop, cell))
+                    continue
+                for bucket in range(row_start // RANGE_BUCKET_ROWS, (row_stop - 1) // RANGE_BUCKET_ROWS + 1):
+                    self.range_buckets[col, bucket].append((row_start, row_stop, cell))
+
+    def _unregister(self, cell):
+        formula = self.formulas.pop(cell)
+        for ref in formula.cells:
+            self.dependents[ref].discard(cell)
+        for row_start, col_start, row_stop, col_stop in formula.ranges:
+            entry = (row_start, row_stop, cell)
+            for col in range(col_start, col_stop):
+                if row_stop - row_start >= MAX_ROWS:
+                    self.column_ranges[col].remove(entry)
+                    continue
+                for bucket in range(row_start // RANGE_BUCKET_ROWS, (row_stop - 1) // RANGE_BUCKET_ROWS + 1):
+                    self.range_buckets[col, bucket].remove(entry)
+
+    def _direct_dependents(self, cell):
+        row, col = cell
+        found = self.dependents.get(cell)
+        result = list(found) if found else []
+        for entries in (self.range_buckets.get((col, row // RANGE_BUCKET_ROWS)),
+                        self.column_ranges.get(col)):
+            if entries:
+                result.extend(dependent for start, stop, dependent in entries if start <= row < stop)
+        return result
+
+    def _recalculate(self, sources):
+        """从sources出发按拓扑顺序重算受影响的公式"""
+        order, cyclic = self._topological_order(sources)
+        changed = {}
+        for cell in order:
+            if cell in cyclic:
+                value = CIRCULAR
+            else:
+                value = self.formulas[cell].evaluate(self)
+                if isinstance(value, RangeRef):
+                    value = VALUE
+                elif isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+                    value = VALUE
+            column = self.column(cell[1])
+            old = column.get(cell[0])
+            column.set(cell[0], value)
+            new = column.get(cell[0])
+            if new != old or type(new) is not type(old):
+                changed[cell] = new
+        return changed
+
+    def _topological_order(self, sources):
+        """迭代DFS的逆后序；遇到回边时把环上的公式记入cyclic"""
+        state = {}  # 1: 在栈上, 2: 已完成
+        order = []
+        cyclic = set()
+        path = []
+        for source in sources:
+            if state.get(source) == 2:
+                continue
+            roots = [source] if source in self.formulas else self._direct_dependents(source)
+            for root in roots:
+                if state.get(root):
+                    if state[root] == 1:
+                        cyclic.update(path[path.index(root):])
+                    continue
+                state[root] = 1
+                path.append(root)
+                stack = [(root, iter(self._direct_dependents(root)))]
+                while stack:
+                    cell, children = stack[-1]
+                    for child in children:
+                        child_state = state.get(child)
+                        if child_state == 1:
+                            cyclic.update(path[path.index(child):])
+                        elif child_state is None:
+                            state[child] = 1
+                            path.append(child)
+                            stack.append((child, iter(self._direct_dependents(child))))
+                            break
+                    else:
+                        stack.pop()
+                        path.pop()
+                        state[cell] = 2
+                        order.append(cell)
+            if source not in self.formulas:
+                state[source] = 2
+        order.reverse()
+        return order, cyclic
+
+
+# 与表格存储的衔接
+
+def _load_column(storage, col, n_rows):
+    """从表格存储加载一列：数值直接取自块的float64数组，布尔和文本放入others"""
+    import numpy as np
+    from application.services.sheet_storage import NUMBER, TEXT
+    numbers = np.full(n_rows, np.nan)
+    others = {}
+    for row_start, chunk, local_col in storage.iter_column_chunks(col):
+        types, values = chunk.column(local_col)
+        count = min(chunk.rows, n_rows - row_start)
+        if count <= 0:
+            break
+        kinds = np.frombuffer(types, dtype=np.uint8)[:count]
+        segment = np.frombuffer(values, dtype=np.float64)[:count].copy()
+        segment[kinds != NUMBER] = np.nan
+        numbers[row_start:row_start + count] = segment
+        for r in np.flatnonzero(kinds > NUMBER):
+            value = chunk.get(int(r), local_col)
+            # 公式的错误结果以文本保存，加载时还原为错误值
+            others[row_start + int(r)] = ERRORS.get(value, value) if kinds[r] == TEXT else value
+    return numbers, others
+
+
+class SheetCalculator:
+    """按表格缓存公式引擎
+
+    引擎以表格修订号（含版本）为键缓存，其他进程修改表格后版本变化，缓存
+    自然失效并从sheet_formulas重新加载；只注册公式，不做全量重算（单元格中
+    保存着上次计算的结果）。编辑过的引擎在事务提交后才以新修订号放回缓存，
+    回滚时丢弃。
+    """
+
+    def __init__(self, app=None, db=None, history=None):
+        self.db = None
+        self.history = None
+        self.maxsize = 8
+        self._lock = threading.Lock()
+        self._engines = OrderedDict()
+        if app is not None:
+            self.init_app(app, db, history)
+
+    def init_app(self, app, db, history=None):
+        self.history = history
+        self.maxsize = app.config.setdefault('SHEET_FORMULA_CACHE_SIZE', self.maxsize)
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        app.extensions['sheet_calculator'] = self
+
+    def engine(self, sheet):
+        with self._lock:
+            engine = self._engines.pop(sheet.revision, None)
+        if engine is None:
+            return self.load(sheet)
+        # 缓存的引擎按需加载新列时使用当前会话中的表格对象
+        engine.load_column = self._column_loader(sheet)
+        return engine
+
+    def load(self, sheet):
+        from application.models.sheet import SheetFormula
+        engine = FormulaEngine(self._column_loader(sheet))
+        rows = self.db.session.execute(select(SheetFormula.row, SheetFormula.col, SheetFormula.source)
+                                       .where(SheetFormula.sheet_id == sheet.id))
+        for row, col, source in rows:
+            engine._register((row, col), compile_formula(source))
+        return engine
+
+    @staticmethod
+    def _column_loader(sheet):
+        from application.services.sheet_storage import SheetStorage
+        storage = SheetStorage(sheet)
+        return lambda col: _load_column(storage, col, sheet.n_rows)
+
+    def apply(self, sheet, cells, authors=None):
+        """写入{(行, 列): 值或=公式}，重算受影响的公式并写回表格存储
+
+        返回值发生变化的{(行, 列): 新值}。配置了操作历史时，写入的单元格和值
+        发生变化的单元格记入历史，authors为{(行, 列): 用户id}。与SheetStorage
+        一样不提交事务。
+        """
+        from application.models.sheet import SheetFormula
+        from application.services.sheet_storage import SheetStorage
+        session = self.db.session
+        engine = self.engine(sheet)
+        changed = engine.set_cells(cells)
+
+        keys = list(cells)
+        session.execute(delete(SheetFormula).where(
+            SheetFormula.sheet_id == sheet.id,
+            tuple_(SheetFormula.row, SheetFormula.col).in_(keys)))
+        formulas = [{'sheet_id': sheet.id, 'row': row, 'col': col, 'source': engine.formulas[row, col].source}
+                    for row, col in keys if (row, col) in engine.formulas]
+        if formulas:
+            session.execute(insert(SheetFormula), formulas)
+        SheetStorage(sheet).write_cells({cell: str(value) if isinstance(value, FormulaError) else value
+                                         for cell, value in changed.items()})
+        if self.history is not None:
+            logged = {cell: engine.get(*cell) for cell in (*cells, *changed)}
+            sources = {cell: engine.formulas[cell].source for cell in logged if cell in engine.formulas}
+            self.history.record(sheet, logged, sources, authors)
+        session.info.setdefault('sheet_engines', {})[sheet.revision] = engine
+        return changed
+
+    def _after_commit(self, session):
+        engines = session.info.pop('sheet_engines', None)
+        if not engines:
+            return
+        with self._lock:
+            for revision, engine in engines.items():
+                self._engines[revision] = engine
+            while len(self._engines) > self.maxsize:
+                self._engines.popitem(last=False)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('sheet_engines', None)
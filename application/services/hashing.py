@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+# 轮数与耗时近似线性、可按目标耗时校准的算法
+CALIBRATABLE_SCHEMES = ('pbkdf2_sha256', 'pbkdf2_sha512', 'sha256_crypt', 'sha512_crypt')
+
+# 子进程内的哈希上下文，由进程池initializer创建
+_worker_context = None
+
+
+def _init_worker(context_config):
+    global _worker_context
+    _worker_context = CryptContext.from_string(context_config)
+
+
+def _call_worker(method, args, kwargs):
+    return getattr(_worker_context, method)(*args, **kwargs)
+
+
+def _gevent_patched():
+    # 打过补丁的进程必然已导入gevent；未导入时不为检查而导入它（约15ms启动耗时）
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def calibrate_rounds(scheme, target_ms, probe_rounds=10000, samples=3):
+    """估算使单次哈希耗时约为target_ms毫秒的轮数"""
+    handler = get_crypt_handler(scheme)
+    probe = handler.using(rounds=probe_rounds)
+    elapsed = min(_time_hash(probe) for _ in range(samples))
+    rounds = int(probe_rounds * target_ms / 1000.0 / elapsed)
+    # 取整到1000，便于在配置和日志中辨认
+    rounds = max(1000, rounds // 1000 * 1000)
+    return max(handler.min_rounds, min(rounds, handler.max_rounds))
+
+
+def _time_hash(handler):
+    start = time.perf_counter()
+    handler.hash('calibration-password')
+    return time.perf_counter() - start
+
+
+class PooledPasswordContext:
+    """CryptContext代理：hash/verify/verify_and_update在有界池中执行
+
+    gevent下使用真实线程池，pbkdf2在OpenSSL中计算时释放GIL，事件循环不被阻塞；
+    其余属性（identify、needs_update等廉价操作）直接转发给原上下文。
+    """
+
+    def __init__(self, context, mode='thread', size=None):
+        self.context = context
+        self.mode = mode
+        self.size = size or os.cpu_count() or 1
+        self._pool = None
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+    def hash(self, secret, **kwargs):
+        return self._run('hash', secret, **kwargs)
+
+    def verify(self, secret, hash, **kwargs):
+        return self._run('verify', secret, hash, **kwargs)
+
+    def verify_and_update(self, secret, hash, **kwargs):
+        return self._run('verify_and_update', secret, hash, **kwargs)
+
+    def _run(self, method, *args, **kwargs):
+        if self.mode == 'none':
+            return getattr(self.context, method)(*args, **kwargs)
+        pool = self._get_pool()
+        if self.mode == 'gevent':
+            return pool.apply(getattr(self.context, method), args, kwargs)
+        if self.mode == 'process':
+            return pool.submit(_call_worker, method, args, kwargs).result()
+        return pool.submit(getattr(self.context, method), *args, **kwargs).result()
+
+    def _get_pool(self):
+        # 延迟创建，避免gunicorn预加载后fork出的worker继承失效的线程/进程
+        if self._pool is None:
+            if self.mode == 'gevent':
+                from gevent.threadpool import ThreadPool
+                self._pool = ThreadPool(self.size)
+            elif self.mode == 'process':
+                self._pool = ProcessPoolExecutor(self.size, initializer=_init_worker,
+                                                 initargs=(self.context.to_string(),))
+            else:
+                self._pool = ThreadPoolExecutor(self.size, thread_name_prefix='password-hash')
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is None:
+            return
+        if self.mode == 'gevent':
+            self._pool.kill()
+        else:
+            self._pool.shutdown(wait=False)
+        self._pool = None
+
+
+class PasswordHasher:
+    """密码哈希服务
+
+    使用PASSWORD_HASH_ROUNDS或按PASSWORD_HASH_TARGET_MS校准得到的轮数，
+    并以该值作为min_rounds：旧哈希在登录验证通过后会被Flask-Security
+    自动重新哈希。需在security.init_app之后初始化。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        state = app.extensions['security']
+        context = state.pwd_context
+        if isinstance(context, PooledPasswordContext):
+            context = context.context
+
+        scheme = app.config['SECURITY_PASSWORD_HASH']
+        target_ms = app.config.get('PASSWORD_HASH_TARGET_MS')
+        rounds = app.config.get('PASSWORD_HASH_ROUNDS')
+        if not rounds and target_ms and scheme in CALIBRATABLE_SCHEMES:
+            # 多个worker各自校准会得到不同轮数，生产环境应预先校准并固定PASSWORD_HASH_ROUNDS
+            rounds = calibrate_rounds(scheme, target_ms)
+            app.logger.info('密码哈希 %s 校准为 %d 轮（目标 %sms）', scheme, rounds, target_ms)
+        if rounds and scheme in CALIBRATABLE_SCHEMES:
+            context = context.copy(**{
+                f'{scheme}__default_rounds': rounds,
+                f'{scheme}__min_rounds': rounds,
+            })
+
+        mode = app.config.get('PASSWORD_HASH_POOL', 'thread')
+        if mode == 'thread' and _gevent_patched():
+            mode = 'gevent'
+        state.pwd_context = PooledPasswordContext(context, mode,
+                                                  app.config.get('PASSWORD_HASH_POOL_SIZE'))
+        app.extensions['password_hasher'] = {'scheme': scheme, 'rounds': rounds, 'mode': mode}
@@ -0,0 +1,210 @@
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+
+class HealthChecker:
+    """依赖健康检查
+
+    数据库（主库及各副本）、连接池饱和度、Redis和邮件服务各自作为一个探针，
+    在线程池中并发执行并受HEALTH_PROBE_TIMEOUT限制。结果在进程内缓存
+    HEALTH_CACHE_TTL秒，同一时刻只有一个请求执行探测，其余请求等待并复用
+    结果，探测洪泛不会放大到数据库上。超时的探针在结束前不会被重复提交。
+
+    critical探针失败时服务不可就绪（503），非critical探针失败只标记为degraded。
+    """
+
+    def __init__(self, app=None, db=None, redis_store=None):
+        self.db = None
+        self.redis_store = None
+        self._probes = {}
+        self._pool = None
+        self._inflight = {}
+        self._cache = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, redis_store)
+
+    def init_app(self, app, db, redis_store=None):
+        app.config.setdefault('HEALTH_CACHE_TTL', 2.0)
+        app.config.setdefault('HEALTH_PROBE_TIMEOUT', 1.0)
+        app.config.setdefault('HEALTH_POOL_SATURATION', 0.9)
+        self.db = db
+        self.redis_store = redis_store
+        if not self._probes:
+            self.register('database', self._database_probes, critical=True)
+            self.register('db_pool', self._pool_probe, critical=True)
+            self.register('redis', self._redis_probe, critical=True)
+            self.register('mail', self._mail_probe, critical=False)
+        app.extensions['health'] = self
+
+    def register(self, name, factory, critical=True):
+        """注册探针
+
+        factory在请求线程中调用（可访问应用配置），返回None表示跳过该依赖，
+        返回可调用对象或{名称: 可调用对象}；这些可调用对象在线程池中执行，
+        成功时返回附加信息dict或None，失败时抛出异常。
+        """
+        self._probes[name] = (factory, critical)
+
+    def invalidate(self):
+        with self._lock:
+            self._cache = None
+
+    # 检查
+
+    def check(self):
+        """返回(就绪状态dict, 是否来自缓存)"""
+        ttl = current_app.config['HEALTH_CACHE_TTL']
+        cached = self._fresh(ttl)
+        if cached is not None:
+            return cached, True
+        with self._lock:
+            # 等锁期间其他请求可能已刷新
+            cached = self._fresh(ttl)
+            if cached is not None:
+                return cached, True
+            result = self._run()
+            self._cache = (current_app._get_current_object(), time.monotonic(), result)
+        return result, False
+
+    def _fresh(self, ttl):
+        cache = self._cache
+        if cache is not None and cache[0] is current_app._get_current_object() \
+                and time.monotonic() - cache[1] < ttl:
+            return cache[2]
+        return None
+
+    def _run(self):
+        timeout = current_app.config['HEALTH_PROBE_TIMEOUT']
+        checks = {}
+        tasks = {}
+        critical_names = set()
+        for name, (factory, critical) in self._probes.items():
+            try:
+                probes = factory()
+            except Exception as e:
+                checks[name] = {'status': 'fail', 'error': str(e)}
+                if critical:
+                    critical_names.add(name)
+                continue
+            if probes is None:
+                checks[name] = {'status': 'skipped'}
+                continue
+            if callable(probes):
+                probes = {name: probes}
+            for check_name, probe in probes.items():
+                if critical:
+                    critical_names.add(check_name)
+                tasks[check_name] = probe
+
+        futures = {}
+        for name, probe in tasks.items():
+            previous = self._inflight.get(name)
+            if previous is not None and not previous.done():
+                # 上次的探测仍未结束，不再叠加新的
+                checks[name] = {'status': 'timeout', 'latency_ms': None,
+                                'error': '上一次探测尚未结束'}
+                continue
+            futures[name] = self._inflight[name] = self._get_pool().submit(_timed, probe)
+
+        wait(futures.values(), timeout=timeout)
+        for name, future in futures.items():
+            if not future.done():
+                checks[name] = {'status': 'timeout', 'latency_ms': round(timeout * 1000, 1)}
+                continue
+            self._inflight.pop(name, None)
+            checks[name] = future.result()
+
+        failed = [name for name, check in checks.items() if check['status'] not in ('ok', 'skipped')]
+        if any(name in critical_names for name in failed):
+            status = 'fail'
+        elif failed:
+            status = 'degraded'
+        else:
+            status = 'ok'
+        return {'status': status, 'checks': checks}
+
+    def _get_pool(self):
+        # 延迟创建，避免gunicorn预加载后fork出的worker继承失效的线程
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(8, thread_name_prefix='health-probe')
+        return self._pool
+
+    # 内置探针
+
+    def _database_probes(self):
+        probes = {}
+        for key, engine in self.db.engines.items():
+            probes['database' if key is None else f'database:{key}'] = _engine_probe(engine)
+        return probes
+
+    def _pool_probe(self):
+        pool = self.db.engine.pool
+        if not isinstance(pool, QueuePool):
+            return None
+        limit = current_app.config['HEALTH_POOL_SATURATION']
+
+        def probe():
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            checked_out = pool.checkedout()
+            saturation = checked_out / capacity if capacity else 0.0
+            info = {'checked_out': checked_out, 'capacity': capacity,
+                    'saturation': round(saturation, 3)}
+            if pool._max_overflow >= 0 and saturation >= limit:
+                raise ProbeError('连接池已饱和', info)
+            return info
+        return probe
+
+    def _redis_probe(self):
+        client = self.redis_store.client if self.redis_store is not None else None
+        if client is None:
+            return None
+        return client.ping
+
+    def _mail_probe(self):
+        config = current_app.config
+        if config.get('MAIL_SUPPRESS_SEND', config.get('TESTING')):
+            return None
+        host, port = config['MAIL_SERVER'], config['MAIL_PORT']
+        use_ssl, timeout = config['MAIL_USE_SSL'], config['HEALTH_PROBE_TIMEOUT']
+
+        def probe():
+            smtp_class = smtplib.SMTP_SSL if use_ssl else smtplib.SMTP
+            with smtp_class(host, port, timeout=timeout) as smtp:
+                smtp.noop()
+        return probe
+
+
+class ProbeError(Exception):
+    """探针失败，附带要在结果中返回的信息"""
+
+    def __init__(self, message, info=None):
+        super().__init__(message)
+        self.info = info or {}
+
+
+def _engine_probe(engine):
+    def probe():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    return probe
+
+
+def _timed(probe):
+    start = time.perf_counter()
+    try:
+        info = probe()
+    except ProbeError as e:
+        result = dict(e.info, status='fail', error=str(e))
+    except Exception as e:
+        result = {'status': 'fail', 'error': f'{type(e).__name__}: {e}'}
+    else:
+        result = dict(info, status='ok') if isinstance(info, dict) else {'status': 'ok'}
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
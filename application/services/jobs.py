@@ -0,0 +1,243 @@
+import importlib
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from redis import RedisError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# 任务队列：io为等待网络/数据库为主的任务（邮件、导出），适合gevent池高并发；
+# cpu为解析、编码、密码哈希等计算任务，适合prefork池每核一个进程
+QUEUES = ('io', 'cpu')
+
+# 默认视为瞬时故障、值得重试的异常
+TRANSIENT_ERRORS = (OperationalError, RedisError, ConnectionError, TimeoutError)
+
+# worker启动时导入以注册任务的模块
+TASK_MODULES = ('application.services.sheet_import', 'application.services.user_import',
+                'application.services.mail_outbox')
+
+# job_task/task登记的任务，创建Celery实例时注册：{任务名: TaskSpec}
+_TASKS = {}
+
+
+class JobFailed(Exception):
+    """任务以失败结束（不重试），消息记入Job.error"""
+
+
+class TaskSpec:
+    """登记的后台任务，投递时才解析为当前应用的Celery任务
+
+    导入celery/kombu约需上百毫秒，Web进程和CLI命令在第一次投递任务前不导入。
+    """
+
+    def __init__(self, run, name, queue, options):
+        self.run = run
+        self.name = name
+        self.queue = queue
+        self.options = options
+        self.__doc__ = run.__doc__
+
+    def apply_async(self, args=(), kwargs=None, **options):
+        celery = current_app.extensions['jobs'].celery_app(current_app)
+        return celery.tasks[self.name].apply_async(args=args, kwargs=kwargs, **options)
+
+
+def _register(run, name, queue, options):
+    _TASKS[name] = TaskSpec(run, name, queue, options)
+    return _TASKS[name]
+
+
+class Jobs:
+    """Celery后台任务扩展
+
+    每个应用在第一次投递任务（或worker启动）时创建一个Celery实例，任务在该
+    应用的上下文中执行，与请求使用同一套配置和扩展；worker通过 celery -A worker
+    加载同一个应用。任务的状态、进度和结果记在jobs表中供轮询，不需要结果后端。
+
+    未配置CELERY_BROKER_URL时使用内存broker并同步执行任务
+    （CELERY_TASK_ALWAYS_EAGER），开发和测试无需任何外部服务。
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        broker = app.config.setdefault('CELERY_BROKER_URL', None)
+        if app.config.get('CELERY_TASK_ALWAYS_EAGER') is None:
+            app.config['CELERY_TASK_ALWAYS_EAGER'] = not broker
+        app.config.setdefault('JOB_MAX_RETRIES', 3)
+        app.config.setdefault('JOB_RETRY_BACKOFF', 2)
+        app.config.setdefault('CELERY_BEAT_SCHEDULE', {})
+        app.extensions['jobs'] = self
+
+    def celery_app(self, app):
+        """返回应用的Celery实例，第一次调用时创建并注册全部任务"""
+        celery = app.extensions.get('celery')
+        if celery is None:
+            celery = app.extensions['celery'] = _make_celery(app)
+        for spec in _TASKS.values():
+            # 在Celery实例创建之后才定义的任务（如测试模块中的）
+            if spec.name not in celery.tasks:
+                celery.task(spec.run, name=spec.name, queue=spec.queue, **spec.options)
+        return celery
+
+    def find(self, key):
+        """按幂等键查找任务"""
+        from application.models.job import Job
+        return self.db.session.execute(select(Job).where(Job.idempotency_key == key)).scalar()
+
+    def submit(self, task, *args, key=None, user=None, total=0, job_id=None, **kwargs):
+        """创建Job记录并把任务投递到其队列，返回Job
+
+        key为幂等键：已有同键且未失败的任务时直接返回该任务，不再入队。
+        同步执行模式下返回时任务已经结束。
+        """
+        from application.models.job import Job
+        session = self.db.session
+        if key is not None:
+            existing = self.find(key)
+            if existing is not None:
+                if existing.status != Job.FAILED:
+                    return existing
+                # 失败的任务释放幂等键，允许用同一个键重新提交
+                existing.idempotency_key = None
+        job = Job(id=job_id or uuid.uuid4().hex, name=task.name, queue=task.queue or 'io',
+                  idempotency_key=key, user_id=user.id if user is not None else None,
+                  progress_total=total)
+        session.add(job)
+        try:
+            session.commit()
+        except IntegrityError:
+            # 并发提交了同一个幂等键
+            session.rollback()
+            return self.find(key)
+        try:
+            task.apply_async(args=(job.id, *args), kwargs=kwargs, task_id=job.id)
+        except Exception as e:
+            session.rollback()
+            job.status = Job.FAILED
+            job.error = f'入队失败: {type(e).__name__}: {e}'
+            session.commit()
+            raise
+        # 同步执行模式下任务已在另一个会话中更新了记录
+        session.expire(job)
+        return job
+
+
+def _make_celery(app):
+    from celery import Celery, Task
+    from kombu import Queue
+
+    class AppTask(Task):
+        """在创建该Celery实例的Flask应用上下文中执行的任务"""
+
+        def __call__(self, *args, **kwargs):
+            with self.app.flask_app.app_context():
+                return self.run(*args, **kwargs)
+
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+    config = app.config
+    celery = Celery(app.import_name, task_cls=AppTask)
+    celery.conf.update(
+        broker_url=config['CELERY_BROKER_URL'] or 'memory://',
+        broker_connection_retry_on_startup=True,
+        task_always_eager=config['CELERY_TASK_ALWAYS_EAGER'],
+        task_ignore_result=True,
+        task_default_queue='io',
+        task_queues=[Queue(name) for name in QUEUES],
+        # 执行完才确认，worker中途退出时消息重新投递（任务须幂等）
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        worker_prefetch_multiplier=1,
+        beat_schedule=config['CELERY_BEAT_SCHEDULE'],
+    )
+    celery.flask_app = app
+    celery.set_default()
+    return celery
+
+
+def task(queue='io', **options):
+    """把函数登记为普通后台任务（不跟踪Job），通过返回对象的apply_async投递"""
+    if queue not in QUEUES:
+        raise ValueError(f'未知队列: {queue}')
+
+    def decorator(func):
+        return _register(func, f'{func.__module__}.{func.__name__}', queue, options)
+    return decorator
+
+
+def job_task(queue='io', retry_on=TRANSIENT_ERRORS, **options):
+    """把函数登记为跟踪Job状态的后台任务，通过Jobs.submit投递
+
+    函数的第一个参数为Job，其余参数须可JSON序列化；返回值保存为Job.result。
+    retry_on中的异常按JOB_RETRY_BACKOFF指数退避重试，最多JOB_MAX_RETRIES次；
+    其他异常和JobFailed直接把任务记为失败。已结束的任务被重复投递时不再执行，
+    未结束的任务重新执行时函数须能安全地从头（或从Job记录的进度）重做。
+    """
+    if queue not in QUEUES:
+        raise ValueError(f'未知队列: {queue}')
+
+    def decorator(func):
+        def run(self, job_id, *args, **kwargs):
+            return _run_job(self, func, retry_on, job_id, args, kwargs)
+        run.__doc__ = func.__doc__
+        return _register(run, f'{func.__module__}.{func.__name__}', queue, dict(options, bind=True))
+    return decorator
+
+
+def _run_job(task, func, retry_on, job_id, args, kwargs):
+    from application import db
+    from application.models.job import Job
+    job = db.session.get(Job, job_id)
+    if job is None:
+        current_app.logger.warning('任务记录不存在: %s', job_id)
+        return None
+    if job.status in Job.FINISHED:
+        return job.result
+    job.status = Job.RUNNING
+    job.attempts += 1
+    job.started_at = job.started_at or datetime.utcnow()
+    db.session.commit()
+
+    try:
+        result = func(job, *args, **kwargs)
+    except retry_on as e:
+        db.session.rollback()
+        config = current_app.config
+        retries = task.request.retries
+        if retries < config['JOB_MAX_RETRIES']:
+            job.status = Job.RETRYING
+            job.error = f'{type(e).__name__}: {e}'
+            db.session.commit()
+            raise task.retry(exc=e, countdown=config['JOB_RETRY_BACKOFF'] * 2 ** retries,
+                             max_retries=config['JOB_MAX_RETRIES'])
+        _fail(job, e)
+        return None
+    except Exception as e:
+        db.session.rollback()
+        _fail(job, e)
+        return None
+
+    job.status = Job.DONE
+    job.result = result
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return result
+
+
+def _fail(job, error):
+    from application import db
+    from application.models.job import Job
+    if not isinstance(error, JobFailed):
+        current_app.logger.error('后台任务失败: %s %s', job.name, job.id, exc_info=error)
+    job.status = Job.FAILED
+    job.error = str(error) if isinstance(error, JobFailed) else f'{type(error).__name__}: {error}'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
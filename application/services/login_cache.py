@@ -0,0 +1,185 @@
+import json
+from datetime import datetime
+
+from flask_security.utils import set_request_attr
+from redis import RedisError
+from sqlalchemy import DateTime, event, inspect, select
+from sqlalchemy.orm import make_transient_to_detached, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+# 不写入缓存的用户列：密码哈希不离开数据库，需要时由会话按需加载
+EXCLUDED_COLUMNS = frozenset(['password'])
+
+
+class LoginCache:
+    """Flask-Security用户加载器的缓存
+
+    会话中保存的fs_uniquifier经缓存还原为用户及其角色，命中时不访问数据库：
+    缓存的列值和角色构造为游离对象后加入当前会话，未缓存的属性（如密码）在访问时才按需加载。
+
+    键中包含权限版本号，角色或权限变化时随版本号整体失效；用户本身的任何
+    变更（包括fs_uniquifier轮换、停用）在提交后删除该用户旧的和新的键。
+    未配置Redis时不缓存：进程内缓存无法在其他worker中失效，停用或轮换后的
+    身份会在那里继续有效直到过期，因此每个请求都从数据库加载用户。
+    """
+
+    KEY = 'login:user:{version}:{uniquifier}'
+
+    def __init__(self, app=None, db=None, redis_store=None, permission_cache=None):
+        self.db = None
+        self.redis_store = None
+        self.permission_cache = None
+        self.ttl = 300
+        if app is not None:
+            self.init_app(app, db, redis_store, permission_cache)
+
+    def init_app(self, app, db, redis_store=None, permission_cache=None):
+        """在security.init_app之后调用，替换Flask-Login的用户加载器"""
+        self.ttl = app.config.get('LOGIN_CACHE_TTL', self.ttl)
+        self.redis_store = redis_store
+        self.permission_cache = permission_cache
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        app.login_manager.user_loader(self.load_user)
+        app.extensions['login_cache'] = self
+
+    @property
+    def redis(self):
+        return self.redis_store.client if self.redis_store is not None else None
+
+    def _key(self, uniquifier):
+        version = self.permission_cache.current_version() if self.permission_cache else 0
+        return self.KEY.format(version=version, uniquifier=uniquifier)
+
+    # 用户加载
+
+    def load_user(self, user_id):
+        """Flask-Login的user_loader，语义同Flask-Security的_user_loader"""
+        uniquifier = str(user_id)
+        if self.redis is None:
+            user = self._load_from_db(uniquifier)
+            if user is None:
+                return None
+        else:
+            key = self._key(uniquifier)
+            data = self._get(key)
+            if data is None:
+                user = self._load_from_db(uniquifier)
+                if user is None:
+                    return None
+                self._set(key, _serialize(user))
+            else:
+                user = self._restore(data)
+        if not user.active:
+            return None
+        set_request_attr('fs_authn_via', 'session')
+        return user
+
+    def _load_from_db(self, uniquifier):
+        from application.models.user import User, Role
+        return self.db.session.execute(
+            select(User).options(selectinload(User.roles).selectinload(Role.permissions))
+            .where(User.fs_uniquifier == uniquifier)).scalar_one_or_none()
+
+    def _restore(self, data):
+        """把缓存数据还原为当前会话中的持久化对象"""
+        from application.models.user import User, Role, Permission
+        session = self.db.session()
+        user = session.identity_map.get(session.identity_key(User, data['user']['id']))
+        if user is not None:
+            return user
+
+        def restore(model, values):
+            obj = session.identity_map.get(session.identity_key(model, values['id']))
+            if obj is not None:
+                return obj, False
+            obj = model(**values)
+            make_transient_to_detached(obj)
+            return obj, True
+
+        roles = []
+        for values in data['roles']:
+            values = dict(values)
+            permissions = values.pop('permissions')
+            role, created = restore(Role, values)
+            if created:
+                # 作为已加载的值写入，不产生变更历史和反向引用事件
+                set_committed_value(role, 'permissions',
+                                    [restore(Permission, p)[0] for p in permissions])
+            roles.append(role)
+        user = User(**_decode_columns(User, data['user']))
+        make_transient_to_detached(user)
+        set_committed_value(user, 'roles', roles)
+        # 游离对象加入会话即成为持久化对象，不发出SQL
+        session.add(user)
+        return user
+
+    # 缓存读写
+
+    def _get(self, key):
+        try:
+            value = self.redis.get(key)
+        except RedisError:
+            return None
+        return json.loads(value) if value is not None else None
+
+    def _set(self, key, data):
+        try:
+            self.redis.set(key, json.dumps(data), ex=self.ttl)
+        except RedisError:
+            pass
+
+    def invalidate(self, *uniquifiers):
+        """删除指定fs_uniquifier的缓存"""
+        client = self.redis
+        keys = [self._key(uniquifier) for uniquifier in uniquifiers if uniquifier]
+        if client is None or not keys:
+            return
+        try:
+            client.delete(*keys)
+        except RedisError:
+            pass
+
+    # 会话事件
+
+    def _after_flush(self, session, flush_context):
+        from application.models.user import User
+        stale = session.info.setdefault('login_cache_stale', set())
+        for obj in (*session.dirty, *session.deleted):
+            if isinstance(obj, User):
+                history = inspect(obj).attrs.fs_uniquifier.history
+                stale.update(history.deleted or ())
+                stale.add(obj.fs_uniquifier)
+
+    def _after_commit(self, session):
+        stale = session.info.pop('login_cache_stale', None)
+        if stale:
+            self.invalidate(*stale)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('login_cache_stale', None)
+
+
+def _serialize(user):
+    columns = {}
+    for column in user.__table__.columns:
+        if column.key in EXCLUDED_COLUMNS:
+            continue
+        value = getattr(user, column.key)
+        columns[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    # Flask-Security每个请求都会读取角色的权限（身份加载），一并缓存
+    roles = [{'id': role.id, 'name': role.name, 'description': role.description,
+              'permissions': [{'id': p.id, 'name': p.name, 'description': p.description}
+                              for p in role.permissions]}
+             for role in user.roles]
+    return {'user': columns, 'roles': roles}
+
+
+def _decode_columns(model, values):
+    columns = model.__table__.columns
+    return {key: datetime.fromisoformat(value)
+            if value is not None and isinstance(columns[key].type, DateTime) else value
+            for key, value in values.items()}
@@ -0,0 +1,284 @@
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.utils import formataddr
+
+from flask import current_app
+from flask_mail import Connection
+from flask_security.mail_util import MailUtil
+from sqlalchemy import and_, event, func, or_, select, update
+
+from application.services.jobs import task
+
+
+class _Connection(Connection):
+    """Flask-Mail的SMTP连接，增加套接字超时，避免慢MTA无限期阻塞发送者"""
+
+    def __init__(self, mail, timeout):
+        super().__init__(mail)
+        self.timeout = timeout
+
+    def configure_host(self):
+        smtp = smtplib.SMTP_SSL if self.mail.use_ssl else smtplib.SMTP
+        host = smtp(self.mail.server, self.mail.port, timeout=self.timeout)
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
+
+
+def _is_permanent(error):
+    """5xx应答（含全部收件人被拒）为永久失败，不再重试"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class MailOutbox:
+    """发件箱：邮件先写入mail_outbox表，由后台发送者批量发送
+
+    enqueue只在当前事务中插入一行，请求不等待SMTP。事务提交后唤醒发送者：
+    配置了Celery broker时投递io队列的deliver_outbox任务（另由celery beat每
+    MAIL_OUTBOX_POLL_SECONDS秒触发一次，处理到期的重试），否则由进程内的
+    后台线程发送。
+
+    发送者每次认领最多MAIL_OUTBOX_BATCH_SIZE封到期邮件，复用一个SMTP连接
+    逐封发送，按MAIL_RATE_LIMIT（封/秒，每个发送者）限速。4xx应答和连接
+    错误按MAIL_RETRY_BACKOFF秒指数退避重试，超过MAIL_MAX_ATTEMPTS次或5xx
+    应答记为失败。认领通过带标记的条件UPDATE完成，多个发送者不会重复认领；
+    每封邮件发送后立即提交状态，发送者中途退出最多重发一封。
+
+    进程内的后台线程在本进程的第一个请求时启动（而不只是在有新邮件时），
+    重启或部署前积压的邮件和到期的重试不必等到下一封新邮件。
+    """
+
+    def __init__(self, app=None, db=None, metrics=None):
+        self.db = None
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._thread = None
+        self._app = None
+        self._next_send = 0.0
+        if app is not None:
+            self.init_app(app, db, metrics)
+
+    def init_app(self, app, db, metrics=None):
+        config = app.config
+        config.setdefault('MAIL_OUTBOX_BATCH_SIZE', 100)
+        config.setdefault('MAIL_RATE_LIMIT', 10)
+        config.setdefault('MAIL_MAX_ATTEMPTS', 5)
+        config.setdefault('MAIL_RETRY_BACKOFF', 30)
+        config.setdefault('MAIL_OUTBOX_POLL_SECONDS', 30)
+        config.setdefault('MAIL_OUTBOX_LEASE_SECONDS', 300)
+        config.setdefault('MAIL_TIMEOUT', 30)
+        sender = config.setdefault('MAIL_OUTBOX_SENDER', 'auto')
+        if sender == 'auto':
+            config['MAIL_OUTBOX_SENDER'] = 'thread' if config.get('CELERY_TASK_ALWAYS_EAGER', True) else 'celery'
+
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        # 由Jobs在创建Celery实例时写入beat_schedule
+        config.setdefault('CELERY_BEAT_SCHEDULE', {})['deliver-outbox'] = {
+            'task': deliver_outbox.name, 'schedule': config['MAIL_OUTBOX_POLL_SECONDS']}
+        if metrics is not None:
+            metrics.register_gauge('mail_outbox_messages', '发件箱中未发送完成的邮件数',
+                                   self.depth, label='status')
+            metrics.register_gauge('mail_outbox_oldest_pending_seconds', '最早一封待发送邮件的等待秒数',
+                                   self.oldest_pending_age)
+        app.before_request(self._before_request)
+        app.extensions['mail_outbox'] = self
+
+    # 写入
+
+    def enqueue(self, subject, recipients, body=None, html=None, sender=None, template=None):
+        """把邮件写入发件箱（不提交事务），提交后由后台发送者发送"""
+        from application.models.mail import OutboxMessage
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        if isinstance(sender, tuple):
+            sender = formataddr((str(sender[0]), str(sender[1])))
+        message = OutboxMessage(subject=str(subject)[:255], recipients=list(recipients), body=body, html=html,
+                                sender=str(sender or current_app.config['MAIL_DEFAULT_SENDER']),
+                                template=template)
+        session = self.db.session
+        session.add(message)
+        session.info['mail_outbox_wake'] = True
+        return message
+
+    def _after_commit(self, session):
+        if session.info.pop('mail_outbox_wake', False):
+            self.wake()
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('mail_outbox_wake', None)
+
+    # 发送
+
+    def wake(self):
+        """通知发送者有新邮件"""
+        mode = current_app.config['MAIL_OUTBOX_SENDER']
+        if mode == 'celery':
+            deliver_outbox.apply_async()
+        elif mode == 'thread':
+            self._start_thread()
+            self._wake_event.set()
+
+    def _before_request(self):
+        if self._thread is None and current_app.config['MAIL_OUTBOX_SENDER'] == 'thread':
+            self._start_thread()
+
+    def _start_thread(self):
+        with self._lock:
+            self._app = current_app._get_current_object()
+            if self._thread is None:
+                # 延迟到请求中启动，避免gunicorn预加载后fork出的worker继承失效的线程；
+                # 启动后立即发送一次积压的邮件
+                self._thread = threading.Thread(target=self._send_loop, name='mail-outbox', daemon=True)
+                self._thread.start()
+                self._wake_event.set()
+
+    def _send_loop(self):
+        while True:
+            self._wake_event.wait(self._app.config['MAIL_OUTBOX_POLL_SECONDS'])
+            self._wake_event.clear()
+            # 等待期间可能换成了唤醒者的应用
+            app = self._app
+            with app.app_context():
+                try:
+                    self.send_all()
+                except Exception:
+                    app.logger.exception('发件箱发送失败')
+
+    def send_all(self):
+        """发送全部到期的邮件，返回认领的邮件数"""
+        total = 0
+        while True:
+            claimed = self.send_pending()
+            if not claimed:
+                return total
+            total += claimed
+
+    def send_pending(self, limit=None):
+        """认领一批到期的邮件并通过一个SMTP连接发送，返回认领的邮件数"""
+        from application.models.mail import OutboxMessage
+        session = self.db.session
+        config = current_app.config
+        messages = self._claim(limit or config['MAIL_OUTBOX_BATCH_SIZE'])
+        if not messages:
+            return 0
+        remaining = list(messages)
+        connection = _Connection(current_app.extensions['mail'], config['MAIL_TIMEOUT'])
+        try:
+            with connection:
+                while remaining:
+                    message = remaining[0]
+                    self._throttle(config['MAIL_RATE_LIMIT'])
+                    try:
+                        connection.send(message.to_message())
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except smtplib.SMTPException as e:
+                        if getattr(e, 'smtp_code', None) == 421:
+                            # 服务端关闭连接
+                            raise
+                        # 单封邮件被拒，连接仍可继续使用
+                        self._failed(message, e)
+                    else:
+                        message.status = OutboxMessage.SENT
+                        message.sent_at = datetime.utcnow()
+                        message.attempts += 1
+                        message.last_error = None
+                    remaining.pop(0)
+                    session.commit()
+        except OSError as e:
+            # 连接失败或中断（SMTPException也是OSError的子类）：未发送的邮件整体按退避重试
+            if remaining:
+                current_app.logger.warning('SMTP连接失败，%d封邮件稍后重试: %s', len(remaining), e)
+            for message in remaining:
+                self._failed(message, e)
+            session.commit()
+        return len(messages)
+
+    def _claim(self, limit):
+        from application.models.mail import OutboxMessage
+        session = self.db.session
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=current_app.config['MAIL_OUTBOX_LEASE_SECONDS'])
+        due = or_(and_(OutboxMessage.status == OutboxMessage.PENDING, OutboxMessage.next_attempt_at <= now),
+                  and_(OutboxMessage.status == OutboxMessage.SENDING, OutboxMessage.claimed_at < stale))
+        ids = session.execute(select(OutboxMessage.id).where(due)
+                              .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(limit)).scalars().all()
+        if not ids:
+            session.commit()
+            return []
+        token = uuid.uuid4().hex
+        session.execute(update(OutboxMessage).where(OutboxMessage.id.in_(ids), due)
+                        .values(status=OutboxMessage.SENDING, claimed_by=token, claimed_at=now)
+                        .execution_options(synchronize_session=False))
+        session.commit()
+        return session.execute(select(OutboxMessage).where(OutboxMessage.claimed_by == token)
+                               .order_by(OutboxMessage.id)).scalars().all()
+
+    def _failed(self, message, error):
+        from application.models.mail import OutboxMessage
+        config = current_app.config
+        message.attempts += 1
+        message.last_error = f'{type(error).__name__}: {error}'[:2000]
+        if _is_permanent(error) or message.attempts >= config['MAIL_MAX_ATTEMPTS']:
+            message.status = OutboxMessage.FAILED
+            current_app.logger.error('邮件发送失败: %s -> %s: %s', message.id, message.recipients, error)
+        else:
+            message.status = OutboxMessage.PENDING
+            message.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=config['MAIL_RETRY_BACKOFF'] * 2 ** (message.attempts - 1))
+
+    def _throttle(self, rate):
+        if not rate:
+            return
+        now = time.monotonic()
+        if self._next_send > now:
+            time.sleep(self._next_send - now)
+            now = self._next_send
+        self._next_send = now + 1.0 / rate
+
+    # 指标
+
+    def depth(self):
+        """各状态（不含已发送）的邮件数"""
+        from application.models.mail import OutboxMessage
+        counts = dict(self.db.session.execute(
+            select(OutboxMessage.status, func.count())
+            .where(OutboxMessage.status != OutboxMessage.SENT)
+            .group_by(OutboxMessage.status)).all())
+        return {status: counts.get(status, 0)
+                for status in (OutboxMessage.PENDING, OutboxMessage.SENDING, OutboxMessage.FAILED)}
+
+    def oldest_pending_age(self):
+        from application.models.mail import OutboxMessage
+        oldest = self.db.session.execute(
+            select(func.min(OutboxMessage.created_at))
+            .where(OutboxMessage.status.in_((OutboxMessage.PENDING, OutboxMessage.SENDING)))).scalar()
+        return (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+
+
+class OutboxMailUtil(MailUtil):
+    """Flask-Security的邮件发送改为写入发件箱并提交"""
+
+    def send_mail(self, template, subject, recipient, sender, body, html, **kwargs):
+        outbox = current_app.extensions['mail_outbox']
+        outbox.enqueue(subject, [recipient], body=body, html=html, sender=sender, template=template)
+        outbox.db.session.commit()
+
+
+@task('io', ignore_result=True)
+def deliver_outbox():
+    """发送发件箱中到期的邮件"""
+    current_app.extensions['mail_outbox'].send_all()
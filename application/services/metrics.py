@@ -0,0 +1,254 @@
+import heapq
+import os
+import random
+import sys
+import time
+from contextvars import ContextVar
+
+from flask import Response, current_app, request, template_rendered, before_render_template
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+# 请求耗时桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 单条SQL耗时桶（秒）
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ALLOCATION_BUCKETS = (0, 100, 1000, 10000, 100000, 1000000)
+
+# 不统计的端点
+SKIP_ENDPOINTS = frozenset(['static', 'metrics'])
+
+# 当前请求的统计；SQL事件每条语句都会触发，ContextVar比g和has_request_context廉价得多
+_current_stats = ContextVar('request_metrics', default=None)
+
+
+class _GaugeCollector:
+    """按需求值的仪表：采集时调用回调，回调返回数值或{标签值: 数值}"""
+
+    def __init__(self):
+        self.gauges = {}
+
+    def collect(self):
+        for name, (documentation, label, func) in self.gauges.items():
+            try:
+                value = func()
+            except Exception:
+                current_app.logger.exception('采集指标 %s 失败', name)
+                continue
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                family = GaugeMetricFamily(name, documentation, labels=[label])
+                for label_value, v in value.items():
+                    family.add_metric([str(label_value)], v)
+            else:
+                family = GaugeMetricFamily(name, documentation, value=value)
+            yield family
+
+
+class Metrics:
+    """请求级指标中间件
+
+    记录每个端点的请求耗时、每请求的SQL条数与总耗时、单条SQL耗时、模板渲染
+    耗时以及请求期间净增的内存块数，在METRICS_PATH以Prometheus文本格式导出；
+    超过METRICS_SLOW_REQUEST_MS的请求连同耗时最长的几条SQL写入警告日志。
+
+    热路径上只有计时和计数：各端点的指标子对象缓存复用，SQL语句只保存引用，
+    排序仅在慢请求时进行。sys.getallocatedblocks需遍历全部内存arena，
+    只对METRICS_ALLOCATION_SAMPLE_RATE比例的请求采样（tracemalloc开销更大）。
+    设置了PROMETHEUS_MULTIPROC_DIR时按prometheus_client多进程模式汇总各worker。
+    """
+
+    def __init__(self, app=None, db=None):
+        self.registry = CollectorRegistry(auto_describe=True)
+        self._gauges = _GaugeCollector()
+        self.registry.register(self._gauges)
+        self._children = {}
+        self._template_children = {}
+
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', '请求耗时', ['endpoint', 'method'],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.requests = Counter(
+            'http_requests', '请求数', ['endpoint', 'method', 'status'], registry=self.registry)
+        self.request_queries = Histogram(
+            'db_queries_per_request', '每个请求执行的SQL条数', ['endpoint'],
+            buckets=QUERY_COUNT_BUCKETS, registry=self.registry)
+        self.request_query_time = Histogram(
+            'db_request_query_duration_seconds', '每个请求的SQL总耗时', ['endpoint'],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.query_latency = Histogram(
+            'db_query_duration_seconds', '单条SQL耗时', buckets=QUERY_BUCKETS, registry=self.registry)
+        self.template_latency = Histogram(
+            'template_render_duration_seconds', '模板渲染耗时', ['template'],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.request_allocations = Histogram(
+            'request_allocated_blocks', '请求期间净增的内存块数', ['endpoint'],
+            buckets=ALLOCATION_BUCKETS, registry=self.registry)
+
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db=None):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        app.config.setdefault('METRICS_SLOW_REQUEST_MS', 500)
+        app.config.setdefault('METRICS_SLOW_QUERY_TOP', 5)
+        app.config.setdefault('METRICS_ALLOCATION_SAMPLE_RATE', 0.01)
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+        if db is not None:
+            # 主库和只读副本的引擎都在db.init_app中创建
+            with app.app_context():
+                engines = list(db.engines.values())
+            for engine in engines:
+                if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+            self.register_gauge('db_pool_checked_out', '已借出的数据库连接数',
+                                lambda: _pool_stat(db, 'checkedout'), label='bind')
+            self.register_gauge('db_pool_size', '数据库连接池大小',
+                                lambda: _pool_stat(db, 'size'), label='bind')
+
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.metrics_view)
+
+    def register_gauge(self, name, documentation, func, label=None):
+        """注册在采集时求值的仪表，func返回数值，或在指定label时返回{标签值: 数值}"""
+        self._gauges.gauges[name] = (documentation, label, func)
+
+    def metrics_view(self):
+        """Prometheus采集端点"""
+        registry = self.registry
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            from prometheus_client import multiprocess
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(self._gauges)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    # 请求钩子
+
+    def _before_request(self):
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        rate = current_app.config['METRICS_ALLOCATION_SAMPLE_RATE']
+        _current_stats.set(_RequestStats(bool(rate) and random.random() < rate))
+
+    def _after_request(self, response):
+        stats = _current_stats.get()
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.start
+        # 未匹配路由统一记为unmatched，避免标签基数随URL增长
+        endpoint = request.endpoint or 'unmatched'
+        key = (endpoint, request.method, response.status_code)
+        children = self._children.get(key)
+        if children is None:
+            children = self._children[key] = self._make_children(*key)
+        latency, requests, queries, query_time, allocations = children
+
+        latency.observe(elapsed)
+        requests.inc()
+        queries.observe(stats.query_count)
+        query_time.observe(stats.query_time)
+        if stats.blocks is not None:
+            allocations.observe(max(0, sys.getallocatedblocks() - stats.blocks))
+
+        if elapsed * 1000 >= current_app.config['METRICS_SLOW_REQUEST_MS']:
+            self._log_slow_request(endpoint, elapsed, stats)
+        return response
+
+    def _teardown_request(self, exc):
+        _current_stats.set(None)
+
+    def _make_children(self, endpoint, method, status):
+        return (self.request_latency.labels(endpoint, method),
+                self.requests.labels(endpoint, method, str(status)),
+                self.request_queries.labels(endpoint),
+                self.request_query_time.labels(endpoint),
+                self.request_allocations.labels(endpoint))
+
+    def _log_slow_request(self, endpoint, elapsed, stats):
+        top = heapq.nlargest(current_app.config['METRICS_SLOW_QUERY_TOP'], stats.queries,
+                             key=lambda q: q[0])
+        lines = [f'  {duration * 1000:.1f}ms  {" ".join(statement.split())[:500]}'
+                 for duration, statement in top]
+        current_app.logger.warning(
+            '慢请求 %s %s (%s) 耗时%.1fms，SQL %d条共%.1fms，模板%.1fms%s',
+            request.method, request.path, endpoint, elapsed * 1000,
+            stats.query_count, stats.query_time * 1000, stats.render_time * 1000,
+            ''.join('\n' + line for line in lines))
+
+    # 模板信号
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.render_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = _current_stats.get()
+        if stats is None or not stats.render_starts:
+            return
+        duration = time.perf_counter() - stats.render_starts.pop()
+        if not stats.render_starts:
+            # 嵌套渲染只计最外层，避免重复累计
+            stats.render_time += duration
+        name = template.name or 'string'
+        child = self._template_children.get(name)
+        if child is None:
+            child = self._template_children[name] = self.template_latency.labels(name)
+        child.observe(duration)
+
+    # SQLAlchemy引擎事件
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        self.query_latency.observe(duration)
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.query_count += 1
+            stats.query_time += duration
+            stats.queries.append((duration, statement))
+
+
+class _RequestStats:
+    __slots__ = ('start', 'blocks', 'query_count', 'query_time', 'queries',
+                 'render_time', 'render_starts')
+
+    def __init__(self, sample_allocations):
+        self.start = time.perf_counter()
+        self.blocks = sys.getallocatedblocks() if sample_allocations else None
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries = []
+        self.render_time = 0.0
+        self.render_starts = []
+
+
+def _pool_stat(db, name):
+    """各bind连接池的统计值；StaticPool等没有该统计的连接池被跳过"""
+    values = {}
+    for key, engine in db.engines.items():
+        stat = getattr(engine.pool, name, None)
+        if stat is not None:
+            values[key or 'default'] = stat()
+    return values
@@ -0,0 +1,245 @@
+import math
+import random
+import time
+import uuid
+from functools import wraps
+
+from flask import current_app, g, has_request_context, make_response, request, session
+from flask_caching import Cache
+from flask_security import current_user
+from markupsafe import Markup
+from redis import RedisError
+from sqlalchemy import event
+
+# 进程内的缓存后端：标签失效到不了其他worker
+LOCAL_CACHE_TYPES = ('SimpleCache', 'simple', 'flask_caching.backends.SimpleCache')
+
+
+class _Uncacheable(Exception):
+    """渲染结果不可缓存（非200、使用了CSRF令牌或修改了会话），携带原响应"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class PageCache:
+    """渲染结果缓存：匿名页面整页缓存、按用户的页面和模板片段缓存
+
+    缓存键包含所依赖标签的版本号。User/Role/Permission在事务提交后按表名
+    （users、roles、permissions）和实例（如users:3）使标签失效：标签换用新的
+    随机版本号，旧键不再被读取，随超时淘汰。
+
+    同一个键并发未命中时只有取得锁的请求渲染，其余请求等待其结果（最多
+    CACHE_LOCK_WAIT秒；结果不可缓存时在CACHE_LOCK_TIMEOUT秒内各自渲染）；临近过期的热点键按渲染耗时提前概率性地刷新，
+    刷新期间其他请求继续使用旧值。
+
+    配置了REDIS_URL时缓存放在Redis中，各进程共享并同步失效；否则为进程内缓存，
+    标签失效只作用于当前worker，因此不缓存依赖标签的条目（按用户的页面和片段），
+    只缓存匿名页面等不依赖标签的条目。CACHE_SHARED可显式指定后端是否共享。
+    """
+
+    TAG_KEY = 'tag:{tag}'
+    LOCK_KEY = 'lock:{key}'
+    # 持锁者渲染失败或结果不可缓存时写在键上，通知等待者各自渲染
+    UNCACHEABLE = 'uncacheable'
+
+    def __init__(self, app=None, db=None):
+        self.cache = Cache()
+        self.db = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        config = app.config
+        if config.get('REDIS_URL'):
+            config.setdefault('CACHE_TYPE', 'RedisCache')
+            config.setdefault('CACHE_REDIS_URL', config['REDIS_URL'])
+        else:
+            config.setdefault('CACHE_TYPE', 'SimpleCache')
+        config.setdefault('CACHE_SHARED', config['CACHE_TYPE'] not in LOCAL_CACHE_TYPES)
+        config.setdefault('CACHE_KEY_PREFIX', 'cache:')
+        config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        config.setdefault('CACHE_LOCK_TIMEOUT', 10)
+        config.setdefault('CACHE_LOCK_WAIT', 2.0)
+        config.setdefault('CACHE_EARLY_REFRESH_BETA', 1.0)
+        self.cache.init_app(app)
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        app.jinja_env.globals['cache_fragment'] = self.fragment
+        app.extensions['page_cache'] = self
+
+    # 标签
+
+    def tag_versions(self, tags):
+        """标签的当前版本号，请求内每个标签只读取一次"""
+        memo = g.setdefault('_cache_tag_versions', {}) if has_request_context() else {}
+        missing = [tag for tag in tags if tag not in memo]
+        if missing:
+            keys = [self.TAG_KEY.format(tag=tag) for tag in missing]
+            for tag, key, version in zip(missing, keys, self.cache.get_many(*keys)):
+                if version is None:
+                    # 标签不存在（或已被淘汰）时建立新版本，避免读到淘汰前写入的旧条目
+                    token = uuid.uuid4().hex[:12]
+                    self.cache.add(key, token, timeout=0)
+                    version = self.cache.get(key) or token
+                memo[tag] = version
+        return [memo[tag] for tag in tags]
+
+    def invalidate(self, *tags):
+        """使依赖这些标签的缓存全部失效"""
+        try:
+            self.cache.set_many({self.TAG_KEY.format(tag=tag): uuid.uuid4().hex[:12] for tag in tags}, timeout=0)
+        except RedisError as e:
+            # 失效失败时旧条目最多保留到超时
+            current_app.logger.warning('缓存标签失效失败 %s: %s', tags, e)
+        memo = g.get('_cache_tag_versions') if has_request_context() else None
+        for tag in tags if memo else ():
+            memo.pop(tag, None)
+
+    @staticmethod
+    def can_cache(tags):
+        """依赖标签的条目只在共享缓存中保存，否则其他worker中的旧条目无法失效"""
+        return not tags or current_app.config['CACHE_SHARED']
+
+    def key(self, kind, name, tags=(), vary=None):
+        versions = '.'.join(self.tag_versions(tags))
+        return f'{kind}:{name}:{vary}:{versions}'
+
+    @staticmethod
+    def user_scope():
+        """当前用户的缓存维度(vary, 标签)：用户本身及其角色、权限"""
+        if not current_user.is_authenticated:
+            return 'anonymous', ()
+        return current_user.id, (f'users:{current_user.id}', 'roles', 'permissions')
+
+    # 读取
+
+    def get_or_render(self, key, render, timeout=None):
+        """读取缓存，未命中或需要提前刷新时调用render()生成并写入"""
+        config = current_app.config
+        timeout = timeout or config['CACHE_DEFAULT_TIMEOUT']
+        cache = self.cache
+        lock = self.LOCK_KEY.format(key=key)
+        entry = cache.get(key)
+        if entry == self.UNCACHEABLE:
+            return render()
+        if entry is not None:
+            value, expires, cost = entry
+            # 提前刷新概率随临近过期和渲染耗时增大（XFetch）
+            early = cost * config['CACHE_EARLY_REFRESH_BETA'] * -math.log(1.0 - random.random())
+            if time.time() + early < expires:
+                return value
+            if not cache.add(lock, 1, timeout=config['CACHE_LOCK_TIMEOUT']):
+                # 其他请求正在刷新
+                return value
+        elif not cache.add(lock, 1, timeout=config['CACHE_LOCK_TIMEOUT']):
+            entry = self._wait(key, config['CACHE_LOCK_WAIT'])
+            if entry is not None and entry != self.UNCACHEABLE:
+                return entry[0]
+            # 持锁者的结果不可缓存，或等待超时：自行渲染但不写入，避免覆盖持锁者的结果
+            return render()
+        try:
+            start = time.perf_counter()
+            try:
+                value = render()
+            except Exception:
+                if entry is None:
+                    cache.set(key, self.UNCACHEABLE, timeout=config['CACHE_LOCK_TIMEOUT'])
+                raise
+            cost = time.perf_counter() - start
+            cache.set(key, (value, time.time() + timeout, cost), timeout=timeout)
+            return value
+        finally:
+            cache.delete(lock)
+
+    def _wait(self, key, wait):
+        deadline = time.monotonic() + wait
+        delay = 0.005
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+            delay = min(delay * 2, 0.05)
+        return None
+
+    def fragment(self, name, per_user=False, tags=(), timeout=None, caller=None):
+        """模板片段缓存：{% call cache_fragment('nav', per_user=True) %}...{% endcall %}"""
+        vary = None
+        if per_user:
+            vary, user_tags = self.user_scope()
+            tags = (*user_tags, *tags)
+        render = lambda: str(caller())  # noqa: E731
+        if not self.can_cache(tags):
+            return Markup(render())
+        try:
+            return Markup(self.get_or_render(self.key('fragment', name, tags, vary), render, timeout))
+        except RedisError:
+            return Markup(render())
+
+    def cached_page(self, timeout=None, per_user=False, tags=()):
+        """视图整页缓存（仅GET、状态200）
+
+        per_user为False时只缓存匿名用户的请求，已登录用户照常渲染；为True时按用户
+        分别缓存，并依赖该用户及角色、权限的标签。tags为额外依赖的标签。
+        读取了闪现消息、生成了CSRF令牌或修改了会话的响应不缓存。
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or '_flashes' in session:
+                    return view(*args, **kwargs)
+                vary, user_tags = self.user_scope()
+                if vary != 'anonymous' and not per_user or not self.can_cache((*user_tags, *tags)):
+                    return view(*args, **kwargs)
+
+                def render():
+                    # 加载用户时可能已修改会话（如_fresh），只看视图本身是否修改
+                    modified = session.modified
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or 'csrf_token' in g or session.modified and not modified:
+                        raise _Uncacheable(response)
+                    return response.get_data(), response.mimetype
+
+                hit = [True]
+
+                def render_miss():
+                    hit[0] = False
+                    return render()
+                try:
+                    key = self.key('page', request.full_path, (*user_tags, *tags), vary)
+                    body, mimetype = self.get_or_render(key, render_miss, timeout)
+                except _Uncacheable as e:
+                    return e.response
+                except RedisError:
+                    current_app.logger.warning('页面缓存不可用，直接渲染', exc_info=True)
+                    return view(*args, **kwargs)
+                response = current_app.response_class(body, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT' if hit[0] else 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    # 会话事件
+
+    def _after_flush(self, session, flush_context):
+        from application.models.user import User, Role, Permission
+        stale = session.info.setdefault('page_cache_stale', set())
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, (User, Role, Permission)):
+                table = obj.__tablename__
+                stale.add(table)
+                if obj.id is not None:
+                    stale.add(f'{table}:{obj.id}')
+
+    def _after_commit(self, session):
+        stale = session.info.pop('page_cache_stale', None)
+        if stale:
+            self.invalidate(*stale)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('page_cache_stale', None)
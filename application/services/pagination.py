@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """一页键集分页结果"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    """将排序键值编码为URL安全的游标字符串"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """解析游标，按列类型还原排序键值；格式错误时抛出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f'无效的分页游标: {cursor}') from e
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise ValueError(f'无效的分页游标: {cursor}')
+    values = []
+    for column, value in zip(columns, payload):
+        if value is not None:
+            python_type = column.type.python_type
+            try:
+                if python_type is datetime:
+                    value = datetime.fromisoformat(value)
+                elif not isinstance(value, python_type) or isinstance(value, bool) and python_type is not bool:
+                    raise TypeError(f'{column.key}: {value!r}')
+            except (TypeError, ValueError) as e:
+                # 结构正确但键值类型不符（如时间位置上是数字）
+                raise ValueError(f'无效的分页游标: {cursor}') from e
+        values.append(value)
+    return values
+
+
+def keyset_query(query, columns, cursor=None, limit=50, descending=True):
+    """按columns做键集（seek）分页，返回取limit+1行的查询
+
+    columns必须能唯一确定顺序（最后一列通常是主键），并应有对应的复合索引。
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def keyset_page(query, columns, cursor=None, limit=50, descending=True):
+    """执行键集分页查询并返回KeysetPage"""
+    rows = keyset_query(query, columns, cursor, limit, descending).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns])
+    return KeysetPage(rows, next_cursor)
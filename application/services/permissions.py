@@ -0,0 +1,233 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context, has_request_context
+from redis import RedisError
+from sqlalchemy import event, select
+
+from application.services.db_routing import replica_reads
+
+
+class PermissionCache:
+    """用户有效权限的位图缓存
+
+    每个用户的权限被编译为一个整数位图（权限名 -> 位序号），依次查询
+    进程内LRU和Redis，二者都未命中时才用一条SQL重新编译。user_roles、
+    role_permissions或权限表发生变化并提交后递增全局版本号，旧条目随之失效。
+    编译查询走只读副本；从副本得到的结果可能落后于新版本号，因此只缓存
+    DB_REPLICA_STICKY_SECONDS秒。
+
+    未配置Redis时版本号只在本进程内递增，其他worker提交的撤权无法通知到本进程，
+    因此不使用跨请求的进程内LRU，位图和权限序号只在当前应用上下文（请求）内缓存。
+    """
+
+    VERSION_KEY = 'perm:version'
+    BITS_KEY = 'perm:bits:{version}:{user_id}'
+
+    def __init__(self, app=None, db=None, redis_store=None):
+        self.db = None
+        self.redis_store = None
+        self.maxsize = 4096
+        self.ttl = 86400
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._registry = (None, {}, None)
+        self._local_version = 0
+        if app is not None:
+            self.init_app(app, db, redis_store)
+
+    def init_app(self, app, db, redis_store=None):
+        self.maxsize = app.config.get('PERMISSION_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('PERMISSION_CACHE_TTL', self.ttl)
+        self.redis_store = redis_store
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        app.extensions['permission_cache'] = self
+
+    @property
+    def redis(self):
+        return self.redis_store.client if self.redis_store is not None else None
+
+    # 版本号
+
+    def current_version(self):
+        """返回当前权限版本号，请求内只读取一次Redis"""
+        client = self.redis
+        if client is None:
+            return self._local_version
+        if has_request_context() and '_permission_version' in g:
+            return g._permission_version
+        try:
+            version = int(client.get(self.VERSION_KEY) or 0)
+        except RedisError:
+            version = self._local_version
+        if has_request_context():
+            g._permission_version = version
+        return version
+
+    def bump_version(self):
+        """使所有用户的权限缓存失效
+
+        ORM之外直接写入关联表（如批量导入）后必须调用。
+        """
+        with self._lock:
+            self._local_version += 1
+            self._entries.clear()
+        if has_app_context():
+            g.pop('_permission_memo', None)
+        client = self.redis
+        if client is not None:
+            try:
+                version = client.incr(self.VERSION_KEY)
+            except RedisError:
+                return
+            if has_request_context():
+                g._permission_version = version
+
+    # 查询
+
+    def has_permission(self, user, name):
+        """检查用户是否拥有名为name的权限"""
+        session = self.db.session
+        if user.id is None or session.info.get('permissions_dirty'):
+            # 未提交的权限变更只在当前事务可见，不能进入共享缓存
+            return user._has_permission_uncached(name)
+        version = self.current_version()
+        index = self._permission_index(version).get(name)
+        if index is None:
+            return False
+        return bool(self.get_bits(user.id, version) >> index & 1)
+
+    def get_bits(self, user_id, version=None):
+        """返回用户的权限位图"""
+        if version is None:
+            version = self.current_version()
+        if self.redis is None:
+            entries = self._request_memo(version).setdefault('bits', {})
+            if user_id not in entries:
+                entries[user_id] = self._compile(user_id, version)[0]
+            return entries[user_id]
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and (entry[2] is None or entry[2] > now):
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        expires = None
+        bits = self._load_shared(user_id, version)
+        if bits is None:
+            bits, lag_ttl = self._compile(user_id, version)
+            self._store_shared(user_id, version, bits, lag_ttl)
+            if lag_ttl:
+                expires = now + lag_ttl
+
+        with self._lock:
+            self._entries[user_id] = (version, bits, expires)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return bits
+
+    def _replica_ttl(self, session):
+        """当前会话读副本时返回结果的缓存秒数，读主库时返回None"""
+        if not session.uses_replica():
+            return None
+        return current_app.config['DB_REPLICA_STICKY_SECONDS']
+
+    @staticmethod
+    def _request_memo(version):
+        """未配置Redis时的请求内缓存，版本号变化时清空"""
+        memo = g.get('_permission_memo')
+        if memo is None or memo['version'] != version:
+            memo = g._permission_memo = {'version': version}
+        return memo
+
+    def _permission_index(self, version):
+        if self.redis is None:
+            memo = self._request_memo(version)
+            if 'index' not in memo:
+                memo['index'] = self._load_index()[0]
+            return memo['index']
+        registry_version, index, expires = self._registry
+        if registry_version == version and (expires is None or expires > time.monotonic()):
+            return index
+        index, lag_ttl = self._load_index()
+        self._registry = (version, index, time.monotonic() + lag_ttl if lag_ttl else None)
+        return index
+
+    def _load_index(self):
+        """读取权限名到位序号的映射，返回(映射, 副本结果的缓存秒数)"""
+        from application.models.user import Permission
+        with replica_reads() as session, session.no_autoflush:
+            lag_ttl = self._replica_ttl(session)
+            rows = session.execute(select(Permission.name).order_by(Permission.id)).scalars()
+            return {name: i for i, name in enumerate(rows)}, lag_ttl
+
+    def _compile(self, user_id, version):
+        """用一条SQL编译用户的权限位图，返回(位图, 副本结果的缓存秒数)"""
+        from application.models.user import Permission, user_roles, role_permissions
+        index = self._permission_index(version)
+        stmt = (select(Permission.name)
+                .join(role_permissions, role_permissions.c.permission_id == Permission.id)
+                .join(user_roles, user_roles.c.role_id == role_permissions.c.role_id)
+                .where(user_roles.c.user_id == user_id)
+                .distinct())
+        bits = 0
+        with replica_reads() as session, session.no_autoflush:
+            lag_ttl = self._replica_ttl(session)
+            for name in session.execute(stmt).scalars():
+                if name in index:
+                    bits |= 1 << index[name]
+        return bits, lag_ttl
+
+    def _load_shared(self, user_id, version):
+        client = self.redis
+        if client is None:
+            return None
+        try:
+            value = client.get(self.BITS_KEY.format(version=version, user_id=user_id))
+        except RedisError:
+            return None
+        return int(value, 16) if value is not None else None
+
+    def _store_shared(self, user_id, version, bits, ttl=None):
+        client = self.redis
+        if client is None:
+            return
+        try:
+            client.set(self.BITS_KEY.format(version=version, user_id=user_id),
+                       format(bits, 'x'), ex=ttl or self.ttl)
+        except RedisError:
+            pass
+
+    # 会话事件
+
+    def _after_flush(self, session, flush_context):
+        if session.info.get('permissions_dirty'):
+            return
+        if any(_touches_permissions(obj, obj in session.deleted)
+               for obj in (*session.new, *session.dirty, *session.deleted)):
+            session.info['permissions_dirty'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('permissions_dirty', False):
+            self.bump_version()
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('permissions_dirty', None)
+
+
+def _touches_permissions(obj, deleted):
+    """判断对象的变更是否会影响权限计算"""
+    from sqlalchemy import inspect
+    from application.models.user import User, Role, Permission
+    if isinstance(obj, (Role, Permission)):
+        return True
+    if isinstance(obj, User):
+        return deleted or inspect(obj).attrs.roles.history.has_changes()
+    return False
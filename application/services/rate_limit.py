@@ -0,0 +1,271 @@
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app, jsonify, request
+from prometheus_client import Counter
+from redis import RedisError
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# 计入账户维度的表单/JSON字段（Flask-Security登录、注册、找回密码）
+ACCOUNT_FIELDS = ('email', 'username', 'identity')
+
+# 批量累加各计数器并返回集群总数。KEYS按(当前窗口, 上一窗口)成对排列，
+# ARGV[1]为过期秒数，ARGV[i + 1]为第i对的本地增量
+FLUSH_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+local result = {}
+for i = 1, #KEYS, 2 do
+    local delta = tonumber(ARGV[(i + 1) / 2 + 1])
+    local current
+    if delta > 0 then
+        current = redis.call('INCRBY', KEYS[i], delta)
+        redis.call('EXPIRE', KEYS[i], ttl)
+    else
+        current = tonumber(redis.call('GET', KEYS[i]) or '0')
+    end
+    result[#result + 1] = current
+    result[#result + 1] = tonumber(redis.call('GET', KEYS[i + 1]) or '0')
+end
+return result
+"""
+
+
+class _Window:
+    """一个键（端点、维度、标识）的滑动窗口计数
+
+    按固定窗口计数，估算值为当前窗口计数加上上一窗口计数按剩余比例折算。
+    本地计数为本进程的请求；shared_*为上次同步时集群（全部进程）的总数，
+    pending为尚未同步的本地增量。
+    """
+
+    __slots__ = ('index', 'current', 'previous', 'shared_current', 'shared_previous', 'pending', 'touched')
+
+    def __init__(self, index):
+        self.index = index
+        self.current = self.previous = 0
+        self.shared_current = self.shared_previous = 0
+        self.pending = 0
+        self.touched = False
+
+    def advance(self, index):
+        if index == self.index:
+            return
+        if index == self.index + 1:
+            self.previous, self.shared_previous = self.current, self.shared_current
+        else:
+            self.previous = self.shared_previous = 0
+        self.current = self.shared_current = self.pending = 0
+        self.index = index
+
+    def counts(self):
+        """(当前窗口, 上一窗口)的计数，取本地与集群视图中较大者"""
+        return (max(self.current, self.shared_current + self.pending),
+                max(self.previous, self.shared_previous))
+
+
+class _Limits:
+    """一个应用的限流规则和本地计数"""
+
+    def __init__(self, rules):
+        # {端点: [(维度, 次数, 秒数)]}
+        self.rules = {endpoint: [(scope, int(limit), int(period)) for scope, (limit, period) in scopes.items()]
+                      for endpoint, scopes in rules.items()}
+        self.windows = {}
+        self.lock = threading.Lock()
+
+
+class RateLimiter:
+    """Flask-Security端点（登录、注册、找回/重置密码等）的限流
+
+    RATE_LIMITS为{端点: {维度: (次数, 秒数)}}，维度为ip、account（表单中的
+    邮箱/用户名）或endpoint（端点整体）。每个(端点, 维度, 标识)按滑动窗口计数，
+    任一维度超限时在before_request中直接返回429，请求不会进入视图，也就不会
+    计算密码哈希；被拒绝的请求不计数。只对POST请求计数。
+
+    计数在进程内完成，热路径只有一次字典查找和加锁的整数运算。配置了Redis时，
+    后台线程每RATE_LIMIT_SYNC_MS毫秒用一个Lua脚本把各键的本地增量原子地累加到
+    共享计数器，并取回集群总数；判断时取本地计数与集群总数（加未同步增量）中
+    的较大者，因此多个worker的合计请求数最多比限额多出一个同步间隔内的请求。
+    Redis不可用时退化为每个进程独立限流。
+
+    ip维度按request.remote_addr计数。部署在反向代理或负载均衡之后时，
+    RATE_LIMIT_TRUSTED_PROXIES设为代理层数，由ProxyFix从X-Forwarded-For
+    右起第该数个地址取得客户端地址；否则所有客户端共用代理的地址。
+    """
+
+    KEY = 'ratelimit:{endpoint}:{scope}:{ident}:{index}'
+
+    def __init__(self, app=None, redis_store=None, metrics=None):
+        self.redis_store = None
+        self.rejections = None
+        self._script = None
+        self._wake_lock = threading.Lock()
+        self._thread = None
+        self._apps = []
+        if app is not None:
+            self.init_app(app, redis_store, metrics)
+
+    def init_app(self, app, redis_store=None, metrics=None):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMITS', {})
+        app.config.setdefault('RATE_LIMIT_SYNC_MS', 100)
+        app.config.setdefault('RATE_LIMIT_TRUSTED_PROXIES', 0)
+        self.redis_store = redis_store
+        if metrics is not None and self.rejections is None:
+            self.rejections = Counter('rate_limited_requests', '被限流拒绝的请求数', ['endpoint', 'scope'],
+                                      registry=metrics.registry)
+        app.extensions['rate_limiter'] = _Limits(app.config['RATE_LIMITS'])
+        if app.config['RATE_LIMIT_TRUSTED_PROXIES'] > 0:
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['RATE_LIMIT_TRUSTED_PROXIES'])
+        if app.config['RATE_LIMIT_ENABLED']:
+            app.before_request(self._before_request)
+
+    # 判断
+
+    def _before_request(self):
+        limits = current_app.extensions['rate_limiter']
+        rules = limits.rules.get(request.endpoint)
+        if rules is None or request.method != 'POST':
+            return None
+        keys = [(rule, self._identity(rule[0])) for rule in rules]
+        retry_after, scope = self.hit(limits, request.endpoint, keys)
+        if retry_after is None:
+            return None
+        if self.rejections is not None:
+            self.rejections.labels(request.endpoint, scope).inc()
+        response = jsonify({'error': '请求过于频繁，请稍后再试', 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @staticmethod
+    def _identity(scope):
+        if scope == 'ip':
+            return request.remote_addr or '-'
+        if scope == 'account':
+            data = request.form or request.get_json(silent=True)
+            if not hasattr(data, 'get'):
+                return None
+            for field in ACCOUNT_FIELDS:
+                value = data.get(field)
+                if isinstance(value, str) and value.strip():
+                    # 键中不保存明文邮箱
+                    return hashlib.blake2b(value.strip().lower().encode(), digest_size=8).hexdigest()
+            return None
+        return '*'
+
+    def hit(self, limits, endpoint, keys, now=None):
+        """对[(规则, 标识)]计数一次；任一规则超限时不计数，返回(重试秒数, 维度)，否则(None, None)"""
+        now = time.time() if now is None else now
+        windows = []
+        with limits.lock:
+            for (scope, limit, period), ident in keys:
+                if ident is None:
+                    continue
+                index, offset = divmod(now, period)
+                key = (endpoint, scope, ident, period)
+                window = limits.windows.get(key)
+                if window is None:
+                    window = limits.windows[key] = _Window(int(index))
+                else:
+                    window.advance(int(index))
+                window.touched = True
+                current, previous = window.counts()
+                weight = 1 - offset / period
+                if current + previous * weight + 1 > limit:
+                    return _retry_after(current, previous, offset, period, limit), scope
+                windows.append(window)
+            for window in windows:
+                window.current += 1
+                window.pending += 1
+        self._start_sync()
+        return None, None
+
+    # 同步
+
+    def _start_sync(self):
+        app = current_app._get_current_object()
+        if app in self._apps or app.config['RATE_LIMIT_SYNC_MS'] <= 0:
+            return
+        with self._wake_lock:
+            if app not in self._apps:
+                self._apps.append(app)
+            if self._thread is None:
+                # 首个请求时才启动，避免gunicorn预加载后fork出的worker继承失效的线程
+                self._thread = threading.Thread(target=self._sync_loop, name='rate-limit-sync', daemon=True)
+                self._thread.start()
+
+    def _sync_loop(self):
+        while True:
+            apps = list(self._apps)
+            time.sleep(min(app.config['RATE_LIMIT_SYNC_MS'] for app in apps) / 1000)
+            for app in apps:
+                with app.app_context():
+                    try:
+                        self.flush()
+                    except Exception:
+                        app.logger.exception('限流计数同步失败')
+
+    def flush(self, now=None):
+        """把当前应用的本地增量累加到Redis并取回集群总数，同时清理过期的计数"""
+        limits = current_app.extensions['rate_limiter']
+        now = time.time() if now is None else now
+        batch = []
+        with limits.lock:
+            for key, window in list(limits.windows.items()):
+                period = key[3]
+                index = int(now // period)
+                if window.index < index - 1:
+                    del limits.windows[key]
+                    continue
+                if window.touched:
+                    window.touched = False
+                    batch.append((key, window.index, window.pending))
+                    window.pending = 0
+        client = self.redis_store.client if self.redis_store is not None else None
+        if client is None or not batch:
+            return
+        redis_keys, args = [], [max(period for (_, _, _, period), _, _ in batch) * 2]
+        for (endpoint, scope, ident, period), index, delta in batch:
+            redis_keys.append(self.KEY.format(endpoint=endpoint, scope=scope, ident=ident, index=index))
+            redis_keys.append(self.KEY.format(endpoint=endpoint, scope=scope, ident=ident, index=index - 1))
+            args.append(delta)
+        if self._script is None or self._script.registered_client is not client:
+            self._script = client.register_script(FLUSH_SCRIPT)
+        try:
+            counts = self._script(keys=redis_keys, args=args)
+        except RedisError as e:
+            current_app.logger.warning('限流计数同步到Redis失败: %s', e)
+            with limits.lock:
+                for key, index, delta in batch:
+                    window = limits.windows.get(key)
+                    if window is not None and window.index == index:
+                        window.pending += delta
+                        window.touched = True
+            return
+        with limits.lock:
+            for i, (key, index, delta) in enumerate(batch):
+                window = limits.windows.get(key)
+                if window is not None and window.index == index:
+                    window.shared_current = int(counts[2 * i])
+                    window.shared_previous = int(counts[2 * i + 1])
+
+    def reset(self):
+        """清空当前应用的本地计数（不影响Redis中的计数）"""
+        limits = current_app.extensions['rate_limiter']
+        with limits.lock:
+            limits.windows.clear()
+
+
+def _retry_after(current, previous, offset, period, limit):
+    """估算值降到可再放行一次所需的秒数"""
+    allowed = limit - 1
+    if current > allowed:
+        # 当前窗口已满：等到下一窗口中本窗口的计数折算到限额以内
+        wait = period - offset + period * max(0.0, 1 - allowed / current)
+    else:
+        # 上一窗口的折算部分随时间减少
+        wait = period * (1 - (allowed - current) / previous) - offset if previous else 0
+    return max(1, math.ceil(wait))
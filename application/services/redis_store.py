@@ -0,0 +1,31 @@
+import redis
+from flask import current_app, has_app_context
+
+
+class RedisStore:
+    """Redis客户端扩展
+
+    未配置REDIS_URL时client为None，调用方需自行退化为进程内实现。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('REDIS_URL')
+        client = None
+        if url:
+            client = redis.Redis.from_url(
+                url,
+                socket_timeout=app.config.get('REDIS_SOCKET_TIMEOUT', 0.5),
+                socket_connect_timeout=app.config.get('REDIS_SOCKET_TIMEOUT', 0.5)
+            )
+        app.extensions['redis'] = client
+
+    @property
+    def client(self):
+        """当前应用的Redis客户端，未配置时返回None"""
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('redis')
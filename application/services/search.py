@@ -0,0 +1,230 @@
+from alembic.operations import ops
+from sqlalchemy import and_, column, event, func, literal_column, or_, select, table, text
+
+# 检索列类型：trigram按子串匹配（用户名、邮箱等标识），text按词匹配（描述等自然文本）
+TRIGRAM, TEXT = 'trigram', 'text'
+
+# trigram索引只能加速至少3个字符的词，更短的词退化为LIKE扫描
+MIN_TRIGRAM_TERM = 3
+
+
+def searchable_columns(model):
+    """模型通过__searchable__声明的检索列，返回{列名: 类型}
+
+    __searchable__可以是列名序列（均为trigram）或{列名: 类型}。
+    """
+    spec = getattr(model, '__searchable__', None)
+    if not spec:
+        return {}
+    if isinstance(spec, dict):
+        return dict(spec)
+    return {name: TRIGRAM for name in spec}
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+class LikeBackend:
+    """没有专用索引的数据库：各列ILIKE '%词%'，需要全表扫描"""
+
+    name = 'like'
+
+    def create_ddl(self, table_name, columns):
+        return []
+
+    def drop_ddl(self, table_name, columns):
+        return []
+
+    def condition(self, model, columns, terms):
+        return and_(*(self._like(model, columns, term) for term in terms))
+
+    @staticmethod
+    def _like(model, columns, term):
+        pattern = _like_pattern(term)
+        return or_(*(getattr(model, name).ilike(pattern, escape='\\') for name in columns))
+
+
+class PostgresBackend(LikeBackend):
+    """PostgreSQL：trigram列建gin_trgm_ops索引，ILIKE '%词%'直接走索引；
+    text列建to_tsvector('simple', 列)表达式索引，按词匹配
+    """
+
+    name = 'postgresql'
+
+    def create_ddl(self, table_name, columns):
+        statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+        for name, kind in columns.items():
+            if kind == TEXT:
+                statements.append(f'CREATE INDEX IF NOT EXISTS ix_{table_name}_{name}_tsv ON {table_name} '
+                                  f"USING gin (to_tsvector('simple', coalesce({name}, '')))")
+            else:
+                statements.append(f'CREATE INDEX IF NOT EXISTS ix_{table_name}_{name}_trgm ON {table_name} '
+                                  f'USING gin ({name} gin_trgm_ops)')
+        return statements
+
+    def drop_ddl(self, table_name, columns):
+        return [f'DROP INDEX IF EXISTS ix_{table_name}_{name}_{"tsv" if kind == TEXT else "trgm"}'
+                for name, kind in columns.items()]
+
+    def condition(self, model, columns, terms):
+        clauses = []
+        for term in terms:
+            pattern = _like_pattern(term)
+            matches = []
+            for name, kind in columns.items():
+                column_ = getattr(model, name)
+                if kind == TEXT:
+                    # 与索引表达式逐字一致（字面量而非绑定参数），规划器才会使用表达式索引
+                    vector = func.to_tsvector(literal_column("'simple'"),
+                                              func.coalesce(column_, literal_column("''")))
+                    matches.append(vector.op('@@')(func.plainto_tsquery(literal_column("'simple'"), term)))
+                else:
+                    matches.append(column_.ilike(pattern, escape='\\'))
+            clauses.append(or_(*matches))
+        return and_(*clauses)
+
+
+class SqliteBackend(LikeBackend):
+    """SQLite：每个表一个FTS5外部内容表（trigram分词，子串匹配、不区分大小写），
+    由触发器随原表的增删改同步；检索为 id IN (SELECT rowid FROM 索引 WHERE 索引 MATCH ...)
+    """
+
+    name = 'sqlite'
+
+    @staticmethod
+    def index_name(table_name):
+        return f'{table_name}_search'
+
+    def create_ddl(self, table_name, columns):
+        index = self.index_name(table_name)
+        names = ', '.join(columns)
+        new = ', '.join(f'new.{name}' for name in columns)
+        old = ', '.join(f'old.{name}' for name in columns)
+        insert = f'INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new});'
+        delete = f"INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5({names}, content='{table_name}', "
+            f"content_rowid='id', tokenize='trigram')",
+            f'CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table_name} BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table_name} BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {names} ON {table_name} '
+            f'BEGIN {delete} {insert} END',
+            # 为已有数据建立索引
+            f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+        ]
+
+    def drop_ddl(self, table_name, columns):
+        index = self.index_name(table_name)
+        return [f'DROP TRIGGER IF EXISTS {index}_{suffix}' for suffix in ('ai', 'ad', 'au')] + \
+            [f'DROP TABLE IF EXISTS {index}']
+
+    def condition(self, model, columns, terms):
+        indexed = [term for term in terms if len(term) >= MIN_TRIGRAM_TERM]
+        clauses = [self._like(model, columns, term) for term in terms if len(term) < MIN_TRIGRAM_TERM]
+        if indexed:
+            index = self.index_name(model.__table__.name)
+            fts = table(index, column('rowid'), column(index))
+            query = ' AND '.join('"%s"' % term.replace('"', '""') for term in indexed)
+            clauses.insert(0, model.id.in_(select(fts.c.rowid).where(fts.c[index].op('MATCH')(query))))
+        return and_(*clauses)
+
+
+BACKENDS = {'postgresql': PostgresBackend, 'sqlite': SqliteBackend}
+
+
+class SearchIndex:
+    """全文检索：按数据库选择检索后端，为声明了__searchable__的模型维护索引
+
+    db.create_all创建表后立即创建对应的检索索引，drop_all前删除（SQLite的FTS表
+    不在元数据中）。使用迁移时，自动生成的迁移为新建的表附带索引DDL
+    （add_migration_ops），并通过include_object忽略已有的检索对象；已有数据库
+    首次启用检索时执行 flask search-index 创建索引并按现有数据重建。
+
+    filter()把检索词加到任意查询上：按空白拆分为多个词，每个词须匹配任一检索列，
+    与Flask-Admin内置搜索的语义一致。
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        if self.db is None:
+            event.listen(db.metadata, 'after_create', self._after_create)
+            event.listen(db.metadata, 'before_drop', self._before_drop)
+        self.db = db
+        app.extensions['search'] = self
+
+    @staticmethod
+    def backend(bind):
+        return BACKENDS.get(bind.dialect.name, LikeBackend)()
+
+    def models(self):
+        """声明了检索列的模型"""
+        return [mapper.class_ for mapper in self.db.Model.registry.mappers
+                if searchable_columns(mapper.class_)]
+
+    def filter(self, query, model, search):
+        """给query（Query或Select）加上检索条件，search为空时原样返回"""
+        columns = searchable_columns(model)
+        terms = (search or '').split()
+        if not columns or not terms:
+            return query
+        backend = self.backend(self.db.session.get_bind(model.__mapper__))
+        return query.filter(backend.condition(model, columns, terms))
+
+    # 索引维护
+
+    def create_indexes(self, bind, tables=None):
+        """创建（并为已有数据重建）检索索引，tables为表名列表，默认全部"""
+        self._execute(bind, tables, 'create_ddl')
+
+    def drop_indexes(self, bind, tables=None):
+        self._execute(bind, tables, 'drop_ddl')
+
+    def _execute(self, bind, tables, kind):
+        backend = self.backend(bind)
+        for model in self.models():
+            name = model.__table__.name
+            if tables is None or name in tables:
+                for statement in getattr(backend, kind)(name, searchable_columns(model)):
+                    bind.execute(text(statement))
+
+    def add_migration_ops(self, upgrade_ops, dialect):
+        """自动生成迁移时，在建表操作后追加该表检索索引的DDL，在删表操作前删除索引
+
+        已有表新增或修改检索列时，在迁移中手写 search.create_indexes(op.get_bind(), [表名])
+        """
+        backend = BACKENDS.get(dialect.name, LikeBackend)()
+        models = {model.__table__.name: model for model in self.models()}
+        result = []
+        for op_ in upgrade_ops.ops:
+            model = models.get(getattr(op_, 'table_name', None))
+            if isinstance(op_, ops.DropTableOp) and model is not None:
+                result.extend(ops.ExecuteSQLOp(sql) for sql in
+                              backend.drop_ddl(op_.table_name, searchable_columns(model)))
+            result.append(op_)
+            if isinstance(op_, ops.CreateTableOp) and model is not None:
+                result.extend(ops.ExecuteSQLOp(sql) for sql in
+                              backend.create_ddl(op_.table_name, searchable_columns(model)))
+        upgrade_ops.ops[:] = result
+
+    def _after_create(self, metadata, connection, tables=(), **kw):
+        self.create_indexes(connection, [t.name for t in tables])
+
+    def _before_drop(self, metadata, connection, tables=(), **kw):
+        self.drop_indexes(connection, [t.name for t in tables])
+
+    def include_object(self, object_, name, type_, reflected, compare_to):
+        """Alembic自动生成迁移时忽略检索索引（FTS表及其影子表、trigram/tsvector索引）"""
+        if not reflected or compare_to is not None:
+            return True
+        tables = {model.__table__.name for model in self.models()}
+        if type_ == 'table':
+            return not any(name.startswith(f'{t}_search') for t in tables)
+        if type_ == 'index':
+            return not (name or '').endswith(('_trgm', '_tsv'))
+        return True
@@ -0,0 +1,279 @@
+import csv
+import io
+import math
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from flask import current_app
+from flask_security.utils import hash_password
+from sqlalchemy import func, insert, select, text
+
+from application import db, page_cache, permission_cache
+
+# 生成数据的时间基准：用户注册时间分布在此前的SPAN_DAYS天内（不取当前时间，保证可复现）
+EPOCH = datetime(2025, 1, 1)
+SPAN_DAYS = 3 * 365
+
+# 权限为“资源.操作”，角色为“部门-级别”，各级别拥有本部门资源的部分操作
+RESOURCES = ['content', 'sheets', 'users', 'roles', 'reports', 'comments', 'media', 'settings',
+             'billing', 'audit', 'forms', 'pages', 'tags', 'menus', 'files']
+ACTIONS = ['view', 'create', 'edit', 'delete', 'approve', 'export', 'manage']
+DEPARTMENTS = ['editorial', 'marketing', 'sales', 'support', 'finance', 'engineering', 'legal',
+               'operations', 'design', 'research']
+TIERS = (('viewer', 1, 0.70), ('editor', 3, 0.25), ('manager', len(ACTIONS), 0.05))
+DOMAINS = (('example.com', 50), ('mail.example.org', 25), ('corp.example.net', 15), ('example.edu', 10))
+FIRST_NAMES = ['wei', 'fang', 'min', 'jing', 'lei', 'yan', 'hao', 'xin', 'alex', 'sam', 'maria', 'li',
+               'chen', 'anna', 'david', 'emma', 'ivan', 'kim', 'lucas', 'mia', 'noah', 'olga', 'raj', 'sara']
+LAST_NAMES = ['wang', 'li', 'zhang', 'liu', 'chen', 'yang', 'huang', 'zhao', 'wu', 'zhou', 'smith',
+              'garcia', 'kumar', 'kim', 'muller', 'rossi', 'silva', 'tanaka', 'novak', 'jones']
+
+USER_COLUMNS = ('id', 'username', 'email', 'password', 'active', 'confirmed_at', 'created_at', 'updated_at',
+                'fs_uniquifier', 'last_login_at', 'current_login_at', 'login_count')
+
+
+class SeedResult:
+    """一次生成的统计结果"""
+
+    def __init__(self):
+        self.permissions = 0
+        self.roles = 0
+        self.users = 0
+        self.user_roles = 0
+        self.elapsed = 0.0
+
+    @property
+    def users_per_minute(self):
+        return self.users / self.elapsed * 60 if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'permissions': self.permissions,
+            'roles': self.roles,
+            'users': self.users,
+            'user_roles': self.user_roles,
+            'elapsed': round(self.elapsed, 3),
+            'users_per_minute': round(self.users_per_minute),
+        }
+
+
+def _zipf_weights(n, s=1.1):
+    return [1 / (rank + 1) ** s for rank in range(n)]
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(
+        ['' if value is None else value for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _generate_users(plan, batch):
+    """生成第batch批用户及其角色关联（在子进程中执行）
+
+    每批使用由种子、起始id和批号派生的独立随机数，结果与进程数和执行顺序无关；
+    在已有用户的库上再次生成时起始id不同，不会重复。
+    """
+    rng = random.Random(f'{plan["seed"]}:users:{plan["first_id"]}:{batch}')
+    first = batch * plan['batch_size']
+    count = min(plan['batch_size'], plan['users'] - first)
+    tiers = plan['tiers']
+    domains, domain_weights = zip(*DOMAINS)
+    department_weights = _zipf_weights(len(tiers))
+    tier_weights = [weight for _, _, weight in TIERS]
+    span = SPAN_DAYS * 86400
+    epoch = EPOCH - timedelta(seconds=span)
+
+    users, links = [], []
+    for n in range(first, first + count):
+        user_id = plan['first_id'] + n
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        handle = f'{first_name}_{last_name}{user_id}'
+        # 注册量逐年增长：注册时间的分布函数为(t/span)^2，id越大注册越晚
+        created_at = epoch + timedelta(seconds=span * math.sqrt((n + rng.random()) / plan['users']))
+        logins = int(rng.expovariate(1 / 20)) if rng.random() < 0.8 else 0
+        last_login = None
+        if logins:
+            last_login = created_at + (EPOCH - created_at) * rng.random()
+        users.append((
+            user_id, handle, f'{first_name}.{last_name}{user_id}@{rng.choices(domains, domain_weights)[0]}',
+            plan['password'], rng.random() < 0.95,
+            created_at + timedelta(minutes=rng.randrange(60)) if rng.random() < 0.9 else None,
+            created_at, last_login or created_at,
+            uuid.UUID(int=rng.getrandbits(128), version=4).hex, last_login, last_login, logins,
+        ))
+        # 部门按Zipf分布抽取，级别越高人数越少；15%的用户再抽一次，可能得到第二个角色
+        role_count = 2 if rng.random() < 0.15 else 1
+        chosen = set()
+        for department in rng.choices(range(len(tiers)), department_weights, k=role_count):
+            tier = rng.choices(range(len(tiers[department])), tier_weights[:len(tiers[department])])[0]
+            chosen.add(tiers[department][tier])
+        links.extend((user_id, role_id) for role_id in sorted(chosen))
+
+    if plan['format'] == 'csv':
+        return count, len(links), _csv(users), _csv(links)
+    return count, len(links), [dict(zip(USER_COLUMNS, row)) for row in users], \
+        [{'user_id': user_id, 'role_id': role_id} for user_id, role_id in links]
+
+
+class DataSeeder:
+    """合成数据生成：N个权限、角色和用户，分布接近真实数据，在空库上同一种子和批大小的结果相同
+
+    权限和角色数量少，用多行INSERT一次写入；用户按批在进程池中生成（每批的随机数
+    由种子和批号决定），主键预先分配，角色关联不需要回查用户id。PostgreSQL上用
+    COPY由多个连接并行写入，其他数据库在当前连接上按批executemany（SQLite只有
+    一个写入者，生成仍然并行）。
+
+    所有用户使用同一个密码，只哈希一次；哈希的盐是随机的，这是唯一不可复现的列。
+    """
+
+    def __init__(self, seed=0, batch_size=None, workers=None, password='password'):
+        config = current_app.config
+        self.seed = seed
+        self.batch_size = batch_size or config['SEED_BATCH_SIZE']
+        self.workers = config['SEED_WORKERS'] if workers is None else workers
+        self.password = password
+
+    def run(self, users, roles=30, permissions=60):
+        result = SeedResult()
+        start = time.perf_counter()
+        rng = random.Random(f'{self.seed}:catalog')
+        permission_ids = self._seed_permissions(permissions, rng, result)
+        tiers = self._seed_roles(roles, permission_ids, rng, result)
+        if users:
+            self._seed_users(users, tiers, result)
+        db.session.commit()
+        # ORM之外写入了关联表
+        permission_cache.bump_version()
+        page_cache.invalidate('users', 'roles', 'permissions')
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def _next_id(model):
+        return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+    def _seed_permissions(self, count, rng, result):
+        """生成“资源.操作”权限（已存在的沿用），返回{资源: [按ACTIONS顺序的权限id]}"""
+        from application.models.user import Permission
+        existing = dict(db.session.execute(select(Permission.name, Permission.id)).all())
+        names = []
+        for k in range(math.ceil(count / len(ACTIONS))):
+            resource = RESOURCES[k % len(RESOURCES)] + (f'{k // len(RESOURCES)}' if k >= len(RESOURCES) else '')
+            names += [f'{resource}.{action}' for action in ACTIONS]
+        next_id = self._next_id(Permission)
+        rows, by_resource = [], {}
+        for name in names[:count]:
+            if name not in existing:
+                existing[name] = next_id + len(rows)
+                rows.append({'id': existing[name], 'name': name, 'description': f'{name} (生成)'})
+            by_resource.setdefault(name.split('.')[0], []).append(existing[name])
+        if rows:
+            db.session.execute(insert(Permission.__table__), rows)
+        result.permissions = len(rows)
+        return by_resource
+
+    def _seed_roles(self, count, permission_ids, rng, result):
+        """按部门生成viewer/editor/manager角色（已存在的沿用，不改其权限），
+        返回[[各级别角色id]]（每个部门一项）
+        """
+        from application.models.user import Role, role_permissions
+        existing = dict(db.session.execute(select(Role.name, Role.id)).all())
+        resources = sorted(permission_ids)
+        next_id = self._next_id(Role)
+        rows, links, tiers = [], [], []
+        planned = 0
+        for k in range(math.ceil(count / len(TIERS))):
+            department = DEPARTMENTS[k % len(DEPARTMENTS)] + (f'{k // len(DEPARTMENTS)}' if k >= len(DEPARTMENTS) else '')
+            # 每个部门负责2-4种资源
+            owned = rng.sample(resources, min(len(resources), rng.randint(2, 4)))
+            ids = []
+            for tier, actions, _ in TIERS[:count - planned]:
+                name = f'{department}-{tier}'
+                if name not in existing:
+                    existing[name] = next_id + len(rows)
+                    rows.append({'id': existing[name], 'name': name, 'description': f'{department} {tier} (生成)'})
+                    links += [{'role_id': existing[name], 'permission_id': permission_id}
+                              for resource in owned for permission_id in permission_ids[resource][:actions]]
+                ids.append(existing[name])
+            planned += len(ids)
+            tiers.append(ids)
+        if rows:
+            db.session.execute(insert(Role.__table__), rows)
+        if links:
+            db.session.execute(insert(role_permissions), links)
+        result.roles = len(rows)
+        return tiers
+
+    def _seed_users(self, count, tiers, result):
+        from application.models.user import User
+        if not tiers:
+            raise ValueError('没有可分配的角色，请至少生成一个角色')
+        with current_app.test_request_context():
+            password = hash_password(self.password)
+        # 写入线程没有应用上下文，不能访问db.engine，在这里取出后传入
+        engine = db.engine
+        postgres = engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg2'
+        first_id = self._next_id(User)
+        plan = {'seed': self.seed, 'users': count, 'batch_size': self.batch_size, 'first_id': first_id,
+                'tiers': tiers, 'password': password,
+                'format': 'csv' if postgres else 'rows'}
+        batches = range(math.ceil(count / self.batch_size))
+        # 权限和角色先提交，COPY使用独立的连接
+        db.session.commit()
+
+        executor = None
+        if self.workers:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+            generated = executor.map(_generate_users, [plan] * len(batches), batches)
+        else:
+            generated = (_generate_users(plan, batch) for batch in batches)
+        try:
+            if postgres:
+                with ThreadPoolExecutor(max_workers=max(1, self.workers)) as writers:
+                    for users, links in writers.map(partial(self._copy, engine), generated):
+                        result.users += users
+                        result.user_roles += links
+                self._reset_sequences()
+            else:
+                from application.models.user import user_roles
+                for users, links, user_rows, link_rows in generated:
+                    db.session.execute(insert(User.__table__), user_rows)
+                    db.session.execute(insert(user_roles), link_rows)
+                    db.session.commit()
+                    result.users += users
+                    result.user_roles += links
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    @staticmethod
+    def _copy(engine, batch):
+        """用engine的一个独立连接COPY一批用户及其角色关联（在写入线程中执行）"""
+        users, links, user_csv, link_csv = batch
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(f'COPY users ({", ".join(USER_COLUMNS)}) FROM STDIN WITH (FORMAT csv)',
+                               io.StringIO(user_csv))
+            cursor.copy_expert('COPY user_roles (user_id, role_id) FROM STDIN WITH (FORMAT csv)',
+                               io.StringIO(link_csv))
+            connection.commit()
+        finally:
+            connection.close()
+        return users, links
+
+    @staticmethod
+    def _reset_sequences():
+        """显式写入了主键，把序列推进到当前最大id"""
+        for table in ('users', 'roles', 'permissions'):
+            db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                    f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+
+
+def seed_data(users, roles=30, permissions=60, **options):
+    """生成合成数据的便捷入口，返回SeedResult"""
+    return DataSeeder(**options).run(users, roles, permissions)
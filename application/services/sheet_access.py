@@ -0,0 +1,261 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context
+from redis import RedisError
+from sqlalchemy import event, inspect, literal, select
+
+# 访问级别，数值越大权限越多
+NONE, READ, WRITE, OWNER = 0, 1, 2, 3
+LEVELS = {'read': READ, 'write': WRITE, 'owner': OWNER}
+
+
+class SheetAccess:
+    """表格级访问控制的决策缓存
+
+    用户对表格的访问级别来自所有权和sheet_permissions中的授权，每次计算只需
+    一条走(user_id, sheet_id)索引的查询。结果依次缓存在请求内（g）、进程内
+    LRU和Redis中，缓存键包含用户的授权版本号和表格键（含创建时间，SQLite
+    重用删除表格的id时不会命中旧决策）。授权或撤销提交后只递增受影响用户的
+    版本号，其他用户的缓存不受影响。
+
+    未配置Redis时版本号无法在进程之间共享，一个worker中的撤销无法让其他worker的
+    进程内LRU失效，因此只在应用上下文（请求）内缓存决策，不使用进程内LRU。
+
+    有效权限还需满足角色权限：读需要SHEET_ROLE_PERMISSIONS['read']，写和所有者
+    操作需要SHEET_ROLE_PERMISSIONS['write']；拥有SHEET_ADMIN_PERMISSION的用户
+    对所有表格具有所有者级别。
+    """
+
+    VERSION_KEY = 'sheetacl:version:{user_id}'
+    LEVEL_KEY = 'sheetacl:level:{user_id}:{version}:{sheet}'
+
+    def __init__(self, app=None, db=None, redis_store=None):
+        self.db = None
+        self.redis_store = None
+        self.maxsize = 65536
+        self.ttl = 86400
+        self.role_permissions = {}
+        self.admin_permission = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if app is not None:
+            self.init_app(app, db, redis_store)
+
+    def init_app(self, app, db, redis_store=None):
+        self.maxsize = app.config.setdefault('SHEET_ACCESS_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.setdefault('SHEET_ACCESS_CACHE_TTL', self.ttl)
+        self.role_permissions = app.config.setdefault(
+            'SHEET_ROLE_PERMISSIONS', {'read': 'view_content', 'write': 'edit_content'})
+        self.admin_permission = app.config.setdefault('SHEET_ADMIN_PERMISSION', 'manage_sheets')
+        self.redis_store = redis_store
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'before_flush', self._before_flush)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        app.extensions['sheet_access'] = self
+
+    @property
+    def redis(self):
+        return self.redis_store.client if self.redis_store is not None else None
+
+    # 决策
+
+    def allowed(self, user, sheet, required):
+        """用户是否可以按required级别访问表格；无任何访问权限时返回None，便于调用方返回404"""
+        level = self.level(user, sheet)
+        if level < required and self.admin_permission and user.has_permission(self.admin_permission):
+            level = OWNER
+        if level == NONE:
+            return None
+        if level < required:
+            return False
+        name = self.role_permissions.get('read' if required == READ else 'write')
+        return name is None or user.has_permission(name)
+
+    def level(self, user, sheet):
+        """用户对表格的访问级别（所有权和授权，不含角色）"""
+        if user.id is None:
+            return NONE
+        if sheet.owner_id == user.id:
+            return OWNER
+        memo = g.setdefault('_sheet_access', {}) if has_app_context() else {}
+        key = (user.id, sheet.key)
+        if key in memo:
+            return memo[key]
+        uncommitted = user.id in self.db.session.info.get('sheet_acl_users', ())
+        version = self.user_version(user.id)
+        if version is None:
+            # 没有共享的版本号时不使用进程内LRU
+            level = self._compute(user.id, sheet)
+            if not uncommitted:
+                memo[key] = level
+            return level
+        cache_key = (user.id, version, sheet.key)
+        with self._lock:
+            level = self._entries.get(cache_key)
+            if level is not None:
+                self._entries.move_to_end(cache_key)
+        if level is None:
+            level = self._load_shared(user.id, version, sheet.key)
+            if level is None:
+                level = self._compute(user.id, sheet)
+                if uncommitted:
+                    # 未提交的授权变更只在当前事务可见，不能进入缓存
+                    return level
+                self._store_shared(user.id, version, sheet.key, level)
+            with self._lock:
+                self._entries[cache_key] = level
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        memo[key] = level
+        return level
+
+    def _compute(self, user_id, sheet):
+        from application.models.sheet import SheetPermission
+        permission_type = self.db.session.execute(
+            select(SheetPermission.permission_type)
+            .where(SheetPermission.user_id == user_id, SheetPermission.sheet_id == sheet.id)).scalar()
+        return LEVELS.get(permission_type, NONE)
+
+    def accessible_sheets(self, user, search=None):
+        """用户拥有或被授权的全部表格，一条查询返回[(表格, 级别名)]
+
+        两部分分别走sheets.owner_id索引和(user_id, sheet_id)索引，以UNION ALL合并。
+        search按表格名称检索（走检索索引）。
+        """
+        from application.models.sheet import Sheet, SheetPermission
+        owned = select(Sheet.id.label('sheet_id'), literal('owner').label('permission_type')) \
+            .where(Sheet.owner_id == user.id)
+        shared = select(SheetPermission.sheet_id, SheetPermission.permission_type) \
+            .where(SheetPermission.user_id == user.id)
+        access = owned.union_all(shared).subquery()
+        stmt = (select(Sheet, access.c.permission_type)
+                .join(access, access.c.sheet_id == Sheet.id)
+                .order_by(Sheet.updated_at.desc(), Sheet.id.desc()))
+        if search:
+            stmt = current_app.extensions['search'].filter(stmt, Sheet, search)
+        rows = self.db.session.execute(stmt).all()
+        if has_app_context():
+            # 列表中的决策直接放入请求内缓存，随后的单表检查不再查询
+            memo = g.setdefault('_sheet_access', {})
+            for sheet, permission_type in rows:
+                memo[user.id, sheet.key] = LEVELS[permission_type]
+        return rows
+
+    # 版本号
+
+    def user_version(self, user_id):
+        """用户的授权版本号，请求内只读取一次；未配置Redis或Redis不可用时返回None"""
+        client = self.redis
+        if client is None:
+            return None
+        versions = g.setdefault('_sheet_acl_versions', {}) if has_app_context() else {}
+        if user_id in versions:
+            return versions[user_id]
+        try:
+            version = int(client.get(self.VERSION_KEY.format(user_id=user_id)) or 0)
+        except RedisError:
+            return None
+        versions[user_id] = version
+        return version
+
+    def invalidate(self, user_ids):
+        """使这些用户的访问决策失效；ORM之外直接写入sheet_permissions后必须调用"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        client = self.redis
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for user_id in user_ids:
+                    pipe.incr(self.VERSION_KEY.format(user_id=user_id))
+                pipe.execute()
+            except RedisError:
+                pass
+        if has_app_context():
+            versions = g.get('_sheet_acl_versions')
+            memo = g.get('_sheet_access')
+            for user_id in user_ids:
+                if versions:
+                    versions.pop(user_id, None)
+                if memo:
+                    for key in [key for key in memo if key[0] == user_id]:
+                        del memo[key]
+
+    def _load_shared(self, user_id, version, sheet_key):
+        client = self.redis
+        if client is None:
+            return None
+        try:
+            value = client.get(self.LEVEL_KEY.format(user_id=user_id, version=version, sheet=sheet_key))
+        except RedisError:
+            return None
+        return int(value) if value is not None else None
+
+    def _store_shared(self, user_id, version, sheet_key, level):
+        client = self.redis
+        if client is None:
+            return
+        try:
+            client.set(self.LEVEL_KEY.format(user_id=user_id, version=version, sheet=sheet_key),
+                       level, ex=self.ttl)
+        except RedisError:
+            pass
+
+    # 会话事件
+
+    def _before_flush(self, session, flush_context, instances):
+        from application.models.sheet import Sheet, SheetPermission
+        affected = session.info.setdefault('sheet_acl_users', set())
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, SheetPermission):
+                history = inspect(obj).attrs.user_id.history
+                affected.update(user_id for user_id in (*history.added, *history.unchanged, *history.deleted)
+                                if user_id is not None)
+            elif isinstance(obj, Sheet) and obj not in session.new:
+                # 所有者变更影响新旧两个所有者
+                history = inspect(obj).attrs.owner_id.history
+                if history.has_changes():
+                    affected.update(user_id for user_id in (*history.added, *history.deleted)
+                                    if user_id is not None)
+
+    def _after_commit(self, session):
+        affected = session.info.pop('sheet_acl_users', None)
+        if affected:
+            self.invalidate(affected)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('sheet_acl_users', None)
+
+
+def grant(sheet, user, permission_type, granted_by=None):
+    """授予或修改用户对表格的权限（不提交事务）"""
+    from application import db
+    from application.models.sheet import SheetPermission
+    if permission_type not in (SheetPermission.READ, SheetPermission.WRITE):
+        raise ValueError(f'无效的权限类型: {permission_type}')
+    permission = db.session.execute(
+        select(SheetPermission).where(SheetPermission.user_id == user.id,
+                                      SheetPermission.sheet_id == sheet.id)).scalar()
+    if permission is None:
+        permission = SheetPermission(sheet_id=sheet.id, user_id=user.id)
+        db.session.add(permission)
+    permission.permission_type = permission_type
+    permission.granted_by = granted_by.id if granted_by is not None else None
+    return permission
+
+
+def revoke(sheet, user_id):
+    """撤销用户对表格的权限（不提交事务），返回是否存在该授权"""
+    from application import db
+    from application.models.sheet import SheetPermission
+    permission = db.session.execute(
+        select(SheetPermission).where(SheetPermission.user_id == user_id,
+                                      SheetPermission.sheet_id == sheet.id)).scalar()
+    if permission is None:
+        return False
+    db.session.delete(permission)
+    return True
@@ -0,0 +1,242 @@
+import gzip
+import json
+import os
+import struct
+import zlib
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from application.services.formulas import FormulaError
+
+# 快照中每个数据块的头：行块、列块、编码长度
+SNAPSHOT_CHUNK = struct.Struct('<III')
+
+
+def _encode_value(value):
+    return str(value) if isinstance(value, FormulaError) else value
+
+
+class SheetVersion:
+    """表格在某个历史序号处的只读视图
+
+    由最近的快照（数据块按需解码）加上回放的增量操作组成，读取接口与
+    SheetStorage一致。
+    """
+
+    def __init__(self, seq, n_rows, n_cols, chunk_rows, chunk_cols, chunks, cells, formulas):
+        self.seq = seq
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.chunk_rows = chunk_rows
+        self.chunk_cols = chunk_cols
+        self.formulas = formulas
+        self._encoded = chunks
+        self._decoded = {}
+        self._cells = cells
+
+    def get_cell(self, row, col):
+        if (row, col) in self._cells:
+            return self._cells[row, col]
+        key = (row // self.chunk_rows, col // self.chunk_cols)
+        chunk = self._decoded.get(key)
+        if chunk is None:
+            data = self._encoded.get(key)
+            if data is None:
+                return None
+            from application.services.sheet_storage import Chunk
+            chunk = self._decoded[key] = Chunk.decode(data)
+        return chunk.get(row % self.chunk_rows, col % self.chunk_cols)
+
+    def read_range(self, row_start, col_start, row_stop, col_stop):
+        return [[self.get_cell(row, col) for col in range(col_start, col_stop)]
+                for row in range(row_start, row_stop)]
+
+
+class SheetHistory:
+    """表格的操作历史
+
+    每次编辑向sheet_operations追加受影响单元格的新值（只追加，不修改），
+    序号每跨过SHEET_SNAPSHOT_INTERVAL条操作时保存一次完整快照（直接复制
+    压缩的数据块，不重新编码）。恢复任意序号时加载不晚于它的最近快照，
+    只回放两者之间的操作，耗时与快照间隔有关而与历史长度无关。
+
+    数据库中只保留最近SHEET_HISTORY_HOT_SNAPSHOTS个完整快照区间和当前区间的
+    操作，更早的操作在保存快照时按快照区间归档为gzip压缩的JSON Lines文件并
+    从表中删除，恢复更早的版本时从归档文件中读取。
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.snapshot_interval = 10000
+        self.hot_snapshots = 2
+        self.archive_dir = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.snapshot_interval = app.config.setdefault('SHEET_SNAPSHOT_INTERVAL', self.snapshot_interval)
+        self.hot_snapshots = app.config.setdefault('SHEET_HISTORY_HOT_SNAPSHOTS', self.hot_snapshots)
+        self.archive_dir = app.config.get('SHEET_HISTORY_ARCHIVE_DIR') or os.path.join(
+            app.instance_path, 'sheet-history')
+        app.extensions['sheet_history'] = self
+
+    # 记录
+
+    def record(self, sheet, cells, formulas=None, authors=None):
+        """追加{(行, 列): 值}的操作，formulas为{(行, 列): 公式源文本}，authors为{(行, 列): 用户id}
+
+        与SheetStorage一样不提交事务，由调用方与数据写入一起提交。
+        """
+        from application.models.sheet import SheetOperation
+        if not cells:
+            return
+        formulas = formulas or {}
+        authors = authors or {}
+        start = self._allocate(sheet, len(cells))
+        now = datetime.utcnow()
+        rows = [{'sheet_id': sheet.id, 'seq': start + i, 'row': row, 'col': col,
+                 'value': _encode_value(value), 'formula': formulas.get((row, col)),
+                 'user_id': authors.get((row, col)), 'created_at': now}
+                for i, ((row, col), value) in enumerate(sorted(cells.items()), start=1)]
+        self.db.session.execute(insert(SheetOperation), rows)
+        if sheet.history_seq // self.snapshot_interval > start // self.snapshot_interval:
+            self.snapshot(sheet)
+            self.archive(sheet)
+
+    def _allocate(self, sheet, count):
+        """在数据库中原子地为count条操作分配序号，返回分配前的序号
+
+        并发写入者（如导入与协作刷新）各自读取再加一会分配到相同的序号，
+        因此用一条UPDATE递增，再把结果同步到对象上（不产生待写变更）。
+        """
+        from application.models.sheet import Sheet
+        table = Sheet.__table__
+        condition = table.c.id == sheet.id
+        session = self.db.session
+        session.execute(table.update().where(condition).values(history_seq=table.c.history_seq + count))
+        # UPDATE持有行锁直到提交，读到的是本事务写入的值
+        stop = session.execute(select(table.c.history_seq).where(condition)).scalar_one()
+        set_committed_value(sheet, 'history_seq', stop)
+        return stop - count
+
+    def snapshot(self, sheet):
+        """保存表格当前状态的快照（数据块和公式须已写入当前事务）"""
+        from application.models.sheet import SheetChunk, SheetFormula, SheetSnapshot
+        session = self.db.session
+        parts = []
+        for row_block, col_block, data in session.execute(
+                select(SheetChunk.row_block, SheetChunk.col_block, SheetChunk.data)
+                .where(SheetChunk.sheet_id == sheet.id)):
+            parts.append(SNAPSHOT_CHUNK.pack(row_block, col_block, len(data)))
+            parts.append(data)
+        formulas = [list(row) for row in session.execute(
+            select(SheetFormula.row, SheetFormula.col, SheetFormula.source)
+            .where(SheetFormula.sheet_id == sheet.id))]
+        seq = sheet.history_seq or 0
+        session.execute(delete(SheetSnapshot).where(SheetSnapshot.sheet_id == sheet.id, SheetSnapshot.seq == seq))
+        session.execute(insert(SheetSnapshot), [{
+            'sheet_id': sheet.id, 'seq': seq, 'n_rows': sheet.n_rows or 0, 'n_cols': sheet.n_cols or 0,
+            'chunks': b''.join(parts), 'formulas': zlib.compress(json.dumps(formulas).encode(), 6),
+            'created_at': datetime.utcnow()}])
+
+    # 归档
+
+    def archive(self, sheet):
+        """把最近hot_snapshots个快照区间之前的操作按快照区间归档到压缩文件，返回归档的操作数"""
+        from application.models.sheet import SheetHistorySegment, SheetOperation, SheetSnapshot
+        session = self.db.session
+        seqs = session.execute(select(SheetSnapshot.seq).where(SheetSnapshot.sheet_id == sheet.id)
+                               .order_by(SheetSnapshot.seq)).scalars().all()
+        if len(seqs) <= self.hot_snapshots:
+            return 0
+        archived_until = session.execute(select(func.max(SheetHistorySegment.seq_stop))
+                                         .where(SheetHistorySegment.sheet_id == sheet.id)).scalar() or 0
+        boundaries = [seq for seq in seqs[:-self.hot_snapshots] if seq > archived_until]
+        archived = 0
+        directory = os.path.join(self.archive_dir, sheet.key)
+        os.makedirs(directory, exist_ok=True)
+        for stop in boundaries:
+            start, archived_until = archived_until, stop
+            condition = (SheetOperation.sheet_id == sheet.id, SheetOperation.seq > start, SheetOperation.seq <= stop)
+            rows = session.execute(
+                select(SheetOperation.seq, SheetOperation.row, SheetOperation.col, SheetOperation.value,
+                       SheetOperation.formula, SheetOperation.user_id, SheetOperation.created_at)
+                .where(*condition).order_by(SheetOperation.seq))
+            name = f'{start + 1:012d}-{stop:012d}.jsonl.gz'
+            count = 0
+            with gzip.open(os.path.join(directory, name), 'wt', encoding='utf-8', compresslevel=6) as output:
+                for seq, row, col, value, formula, user_id, created_at in rows:
+                    output.write(json.dumps([seq, row, col, value, formula, user_id,
+                                             created_at.isoformat() if created_at else None],
+                                            ensure_ascii=False, separators=(',', ':')))
+                    output.write('\n')
+                    count += 1
+            session.execute(delete(SheetOperation).where(*condition))
+            session.add(SheetHistorySegment(sheet_id=sheet.id, seq_start=start, seq_stop=stop,
+                                            path=os.path.join(sheet.key, name), operations=count,
+                                            bytes=os.path.getsize(os.path.join(directory, name))))
+            archived += count
+        return archived
+
+    # 恢复
+
+    def restore(self, sheet, seq):
+        """返回表格在序号seq（执行完第seq条操作后）的只读视图"""
+        from application.models.sheet import SheetSnapshot
+        if not 0 <= seq <= (sheet.history_seq or 0):
+            raise ValueError(f'历史序号超出范围: {seq}')
+        session = self.db.session
+        snapshot = session.execute(
+            select(SheetSnapshot).where(SheetSnapshot.sheet_id == sheet.id, SheetSnapshot.seq <= seq)
+            .order_by(SheetSnapshot.seq.desc()).limit(1)).scalar()
+        chunks, formulas = {}, {}
+        base, n_rows, n_cols = 0, 0, 0
+        if snapshot is not None:
+            base, n_rows, n_cols = snapshot.seq, snapshot.n_rows, snapshot.n_cols
+            data = memoryview(snapshot.chunks)
+            pos = 0
+            while pos < len(data):
+                row_block, col_block, size = SNAPSHOT_CHUNK.unpack_from(data, pos)
+                pos += SNAPSHOT_CHUNK.size
+                chunks[row_block, col_block] = bytes(data[pos:pos + size])
+                pos += size
+            formulas = {(row, col): source for row, col, source in json.loads(zlib.decompress(snapshot.formulas))}
+
+        cells = {}
+        for _, row, col, value, formula in self.operations(sheet, base, seq):
+            cells[row, col] = value
+            if formula:
+                formulas[row, col] = formula
+            else:
+                formulas.pop((row, col), None)
+            n_rows, n_cols = max(n_rows, row + 1), max(n_cols, col + 1)
+        return SheetVersion(seq, n_rows, n_cols, sheet.chunk_rows, sheet.chunk_cols, chunks, cells, formulas)
+
+    def operations(self, sheet, after, until):
+        """按序号产出 (after, until] 内的操作(序号, 行, 列, 值, 公式)，依次读取归档文件和数据库"""
+        from application.models.sheet import SheetHistorySegment, SheetOperation
+        session = self.db.session
+        segments = session.execute(
+            select(SheetHistorySegment.path, SheetHistorySegment.seq_stop)
+            .where(SheetHistorySegment.sheet_id == sheet.id, SheetHistorySegment.seq_stop > after,
+                   SheetHistorySegment.seq_start < until)
+            .order_by(SheetHistorySegment.seq_start)).all()
+        archived_until = after
+        for path, seq_stop in segments:
+            with gzip.open(os.path.join(self.archive_dir, path), 'rt', encoding='utf-8') as lines:
+                for line in lines:
+                    seq, row, col, value, formula = json.loads(line)[:5]
+                    if after < seq <= until:
+                        yield seq, row, col, value, formula
+            archived_until = max(archived_until, seq_stop)
+        if archived_until >= until:
+            return
+        yield from session.execute(
+            select(SheetOperation.seq, SheetOperation.row, SheetOperation.col,
+                   SheetOperation.value, SheetOperation.formula)
+            .where(SheetOperation.sheet_id == sheet.id, SheetOperation.seq > archived_until,
+                   SheetOperation.seq <= until)
+            .order_by(SheetOperation.seq))
@@ -0,0 +1,230 @@
+import csv
+import io
+import os
+import re
+from datetime import date, datetime, time
+
+from flask import current_app
+
+from application import db, jobs, sheet_history
+from application.services.jobs import JobFailed, job_task
+from application.services.sheet_storage import SheetStorage
+
+INTEGER_RE = re.compile(r'^[+-]?(0|[1-9]\d*)$')
+NUMBER_RE = re.compile(r'^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$')
+LEADING_ZERO_RE = re.compile(r'^[+-]?0\d')
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+BOOLEANS = {'true': True, 'false': False}
+
+# 列类型的合并：integer与number合并为number，其余不同类型合并为text
+NUMERIC_KINDS = frozenset(['integer', 'number'])
+
+
+def detect_format(filename):
+    """根据扩展名判断表格文件格式"""
+    return 'xlsx' if filename.lower().endswith(('.xlsx', '.xlsm')) else 'csv'
+
+
+def parse_cell(value):
+    """把单元格原始值转换为存储值，返回(值, 类型)；空单元格返回(None, None)
+
+    CSV中的字符串按内容识别整数、小数和布尔值；带前导零的数字（编号、邮编）
+    保持为文本。日期统一保存为ISO格式文本，类型记为date。
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, bool):
+        return value, 'bool'
+    if isinstance(value, int):
+        return value, 'integer'
+    if isinstance(value, float):
+        return value, 'integer' if value.is_integer() else 'number'
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat(), 'date'
+    text = str(value).strip()
+    if not text:
+        return None, None
+    if INTEGER_RE.match(text):
+        return int(text), 'integer'
+    if NUMBER_RE.match(text) and not LEADING_ZERO_RE.match(text):
+        return float(text), 'number'
+    lowered = text.lower()
+    if lowered in BOOLEANS:
+        return BOOLEANS[lowered], 'bool'
+    if DATE_RE.match(text):
+        return text, 'date'
+    return text, 'text'
+
+
+class ColumnTypes:
+    """逐行推断各列类型，只保存每列当前的类型"""
+
+    def __init__(self):
+        self.kinds = []
+
+    def update(self, kinds):
+        current = self.kinds
+        if len(kinds) > len(current):
+            current.extend([None] * (len(kinds) - len(current)))
+        for i, kind in enumerate(kinds):
+            if kind is None or kind == current[i]:
+                continue
+            previous = current[i]
+            if previous is None:
+                current[i] = kind
+            elif previous in NUMERIC_KINDS and kind in NUMERIC_KINDS:
+                current[i] = 'number'
+            else:
+                current[i] = 'text'
+
+    def result(self):
+        return [kind or 'text' for kind in self.kinds]
+
+
+def _detect_encoding(sample):
+    """UTF-8（含BOM）无法解码时按GB18030读取（Excel中文版导出的CSV）"""
+    try:
+        # 样本末尾可能截断多字节字符
+        sample.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            return 'gb18030'
+    return 'utf-8-sig'
+
+
+def iter_csv(path):
+    """逐行产出(单元格列表, 已读字节数)"""
+    with open(path, 'rb') as raw:
+        sample = raw.read(65536)
+        raw.seek(0)
+        text = io.TextIOWrapper(raw, encoding=_detect_encoding(sample), newline='')
+        try:
+            # 只采用嗅探出的分隔符，引号等其余规则保持Excel默认
+            delimiter = csv.Sniffer().sniff(sample.decode('latin-1'), delimiters=',;\t|').delimiter
+        except csv.Error:
+            delimiter = ','
+        for row in csv.reader(text, delimiter=delimiter):
+            yield row, raw.tell()
+
+
+def iter_xlsx(path):
+    """以openpyxl只读模式逐行读取第一个工作表，按行数比例估算已读字节数"""
+    from openpyxl import load_workbook
+    size = os.path.getsize(path)
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        total_rows = worksheet.max_row or 0
+        for i, row in enumerate(worksheet.iter_rows(values_only=True), start=1):
+            yield list(row), size * i // total_rows if total_rows else 0
+    finally:
+        workbook.close()
+
+
+READERS = {'csv': iter_csv, 'xlsx': iter_xlsx}
+
+
+class SheetImporter:
+    """把CSV/XLSX文件流式导入表格
+
+    文件逐行解析，每累计batch_rows行（对齐到块的行数，每个块只写一次）
+    写入一次表格存储并提交，同时更新导入记录的进度。内存占用只与批大小和
+    列数有关，与文件大小无关。
+    """
+
+    def __init__(self, batch_rows=None):
+        self.batch_rows = batch_rows or current_app.config['SHEET_IMPORT_BATCH_ROWS']
+
+    def run(self, sheet_import, path, job=None):
+        """执行导入；job为后台任务记录时同步更新其进度"""
+        from application.models.sheet import SheetImport
+        sheet = sheet_import.sheet
+        storage = SheetStorage(sheet)
+        batch_rows = max(1, self.batch_rows // storage.chunk_rows) * storage.chunk_rows
+        types = ColumnTypes()
+
+        sheet_import.status = SheetImport.RUNNING
+        sheet_import.bytes_total = os.path.getsize(path)
+        db.session.commit()
+
+        batch = []
+        row_start = 0
+        position = 0
+        try:
+            for line_no, (raw_row, position) in enumerate(READERS[sheet_import.format](path)):
+                values, kinds = [], []
+                for raw in raw_row:
+                    value, kind = parse_cell(raw)
+                    values.append(value)
+                    kinds.append(kind)
+                # 首行作为表头写入，不参与类型推断
+                if line_no:
+                    types.update(kinds)
+                batch.append(values)
+                if len(batch) >= batch_rows:
+                    self._flush(sheet_import, storage, types, row_start, batch, position, job)
+                    row_start += len(batch)
+                    batch = []
+            self._flush(sheet_import, storage, types, row_start, batch, position, job)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('表格导入失败: %s', sheet_import.filename)
+            sheet_import.status = SheetImport.FAILED
+            sheet_import.error = f'{type(e).__name__}: {e}'
+            sheet_import.finished_at = datetime.utcnow()
+            db.session.commit()
+            return sheet_import
+
+        # 导入的内容作为操作历史的起点
+        sheet_history.snapshot(sheet)
+        sheet_import.status = SheetImport.DONE
+        sheet_import.bytes_read = sheet_import.bytes_total
+        sheet_import.finished_at = datetime.utcnow()
+        db.session.commit()
+        return sheet_import
+
+    def _flush(self, sheet_import, storage, types, row_start, batch, position, job=None):
+        if batch:
+            storage.write_rows(row_start, batch)
+            sheet_import.rows_imported = row_start + len(batch)
+        storage.sheet.column_types = types.result()
+        sheet_import.bytes_read = position
+        if job is not None:
+            job.set_progress(position, sheet_import.bytes_total)
+        db.session.commit()
+
+
+def run_import(import_id, path, remove=True, job=None):
+    """执行一个导入任务，完成后删除上传的临时文件"""
+    from application.models.sheet import SheetImport
+    try:
+        sheet_import = db.session.get(SheetImport, import_id)
+        return SheetImporter().run(sheet_import, path, job)
+    finally:
+        if remove:
+            os.remove(path)
+
+
+@job_task('cpu', retry_on=())
+def import_sheet_job(job, import_id, path):
+    """后台导入表格：解析单元格和编码数据块以CPU为主
+
+    重复投递时已完成的导入直接返回；未完成的导入从第一行重写，写入的块
+    覆盖上次的内容，结果相同。
+    """
+    from application.models.sheet import SheetImport
+    sheet_import = db.session.get(SheetImport, import_id)
+    if sheet_import is None:
+        raise JobFailed(f'导入记录不存在: {import_id}')
+    if sheet_import.status != SheetImport.DONE:
+        sheet_import = run_import(import_id, path, job=job)
+    if sheet_import.status == SheetImport.FAILED:
+        raise JobFailed(sheet_import.error)
+    return {'import_id': import_id, 'sheet_id': sheet_import.sheet_id,
+            'rows_imported': sheet_import.rows_imported}
+
+
+def submit_import(sheet_import, path, user=None, key=None):
+    """提交后台导入任务，返回Job；未配置Celery broker时在当前请求中执行"""
+    return jobs.submit(import_sheet_job, sheet_import.id, path, user=user, key=key,
+                       total=sheet_import.bytes_total, job_id=sheet_import.job_id)
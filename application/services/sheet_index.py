@@ -0,0 +1,319 @@
+import re
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+CELL_RE = re.compile(r'^([A-Za-z]{1,3})([1-9]\d{0,6})$')
+COLUMNS_RE = re.compile(r'^([A-Za-z]{1,3})$')
+FILTER_RE = re.compile(r'^([A-Za-z]{1,3})(>=|<=|!=|=|>|<|~)(.*)$', re.S)
+NUMERIC_KINDS = frozenset(['integer', 'number'])
+
+INDEX_FORMAT_VERSION = 1
+# 索引头：格式版本、数值/文本/布尔/空单元格各段的行数
+INDEX_HEADER = struct.Struct('<B4I')
+
+
+# A1地址
+
+def column_label(index):
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    label = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        label = chr(65 + rem) + label
+    return label
+
+
+def column_index(label):
+    index = 0
+    for ch in label.upper():
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def parse_range(text):
+    """解析A1:Z200或B7形式的地址，返回左闭右开、从0开始的(起始行, 起始列, 结束行, 结束列)"""
+    parts = text.strip().split(':')
+    if len(parts) > 2:
+        raise ValueError(f'无效的范围: {text}')
+    cells = []
+    for part in parts:
+        match = CELL_RE.match(part.strip())
+        if match is None:
+            raise ValueError(f'无效的单元格地址: {part}')
+        cells.append((int(match.group(2)) - 1, column_index(match.group(1))))
+    (r0, c0), (r1, c1) = cells[0], cells[-1]
+    return min(r0, r1), min(c0, c1), max(r0, r1) + 1, max(c0, c1) + 1
+
+
+def format_range(row_start, col_start, row_stop, col_stop):
+    start = f'{column_label(col_start)}{row_start + 1}'
+    stop = f'{column_label(col_stop - 1)}{row_stop}'
+    return start if start == stop else f'{start}:{stop}'
+
+
+def parse_sort(text):
+    """'B'为升序，'-B'为降序，返回(列, 是否降序)"""
+    text = text.strip()
+    descending = text.startswith('-')
+    label = text.lstrip('+-')
+    if not COLUMNS_RE.match(label):
+        raise ValueError(f'无效的排序列: {text}')
+    return column_index(label), descending
+
+
+def parse_filter(text):
+    """解析'B>10'、'A=苹果'、'C~关键字'形式的条件，返回(列, 运算符, 值, 值类型)"""
+    from application.services.sheet_import import parse_cell
+    match = FILTER_RE.match(text.strip())
+    if match is None:
+        raise ValueError(f'无效的筛选条件: {text}')
+    label, op, raw = match.groups()
+    if op == '~':
+        return column_index(label), op, raw.strip(), 'text'
+    value, kind = parse_cell(raw)
+    return column_index(label), op, value, kind
+
+
+# 列索引
+
+class ColumnIndex:
+    """单列的排序索引
+
+    rows为按Excel升序（数值 < 文本 < 布尔 < 空）排列的全部行号，numbers、
+    texts（casefold后）、bools依次是前三段的有序键。排序直接使用rows，
+    比较类筛选在对应段的键上二分查找，得到rows中的一段连续区间。
+    """
+
+    __slots__ = ('rows', 'numbers', 'texts', 'bools', 'n_empty')
+
+    def __init__(self, rows, numbers, texts, bools, n_empty):
+        self.rows = rows
+        self.numbers = numbers
+        self.texts = texts
+        self.bools = bools
+        self.n_empty = n_empty
+
+    @classmethod
+    def build(cls, storage, col, n_rows):
+        from application.services.sheet_storage import NUMBER, TEXT
+        numbers, texts, bools = [], [], []
+        present = bytearray(n_rows)
+        for row_start, chunk, local_col in storage.iter_column_chunks(col):
+            types, values = chunk.column(local_col)
+            for r, kind in enumerate(types):
+                if not kind:
+                    continue
+                row = row_start + r
+                if kind == NUMBER:
+                    numbers.append((values[r], row))
+                elif kind == TEXT:
+                    texts.append((chunk.get(r, local_col).casefold(), row))
+                else:
+                    bools.append((values[r], row))
+                present[row] = 1
+        numbers.sort()
+        texts.sort()
+        bools.sort()
+        rows = array('I', [row for _, row in numbers])
+        rows.extend(row for _, row in texts)
+        rows.extend(row for _, row in bools)
+        empty = [row for row, flag in enumerate(present) if not flag]
+        rows.extend(empty)
+        return cls(rows, array('d', [key for key, _ in numbers]), [key for key, _ in texts],
+                   array('B', [int(key) for key, _ in bools]), len(empty))
+
+    def ordered(self, descending=False):
+        """排序后的行号；降序时空单元格仍排在最后"""
+        if not descending:
+            return self.rows
+        filled = len(self.rows) - self.n_empty
+        result = self.rows[filled - 1::-1] if filled else array('I')
+        return result + self.rows[filled:]
+
+    def match(self, op, value, kind):
+        """满足条件的行号"""
+        n_numbers, n_texts = len(self.numbers), len(self.texts)
+        filled = len(self.rows) - self.n_empty
+        if op == '~':
+            needle = value.casefold()
+            return [self.rows[n_numbers + i] for i, key in enumerate(self.texts) if needle in key]
+        if value is None:
+            # 与空值比较：=匹配空单元格，!=匹配非空单元格
+            if op == '=':
+                return self.rows[filled:]
+            if op == '!=':
+                return self.rows[:filled]
+            return []
+        if kind in NUMERIC_KINDS:
+            keys, offset, value = self.numbers, 0, float(value)
+        elif kind == 'bool':
+            keys, offset, value = self.bools, n_numbers + n_texts, int(value)
+        else:
+            keys, offset, value = self.texts, n_numbers, str(value).casefold()
+        lo, hi = 0, len(keys)
+        if op == '=':
+            lo, hi = bisect_left(keys, value), bisect_right(keys, value)
+        elif op == '!=':
+            start, stop = offset + bisect_left(keys, value), offset + bisect_right(keys, value)
+            return self.rows[:start] + self.rows[stop:filled]
+        elif op == '>':
+            lo = bisect_right(keys, value)
+        elif op == '>=':
+            lo = bisect_left(keys, value)
+        elif op == '<':
+            hi = bisect_left(keys, value)
+        elif op == '<=':
+            hi = bisect_right(keys, value)
+        return self.rows[offset + lo:offset + hi]
+
+    def encode(self):
+        encoded = [text.encode('utf-8') for text in self.texts]
+        offsets = array('I', accumulate((len(data) for data in encoded), initial=0))
+        return zlib.compress(b''.join([
+            INDEX_HEADER.pack(INDEX_FORMAT_VERSION, len(self.numbers), len(self.texts),
+                              len(self.bools), self.n_empty),
+            self.rows.tobytes(), self.numbers.tobytes(), self.bools.tobytes(),
+            offsets.tobytes(), *encoded]), 1)
+
+    @classmethod
+    def decode(cls, data):
+        raw = zlib.decompress(data)
+        version, n_numbers, n_texts, n_bools, n_empty = INDEX_HEADER.unpack_from(raw)
+        if version != INDEX_FORMAT_VERSION:
+            raise ValueError('无法识别的索引格式')
+        pos = INDEX_HEADER.size
+        rows, numbers, bools, offsets = array('I'), array('d'), array('B'), array('I')
+        for arr, count in ((rows, n_numbers + n_texts + n_bools + n_empty), (numbers, n_numbers),
+                           (bools, n_bools), (offsets, n_texts + 1)):
+            size = arr.itemsize * count
+            arr.frombytes(raw[pos:pos + size])
+            pos += size
+        blob = raw[pos:]
+        texts = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(n_texts)]
+        return cls(rows, numbers, texts, bools, n_empty)
+
+
+class SheetIndexCache:
+    """列排序索引与查询视图的缓存
+
+    列索引在首次排序或筛选时构建，请求会话的事务结束后在独立的连接中持久化到
+    sheet_column_indexes，其他worker和重启后的进程直接加载；进程内再按(表格, 列, 版本)做LRU缓存。视图是筛选并
+    排序后的行号序列，按(表格, 版本, 查询条件)缓存，滚动时只对视图切片读取
+    可见的行，延迟与表格大小无关。表格版本变化后旧条目不再命中，随LRU淘汰。
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.maxsize = 32
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.maxsize = app.config.setdefault('SHEET_INDEX_CACHE_SIZE', self.maxsize)
+        if self.db is None:
+            self.db = db
+            event.listen(db.session, 'after_transaction_end', self._after_transaction_end)
+        app.extensions['sheet_indexes'] = self
+
+    def column_index(self, sheet, col):
+        key = ('index', sheet.revision, col)
+        index = self._get(key)
+        if index is None:
+            index = self._load_or_build(sheet, col)
+            self._set(key, index)
+        return index
+
+    def view(self, sheet, header=0, sort=None, filters=()):
+        """筛选并排序后的行号序列（不含前header行）"""
+        if sort is None and not filters:
+            return range(header, sheet.n_rows)
+        key = ('view', sheet.revision, header, sort, tuple(filters))
+        rows = self._get(key)
+        if rows is None:
+            rows = self._compute_view(sheet, header, sort, filters)
+            self._set(key, rows)
+        return rows
+
+    def _compute_view(self, sheet, header, sort, filters):
+        matched = None
+        for col, op, value, kind in filters:
+            rows = set(self.column_index(sheet, col).match(op, value, kind))
+            matched = rows if matched is None else matched & rows
+        if sort is not None:
+            ordered = self.column_index(sheet, sort[0]).ordered(sort[1])
+            return array('I', (row for row in ordered
+                               if row >= header and (matched is None or row in matched)))
+        return array('I', sorted(row for row in matched if row >= header))
+
+    def _load_or_build(self, sheet, col):
+        from application.models.sheet import SheetColumnIndex
+        from application.services.sheet_storage import SheetStorage
+        stored = self.db.session.get(SheetColumnIndex, (sheet.id, col))
+        if stored is not None and stored.version == sheet.version:
+            return ColumnIndex.decode(stored.data)
+        index = ColumnIndex.build(SheetStorage(sheet), col, sheet.n_rows)
+        self.db.session.info.setdefault('sheet_index_pending', []).append(
+            (sheet.id, col, sheet.version, index, stored is not None))
+        return index
+
+    def _after_transaction_end(self, session, transaction):
+        """请求会话的事务结束（提交、回滚或关闭）后保存期间重建的索引
+
+        读取请求不提交请求会话：那会一并提交会话中的其他变更并触发各缓存的
+        提交钩子；事务结束前保存又会与会话持有的写锁冲突（SQLite）。
+        """
+        if transaction.parent is not None:
+            return
+        for pending in session.info.pop('sheet_index_pending', ()):
+            self._persist(*pending)
+
+    def _persist(self, sheet_id, col, version, index, exists):
+        """在独立的连接中保存索引；版本未提交（已回滚）时不保存，失败时下次读取再重建"""
+        from application.models.sheet import Sheet, SheetColumnIndex
+        table = SheetColumnIndex.__table__
+        data = index.encode()
+        try:
+            with self.db.engine.begin() as connection:
+                committed = connection.execute(
+                    select(Sheet.__table__.c.version).where(Sheet.__table__.c.id == sheet_id)).scalar()
+                if committed != version:
+                    return
+                if exists:
+                    # 不覆盖其他worker已写入的更新版本
+                    connection.execute(table.update().where(
+                        table.c.sheet_id == sheet_id, table.c.col == col, table.c.version < version)
+                        .values(version=version, data=data))
+                else:
+                    connection.execute(table.insert().values(
+                        sheet_id=sheet_id, col=col, version=version, data=data))
+        except IntegrityError:
+            # 其他worker同时构建了同一列的索引
+            pass
+        except OperationalError as e:
+            current_app.logger.warning('保存列索引失败 %s:%s: %s', sheet_id, col, e)
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -0,0 +1,344 @@
+import math
+import struct
+import zlib
+from array import array
+from itertools import accumulate
+
+from sqlalchemy import case, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from application import db
+from application.models.sheet import Sheet, SheetChunk
+
+# 单元格类型码
+EMPTY, NUMBER, TEXT, BOOL = 0, 1, 2, 3
+
+MAGIC = b'SC'
+FORMAT_VERSION = 1
+# 块头：魔数、格式版本、行数、列数
+HEADER = struct.Struct('<2sBHH')
+# 整数值在此范围内按int返回，超出float64可精确表示的范围后保持float
+MAX_EXACT_INT = 2 ** 53
+
+_NAN = float('nan')
+
+# 新块被并发写入者抢先插入时重新读改写的次数上限
+CHUNK_WRITE_ATTEMPTS = 3
+
+
+class Chunk:
+    """一块单元格的内存表示（按列存储）
+
+    第c列第r行位于下标 c * rows + r。types为每个单元格的类型码（uint8），
+    numbers为float64数组（非数值单元格为NaN，可直接nansum），texts为已解码的
+    {下标: 字符串}，从编码解出的文本在首次读取时才解码。编码后每列依次为：
+        types[rows] uint8 | numbers[rows] float64 | offsets[rows+1] uint32 | UTF-8文本
+    整块再经zlib压缩。解压后各数组都可以用numpy.frombuffer按偏移零拷贝读取。
+    """
+
+    __slots__ = ('rows', 'cols', 'types', 'numbers', 'texts', '_pending')
+
+    def __init__(self, rows, cols):
+        n = rows * cols
+        self.rows = rows
+        self.cols = cols
+        self.types = bytearray(n)
+        self.numbers = array('d', [_NAN]) * n
+        self.texts = {}
+        # 解码时暂不展开的文本列：{列: (文本数据起点, 偏移量视图)}，读取时按单元格解码
+        self._pending = {}
+
+    def get(self, row, col):
+        i = col * self.rows + row
+        kind = self.types[i]
+        if kind == NUMBER:
+            value = self.numbers[i]
+            if value.is_integer() and abs(value) < MAX_EXACT_INT:
+                return int(value)
+            return value
+        if kind == TEXT:
+            text = self.texts.get(i)
+            if text is None:
+                blob, offsets = self._pending[col]
+                text = self.texts[i] = str(blob[offsets[row]:offsets[row + 1]], 'utf-8')
+            return text
+        if kind == BOOL:
+            return self.numbers[i] != 0
+        return None
+
+    def set(self, row, col, value):
+        if col in self._pending:
+            self._expand(col)
+        i = col * self.rows + row
+        self.texts.pop(i, None)
+        if value is None or value == '':
+            self.types[i] = EMPTY
+            self.numbers[i] = _NAN
+        elif isinstance(value, bool):
+            self.types[i] = BOOL
+            self.numbers[i] = 1.0 if value else 0.0
+        elif isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value)):
+            self.types[i] = NUMBER
+            self.numbers[i] = value
+        else:
+            self.types[i] = TEXT
+            self.numbers[i] = _NAN
+            self.texts[i] = str(value)
+
+    def _expand(self, col):
+        """解码该列尚未读取的全部文本"""
+        lo = col * self.rows
+        for row in range(self.rows):
+            if self.types[lo + row] == TEXT:
+                self.get(row, col)
+        del self._pending[col]
+
+    def is_empty(self):
+        return not any(self.types)
+
+    def encode(self):
+        for col in list(self._pending):
+            self._expand(col)
+        rows = self.rows
+        parts = [HEADER.pack(MAGIC, FORMAT_VERSION, rows, self.cols)]
+        encoded = {i: text.encode('utf-8') for i, text in self.texts.items()}
+        for col in range(self.cols):
+            lo = col * rows
+            lengths = [0] * rows
+            blob = []
+            for row in range(rows):
+                data = encoded.get(lo + row)
+                if data is not None:
+                    lengths[row] = len(data)
+                    blob.append(data)
+            parts.append(bytes(self.types[lo:lo + rows]))
+            parts.append(self.numbers[lo:lo + rows].tobytes())
+            parts.append(array('I', accumulate(lengths, initial=0)).tobytes())
+            parts.append(b''.join(blob))
+        return zlib.compress(b''.join(parts), 1)
+
+    @classmethod
+    def decode(cls, data):
+        raw = zlib.decompress(data)
+        magic, version, rows, cols = HEADER.unpack_from(raw)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('无法识别的数据块格式')
+        chunk = cls.__new__(cls)
+        chunk.rows = rows
+        chunk.cols = cols
+        chunk.types = bytearray()
+        chunk.numbers = array('d')
+        chunk.texts = {}
+        chunk._pending = {}
+        view = memoryview(raw)
+        pos = HEADER.size
+        for col in range(cols):
+            types = raw[pos:pos + rows]
+            pos += rows
+            chunk.types += types
+            chunk.numbers.frombytes(raw[pos:pos + 8 * rows])
+            pos += 8 * rows
+            offsets = view[pos:pos + 4 * (rows + 1)].cast('I')
+            pos += 4 * (rows + 1)
+            if TEXT in types:
+                # 文本在读取时才解码，按行号读取少量单元格时不必解码整块
+                chunk._pending[col] = (view[pos:pos + offsets[rows]], offsets)
+            pos += offsets[rows]
+        return chunk
+
+    def column(self, col):
+        """返回第col列的(类型码, 数值数组)视图"""
+        lo = col * self.rows
+        return memoryview(self.types)[lo:lo + self.rows], self.numbers[lo:lo + self.rows]
+
+
+class SheetStorage:
+    """表格的分块读写
+
+    行列下标从0开始，范围均为左闭右开。读写只加载与范围相交的块，
+    写入不提交事务，由调用方提交。
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.chunk_rows = sheet.chunk_rows
+        self.chunk_cols = sheet.chunk_cols
+
+    # 读取
+
+    def read_range(self, row_start, col_start, row_stop, col_stop):
+        """返回范围内的单元格值，按行组织的二维列表"""
+        row_stop = max(row_start, row_stop)
+        col_stop = max(col_start, col_stop)
+        result = [[None] * (col_stop - col_start) for _ in range(row_stop - row_start)]
+        if row_start >= row_stop or col_start >= col_stop:
+            return result
+        chunks = self._load(row_start // self.chunk_rows, (row_stop - 1) // self.chunk_rows,
+                            col_start // self.chunk_cols, (col_stop - 1) // self.chunk_cols)
+        for (row_block, col_block), chunk in chunks.items():
+            base_row = row_block * self.chunk_rows
+            base_col = col_block * self.chunk_cols
+            rows = range(max(row_start, base_row), min(row_stop, base_row + self.chunk_rows))
+            cols = range(max(col_start, base_col), min(col_stop, base_col + self.chunk_cols))
+            for col in cols:
+                for row in rows:
+                    result[row - row_start][col - col_start] = chunk.get(row - base_row, col - base_col)
+        return result
+
+    def get_cell(self, row, col):
+        return self.read_range(row, col, row + 1, col + 1)[0][0]
+
+    def read_rows(self, rows, col_start, col_stop):
+        """按给定行号（可不连续，如排序后的视图）读取[col_start, col_stop)列"""
+        result = [[None] * (col_stop - col_start) for _ in rows]
+        if not rows or col_start >= col_stop:
+            return result
+        col_blocks = range(col_start // self.chunk_cols, (col_stop - 1) // self.chunk_cols + 1)
+        row_blocks = {row // self.chunk_rows for row in rows}
+        chunks = self._load_keys([(rb, cb) for rb in row_blocks for cb in col_blocks])
+        for i, row in enumerate(rows):
+            row_block, local_row = divmod(row, self.chunk_rows)
+            values = result[i]
+            for col_block in col_blocks:
+                chunk = chunks.get((row_block, col_block))
+                if chunk is None:
+                    continue
+                base_col = col_block * self.chunk_cols
+                for col in range(max(col_start, base_col), min(col_stop, base_col + self.chunk_cols)):
+                    values[col - col_start] = chunk.get(local_row, col - base_col)
+        return result
+
+    def iter_column_chunks(self, col):
+        """按行块顺序产出第col列的(起始行, Chunk, 块内列号)，供排序索引和公式计算使用"""
+        col_block, local_col = divmod(col, self.chunk_cols)
+        stmt = (select(SheetChunk.row_block, SheetChunk.data)
+                .where(SheetChunk.sheet_id == self.sheet.id, SheetChunk.col_block == col_block)
+                .order_by(SheetChunk.row_block))
+        for row_block, data in db.session.execute(stmt):
+            yield row_block * self.chunk_rows, Chunk.decode(data), local_col
+
+    # 写入
+
+    def write_cells(self, cells):
+        """写入{(行, 列): 值}，只读改写涉及的块"""
+        if not cells:
+            return
+        by_chunk = {}
+        for (row, col), value in cells.items():
+            if row < 0 or col < 0:
+                raise ValueError('单元格下标不能为负数')
+            row_block, local_row = divmod(row, self.chunk_rows)
+            col_block, local_col = divmod(col, self.chunk_cols)
+            by_chunk.setdefault((row_block, col_block), []).append((local_row, local_col, value))
+        self._apply(by_chunk)
+        self._touch(max(row for row, _ in cells) + 1, max(col for _, col in cells) + 1)
+
+    def set_cell(self, row, col, value):
+        self.write_cells({(row, col): value})
+
+    def write_rows(self, row_start, rows, col_start=0):
+        """从row_start行起整行写入（批量导入），空值不覆盖已有内容"""
+        rows = list(rows)
+        if not rows:
+            return
+        by_chunk = {}
+        width = 0
+        for offset, values in enumerate(rows):
+            row_block, local_row = divmod(row_start + offset, self.chunk_rows)
+            width = max(width, len(values))
+            for i, value in enumerate(values):
+                if value is None or value == '':
+                    continue
+                col_block, local_col = divmod(col_start + i, self.chunk_cols)
+                by_chunk.setdefault((row_block, col_block), []).append((local_row, local_col, value))
+        if by_chunk:
+            self._apply(by_chunk)
+        self._touch(row_start + len(rows), col_start + width)
+
+    # 内部
+
+    def _touch(self, n_rows, n_cols):
+        """在数据库中原子地递增版本并扩大行列范围
+
+        并发写入者各自在内存中加一会提交相同的版本号，而版本号是ETag和各级
+        缓存的键，因此用一条UPDATE完成，再把结果同步到对象上（不产生待写变更）。
+        """
+        table = Sheet.__table__
+        condition = table.c.id == self.sheet.id
+        db.session.execute(table.update().where(condition).values(
+            n_rows=case((table.c.n_rows < n_rows, n_rows), else_=table.c.n_rows),
+            n_cols=case((table.c.n_cols < n_cols, n_cols), else_=table.c.n_cols),
+            version=table.c.version + 1))
+        # UPDATE持有行锁直到提交，读到的是本事务写入的值
+        row = db.session.execute(
+            select(table.c.n_rows, table.c.n_cols, table.c.version).where(condition)).one()
+        for name, value in row._mapping.items():
+            set_committed_value(self.sheet, name, value)
+
+    def _load(self, row_block_start, row_block_stop, col_block_start, col_block_stop):
+        stmt = select(SheetChunk.row_block, SheetChunk.col_block, SheetChunk.data).where(
+            SheetChunk.sheet_id == self.sheet.id,
+            SheetChunk.row_block.between(row_block_start, row_block_stop),
+            SheetChunk.col_block.between(col_block_start, col_block_stop))
+        return {(rb, cb): Chunk.decode(data) for rb, cb, data in db.session.execute(stmt)}
+
+    def _apply(self, by_chunk):
+        """把{(行块, 列块): [(块内行, 块内列, 值)]}写入对应的块
+
+        FOR UPDATE锁不住尚不存在的块：两个写入者同时首次写入同一新块时，后插入的
+        一方违反主键约束，此时对这些块重新读取（已存在并加锁）再改写。
+        """
+        for attempt in range(1, CHUNK_WRITE_ATTEMPTS + 1):
+            existing = self._load_keys(list(by_chunk), for_update=True)
+            changed = {}
+            for key, updates in by_chunk.items():
+                chunk = existing.get(key) or Chunk(self.chunk_rows, self.chunk_cols)
+                for row, col, value in updates:
+                    chunk.set(row, col, value)
+                changed[key] = chunk
+            conflicts = self._save(changed, set(existing), retry=attempt < CHUNK_WRITE_ATTEMPTS)
+            if not conflicts:
+                return
+            by_chunk = {key: by_chunk[key] for key in conflicts}
+
+    def _load_keys(self, keys, for_update=False):
+        stmt = select(SheetChunk.row_block, SheetChunk.col_block, SheetChunk.data).where(
+            SheetChunk.sheet_id == self.sheet.id,
+            tuple_(SheetChunk.row_block, SheetChunk.col_block).in_(keys))
+        if for_update:
+            # 并发写同一块时串行化读改写（SQLite忽略）
+            stmt = stmt.with_for_update()
+        return {(rb, cb): Chunk.decode(data) for rb, cb, data in db.session.execute(stmt)}
+
+    def _save(self, chunks, existing_keys, retry=False):
+        """写入改动的块；retry为True时新块与并发插入冲突则返回这些块的键，不抛出异常"""
+        table = SheetChunk.__table__
+        inserts = []
+        for (row_block, col_block), chunk in chunks.items():
+            if (row_block, col_block) in existing_keys:
+                condition = ((table.c.sheet_id == self.sheet.id) & (table.c.row_block == row_block)
+                             & (table.c.col_block == col_block))
+                if chunk.is_empty():
+                    db.session.execute(table.delete().where(condition))
+                else:
+                    db.session.execute(table.update().where(condition).values(data=chunk.encode()))
+            elif not chunk.is_empty():
+                inserts.append({'sheet_id': self.sheet.id, 'row_block': row_block,
+                                'col_block': col_block, 'data': chunk.encode()})
+        if not inserts:
+            return []
+        if not retry:
+            db.session.execute(insert(table), inserts)
+            return []
+        try:
+            if db.engine.dialect.name == 'sqlite':
+                # SQLite中失败的语句只回滚自身；pysqlite在事务外执行SAVEPOINT时释放即提交，不能使用
+                db.session.execute(insert(table), inserts)
+            else:
+                with db.session.begin_nested():
+                    db.session.execute(insert(table), inserts)
+        except IntegrityError:
+            return [(row['row_block'], row['col_block']) for row in inserts]
+        return []
+
@@ -0,0 +1,338 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from email_validator import EmailNotValidError, validate_email
+from flask import current_app
+from flask_security.utils import get_hmac, use_double_hash
+from passlib.context import CryptContext
+from sqlalchemy import insert, select
+
+from application import db, page_cache, permission_cache
+from application.services.jobs import job_task
+from application.forms import USERNAME_MAX_LENGTH, USERNAME_MIN_LENGTH, USERNAME_PATTERN
+
+USERNAME_RE = re.compile(USERNAME_PATTERN)
+
+# 子进程内的哈希上下文，由进程池initializer创建
+_worker_context = None
+
+
+def _init_hash_worker(context_config):
+    global _worker_context
+    _worker_context = CryptContext.from_string(context_config)
+
+
+def _hash_secrets(secrets):
+    """在子进程中批量计算密码哈希"""
+    return [_worker_context.hash(secret) for secret in secrets]
+
+
+class ImportResult:
+    """一次导入的统计结果"""
+
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.rejects_path = None
+
+    @property
+    def rows_per_second(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def detect_format(filename):
+    """根据扩展名判断输入格式"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def iter_rows(stream, fmt):
+    """逐行读取二进制流中的CSV或JSONL记录"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line in text:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = {'_raw': line}
+            yield row if isinstance(row, dict) else {'_raw': line}
+    else:
+        yield from csv.DictReader(text)
+
+
+def _parse_roles(value, default_role):
+    """解析角色列表或以;/|分隔的字符串，其他类型（如JSONL中的数字、对象）返回None"""
+    if isinstance(value, list):
+        names = [str(v).strip() for v in value]
+    elif value is None or isinstance(value, str):
+        names = [v.strip() for v in re.split(r'[;|]', value or '')]
+    else:
+        return None
+    names = [name for name in names if name]
+    if not names and default_role:
+        names = [default_role]
+    return names
+
+
+def _parse_active(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == '':
+        return True
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+class UserImporter:
+    """批量用户导入
+
+    按批校验（规则同ExtendedRegisterForm），用进程池计算密码哈希，
+    以多行INSERT写入users并批量关联user_roles。当前批次哈希期间
+    同时校验下一批。
+    """
+
+    def __init__(self, batch_size=None, workers=None, default_role=None):
+        config = current_app.config
+        self.batch_size = batch_size or config['USER_IMPORT_BATCH_SIZE']
+        self.workers = config['USER_IMPORT_WORKERS'] if workers is None else workers
+        self.default_role = default_role
+        self.security = current_app.extensions['security']
+        self._role_ids = None
+
+    def run(self, stream, fmt='csv', rejects=None):
+        """导入stream中的全部记录，rejects为可写文本文件，收集被拒绝的行"""
+        result = ImportResult()
+        start = time.perf_counter()
+        self._reject_writer = self._make_reject_writer(rejects, fmt)
+        self._result = result
+        self._seen_usernames = set()
+        self._seen_emails = set()
+
+        executor = None
+        if self.workers:
+            executor = ProcessPoolExecutor(max_workers=self.workers,
+                                           initializer=_init_hash_worker,
+                                           initargs=(self.security.pwd_context.to_string(),))
+        try:
+            pending = None
+            for batch in self._batches(iter_rows(stream, fmt)):
+                result.total += len(batch)
+                valid = self._validate(batch)
+                future = self._hash_async(executor, valid)
+                if pending is not None:
+                    self._insert(*pending)
+                pending = (valid, future)
+            if pending is not None:
+                self._insert(*pending)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if result.imported:
+            # 在ORM之外写入了users和user_roles，需手动使权限缓存和页面缓存失效
+            permission_cache.bump_version()
+            page_cache.invalidate('users', 'roles')
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _batches(self, rows):
+        batch = []
+        for line_no, row in enumerate(rows, start=1):
+            batch.append((line_no, row))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _validate(self, batch):
+        """校验一批记录，返回通过校验的记录列表"""
+        from application.models.user import User
+
+        candidates = []
+        for line_no, row in batch:
+            if '_raw' in row:
+                self._reject(line_no, row, ['无法解析的行'])
+                continue
+            errors = []
+            username = str(row.get('username') or '').strip()
+            email = str(row.get('email') or '').strip()
+            password = str(row.get('password') or '')
+
+            if not username:
+                errors.append('用户名不能为空')
+            elif not USERNAME_MIN_LENGTH <= len(username) <= USERNAME_MAX_LENGTH:
+                errors.append('用户名长度必须在3-80个字符之间')
+            elif not USERNAME_RE.match(username):
+                errors.append('用户名只能包含字母、数字、下划线和连字符')
+            if not email:
+                errors.append('邮箱不能为空')
+            else:
+                try:
+                    validate_email(email, check_deliverability=False)
+                except EmailNotValidError:
+                    errors.append('邮箱格式不正确')
+            password_errors, password = self.security._password_util.validate(
+                password, True, username=username, email=email)
+            if password_errors:
+                errors.extend(str(e) for e in password_errors)
+
+            roles = _parse_roles(row.get('roles'), self.default_role)
+            if roles is None:
+                errors.append('角色格式不正确')
+                roles = []
+            unknown = [name for name in roles if name not in self.role_ids]
+            if unknown:
+                errors.append('未知角色: ' + ', '.join(unknown))
+
+            if errors:
+                self._reject(line_no, row, errors)
+            else:
+                candidates.append((line_no, row, username, email, password, roles))
+
+        # 唯一性：一次查询本批所有用户名/邮箱，并排除文件内重复
+        usernames = {c[2] for c in candidates}
+        emails = {c[3] for c in candidates}
+        taken_usernames = set(db.session.execute(
+            select(User.username).where(User.username.in_(usernames))).scalars())
+        taken_emails = set(db.session.execute(
+            select(User.email).where(User.email.in_(emails))).scalars())
+
+        valid = []
+        for line_no, row, username, email, password, roles in candidates:
+            errors = []
+            if username in taken_usernames or username in self._seen_usernames:
+                errors.append('该用户名已被使用')
+            if email in taken_emails or email in self._seen_emails:
+                errors.append('该邮箱已被使用')
+            if errors:
+                self._reject(line_no, row, errors)
+                continue
+            self._seen_usernames.add(username)
+            self._seen_emails.add(email)
+            valid.append({
+                'username': username,
+                'email': email,
+                'password': password,
+                'active': _parse_active(row.get('active')),
+                'roles': roles,
+            })
+        return valid
+
+    @property
+    def role_ids(self):
+        if self._role_ids is None:
+            from application.models.user import Role
+            self._role_ids = dict(db.session.execute(select(Role.name, Role.id)).all())
+        return self._role_ids
+
+    def _hash_async(self, executor, valid):
+        """提交一批密码哈希；与Flask-Security的hash_password结果一致"""
+        double_hash = use_double_hash()
+        secrets = [get_hmac(v['password']).decode('ascii') if double_hash else v['password']
+                   for v in valid]
+        if executor is None or not secrets:
+            context = self.security.pwd_context
+            return [context.hash(secret) for secret in secrets]
+        chunk = max(1, len(secrets) // self.workers)
+        return [executor.submit(_hash_secrets, secrets[i:i + chunk])
+                for i in range(0, len(secrets), chunk)]
+
+    def _insert(self, valid, hashed):
+        """多行INSERT写入一批用户并批量关联角色"""
+        from application.models.user import User, user_roles
+        if not valid:
+            return
+        if hashed and not isinstance(hashed[0], str):
+            hashed = [h for future in hashed for h in future.result()]
+
+        now = datetime.utcnow()
+        rows = [{
+            'username': v['username'],
+            'email': v['email'],
+            'password': password_hash,
+            'active': v['active'],
+            'fs_uniquifier': uuid.uuid4().hex,
+            'created_at': now,
+            'updated_at': now,
+            'login_count': 0,
+        } for v, password_hash in zip(valid, hashed)]
+        db.session.execute(insert(User.__table__).values(rows))
+
+        ids = dict(db.session.execute(
+            select(User.email, User.id).where(User.email.in_([v['email'] for v in valid]))).all())
+        links = [{'user_id': ids[v['email']], 'role_id': self.role_ids[name]}
+                 for v in valid for name in v['roles']]
+        if links:
+            db.session.execute(insert(user_roles).values(links))
+        db.session.commit()
+        self._result.imported += len(valid)
+
+    def _make_reject_writer(self, rejects, fmt):
+        if rejects is None:
+            return None
+        if fmt == 'jsonl':
+            def write(line_no, row, errors):
+                record = dict(row, line=line_no, errors=errors)
+                rejects.write(json.dumps(record, ensure_ascii=False) + '\n')
+            return write
+        writer = csv.writer(rejects)
+        writer.writerow(['line', 'username', 'email', 'roles', 'active', 'errors'])
+
+        def write(line_no, row, errors):
+            writer.writerow([line_no, row.get('username', ''), row.get('email', ''),
+                             row.get('roles', ''), row.get('active', ''), '; '.join(errors)])
+        return write
+
+    def _reject(self, line_no, row, errors):
+        self._result.rejected += 1
+        if self._reject_writer is not None:
+            # 被拒绝的行不回写明文密码
+            row = {k: v for k, v in row.items() if k != 'password'}
+            self._reject_writer(line_no, row, errors)
+
+
+def import_users(stream, fmt='csv', rejects=None, **options):
+    """导入用户的便捷入口，返回ImportResult"""
+    return UserImporter(**options).run(stream, fmt, rejects)
+
+
+@job_task('cpu', retry_on=())
+def import_users_job(job, path, fmt, rejects_path, default_role=None):
+    """后台批量导入用户，结束后（无论成败）删除上传的文件
+
+    worker进程按核数并发，且prefork池的子进程不能再创建进程池，因此在当前
+    进程计算哈希。不自动重试：已提交的批次再次导入时会因用户名、邮箱重复
+    而被拒绝，不会产生重复用户。
+    """
+    rejected = 0
+    try:
+        with open(path, 'rb') as stream, open(rejects_path, 'w', newline='', encoding='utf-8') as rejects:
+            result = import_users(stream, fmt, rejects, workers=0, default_role=default_role)
+        rejected = result.rejected
+    finally:
+        # 上传文件含明文密码，无论成败都删除；失败或没有被拒绝的行时也删除拒绝文件
+        for leftover in (path,) if rejected else (path, rejects_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    job.set_progress(result.total, result.total)
+    return dict(result.to_dict(), rejects_path=os.path.basename(rejects_path) if result.rejected else None)
@@ -0,0 +1 @@
+# 性能基准包初始化文件
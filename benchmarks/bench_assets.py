@@ -0,0 +1,82 @@
+"""静态资源基准：首页和管理后台页面引用的本地资源的传输字节数与首次绘制时间
+
+分别在未构建（Flask原样返回）和 assets-build 之后请求页面引用的本地CSS/JS
+（管理后台取Flask-Admin bootstrap4模板中的资源），浏览器声明支持gzip和br。
+首次访问统计全部字节数；再次访问时未构建的资源每个都要带条件请求重新验证
+（304），带指纹的资源为immutable，不再发出请求。
+
+首次绘制时间按模拟网络估算（默认RTT 150ms、带宽1.6Mbps，即Fast 3G）：
+HTML一个往返加传输，之后阻塞渲染的CSS并行请求，一个往返加传输。CDN上的
+资源两种情况相同，不计入；管理后台只计资源，不计HTML。
+
+用法: python -m benchmarks.bench_assets [RTT毫秒] [带宽kbps]
+"""
+import re
+import sys
+import tempfile
+
+from flask import url_for
+
+from application import assets
+from benchmarks.common import bench_app, report
+
+# Flask-Admin bootstrap4 base.html 中的资源
+ADMIN_CSS = ['bootstrap/bootstrap4/css/bootstrap.min.css', 'admin/css/bootstrap4/admin.css',
+             'bootstrap/bootstrap4/css/font-awesome.min.css']
+ADMIN_JS = ['vendor/jquery.min.js', 'bootstrap/bootstrap4/js/popper.min.js',
+            'bootstrap/bootstrap4/js/bootstrap.min.js', 'vendor/moment.min.js',
+            'vendor/bootstrap4/util.js', 'vendor/bootstrap4/dropdown.js', 'vendor/select2/select2.min.js',
+            'admin/js/helpers.js']
+
+
+def _page_assets(app, client):
+    html = client.get('/').data.decode('utf-8')
+    css = re.findall(r'<link[^>]+href="(/static/[^"]+)"', html)
+    js = re.findall(r'<script[^>]+src="(/static/[^"]+)"', html)
+    with app.test_request_context():
+        admin_css = [url_for('admin.static', filename=name) for name in ADMIN_CSS]
+        admin_js = [url_for('admin.static', filename=name) for name in ADMIN_JS]
+    return {'index': (len(html.encode()), css, js), 'admin': (0, admin_css, admin_js)}
+
+
+def _visit(client, html_bytes, css, js, rtt, bandwidth):
+    """返回(首次字节数, 首次绘制ms, 再次访问请求数, 再次绘制ms)"""
+    headers = {'Accept-Encoding': 'gzip, deflate, br'}
+    sizes, revalidate = {}, 0
+    for url in css + js:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, url
+        sizes[url] = len(response.data)
+        if 'immutable' not in response.headers.get('Cache-Control', ''):
+            revalidate += 1
+    transfer = lambda n: n * 8 / bandwidth  # noqa: E731  毫秒
+    html_ms = rtt + transfer(html_bytes)
+    css_bytes = sum(sizes[url] for url in css)
+    first_paint = html_ms + (rtt + transfer(css_bytes) if css else 0)
+    blocking_revalidations = sum(1 for url in css if 'immutable' not in
+                                 client.get(url).headers.get('Cache-Control', ''))
+    repeat_paint = html_ms + (rtt if blocking_revalidations else 0)
+    return sum(sizes.values()), first_paint, revalidate, repeat_paint
+
+
+def run(rtt=150, bandwidth_kbps=1600):
+    rows = []
+    with tempfile.TemporaryDirectory() as build_dir:
+        for label in ('raw', 'built'):
+            if label == 'built':
+                # 清单在应用启动时读取，先构建再创建测量用的应用
+                with bench_app(ASSETS_BUILD_DIR=build_dir) as app:
+                    assets.build(app, endpoints=['static', 'admin.static'])
+            with bench_app(ASSETS_BUILD_DIR=build_dir, RATE_LIMIT_ENABLED=False) as app:
+                client = app.test_client()
+                for page, (html_bytes, css, js) in _page_assets(app, client).items():
+                    size, first, requests, repeat = _visit(client, html_bytes, css, js, rtt, bandwidth_kbps)
+                    rows += [(f'{page} {label}: asset bytes', size / 1024, 'KB'),
+                             (f'{page} {label}: first paint', first, 'ms'),
+                             (f'{page} {label}: repeat-visit requests', requests, ''),
+                             (f'{page} {label}: repeat first paint', repeat, 'ms')]
+    report(f'静态资源 (RTT {rtt}ms, {bandwidth_kbps}kbps)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,116 @@
+"""协作编辑基准：50人同时编辑一个表格时的广播延迟和写入合并率
+
+场景：E个编辑者（默认50）各自以约每秒10次按键的频率连续编辑自己的一块
+单元格，每次按键提交一个操作；同一表格上有E个推送连接（每个编辑者一个）。
+延迟为从提交到每个连接收到消息的时间。Redis模式使用进程内的fakeredis
+服务器，消息经pub/sub监听线程分发，与多worker部署的路径一致。
+合并率为提交的操作数与实际写入表格存储的单元格数之比。
+
+用法: python -m benchmarks.bench_collaboration [编辑者数] [每人按键数]
+"""
+import json
+import statistics
+import sys
+import threading
+import time
+
+import fakeredis
+import redis
+
+from application import collaboration, db, sheet_calculator
+from application.models.sheet import Sheet
+from application.models.user import User
+from benchmarks.common import bench_app, report
+
+
+def run_mode(app, editors, keystrokes):
+    owner = User(username=f'owner-{time.monotonic_ns()}', email=f'{time.monotonic_ns()}@example.com',
+                 password='x', active=True, fs_uniquifier=str(time.monotonic_ns()))
+    sheet = Sheet(name='协作', owner=owner)
+    db.session.add(sheet)
+    db.session.commit()
+    sheet_id = sheet.id
+
+    writes = []
+    original = sheet_calculator.apply
+
+    def counting_apply(s, cells, authors=None):
+        writes.append(len(cells))
+        return original(s, cells, authors)
+    sheet_calculator.apply = counting_apply
+
+    subscriptions = [collaboration.subscribe(sheet) for _ in range(editors)]
+    expected = editors * keystrokes
+    latencies = []
+    lock = threading.Lock()
+
+    def listen(subscription):
+        received = 0
+        while received < expected:
+            message = subscription.get(timeout=10)
+            if message is None:
+                break
+            data = json.loads(message)
+            if data['type'] != 'ops':
+                continue
+            received += 1
+            latency = time.perf_counter() - float(data['origin'])
+            with lock:
+                latencies.append(latency)
+
+    def edit(editor):
+        with app.app_context():
+            local = db.session.get(Sheet, sheet_id)
+            version = 0
+            for i in range(keystrokes):
+                text = 'x' * (i + 1)
+                result = collaboration.submit(local, [(editor, 0, text, version)],
+                                              origin=repr(time.perf_counter()))
+                version = result['accepted'][0]['version']
+                time.sleep(0.1)
+            db.session.remove()
+
+    listeners = [threading.Thread(target=listen, args=(s,)) for s in subscriptions]
+    workers = [threading.Thread(target=edit, args=(e,)) for e in range(editors)]
+    start = time.perf_counter()
+    for thread in listeners + workers:
+        thread.start()
+    for thread in workers + listeners:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for subscription in subscriptions:
+        subscription.close()
+
+    # 等待后台线程写完最后一批
+    time.sleep(app.config['COLLAB_FLUSH_INTERVAL_MS'] / 1000 * 3)
+    sheet_calculator.apply = original
+    latencies.sort()
+    delivered = len(latencies) / (expected * editors) * 100
+    return [
+        ('delivered', delivered, '%'),
+        ('fan-out p50', statistics.median(latencies) * 1000, 'ms'),
+        ('fan-out p99', latencies[int(len(latencies) * 0.99) - 1] * 1000, 'ms'),
+        ('fan-out max', latencies[-1] * 1000, 'ms'),
+        ('ops submitted', expected, 'ops'),
+        ('cells written', sum(writes), 'cells'),
+        ('storage commits', len(writes), 'commits'),
+        ('ops/s', expected / elapsed, 'ops/s'),
+    ]
+
+
+def run(editors=50, keystrokes=30):
+    with bench_app(COLLAB_FLUSH_INTERVAL_MS=200) as app:
+        report(f'进程内广播 ({editors}个编辑者 × {keystrokes}次按键)', run_mode(app, editors, keystrokes))
+
+    server = fakeredis.FakeServer()
+    original = redis.Redis.from_url
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server))
+    try:
+        with bench_app(REDIS_URL='redis://fake', COLLAB_FLUSH_INTERVAL_MS=200) as app:
+            report(f'Redis pub/sub广播 ({editors}个编辑者 × {keystrokes}次按键)', run_mode(app, editors, keystrokes))
+    finally:
+        redis.Redis.from_url = original
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,106 @@
+"""公式引擎基准：10万个公式的表格上单次编辑的重算延迟
+
+场景（N默认100000）：
+  A列为数值，B(i) = A(i)*2+1 共N个公式，另有 SUM(B1:BN)、AVERAGE(A:A)、
+  COUNTIF(B:B,">1000") 三个区域公式；编辑一个A单元格只需重算对应的B和
+  三个区域公式。对照组为每次编辑后全量重算全部公式。
+  链式场景 D(i) = D(i-1)+A(i)：编辑A1时整条链都需重算（最坏情况）。
+  持久化场景：经SheetCalculator写回表格存储并提交的单次编辑延迟。
+
+用法: python -m benchmarks.bench_formulas [公式数] [重复次数]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from application import db, sheet_calculator
+from application.models.sheet import Sheet
+from application.models.user import User
+from application.services.formulas import FormulaEngine
+from application.services.sheet_storage import SheetStorage
+from benchmarks.common import Timer, bench_app, report
+
+
+def build(n):
+    engine = FormulaEngine()
+    cells = {(i, 0): float(i % 1000) for i in range(n)}
+    cells.update({(i, 1): f'=A{i + 1}*2+1' for i in range(n)})
+    cells.update({(0, 2): f'=SUM(B1:B{n})', (1, 2): '=AVERAGE(A:A)', (2, 2): '=COUNTIF(B:B,">1000")'})
+    start = time.perf_counter()
+    engine.set_cells(cells)
+    return engine, time.perf_counter() - start
+
+
+def run(n=100000, repeats=200):
+    rng = random.Random(0)
+    rows = []
+
+    engine, build_time = build(n)
+    rows.append((f'load + full calc ({n + 3} formulas)', build_time, 's'))
+
+    incremental = Timer()
+    for _ in range(repeats):
+        row = rng.randrange(n)
+        with incremental.measure():
+            changed = engine.set_cells({(row, 0): rng.random() * 1000})
+        assert (row, 1) in changed
+    expected = float(np.nansum(engine.column(1).numbers[:n]))
+    assert abs(engine.get(0, 2) - expected) < 1e-6 * abs(expected)
+    rows.append(('single edit, incremental', incremental.per_op_us / 1000, 'ms'))
+
+    full = Timer()
+    for _ in range(max(1, repeats // 50)):
+        engine.set_cells({(rng.randrange(n), 0): rng.random()})
+        with full.measure():
+            engine.recalculate_all()
+    rows.append(('single edit, full recalc', full.per_op_us / 1000, 'ms'))
+
+    # 区域函数：NumPy切片 vs 逐单元格读取
+    vectorised, per_cell = Timer(), Timer()
+    with vectorised.measure():
+        engine.set_cells({(3, 2): f'=SUM(A1:A{n})'})
+    with per_cell.measure():
+        sum(engine.get(i, 0) or 0 for i in range(n))
+    rows += [(f'SUM over {n} cells (numpy)', vectorised.per_op_us / 1000, 'ms'),
+             (f'SUM over {n} cells (per cell)', per_cell.per_op_us / 1000, 'ms')]
+
+    chain = FormulaEngine()
+    chain.set_cells({(i, 0): 1 for i in range(n)})
+    chain.set_cells({(0, 3): '=A1'})
+    chain.set_cells({(i, 3): f'=D{i}+A{i + 1}' for i in range(1, n)})
+    start = time.perf_counter()
+    chain.set_cells({(0, 0): 2})
+    rows.append((f'chain of {n}, edit head', (time.perf_counter() - start) * 1000, 'ms'))
+    assert chain.get(n - 1, 3) == n + 1
+
+    with bench_app():
+        owner = User(username='owner', email='owner@example.com', password='x', fs_uniquifier='owner')
+        sheet = Sheet(name='bench', owner=owner)
+        db.session.add(sheet)
+        db.session.commit()
+        SheetStorage(sheet).write_rows(0, [[float(i % 1000)] for i in range(n)])
+        sheet_calculator.apply(sheet, {(i, 1): f'=A{i + 1}*2+1' for i in range(n)})
+        sheet_calculator.apply(sheet, {(0, 2): f'=SUM(B1:B{n})', (1, 2): '=AVERAGE(A:A)'})
+        db.session.commit()
+
+        sheet_calculator._engines.clear()
+        start = time.perf_counter()
+        sheet_calculator.apply(sheet, {(0, 0): 1.5})
+        db.session.commit()
+        rows.append(('persisted: first edit (load engine)', (time.perf_counter() - start) * 1000, 'ms'))
+
+        persisted = Timer()
+        for _ in range(repeats // 4):
+            row = rng.randrange(n)
+            with persisted.measure():
+                sheet_calculator.apply(sheet, {(row, 0): rng.random() * 1000})
+                db.session.commit()
+        rows.append(('persisted: edit + write back + commit', persisted.per_op_us / 1000, 'ms'))
+
+    report(f'formula engine ({n} formulas, {repeats} edits)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,70 @@
+"""登录吞吐基准：gevent下在事件循环中直接哈希 vs 在线程池中哈希
+
+同时记录事件循环的最大阻塞时间（一个5ms周期的心跳协程的最大延迟）。
+
+用法: python -m benchmarks.bench_login [并发数] [登录次数] [目标毫秒]
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import gevent  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+
+from application import db  # noqa: E402
+from application.models.user import User  # noqa: E402
+from benchmarks.common import bench_app, report  # noqa: E402
+
+
+def seed(app, n_users):
+    from flask_security.utils import hash_password
+    with app.test_request_context():
+        password = hash_password('password123')
+    db.session.add_all(User(username=f'user{i}', email=f'user{i}@example.com', password=password,
+                            fs_uniquifier=f'uniq-{i}') for i in range(n_users))
+    db.session.commit()
+
+
+def measure(app, concurrency, logins):
+    max_lag = 0.0
+    running = True
+
+    def heartbeat():
+        nonlocal max_lag
+        while running:
+            start = time.perf_counter()
+            gevent.sleep(0.005)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.005)
+
+    def login(i):
+        client = app.test_client()
+        response = client.post('/login', data={'email': f'user{i % concurrency}@example.com',
+                                               'password': 'password123'})
+        assert response.status_code in (200, 302), response.status_code
+
+    monitor = gevent.spawn(heartbeat)
+    start = time.perf_counter()
+    Pool(concurrency).map(login, range(logins))
+    elapsed = time.perf_counter() - start
+    running = False
+    monitor.join()
+    return logins / elapsed, max_lag * 1000
+
+
+def run(concurrency=16, logins=160, target_ms=20):
+    rows = []
+    for mode in ('none', 'thread'):
+        with bench_app(SECURITY_PASSWORD_HASH='pbkdf2_sha256', PASSWORD_HASH_TARGET_MS=target_ms,
+                       PASSWORD_HASH_POOL=mode) as app:
+            seed(app, concurrency)
+            rate, lag = measure(app, concurrency, logins)
+            label = 'inline' if mode == 'none' else app.extensions['password_hasher']['mode'] + ' pool'
+            rows += [(f'{label} logins/s', rate, '/s'), (f'{label} max loop lag', lag, 'ms')]
+    report(f'login ({concurrency} concurrent, {logins} logins, ~{target_ms}ms/hash)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:4]])
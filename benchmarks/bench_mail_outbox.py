@@ -0,0 +1,96 @@
+"""发件箱基准：慢MTA下请求线程的发信耗时，以及批量发送与逐封连接的吞吐
+
+场景：本地模拟的MTA在建立连接（问候）时延迟CONNECT_MS毫秒、每封邮件的DATA
+应答延迟MESSAGE_MS毫秒。请求耗时对比在请求中直接用mail.send发送与写入
+发件箱并提交；吞吐对比发件箱一个连接发送一批与每封邮件新建连接。
+
+用法: python -m benchmarks.bench_mail_outbox [邮件数] [连接延迟ms] [每封延迟ms]
+"""
+import socketserver
+import sys
+import threading
+import time
+
+from flask_mail import Message
+
+from application import db, mail, mail_outbox
+from benchmarks.common import Timer, bench_app, report
+
+
+class SlowSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay, message_delay):
+        super().__init__(('127.0.0.1', 0), SlowSMTPHandler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        time.sleep(self.server.connect_delay)
+        self.reply('220 slow')
+        for raw in self.rfile:
+            verb = raw[:4].upper()
+            if verb == b'DATA':
+                self.reply('354 go ahead')
+                for line in self.rfile:
+                    if line.rstrip(b'\r\n') == b'.':
+                        break
+                time.sleep(self.server.message_delay)
+                self.reply('250 queued')
+            elif verb == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+def run(messages=200, connect_ms=50, message_ms=5):
+    server = SlowSMTP(connect_ms / 1000, message_ms / 1000)
+    with bench_app(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.server_address[1], MAIL_SUPPRESS_SEND=False,
+                   MAIL_OUTBOX_SENDER='none', MAIL_RATE_LIMIT=0):
+        direct, queued = Timer(), Timer()
+        requests = min(messages, 50)
+        for i in range(requests):
+            with direct.measure():
+                mail.send(Message('重置密码', recipients=[f'user{i}@example.com'], body='正文'))
+            with queued.measure():
+                mail_outbox.enqueue('重置密码', [f'user{i}@example.com'], body='正文')
+                db.session.commit()
+        mail_outbox.send_all()
+
+        for i in range(messages):
+            mail_outbox.enqueue('通知', [f'user{i}@example.com'], body='正文')
+        db.session.commit()
+        server.connections = 0
+        start = time.perf_counter()
+        mail_outbox.send_all()
+        batched = time.perf_counter() - start
+        batched_connections = server.connections
+
+        start = time.perf_counter()
+        for i in range(messages):
+            mail.send(Message('通知', recipients=[f'user{i}@example.com'], body='正文'))
+        per_message = time.perf_counter() - start
+
+        report(f'发件箱 (MTA连接延迟{connect_ms}ms，每封{message_ms}ms，{messages}封)', [
+            ('request: mail.send', direct.per_op_us / 1000, 'ms'),
+            ('request: outbox enqueue', queued.per_op_us / 1000, 'ms'),
+            ('send: connection per msg', messages / per_message, 'msg/s'),
+            ('send: outbox batches', messages / batched, 'msg/s'),
+            ('outbox SMTP connections', batched_connections, 'conns'),
+        ])
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:4]))
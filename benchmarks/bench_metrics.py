@@ -0,0 +1,112 @@
+"""请求指标中间件的开销基准
+
+1. 钩子本身：每个请求before/after钩子的耗时、每条SQL的引擎事件耗时（绝对值）；
+2. 端到端：同一组请求在关闭/开启METRICS_ENABLED时的耗时。两个应用各用一个
+   临时库，按轮交替计时（每轮交换先后顺序以抵消顺序影响），开销取各轮
+   开启/关闭耗时比的中位数。测试客户端没有网络和真实数据库延迟，单次测量
+   的噪声约为±5%，比例偏高；生产请求的耗时以毫秒计，应以第1项的绝对值评估。
+用法: python -m benchmarks.bench_metrics [每轮请求数] [轮数]
+"""
+import statistics
+import sys
+from contextlib import ExitStack
+
+from flask import Response
+from sqlalchemy import event, text
+
+from application import db, metrics
+from application.models.user import User, Role
+from benchmarks.common import Timer, bench_app, report
+
+ENDPOINTS = ('/api/health', '/', '/auth/user_list?limit=50')
+
+
+def seed(n_users=200):
+    admin = Role(name='admin')
+    users = [User(username=f'user_{i}', email=f'user_{i}@example.com',
+                  password='password', fs_uniquifier=f'uniq-{i}') for i in range(n_users)]
+    users[0].roles = [admin]
+    db.session.add_all([admin] + users)
+    db.session.commit()
+    return users[0].fs_uniquifier
+
+
+def make_client(stack, enabled):
+    app = stack.enter_context(bench_app(METRICS_ENABLED=enabled, METRICS_SLOW_REQUEST_MS=10 ** 6))
+    uniquifier = seed()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = uniquifier
+        session['_fresh'] = True
+    return app, client
+
+
+def time_round(app, client, path, n_requests):
+    timer = Timer()
+    with app.app_context():
+        for _ in range(n_requests):
+            with timer.measure():
+                client.get(path)
+    return timer.per_op_us
+
+
+def hook_costs(clients, n=20000):
+    """返回(每请求钩子耗时, 每条SQL的事件耗时)，单位微秒"""
+    app, _ = clients[True]
+    response = Response('ok')
+    with app.test_request_context('/api/health'):
+        timer = Timer()
+        with timer.measure():
+            for _ in range(n):
+                metrics._before_request()
+                metrics._after_request(response)
+        per_request = timer.total / n * 1e6
+
+    # 同一引擎上分别在有/无事件监听时执行，避免两个数据库文件之间的差异
+    with app.test_request_context('/api/health'):
+        metrics._before_request()
+        engine = db.engine
+        per_statement = {}
+        for enabled in (True, False):
+            if not enabled:
+                event.remove(engine, 'before_cursor_execute', metrics._before_cursor_execute)
+                event.remove(engine, 'after_cursor_execute', metrics._after_cursor_execute)
+            best = None
+            for _ in range(5):
+                timer = Timer()
+                with timer.measure():
+                    for _ in range(n // 4):
+                        db.session.execute(text('SELECT 1'))
+                best = timer.total if best is None else min(best, timer.total)
+            per_statement[enabled] = best / (n // 4) * 1e6
+        event.listen(engine, 'before_cursor_execute', metrics._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', metrics._after_cursor_execute)
+        db.session.remove()
+    return per_request, per_statement[True] - per_statement[False]
+
+
+def run(n_requests=50, rounds=40):
+    with ExitStack() as stack:
+        # bench_app会推入应用上下文，每个应用的请求都在自己的上下文中发出
+        clients = {enabled: make_client(stack, enabled) for enabled in (False, True)}
+        per_request, per_statement = hook_costs(clients)
+        rows = [('request hooks', per_request, 'us/req'),
+                ('sql events', per_statement, 'us/stmt')]
+        for path in ENDPOINTS:
+            for app, client in clients.values():
+                time_round(app, client, path, n_requests)  # 预热
+            timings = {False: [], True: []}
+            for i in range(rounds):
+                order = (False, True) if i % 2 == 0 else (True, False)
+                for enabled in order:
+                    app, client = clients[enabled]
+                    timings[enabled].append(time_round(app, client, path, n_requests))
+            ratios = [on / off for off, on in zip(timings[False], timings[True])]
+            rows.append((f'{path} off', statistics.median(timings[False]), 'us/req'))
+            rows.append((f'{path} on', statistics.median(timings[True]), 'us/req'))
+            rows.append((f'{path} overhead', (statistics.median(ratios) - 1) * 100, '%'))
+    report(f'metrics middleware ({n_requests} requests x {rounds} rounds, median)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
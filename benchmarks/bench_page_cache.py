@@ -0,0 +1,44 @@
+"""页面缓存基准：首页（匿名整页缓存）和个人资料页（按用户缓存）的请求耗时
+
+每个页面先在关闭缓存（NullCache）时请求N次，再在开启缓存时请求N次
+（第一次未命中，其余命中），对比平均耗时。开启时用进程内SimpleCache代替Redis，
+并以CACHE_SHARED=True启用按用户的缓存（单进程内失效是可靠的）。
+
+用法: python -m benchmarks.bench_page_cache [请求次数]
+"""
+import sys
+
+from application import db
+from application.models.user import User
+from benchmarks.common import Timer, bench_app, report
+
+
+def _measure(app, requests):
+    db.session.add(User(username='reader', email='reader@example.com', fs_uniquifier='reader'))
+    db.session.commit()
+    timers = {}
+    for name, login in (('index (anonymous)', False), ('profile (per user)', True)):
+        client = app.test_client()
+        if login:
+            with client.session_transaction() as session:
+                session['_user_id'] = 'reader'
+                session['_fresh'] = True
+        url = '/auth/profile' if login else '/'
+        timer = timers[name] = Timer()
+        for _ in range(requests):
+            with app.app_context(), timer.measure():
+                assert client.get(url).status_code == 200
+    return timers
+
+
+def run(requests=500):
+    rows = []
+    for label, cache_type in (('uncached', 'NullCache'), ('cached', 'SimpleCache')):
+        with bench_app(CACHE_TYPE=cache_type, CACHE_SHARED=True, RATE_LIMIT_ENABLED=False) as app:
+            for name, timer in _measure(app, requests).items():
+                rows.append((f'{name}: {label}', timer.per_op_us, 'us'))
+    report(f'页面缓存 ({requests}次请求)', sorted(rows))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
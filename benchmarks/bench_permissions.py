@@ -0,0 +1,78 @@
+"""User.has_permission 基准：逐角色遍历 vs 跨请求的权限位图缓存（进程内LRU、Redis）
+
+用法: python -m benchmarks.bench_permissions [用户数] [检查次数]
+"""
+import random
+import sys
+
+import fakeredis
+import redis
+
+from application import db, permission_cache
+from application.models.user import User, Role, Permission
+from benchmarks.common import Timer, bench_app, report
+
+
+def seed(n_users, n_roles=10, n_permissions=50):
+    rng = random.Random(42)
+    permissions = [Permission(name=f'perm_{i}') for i in range(n_permissions)]
+    roles = []
+    for i in range(n_roles):
+        role = Role(name=f'role_{i}')
+        role.permissions = rng.sample(permissions, n_permissions // 4)
+        roles.append(role)
+    users = []
+    for i in range(n_users):
+        user = User(username=f'user_{i}', email=f'user_{i}@example.com',
+                    password='password', fs_uniquifier=f'uniq-{i}')
+        user.roles = rng.sample(roles, 2)
+        users.append(user)
+    db.session.add_all(permissions + roles + users)
+    db.session.commit()
+    return [u.id for u in users], [p.name for p in permissions]
+
+
+def run(n_users=200, n_checks=2000):
+    # 跨请求的位图缓存只在配置了Redis时启用，这里使用进程内的fakeredis
+    server = fakeredis.FakeServer()
+    original = redis.Redis.from_url
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server))
+    try:
+        with bench_app(REDIS_URL='redis://fake') as app:
+            user_ids, names = seed(n_users)
+            rng = random.Random(7)
+            checks = [(rng.choice(user_ids), rng.choice(names)) for _ in range(n_checks)]
+
+            # 预热：编译全部用户的位图并写入Redis和进程内LRU，计时只包含命中路径
+            for user_id in user_ids:
+                with app.test_request_context():
+                    db.session.get(User, user_id).has_permission(names[0])
+
+            uncached, lru, shared = Timer(), Timer(), Timer()
+            for mode, timer in (('uncached', uncached), ('lru', lru), ('redis', shared)):
+                for user_id, name in checks:
+                    # 每次检查模拟一个新请求：新的请求上下文和会话，仅计时权限检查本身
+                    with app.test_request_context():
+                        user = db.session.get(User, user_id)
+                        if mode == 'redis':
+                            # 清空进程内LRU，只命中Redis中的位图
+                            permission_cache._entries.clear()
+                        with timer.measure():
+                            if mode == 'uncached':
+                                user._has_permission_uncached(name)
+                            else:
+                                user.has_permission(name)
+    finally:
+        redis.Redis.from_url = original
+
+    report(f'has_permission ({n_users} users, {n_checks} checks)', [
+        ('walk roles', uncached.per_op_us, 'us/op'),
+        ('bitset cache (process LRU)', lru.per_op_us, 'us/op'),
+        ('bitset cache (Redis)', shared.per_op_us, 'us/op'),
+        ('speedup (LRU)', uncached.total / lru.total, 'x'),
+        ('speedup (Redis)', uncached.total / shared.total, 'x'),
+    ])
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
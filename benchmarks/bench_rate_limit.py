@@ -0,0 +1,56 @@
+"""限流基准：登录请求上限流钩子的耗时，以及撞库时被拒绝请求与正常密码校验的成本
+
+场景一：对POST /login的请求上下文直接调用限流钩子（放行），统计每次的耗时，
+其中账户维度需要解析JSON请求体并计算摘要。场景二：同一账户连续尝试N次错误
+密码（pbkdf2，目标PASSWORD_HASH_TARGET_MS毫秒），超出账户限额的请求被拒绝，
+对比被拒绝请求与进入视图校验密码的请求的平均耗时。
+
+用法: python -m benchmarks.bench_rate_limit [钩子调用次数] [撞库尝试次数] [目标毫秒]
+"""
+import sys
+import time
+
+from application import db, rate_limiter
+from application.models.user import User
+from benchmarks.common import Timer, bench_app, report
+
+
+def run(calls=20000, attempts=50, target_ms=20):
+    with bench_app(SECURITY_PASSWORD_HASH='pbkdf2_sha256', PASSWORD_HASH_TARGET_MS=target_ms,
+                   WTF_CSRF_ENABLED=False, RATE_LIMIT_SYNC_MS=0,
+                   RATE_LIMITS={'security.login': {'ip': (10 ** 9, 60), 'account': (5, 300)}}) as app:
+        from flask_security.utils import hash_password
+        with app.test_request_context():
+            password = hash_password('password123')
+        db.session.add(User(username='victim', email='victim@example.com', password=password,
+                            fs_uniquifier='victim'))
+        db.session.commit()
+
+        hook = Timer()
+        for i in range(calls):
+            with app.test_request_context('/login', method='POST', json={'email': f'user{i}@example.com'},
+                                          environ_base={'REMOTE_ADDR': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'}):
+                with hook.measure():
+                    assert rate_limiter._before_request() is None
+        rate_limiter.reset()
+
+        client = app.test_client()
+        checked, rejected = Timer(), Timer()
+        for i in range(attempts):
+            start = time.perf_counter()
+            response = client.post('/login', json={'email': 'victim@example.com', 'password': f'guess{i}'})
+            elapsed = time.perf_counter() - start
+            timer = rejected if response.status_code == 429 else checked
+            timer.total += elapsed
+            timer.count += 1
+
+        report(f'限流 ({calls}次钩子调用；撞库{attempts}次，账户限额5次/300秒，~{target_ms}ms/hash)', [
+            ('limiter hook per request', hook.per_op_us, 'us'),
+            ('attempt: password checked', checked.per_op_us / 1000, 'ms'),
+            ('attempt: rejected (429)', rejected.per_op_us / 1000, 'ms'),
+            ('attempts rejected', rejected.count, ''),
+        ])
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,24 @@
+"""合成数据生成基准：SQLite上每分钟生成的用户数（当前进程生成 vs 进程池生成）
+
+用法: python -m benchmarks.bench_seed [用户数]
+"""
+import os
+import sys
+
+from application.services.seed import seed_data
+from benchmarks.common import bench_app, report
+
+
+def run(users=200000):
+    rows = []
+    for workers in (0, os.cpu_count() or 1):
+        with bench_app():
+            result = seed_data(users, workers=workers)
+            label = 'in process' if not workers else f'{workers} workers'
+            rows += [(f'{label}: users/min', result.users_per_minute, ''),
+                     (f'{label}: elapsed', result.elapsed, 's')]
+    report(f'flask seed ({users} users, SQLite)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
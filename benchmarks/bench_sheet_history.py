@@ -0,0 +1,102 @@
+"""操作历史基准：100万次单元格编辑后的存储增长和时间回溯延迟
+
+场景：10000行 × 10列的表格，随机编辑单元格共N次（默认100万，每批1000个，
+与协作编辑的批量写入一致）。每10000条操作保存一次快照，数据库中保留最近
+两个快照区间的操作，其余归档为压缩文件。
+存储增长分别统计操作日志（数据库）、快照和归档文件，并与每次编辑复制整表
+JSON的做法（按最终表格的JSON大小估算）对比。
+时间回溯延迟为恢复随机历史序号并读取A1:J200的耗时，分别统计仍在数据库中
+的近期版本和需要读取归档文件的早期版本。
+
+用法: python -m benchmarks.bench_sheet_history [编辑次数] [回溯次数]
+"""
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import func, select, text
+
+from application import db, sheet_history
+from application.models.sheet import Sheet, SheetHistorySegment, SheetOperation, SheetSnapshot
+from application.models.user import User
+from application.services.sheet_storage import SheetStorage
+from benchmarks.common import Timer, bench_app, report
+
+ROWS, COLS, BATCH = 10000, 10, 1000
+
+
+def _db_bytes():
+    page_size = db.session.execute(text('PRAGMA page_size')).scalar()
+    pages = db.session.execute(text('PRAGMA page_count')).scalar()
+    free = db.session.execute(text('PRAGMA freelist_count')).scalar()
+    return (pages - free) * page_size
+
+
+def run(edits=1000000, lookups=50):
+    archive_dir = tempfile.mkdtemp(prefix='sheet-history-')
+    with bench_app(SHEET_HISTORY_ARCHIVE_DIR=archive_dir) as app:
+        rng = random.Random(0)
+        owner = User(username='bench', email='bench@example.com', password='x', active=True, fs_uniquifier='bench')
+        sheet = Sheet(name='历史', owner=owner)
+        db.session.add(sheet)
+        db.session.commit()
+        storage = SheetStorage(sheet)
+        storage.write_rows(0, [[r * COLS + c for c in range(COLS)] for r in range(ROWS)])
+        sheet_history.snapshot(sheet)
+        db.session.commit()
+        baseline = _db_bytes()
+
+        start = time.perf_counter()
+        for done in range(0, edits, BATCH):
+            cells = {}
+            for _ in range(BATCH):
+                value = rng.random() * 1000 if rng.random() < 0.7 else f'文本{rng.randrange(100000)}'
+                cells[rng.randrange(ROWS), rng.randrange(COLS)] = value
+            storage.write_cells(cells)
+            sheet_history.record(sheet, cells)
+            db.session.commit()
+        write_time = time.perf_counter() - start
+        total_ops = sheet.history_seq
+
+        db.session.execute(text('VACUUM'))
+        log_rows = db.session.execute(select(func.count()).select_from(SheetOperation)).scalar()
+        snapshots = db.session.execute(select(func.count(), func.sum(func.length(SheetSnapshot.chunks))
+                                              + func.sum(func.length(SheetSnapshot.formulas)))).one()
+        archived = db.session.execute(select(func.sum(SheetHistorySegment.operations),
+                                             func.sum(SheetHistorySegment.bytes))).one()
+        growth = _db_bytes() - baseline
+        sheet_json = len(json.dumps(storage.read_range(0, 0, ROWS, COLS), ensure_ascii=False).encode())
+
+        hot_start = db.session.execute(select(func.min(SheetOperation.seq))
+                                       .where(SheetOperation.sheet_id == sheet.id)).scalar() or total_ops
+        hot, cold = Timer(), Timer()
+        for _ in range(lookups):
+            for timer, seq in ((hot, rng.randrange(hot_start, total_ops + 1)),
+                               (cold, rng.randrange(1, hot_start))):
+                db.session.expire_all()
+                with timer.measure():
+                    version = sheet_history.restore(sheet, seq)
+                    version.read_range(0, 0, 200, COLS)
+
+        mib = 1024 * 1024
+        report(f'操作历史 ({total_ops}次编辑，每{app.config["SHEET_SNAPSHOT_INTERVAL"]}条一个快照)', [
+            ('write throughput', total_ops / write_time, 'ops/s'),
+            ('database growth', growth / mib, 'MiB'),
+            ('  log rows kept', log_rows, 'rows'),
+            ('  snapshots', snapshots[0], 'snapshots'),
+            ('  snapshot bytes', (snapshots[1] or 0) / mib, 'MiB'),
+            ('archived operations', archived[0] or 0, 'ops'),
+            ('archive files', (archived[1] or 0) / mib, 'MiB'),
+            ('archive bytes/op', (archived[1] or 0) / max(1, archived[0] or 0), 'B'),
+            ('JSON copy per edit', sheet_json * total_ops / mib, 'MiB'),
+            ('time travel (db)', hot.per_op_us / 1000, 'ms'),
+            ('time travel (archive)', cold.per_op_us / 1000, 'ms'),
+        ])
+    shutil.rmtree(archive_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,89 @@
+"""表格导入基准：不同大小的CSV文件导入耗时和进程内存峰值
+
+按从小到大的顺序导入生成的CSV（默认10MB和50MB，可传入500），每次导入后
+记录进程RSS峰值。内存占用与文件大小无关时，较大文件的峰值不应明显增长。
+同时记录导入过程中进度被更新的次数。
+
+用法: python -m benchmarks.bench_sheet_import [文件大小MB ...]
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from application import db
+from application.models.sheet import Sheet, SheetImport
+from application.models.user import User
+from application.services.sheet_import import SheetImporter
+from benchmarks.common import bench_app, report
+
+COLUMNS = ['id', 'name', 'price', 'quantity', 'code', 'date', 'active', 'note']
+
+
+def write_csv(path, size_mb, rng):
+    target = size_mb * 2 ** 20
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(COLUMNS) + '\n')
+        i = 0
+        while f.tell() < target:
+            lines = []
+            for _ in range(1000):
+                i += 1
+                lines.append(f'{i},商品{rng.randrange(100000)},{rng.random() * 1000:.2f},'
+                             f'{rng.randrange(500)},{rng.randrange(10 ** 6):06d},'
+                             f'2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d},'
+                             f'{rng.random() < 0.5},"备注, {rng.randrange(10 ** 9)}"\n')
+            f.write(''.join(lines))
+    return i
+
+
+def peak_rss_mb():
+    # Linux下ru_maxrss单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(*sizes):
+    sizes = sorted(sizes or (10, 50))
+    rng = random.Random(0)
+    rows = [('baseline peak rss', peak_rss_mb(), 'MiB')]
+    with bench_app():
+        owner = User(username='owner', email='owner@example.com', password='x', fs_uniquifier='owner')
+        db.session.add(owner)
+        db.session.commit()
+        updates = []
+        original_flush = SheetImporter._flush
+
+        def counting_flush(self, sheet_import, *args):
+            original_flush(self, sheet_import, *args)
+            updates.append(sheet_import.progress)
+
+        SheetImporter._flush = counting_flush
+        for size in sizes:
+            fd, path = tempfile.mkstemp(suffix='.csv')
+            os.close(fd)
+            try:
+                n_rows = write_csv(path, size, rng)
+                sheet_import = SheetImport(sheet=Sheet(name=f'bench-{size}', owner=owner),
+                                           filename='bench.csv', format='csv')
+                db.session.add(sheet_import)
+                db.session.commit()
+                del updates[:]
+                start = time.perf_counter()
+                SheetImporter().run(sheet_import, path)
+                elapsed = time.perf_counter() - start
+                assert sheet_import.status == SheetImport.DONE, sheet_import.error
+                assert sheet_import.rows_imported == n_rows + 1
+            finally:
+                os.remove(path)
+            rows += [(f'{size}MB import', elapsed, 's'),
+                     (f'{size}MB rows/s', n_rows / elapsed, '/s'),
+                     (f'{size}MB progress updates', len(updates), ''),
+                     (f'{size}MB peak rss', peak_rss_mb(), 'MiB')]
+        SheetImporter._flush = original_flush
+    report(f'sheet import ({len(COLUMNS)} columns)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,101 @@
+"""范围读取基准：视口滚动延迟与表格大小的关系
+
+对不同行数的表格（默认1万、10万、50万行×5列）分别测量：
+首次排序时构建列索引、首次筛选时构建视图的耗时，以及普通、排序、筛选+排序
+三种情况下随机视口（A列起200行×5列）请求的平均延迟和ETag重新验证（304）的延迟。
+排序后的视口分散在最多200个行块中，延迟随表格增大而增长，直至达到该上限。
+
+用法: python -m benchmarks.bench_sheet_range [行数 ...]
+"""
+import random
+import sys
+import time
+
+from application import db
+from application.models.sheet import Sheet
+from application.models.user import User
+from application.services.sheet_storage import SheetStorage
+from benchmarks.common import Timer, bench_app, report
+
+WINDOW = 200
+
+
+def seed(owner, n_rows, rng):
+    sheet = Sheet(name=f'bench-{n_rows}', owner=owner)
+    db.session.add(sheet)
+    db.session.commit()
+    storage = SheetStorage(sheet)
+    batch = storage.chunk_rows * 16
+    for start in range(0, n_rows, batch):
+        storage.write_rows(start, [[i, f'item-{rng.randrange(10 ** 6)}', round(rng.random() * 1000, 2),
+                                    rng.random() < 0.5, rng.randrange(100)]
+                                   for i in range(start, min(n_rows, start + batch))])
+    db.session.commit()
+    return sheet
+
+
+def measure(app, client, url, params, total, rng, repeats):
+    timer = Timer()
+    etag = None
+    for _ in range(repeats):
+        row = rng.randrange(1, max(2, total - WINDOW))
+        with app.app_context(), timer.measure():
+            response = client.get(url, query_string=dict(params, range=f'A{row}:E{row + WINDOW - 1}'))
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+    revalidate = Timer()
+    for _ in range(repeats):
+        with app.app_context(), revalidate.measure():
+            response = client.get(url, query_string=dict(params, range=f'A{row}:E{row + WINDOW - 1}'),
+                                  headers={'If-None-Match': etag})
+        assert response.status_code == 304
+    return timer.per_op_us / 1000, revalidate.per_op_us / 1000
+
+
+def run(*sizes, repeats=50):
+    sizes = sorted(sizes or (10000, 100000, 500000))
+    rng = random.Random(0)
+    rows = []
+    with bench_app() as app:
+        owner = User(username='owner', email='owner@example.com', password='x', fs_uniquifier='owner')
+        db.session.add(owner)
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = 'owner'
+            session['_fresh'] = True
+
+        for n_rows in sizes:
+            sheet = seed(owner, n_rows, rng)
+            base = f'/api/sheets/{sheet.id}/range'
+            plain, plain_304 = measure(app, client, base, {}, n_rows, rng, repeats)
+
+            with app.app_context():
+                start = time.perf_counter()
+                client.get(base, query_string={'sort': '-C', 'range': 'A1:E1'})
+                build = time.perf_counter() - start
+            # 模拟新worker：清空进程内缓存，从持久化的索引加载
+            app.extensions['sheet_indexes']._entries.clear()
+            with app.app_context():
+                start = time.perf_counter()
+                client.get(base, query_string={'sort': '-C', 'range': 'A1:E1'})
+                load = time.perf_counter() - start
+            sorted_ms, _ = measure(app, client, base, {'sort': '-C'}, n_rows, rng, repeats)
+            filtered = {'sort': 'B', 'filter': ['E<50', 'D=true']}
+            with app.app_context():
+                start = time.perf_counter()
+                client.get(base, query_string=dict(filtered, range='A1:E1'))
+                first_filter = time.perf_counter() - start
+            filtered_ms, _ = measure(app, client, base, filtered, n_rows // 4, rng, repeats)
+            rows += [(f'{n_rows} rows: plain window', plain, 'ms'),
+                     (f'{n_rows} rows: 304 revalidate', plain_304, 'ms'),
+                     (f'{n_rows} rows: first sort (build index)', build * 1000, 'ms'),
+                     (f'{n_rows} rows: sort in new worker (load)', load * 1000, 'ms'),
+                     (f'{n_rows} rows: sorted window', sorted_ms, 'ms'),
+                     (f'{n_rows} rows: first filter (build view)', first_filter * 1000, 'ms'),
+                     (f'{n_rows} rows: filtered+sorted window', filtered_ms, 'ms')]
+    report(f'sheet range API ({WINDOW}x5 windows, {repeats} requests each)', rows)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,109 @@
+"""表格存储基准：分块列存 vs 整表JSON
+
+构造 行数×列数 的混合类型表格（默认100000×10，共100万单元格），比较：
+批量写入耗时、存储字节数、随机视口（50行×10列）读取延迟、单元格写入并提交的延迟。
+JSON基线把整张表存为一个字段，每次读写都要整体反序列化和序列化。
+
+用法: python -m benchmarks.bench_sheet_storage [行数] [列数] [重复次数]
+"""
+import json
+import random
+import sys
+import time
+
+from sqlalchemy import func
+
+from application import db
+from application.models.sheet import Sheet, SheetChunk
+from application.models.user import User
+from application.services.sheet_storage import SheetStorage
+from benchmarks.common import Timer, bench_app, report
+
+VIEWPORT = (50, 10)
+
+
+def make_rows(n_rows, n_cols, rng):
+    kinds = [i % 3 for i in range(n_cols)]
+    for r in range(n_rows):
+        yield [round(rng.random() * 1000, 2) if kind == 0 else
+               r * n_cols + c if kind == 1 else
+               f'item-{rng.randrange(5000)}'
+               for c, kind in enumerate(kinds)]
+
+
+def run(n_rows=100000, n_cols=10, repeats=200):
+    rng = random.Random(0)
+    with bench_app():
+        owner = User(username='owner', email='owner@example.com', password='x', fs_uniquifier='owner')
+        db.session.add(owner)
+        sheet = Sheet(name='bench', owner=owner)
+        db.session.add(sheet)
+        db.session.commit()
+        storage = SheetStorage(sheet)
+
+        rows = list(make_rows(n_rows, n_cols, rng))
+        start = time.perf_counter()
+        batch = storage.chunk_rows * 16
+        for offset in range(0, n_rows, batch):
+            storage.write_rows(offset, rows[offset:offset + batch])
+        db.session.commit()
+        chunked_write = time.perf_counter() - start
+        chunked_bytes = db.session.query(func.sum(func.length(SheetChunk.data))).scalar()
+
+        # 基线：整表JSON保存在一个字段里
+        db.session.execute(db.text('CREATE TABLE json_sheets (id INTEGER PRIMARY KEY, data TEXT)'))
+        start = time.perf_counter()
+        db.session.execute(db.text('INSERT INTO json_sheets VALUES (1, :data)'),
+                           {'data': json.dumps(rows)})
+        db.session.commit()
+        json_write = time.perf_counter() - start
+        json_bytes = db.session.execute(db.text('SELECT length(data) FROM json_sheets')).scalar()
+
+        def viewport():
+            r = rng.randrange(n_rows - VIEWPORT[0])
+            return r, 0, r + VIEWPORT[0], min(n_cols, VIEWPORT[1])
+
+        chunked_read, json_read = Timer(), Timer()
+        for _ in range(repeats):
+            r0, c0, r1, c1 = viewport()
+            with chunked_read.measure():
+                window = storage.read_range(r0, c0, r1, c1)
+            assert window[0][1] == rows[r0][1]
+            db.session.rollback()
+        for _ in range(max(1, repeats // 20)):
+            r0, c0, r1, c1 = viewport()
+            with json_read.measure():
+                data = json.loads(db.session.execute(
+                    db.text('SELECT data FROM json_sheets WHERE id = 1')).scalar())
+                [row[c0:c1] for row in data[r0:r1]]
+
+        chunked_edit, json_edit = Timer(), Timer()
+        for _ in range(repeats):
+            r, c = rng.randrange(n_rows), rng.randrange(n_cols)
+            with chunked_edit.measure():
+                storage.set_cell(r, c, rng.random())
+                db.session.commit()
+        for _ in range(max(1, repeats // 20)):
+            r, c = rng.randrange(n_rows), rng.randrange(n_cols)
+            with json_edit.measure():
+                data = json.loads(db.session.execute(
+                    db.text('SELECT data FROM json_sheets WHERE id = 1')).scalar())
+                data[r][c] = rng.random()
+                db.session.execute(db.text('UPDATE json_sheets SET data = :data WHERE id = 1'),
+                                   {'data': json.dumps(data)})
+                db.session.commit()
+
+    report(f'sheet storage ({n_rows}x{n_cols} = {n_rows * n_cols} cells)', [
+        ('chunked bulk write', chunked_write, 's'),
+        ('json bulk write', json_write, 's'),
+        ('chunked storage', chunked_bytes / 2 ** 20, 'MiB'),
+        ('json storage', json_bytes / 2 ** 20, 'MiB'),
+        (f'chunked {VIEWPORT[0]}x{VIEWPORT[1]} read', chunked_read.per_op_us / 1000, 'ms'),
+        (f'json {VIEWPORT[0]}x{VIEWPORT[1]} read', json_read.per_op_us / 1000, 'ms'),
+        ('chunked cell write+commit', chunked_edit.per_op_us / 1000, 'ms'),
+        ('json cell write+commit', json_edit.per_op_us / 1000, 'ms'),
+    ])
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:4]])
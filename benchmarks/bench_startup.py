@@ -0,0 +1,68 @@
+"""启动耗时基准与回归预算
+
+- 导入耗时：python -X importtime 统计的 app 模块累计导入耗时（含create_app）
+- 首个请求耗时：从启动解释器到首个请求返回的墙钟时间
+
+取多次运行的中位数，超出预算时以非零状态退出，供CI判定回归。
+预算可通过 STARTUP_IMPORT_BUDGET_MS / STARTUP_FIRST_REQUEST_BUDGET_MS 覆盖。
+
+用法: python -m benchmarks.bench_startup [重复次数]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = float(os.environ.get('STARTUP_IMPORT_BUDGET_MS', 1000))
+FIRST_REQUEST_BUDGET_MS = float(os.environ.get('STARTUP_FIRST_REQUEST_BUDGET_MS', 1400))
+
+FIRST_REQUEST_SCRIPT = """
+from app import app
+response = app.test_client().get('/api/health')
+assert response.status_code == 200, response.status_code
+"""
+
+
+def _env():
+    return dict(os.environ, STARTUP_DB_CHECK='false', PYTHONDONTWRITEBYTECODE='1')
+
+
+def import_time_ms():
+    """解析 -X importtime 输出中顶层 app 模块的累计耗时"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, env=_env(), capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        parts = [p.strip() for p in line.split('|')]
+        if len(parts) == 3 and parts[2] == 'app':
+            return int(parts[1]) / 1000.0
+    raise RuntimeError('importtime输出中未找到app模块')
+
+
+def first_request_ms():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', FIRST_REQUEST_SCRIPT], cwd=ROOT, env=_env(),
+                   capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(repeat=5):
+    imports = statistics.median(import_time_ms() for _ in range(repeat))
+    first = statistics.median(first_request_ms() for _ in range(repeat))
+    report(f'startup (median of {repeat})', [
+        ('import app', imports, 'ms'),
+        ('import budget', IMPORT_BUDGET_MS, 'ms'),
+        ('time to first request', first, 'ms'),
+        ('first request budget', FIRST_REQUEST_BUDGET_MS, 'ms'),
+    ])
+    over = imports > IMPORT_BUDGET_MS or first > FIRST_REQUEST_BUDGET_MS
+    if over:
+        print('启动耗时超出预算', file=sys.stderr)
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(*[int(arg) for arg in sys.argv[1:2]]))
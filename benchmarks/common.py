@@ -0,0 +1,59 @@
+"""基准测试公共工具"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from application import create_app, db
+
+BENCH_CONFIG = {
+    'TESTING': True,
+    'WTF_CSRF_ENABLED': False,
+    'SECURITY_PASSWORD_HASH': 'plaintext',
+    'SECURITY_PASSWORD_SALT': 'bench-salt',
+}
+
+
+@contextmanager
+def bench_app(**config):
+    """创建使用临时SQLite数据库的应用，并在退出时清理"""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    # create_app通过from_object读取配置，需传入带属性的对象而非dict
+    settings = dict(BENCH_CONFIG, SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_path}', **config)
+    app = create_app(SimpleNamespace(**settings), register_admin=False)
+    try:
+        with app.app_context():
+            db.create_all()
+            yield app
+            db.session.remove()
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+class Timer:
+    """累计多段耗时"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+
+    @contextmanager
+    def measure(self):
+        start = time.perf_counter()
+        yield
+        self.total += time.perf_counter() - start
+        self.count += 1
+
+    @property
+    def per_op_us(self):
+        return self.total / self.count * 1e6 if self.count else 0.0
+
+
+def report(title, rows):
+    """打印对齐的结果表，rows为(名称, 数值, 单位)"""
+    print(title)
+    width = max(len(name) for name, _, _ in rows)
+    for name, value, unit in rows:
+        print(f'  {name.ljust(width)}  {value:>12.2f} {unit}')
@@ -0,0 +1,177 @@
+"""认证和管理后台的负载测试：用种子数据启动本地gunicorn，运行场景并输出JSON结果
+
+默认在临时目录中创建SQLite数据库并写入--seed-users个用户，以gunicorn.conf.py启动
+服务（关闭认证限流），运行 benchmarks.load.scenarios 中的场景。指定--url时直接压测
+已运行的服务（需已有相同格式的种子数据）。
+
+--baseline 指定之前的结果文件时逐个请求对比，p95变慢或吞吐下降超过--max-regression
+百分比、或失败率超过--max-failure-rate时以状态码1退出，供CI标记性能回退。
+
+用法: python -m benchmarks.load [--users 20] [--duration 30] [--seed-users 10000]
+      [--json benchmarks/results/load.json] [--baseline baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from urllib.request import urlopen
+
+from benchmarks.load.runner import run_users
+from benchmarks.load.scenarios import SCENARIOS
+from benchmarks.load.seed import LOGIN_ACCOUNTS, seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SERVER_ENV = {
+    'SECRET_KEY': 'loadtest-secret',
+    'SECURITY_PASSWORD_SALT': 'loadtest-salt',
+    'RATE_LIMIT_ENABLED': 'false',
+    'STARTUP_DB_CHECK': 'false',
+}
+# 样本少于该数的请求只检查失败率，不比较p95
+MIN_SAMPLES = 30
+
+
+def seed_database(url, users, admins, password):
+    from application import create_app, db
+    app = create_app(SimpleNamespace(SQLALCHEMY_DATABASE_URI=url, SECRET_KEY=SERVER_ENV['SECRET_KEY'],
+                                     SECURITY_PASSWORD_SALT=SERVER_ENV['SECURITY_PASSWORD_SALT']),
+                     register_admin=False)
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        count = seed(app, users, admins, password)
+        db.session.remove()
+        db.engine.dispose()
+    return count, time.perf_counter() - start
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url, workers, worker_class):
+    """启动gunicorn并等待存活检查通过，返回(进程, 地址)"""
+    port = _free_port()
+    env = dict(os.environ, **SERVER_ENV, DATABASE_URL=database_url, GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_WORKERS=str(workers), GUNICORN_WORKER_CLASS=worker_class)
+    env.pop('REDIS_URL', None)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn启动失败:\n' + process.stderr.read().decode(errors='replace'))
+        try:
+            with urlopen(base_url + '/api/health/live', timeout=1):
+                return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn在60秒内未就绪')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def compare(result, baseline, max_regression, max_failure_rate):
+    """返回回退说明的列表，为空表示通过"""
+    problems = []
+    limit = 1 + max_regression / 100
+    current, previous = result['scenario']['requests'], baseline['scenario']['requests']
+    for name, stats in current.items():
+        if stats['failure_rate'] > max_failure_rate:
+            problems.append(f'{name}: 失败率 {stats["failure_rate"]:.1%}')
+        before = previous.get(name)
+        if before and min(stats['requests'], before['requests']) >= MIN_SAMPLES \
+                and stats['p95_ms'] > before['p95_ms'] * limit:
+            problems.append(f'{name}: p95 {before["p95_ms"]:.1f}ms -> {stats["p95_ms"]:.1f}ms')
+    rps, before_rps = result['scenario']['total']['rps'], baseline['scenario']['total']['rps']
+    if rps * limit < before_rps:
+        problems.append(f'总吞吐 {before_rps:.1f}/s -> {rps:.1f}/s')
+    return problems
+
+
+def _print_table(summary):
+    print(f'  {"request":<26}{"count":>8}{"fail":>6}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}')
+    for name, s in list(summary['requests'].items()) + [('TOTAL', summary['total'])]:
+        print(f'  {name:<26}{s["requests"]:>8}{s["failures"]:>6}{s["rps"]:>9.1f}'
+              f'{s["p50_ms"]:>9.1f}{s["p95_ms"]:>9.1f}{s["p99_ms"]:>9.1f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load', description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=20, help='并发模拟用户数')
+    parser.add_argument('--spawn-rate', type=float, default=10, help='每秒启动的模拟用户数')
+    parser.add_argument('--duration', type=float, default=30, help='场景运行秒数（不含启动阶段）')
+    parser.add_argument('--seed-users', type=int, default=10000, help='种子数据中的普通用户数')
+    parser.add_argument('--admins', type=int, default=5, help='种子数据中的管理员数')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker数')
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--database-url', help='种子数据库（默认临时SQLite文件，须为空库）')
+    parser.add_argument('--url', help='压测已运行的服务，不写入种子数据也不启动gunicorn')
+    parser.add_argument('--seed', type=int, default=0, help='模拟用户随机数种子')
+    parser.add_argument('--json', help='结果输出文件')
+    parser.add_argument('--baseline', help='对比的基线结果文件')
+    parser.add_argument('--max-regression', type=float, default=20, help='允许的p95/吞吐回退百分比')
+    parser.add_argument('--max-failure-rate', type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    meta = {key: getattr(args, key) for key in ('users', 'spawn_rate', 'duration', 'seed_users', 'admins',
+                                                 'workers', 'worker_class', 'seed')}
+    meta.update(started_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                python=platform.python_version(), cpus=os.cpu_count())
+    context = {'users': min(args.seed_users, LOGIN_ACCOUNTS), 'admins': args.admins, 'password': args.password}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        base_url = args.url
+        if base_url is None:
+            database_url = args.database_url or f'sqlite:///{os.path.join(workdir, "loadtest.db")}'
+            count, seconds = seed_database(database_url, args.seed_users, args.admins, args.password)
+            print(f'种子数据: {count}个用户, {seconds:.1f}s')
+            meta['seed_seconds'] = seconds
+            process, base_url = start_server(database_url, args.workers, args.worker_class)
+        try:
+            stats, ramp_stats = run_users(base_url, SCENARIOS, args.users, args.duration,
+                                          spawn_rate=args.spawn_rate, seed=args.seed, context=context)
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    result = {'meta': meta, 'startup': ramp_stats.summary(), 'scenario': stats.summary()}
+    print(f'负载测试 ({args.users}个用户, {args.duration:g}s, {args.seed_users}个种子用户)')
+    _print_table(result['scenario'])
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(result, json.load(f), args.max_regression, args.max_failure_rate)
+    else:
+        problems = [f'{name}: 失败率 {s["failure_rate"]:.1%}' for name, s in result['scenario']['requests'].items()
+                    if s['failure_rate'] > args.max_failure_rate]
+    for problem in problems:
+        print('回退:', problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""locust风格的场景运行器：按权重随机执行任务的模拟用户、分请求名的延迟统计"""
+import random
+import re
+import threading
+import time
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def task(weight=1):
+    """把ScenarioUser的方法标记为任务，weight为被选中的相对权重"""
+    def decorator(f):
+        f.task_weight = weight
+        return f
+    return decorator
+
+
+class Stats:
+    """按请求名累计延迟和失败次数（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @staticmethod
+    def _summary(latencies, failures, elapsed):
+        ordered = sorted(latencies)
+        count = len(ordered)
+
+        def percentile(p):
+            return ordered[min(count - 1, int(count * p))] * 1000 if count else 0.0
+
+        return {
+            'requests': count,
+            'failures': failures,
+            'failure_rate': failures / count if count else 0.0,
+            'rps': count / elapsed if elapsed else 0.0,
+            'mean_ms': sum(ordered) / count * 1000 if count else 0.0,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': ordered[-1] * 1000 if count else 0.0,
+        }
+
+    def summary(self):
+        """{'requests': {请求名: 统计}, 'total': 统计}"""
+        elapsed = self.elapsed or time.perf_counter() - self.started
+        with self._lock:
+            requests = {name: self._summary(values, self.failures.get(name, 0), elapsed)
+                        for name, values in sorted(self.latencies.items())}
+            everything = [value for values in self.latencies.values() for value in values]
+            total = self._summary(everything, sum(self.failures.values()), elapsed)
+        return {'requests': requests, 'total': total}
+
+
+class HttpSession:
+    """带Cookie的HTTP客户端，记录每个请求的耗时；POST自动附带CSRF令牌"""
+
+    def __init__(self, base_url, stats, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.csrf_token = None
+        self._opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def request(self, name, method, path, data=None, expect=(200,), check=None):
+        """返回(状态码, 最终URL, 正文)，重定向自动跟随
+
+        状态码不在expect中或check(最终URL, 正文)为假时记为失败，连接错误的状态码为0。
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        body = None
+        if method == 'POST':
+            data = dict(data or {})
+            if self.csrf_token:
+                data.setdefault('csrf_token', self.csrf_token)
+            body = urlencode(data, doseq=True).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = time.perf_counter()
+        try:
+            with self._opener.open(Request(self.base_url + path, body, headers, method=method),
+                                   timeout=self.timeout) as response:
+                status, url, text = response.status, response.url, response.read().decode('utf-8', 'replace')
+        except HTTPError as e:
+            status, url, text = e.code, e.url, e.read().decode('utf-8', 'replace')
+        except (URLError, OSError) as e:
+            status, url, text = 0, self.base_url + path, str(e)
+        elapsed = time.perf_counter() - start
+        self.stats.record(name, elapsed, status in expect and (check is None or bool(check(url, text))))
+        match = CSRF_PATTERN.search(text)
+        if match:
+            self.csrf_token = match.group(1)
+        return status, url, text
+
+    def get(self, path, name=None, **kwargs):
+        return self.request(name or path, 'GET', path, **kwargs)
+
+    def post(self, path, data=None, name=None, **kwargs):
+        return self.request(name or path, 'POST', path, data=data, **kwargs)
+
+
+class ScenarioUser:
+    """模拟用户：on_start之后按权重随机执行@task方法，两次任务之间等待wait_time秒"""
+
+    wait_time = (0.0, 0.0)
+
+    # 按该权重分配各类模拟用户的数量
+    weight = 1
+
+    def __init__(self, base_url, stats, rng, context):
+        self.client = HttpSession(base_url, stats)
+        self.rng = rng
+        self.context = context
+        self.tasks = [getattr(self, name) for name in dir(type(self))
+                      if hasattr(getattr(type(self), name), 'task_weight')]
+        self.weights = [t.task_weight for t in self.tasks]
+
+    def on_start(self):
+        pass
+
+    def run(self, stop):
+        while not stop.is_set():
+            self.rng.choices(self.tasks, self.weights)[0]()
+            low, high = self.wait_time
+            if high:
+                stop.wait(self.rng.uniform(low, high))
+
+
+def run_users(base_url, user_classes, users, duration, spawn_rate=10, seed=0, context=None):
+    """启动users个模拟用户（按类的weight分配，每秒启动spawn_rate个），运行duration秒
+
+    context原样传给各模拟用户（如种子数据的规模和密码）。
+    返回(场景统计, 启动阶段统计)：场景统计从全部用户完成on_start（如登录）之后开始，
+    启动阶段的请求单独统计。
+    """
+    stats = Stats()
+    ramp_stats = Stats()
+    stop = threading.Event()
+    total_weight = sum(cls.weight for cls in user_classes)
+    plan = []
+    for cls in user_classes:
+        plan += [cls] * max(1, round(users * cls.weight / total_weight))
+    random.Random(seed).shuffle(plan)
+
+    threads = []
+    started = threading.Barrier(len(plan) + 1)
+    for i, cls in enumerate(plan):
+        user = cls(base_url, ramp_stats, random.Random(seed + i), context or {})
+
+        def body(user=user):
+            try:
+                user.on_start()
+            finally:
+                user.client.stats = stats
+                started.wait()
+            user.run(stop)
+
+        thread = threading.Thread(target=body, daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(1 / spawn_rate)
+    started.wait()
+    stats.started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    stats.stop()
+    for thread in threads:
+        thread.join()
+    return stats, ramp_stats
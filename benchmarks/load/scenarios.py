@@ -0,0 +1,99 @@
+"""负载测试场景：普通用户（登录、首页、个人资料）和管理员（用户列表、后台检索和角色增删改）
+
+context来自种子数据：users/admins为普通用户和管理员数量，password为统一密码。
+账号格式与 benchmarks.load.seed 一致：user_<i>@example.com、admin_<i>@example.com。
+"""
+import re
+import uuid
+
+from benchmarks.load.runner import ScenarioUser, task
+
+NEXT_CURSOR = re.compile(r'user_list\?after=([^&"]+)')
+EDIT_ID = re.compile(r'[?&]id=(\d+)')
+
+
+def _logged_in(url, text):
+    """会话失效时需要登录的页面会重定向到登录页"""
+    return '/login' not in url
+
+
+class _LoggedInUser(ScenarioUser):
+    account = 'user'
+
+    def on_start(self):
+        self.email = f'{self.account}_{self.rng.randrange(self.context[self.account + "s"])}@example.com'
+        self.login()
+
+    def login(self):
+        self.client.get('/login', name='login page')
+        # 登录失败时停留在登录页（200）
+        self.client.post('/login', {'email': self.email, 'password': self.context['password']}, name='login',
+                         check=_logged_in)
+
+
+class Visitor(_LoggedInUser):
+    """普通用户：浏览首页和个人资料，偶尔退出后重新登录"""
+
+    weight = 4
+    wait_time = (0.0, 0.1)
+
+    @task(5)
+    def index(self):
+        self.client.get('/', name='index')
+
+    @task(5)
+    def profile(self):
+        self.client.get('/auth/profile', name='profile', check=_logged_in)
+
+    @task(1)
+    def relogin(self):
+        self.client.get('/logout', name='logout')
+        self.login()
+
+
+class Administrator(_LoggedInUser):
+    """管理员：翻页浏览用户列表，在后台检索用户，创建、编辑并删除角色"""
+
+    weight = 1
+    account = 'admin'
+    wait_time = (0.0, 0.2)
+
+    def on_start(self):
+        super().on_start()
+        self.cursor = None
+
+    @task(4)
+    def user_list(self):
+        path = '/auth/user_list' + (f'?after={self.cursor}' if self.cursor else '')
+        _, _, text = self.client.get(path, name='user_list', check=_logged_in)
+        match = NEXT_CURSOR.search(text)
+        self.cursor = match.group(1) if match else None
+
+    @task(2)
+    def admin_users(self):
+        self.client.get('/admin/user/', name='admin user list', check=_logged_in)
+
+    @task(2)
+    def admin_search(self):
+        term = f'user_{self.rng.randrange(self.context["users"])}'
+        self.client.get(f'/admin/user/?search={term}', name='admin user search', check=_logged_in)
+
+    @task(1)
+    def role_crud(self):
+        name = f'load-{uuid.uuid4().hex[:12]}'
+        self.client.get('/admin/role/new/', name='admin role form', check=_logged_in)
+        # 保存后继续编辑：重定向到编辑页，URL中带新角色的id
+        _, url, _ = self.client.post('/admin/role/new/?url=/admin/role/',
+                                     {'name': name, 'description': 'load test', '_continue_editing': '1'},
+                                     name='admin role create', check=lambda url, text: EDIT_ID.search(url))
+        match = EDIT_ID.search(url)
+        if match is None:
+            return
+        role_id = match.group(1)
+        self.client.post(f'/admin/role/edit/?id={role_id}&url=/admin/role/',
+                         {'name': name, 'description': 'load test (edited)'}, name='admin role edit')
+        self.client.post('/admin/role/delete/', {'id': role_id, 'url': '/admin/role/'},
+                         name='admin role delete')
+
+
+SCENARIOS = [Visitor, Administrator]
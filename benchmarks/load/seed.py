@@ -0,0 +1,65 @@
+"""负载测试的种子数据：固定的角色和权限、场景登录用的普通用户和管理员，
+其余用户由 flask seed 的生成器写入
+
+所有账号使用同一个密码，只哈希一次；用户和角色关联分批用Core批量插入。
+"""
+from datetime import datetime, timedelta
+
+from flask_security.utils import hash_password
+from sqlalchemy import insert, select
+
+from application import db, permission_cache
+from application.models.user import Permission, Role, User, user_roles
+from application.services.seed import seed_data
+
+# 场景登录使用的普通用户数（user_<i>），超出的部分生成为合成用户
+LOGIN_ACCOUNTS = 1000
+
+PERMISSIONS = {
+    'view_content': '查看内容',
+    'create_content': '创建内容',
+    'edit_content': '编辑内容',
+}
+ROLES = {
+    'admin': ('管理员', ['view_content', 'create_content', 'edit_content']),
+    'editor': ('编辑', ['view_content', 'edit_content']),
+    'viewer': ('访客', ['view_content']),
+}
+
+
+def seed(app, users, admins=5, password='loadtest-password', batch_size=5000):
+    """创建user_<i>（editor或viewer，最多LOGIN_ACCOUNTS个）和admin_<i>，共users+admins个用户，
+    返回创建的用户数
+    """
+    with app.test_request_context():
+        hashed = hash_password(password)
+    permissions = {name: Permission(name=name, description=description)
+                   for name, description in PERMISSIONS.items()}
+    roles = {name: Role(name=name, description=description, permissions=[permissions[p] for p in granted])
+             for name, (description, granted) in ROLES.items()}
+    db.session.add_all(roles.values())
+    db.session.commit()
+    role_ids = {name: role.id for name, role in roles.items()}
+
+    accounts = [('admin', i, 'admin') for i in range(admins)]
+    accounts += [('user', i, 'editor' if i % 10 == 0 else 'viewer') for i in range(min(users, LOGIN_ACCOUNTS))]
+    # created_at递增，用户列表的键集分页有稳定的顺序
+    start = datetime.utcnow() - timedelta(seconds=len(accounts))
+    for offset in range(0, len(accounts), batch_size):
+        chunk = accounts[offset:offset + batch_size]
+        rows = [{'username': f'{prefix}_{i}', 'email': f'{prefix}_{i}@example.com', 'password': hashed,
+                 'active': True, 'fs_uniquifier': f'{prefix}-{i}', 'login_count': 0,
+                 'created_at': start + timedelta(seconds=offset + n), 'updated_at': start}
+                for n, (prefix, i, _) in enumerate(chunk)]
+        db.session.execute(insert(User.__table__), rows)
+        ids = dict(db.session.execute(
+            select(User.fs_uniquifier, User.id).where(User.fs_uniquifier.in_([row['fs_uniquifier'] for row in rows]))
+        ).all())
+        db.session.execute(insert(user_roles), [{'user_id': ids[f'{prefix}-{i}'], 'role_id': role_ids[role]}
+                                                for prefix, i, role in chunk])
+        db.session.commit()
+    # ORM之外写入了关联表
+    permission_cache.bump_version()
+    if users > LOGIN_ACCOUNTS:
+        seed_data(users - LOGIN_ACCOUNTS, password=password)
+    return users + admins
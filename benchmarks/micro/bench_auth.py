@@ -0,0 +1,62 @@
+"""认证热点路径的微基准：权限和角色检查、登录和注册表单验证
+
+用法: python -m pytest benchmarks/micro [--benchmark-json=results/micro.json]
+"""
+import random
+
+import pytest
+from flask_security.forms import LoginForm
+
+from application import db
+from application.forms import ExtendedRegisterForm
+from application.models.user import User
+
+
+@pytest.fixture
+def users(app, seeded):
+    """预先加载的用户（角色已在会话中），按固定顺序轮流检查"""
+    user_ids, names = seeded
+    db.session.expunge_all()
+    users = [db.session.get(User, user_id) for user_id in user_ids]
+    for user in users:
+        user.has_role('role_0')
+    return users
+
+
+def _cycle(items):
+    rng = random.Random(42)
+    items = list(items)
+    while True:
+        yield rng.choice(items)
+
+
+def test_has_permission_cached(benchmark, users, seeded):
+    # 先为每个用户编译好权限位图，只测命中
+    for user in users:
+        user.has_permission(seeded[1][0])
+    checks = _cycle([(user, name) for user in users for name in seeded[1][::5]])
+    benchmark(lambda: User.has_permission(*next(checks)))
+
+
+def test_has_permission_walk_roles(benchmark, users, seeded):
+    checks = _cycle([(user, name) for user in users for name in seeded[1][::5]])
+    benchmark(lambda: User._has_permission_uncached(*next(checks)))
+
+
+def test_has_role(benchmark, users):
+    checks = _cycle([(user, f'role_{i}') for user in users for i in range(10)])
+    benchmark(lambda: User.has_role(*next(checks)))
+
+
+def test_login_form_validate(benchmark, app, seeded):
+    data = {'email': 'user_7@example.com', 'password': 'password'}
+    with app.test_request_context('/login', method='POST', data=data):
+        assert benchmark(lambda: LoginForm().validate())
+
+
+def test_register_form_validate(benchmark, app, seeded):
+    # 用户名和邮箱唯一性检查各查询一次数据库
+    data = {'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'Correct-horse-9', 'password_confirm': 'Correct-horse-9'}
+    with app.test_request_context('/register', method='POST', data=data):
+        assert benchmark(lambda: ExtendedRegisterForm().validate())
@@ -0,0 +1,16 @@
+import pytest
+
+from benchmarks.bench_permissions import seed
+from benchmarks.common import bench_app
+
+
+@pytest.fixture(scope='module')
+def app():
+    with bench_app(RATE_LIMIT_ENABLED=False) as app:
+        yield app
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    """10个角色、50个权限和200个用户，返回(用户id列表, 权限名列表)"""
+    return seed(200)
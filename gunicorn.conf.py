@@ -0,0 +1,29 @@
+"""Gunicorn配置
+
+预加载应用：导入和create_app在master中只执行一次，worker通过fork共享；
+STARTUP_DB_CHECK=true时表结构检查随预加载的create_app在master中执行一次，
+而不是在每个worker中执行。
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+preload_app = True
+
+
+def on_starting(server):
+    """fork前释放master中预加载应用建立的数据库连接，避免worker共用同一连接"""
+    from application import db
+    from app import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def child_exit(server, worker):
+    """多进程指标模式下清理退出worker的指标文件"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -86,6 +86,10 @@ def run_migrations_online():
     def process_revision_directives(context, revision, directives):
         if getattr(config.cmd_opts, 'autogenerate', False):
             script = directives[0]
+            # 新建/删除声明了检索列的表时，一并创建/删除其检索索引
+            search = current_app.extensions['search']
+            search.add_migration_ops(script.upgrade_ops, context.dialect)
+            search.add_migration_ops(script.downgrade_ops, context.dialect)
             if script.upgrade_ops.is_empty():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
@@ -1,14 +1,13 @@
 #!/usr/bin/env python
 """
 应用启动脚本
+
+create_app不访问数据库；首次运行前执行 flask --app app check-db 创建表结构，
+或设置 STARTUP_DB_CHECK=true 在创建应用时检查。
 """
-from application import create_app, db, init_db
+from application import create_app
 
 app = create_app()
 
-# 确保在应用启动前初始化数据库
-with app.app_context():
-    init_db()
-
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,105 @@
+import io
+import json
+
+import pytest
+from flask_admin import Admin
+from flask_security.utils import login_user
+from openpyxl import load_workbook
+
+from application import db
+from application.controllers.admin import UserModelView
+from application.models.user import User
+from application.services.export import iter_csv, iter_jsonl, iter_xlsx
+
+
+@pytest.fixture
+def export_admin(app):
+    """在测试应用上注册独立的管理后台，避免与全局admin实例冲突"""
+    test_admin = Admin(app, name='test-admin', url='/test-admin', endpoint='test_admin',
+                       template_mode='bootstrap4')
+    test_admin.add_view(UserModelView(User, db.session, name='用户管理', endpoint='export_user'))
+    return test_admin
+
+
+def test_csv_writer_chunks():
+    """CSV按块输出且内容完整"""
+    rows = ([i, f'name-{i}'] for i in range(1000))
+    chunks = list(iter_csv(['id', 'name'], rows, chunk_size=1024))
+    assert len(chunks) > 1
+    lines = ''.join(chunks).splitlines()
+    assert lines[0] == 'id,name'
+    assert lines[-1] == '999,name-999'
+
+
+def test_jsonl_writer():
+    """JSONL每行一个对象"""
+    text = ''.join(iter_jsonl(['id', 'name'], [[1, '张三'], [2, 'b']]))
+    assert [json.loads(line) for line in text.splitlines()] == [
+        {'id': 1, 'name': '张三'}, {'id': 2, 'name': 'b'}]
+
+
+def test_xlsx_writer():
+    """XLSX可被openpyxl读回"""
+    data = b''.join(iter_xlsx(['id', 'name'], ([i, str(i)] for i in range(10))))
+    sheet = load_workbook(io.BytesIO(data), read_only=True).active
+    values = list(sheet.values)
+    assert values[0] == ('id', 'name')
+    assert len(values) == 11
+
+
+def test_export_view_honours_search(app, client, admin_user, export_admin):
+    """导出遵循当前搜索条件"""
+    with app.app_context():
+        login_user(admin_user)
+        response = client.get('/test-admin/export_user/export/csv/?search=editor')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        body = response.data.decode('utf-8')
+        assert 'editor@example.com' in body
+        assert 'viewer@example.com' not in body
+
+        response = client.get('/test-admin/export_user/export/jsonl/')
+        assert len(response.data.decode('utf-8').splitlines()) == 3
+
+
+def test_export_view_rejects_unknown_type(app, client, admin_user, export_admin):
+    """不支持的导出格式重定向回列表页"""
+    with app.app_context():
+        login_user(admin_user)
+        response = client.get('/test-admin/export_user/export/pdf/')
+        assert response.status_code == 302
+
+
+def test_export_excludes_credentials(app, client, admin_user, export_admin):
+    """导出文件不包含密码哈希、fs_uniquifier和登录IP"""
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        admin.password = '$pbkdf2-sha256$29000$secret-hash'
+        admin.current_login_ip = '203.0.113.7'
+        db.session.commit()
+        login_user(admin)
+        for export_type in ('csv', 'jsonl'):
+            body = client.get(f'/test-admin/export_user/export/{export_type}/').data.decode('utf-8')
+            assert 'admin@example.com' in body
+            assert 'secret-hash' not in body
+            assert 'admin-uniquifier' not in body
+            assert '203.0.113.7' not in body
+            assert 'Fs Uniquifier' not in body and 'Password' not in body
+
+
+def test_export_does_not_touch_view_state(app, client, admin_user, export_admin, monkeypatch):
+    """导出不修改共享的视图实例（并发的列表请求仍计数分页），也不执行COUNT"""
+    view = next(v for v in export_admin._views if v.endpoint == 'export_user')
+    seen = []
+    original = view.get_query
+
+    def get_query():
+        seen.append(view.simple_list_pager)
+        return original()
+    monkeypatch.setattr(view, 'get_query', get_query)
+    monkeypatch.setattr(view, 'get_count_query', lambda: pytest.fail('导出不应计数'))
+    with app.app_context():
+        login_user(admin_user)
+        body = client.get('/test-admin/export_user/export/csv/?search=example&sort=1&desc=1').data.decode('utf-8')
+    assert seen == [False]
+    assert len(body.splitlines()) == 4
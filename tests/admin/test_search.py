@@ -0,0 +1,100 @@
+import pytest
+from flask_admin import Admin
+from flask_security.utils import login_user
+from sqlalchemy import inspect, text
+
+from application import db, search
+from application.controllers.admin import RoleModelView, UserModelView
+from application.models.user import Role, User
+from application.services.search import PostgresBackend, SqliteBackend, searchable_columns
+
+
+@pytest.fixture
+def search_admin(app):
+    """在测试应用上注册独立的管理后台，避免与全局admin实例冲突"""
+    test_admin = Admin(app, name='test-admin', url='/test-admin', endpoint='test_admin',
+                       template_mode='bootstrap4')
+    test_admin.add_view(UserModelView(User, db.session, name='用户管理', endpoint='search_user'))
+    test_admin.add_view(RoleModelView(Role, db.session, name='角色管理', endpoint='search_role'))
+    return test_admin
+
+
+def _usernames(query):
+    return sorted(user.username for user in query)
+
+
+def test_create_all_builds_fts_index(app):
+    """create_all为声明了检索列的表建立FTS索引，已有数据可检索"""
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        assert 'users_search' in tables
+        assert 'sheets_search' in tables
+        assert _usernames(search.filter(User.query, User, 'EDIT')) == ['editor']
+        assert _usernames(search.filter(User.query, User, 'example.com')) == ['admin', 'editor', 'viewer']
+
+
+def test_index_follows_inserts_updates_and_deletes(app):
+    """触发器随增删改同步索引"""
+    with app.app_context():
+        user = User(username='zhangsan', email='zs@corp.cn', fs_uniquifier='zs')
+        db.session.add(user)
+        db.session.commit()
+        assert _usernames(search.filter(User.query, User, 'gsan')) == ['zhangsan']
+
+        user.username = 'lisi'
+        db.session.commit()
+        assert _usernames(search.filter(User.query, User, 'gsan')) == []
+        assert _usernames(search.filter(User.query, User, 'corp lisi')) == ['lisi']
+
+        db.session.delete(user)
+        db.session.commit()
+        assert _usernames(search.filter(User.query, User, 'corp')) == []
+
+
+def test_terms_are_combined_and_short_terms_fall_back(app):
+    """多个词须同时匹配；短于3个字符的词按LIKE匹配，特殊字符按字面匹配"""
+    with app.app_context():
+        assert _usernames(search.filter(User.query, User, 'ad example')) == ['admin']
+        assert _usernames(search.filter(User.query, User, 'ad viewer')) == []
+        assert _usernames(search.filter(User.query, User, '%')) == []
+        assert _usernames(search.filter(User.query, User, '"x')) == []
+        assert _usernames(search.filter(User.query, User, '')) == ['admin', 'editor', 'viewer']
+
+
+def test_drop_and_rebuild_indexes(app):
+    """drop_indexes删除FTS表和触发器，create_indexes按现有数据重建"""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            search.drop_indexes(connection, ['users'])
+        assert 'users_search' not in inspect(db.engine).get_table_names()
+
+        db.session.execute(text("UPDATE users SET username = 'root' WHERE username = 'admin'"))
+        db.session.commit()
+        with db.engine.begin() as connection:
+            search.create_indexes(connection, ['users'])
+        assert _usernames(search.filter(User.query, User, 'root')) == ['root']
+
+
+def test_postgres_backend_ddl():
+    """PostgreSQL为trigram列建gin_trgm_ops索引，为text列建tsvector表达式索引"""
+    ddl = PostgresBackend().create_ddl('roles', searchable_columns(Role))
+    assert ddl[0] == 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+    assert 'ix_roles_name_trgm ON roles USING gin (name gin_trgm_ops)' in ddl[1]
+    assert "to_tsvector('simple', coalesce(description, ''))" in ddl[2]
+    assert SqliteBackend().drop_ddl('roles', searchable_columns(Role))[-1] == 'DROP TABLE IF EXISTS roles_search'
+
+
+def test_admin_list_searches_through_index(app, client, admin_user, search_admin):
+    """管理后台列表页的搜索框通过检索索引过滤，计数与结果一致"""
+    with app.app_context():
+        login_user(admin_user)
+        response = client.get('/test-admin/search_user/?search=viewer')
+        body = response.data.decode('utf-8')
+        assert response.status_code == 200
+        assert 'viewer@example.com' in body
+        assert 'editor@example.com' not in body
+
+        response = client.get('/test-admin/search_role/?search=编辑')
+        body = response.data.decode('utf-8')
+        assert 'editor' in body
+        assert '访客' not in body
@@ -0,0 +1,72 @@
+import io
+import os
+
+import pytest
+from flask_admin import Admin
+from flask_security.utils import login_user
+
+from application import db
+from application.controllers.admin import UserImportView
+from application.models.job import Job
+from application.models.user import User
+
+
+@pytest.fixture
+def import_admin(app):
+    """在测试应用上注册独立的管理后台"""
+    test_admin = Admin(app, name='test-admin', url='/test-admin', endpoint='test_admin',
+                       template_mode='bootstrap4')
+    test_admin.add_view(UserImportView(name='批量导入', endpoint='test_user_import'))
+    return test_admin
+
+
+def test_upload_imports_users(app, client, admin_user, import_admin):
+    """上传CSV后展示结果并可下载被拒绝的行"""
+    with app.app_context():
+        login_user(admin_user)
+        response = client.get('/test-admin/test_user_import/')
+        assert response.status_code == 200
+        html = response.data.decode('utf-8')
+        assert '批量导入用户' in html
+        csrf_token = html.split('name="csrf_token" value="')[1].split('"')[0]
+
+        data = b'username,email,password\nzoe,zoe@example.com,password123\nx,x@example.com,password123\n'
+        response = client.post('/test-admin/test_user_import/', data={
+            'file': (io.BytesIO(data), 'users.csv'),
+            'default_role': 'viewer',
+            'csrf_token': csrf_token,
+        })
+        html = response.data.decode('utf-8')
+        assert response.status_code == 200
+        assert '成功 1 行' in html
+        assert User.query.filter_by(username='zoe').first().has_role('viewer')
+
+        link = html.split('href="/test-admin/test_user_import/rejects/')[1].split('"')[0]
+        response = client.get('/test-admin/test_user_import/rejects/' + link)
+        assert response.status_code == 200
+        assert b'x@example.com' in response.data
+
+
+def test_rejects_download_limited_to_own_job(app, client, admin_user, editor_user, import_admin):
+    """只能通过自己的任务下载被拒绝行文件，上传文件不可下载"""
+    with app.app_context():
+        login_user(admin_user)
+        html = client.get('/test-admin/test_user_import/').data.decode('utf-8')
+        csrf_token = html.split('name="csrf_token" value="')[1].split('"')[0]
+        data = b'username,email,password\nx,x@example.com,password123\n'
+        response = client.post('/test-admin/test_user_import/', data={
+            'file': (io.BytesIO(data), 'users.csv'),
+            'csrf_token': csrf_token,
+        })
+        assert response.status_code == 200
+        job = Job.query.filter_by(user_id=admin_user.id).one()
+        assert job.result['rejects_path'].startswith('rejects-')
+        upload_name = 'upload-' + job.result['rejects_path'][len('rejects-'):]
+
+        assert client.get('/test-admin/test_user_import/rejects/' + job.id).status_code == 200
+        assert client.get('/test-admin/test_user_import/rejects/' + upload_name).status_code == 404
+        assert not os.path.exists(os.path.join(UserImportView.upload_dir(), upload_name))
+
+        job.user_id = editor_user.id
+        db.session.commit()
+        assert client.get('/test-admin/test_user_import/rejects/' + job.id).status_code == 404
@@ -0,0 +1,46 @@
+from flask_security.utils import get_hmac
+from passlib.hash import pbkdf2_sha256
+
+from application import db, password_hasher
+from application.models.user import User
+from application.services.hashing import PooledPasswordContext, calibrate_rounds
+
+
+def test_calibrate_rounds():
+    """校准结果随目标耗时增长"""
+    low = calibrate_rounds('pbkdf2_sha256', 2)
+    high = calibrate_rounds('pbkdf2_sha256', 20)
+    assert 1000 <= low <= high
+    assert low % 1000 == 0
+
+
+def test_pooled_context_hash_and_verify(app):
+    """线程池中的哈希与验证结果与原上下文一致"""
+    with app.app_context():
+        context = app.extensions['security'].pwd_context
+        assert isinstance(context, PooledPasswordContext)
+        hashed = context.hash('secret-password')
+        assert context.verify('secret-password', hashed)
+        assert not context.verify('wrong-password', hashed)
+        assert context.identify(hashed) == app.config['SECURITY_PASSWORD_HASH']
+
+
+def test_stale_hash_is_upgraded_on_login(app):
+    """轮数低于校准值的旧哈希在验证成功后被重新哈希"""
+    app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2_sha256'
+    app.config['PASSWORD_HASH_TARGET_MS'] = 5
+    password_hasher.init_app(app)
+    rounds = app.extensions['password_hasher']['rounds']
+
+    with app.test_request_context():
+        user = User.query.filter_by(username='viewer').first()
+        # 按旧参数（更少轮数）生成的哈希
+        stale = pbkdf2_sha256.using(rounds=rounds // 2).hash(get_hmac('password123').decode('ascii'))
+        user.password = stale
+        db.session.commit()
+
+        assert user.verify_and_update_password('password123') is True
+        db.session.commit()
+        assert user.password != stale
+        assert pbkdf2_sha256.from_string(user.password).rounds == rounds
+        assert user.verify_and_update_password('password123') is True
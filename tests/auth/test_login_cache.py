@@ -0,0 +1,132 @@
+import fakeredis
+import pytest
+import redis
+from types import SimpleNamespace
+from sqlalchemy import update
+
+from application import create_app, db, login_cache
+from application.models.user import User
+from tests.auth.test_permission_cache import count_queries
+
+
+def _login(client, uniquifier):
+    with client.session_transaction() as session:
+        session['_user_id'] = uniquifier
+        session['_fresh'] = True
+
+
+def _get(app, client, path):
+    """在新的应用上下文中发出请求
+
+    app夹具已推入应用上下文，请求会复用它，Flask-Login存放在g中的用户
+    因而跨请求保留；生产环境中每个请求都有自己的应用上下文。
+    """
+    with app.app_context():
+        return client.get(path)
+
+
+@pytest.fixture
+def redis_app(app, monkeypatch):
+    """使用fakeredis的应用：服务端会话和登录缓存都存放在Redis中"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)))
+    settings = {key: app.config[key] for key in
+                ('SQLALCHEMY_DATABASE_URI', 'SECURITY_PASSWORD_HASH', 'SECURITY_PASSWORD_SALT')}
+    return create_app(SimpleNamespace(REDIS_URL='redis://fake', **settings), register_admin=False)
+
+
+def test_authenticated_request_needs_no_queries(redis_app):
+    """缓存命中后，已登录请求（含角色和权限加载）不访问数据库"""
+    client = redis_app.test_client()
+    _login(client, 'admin-uniquifier')
+    assert _get(redis_app, client, '/auth/profile').status_code == 200
+
+    with redis_app.app_context():
+        statements, stop = count_queries()
+    try:
+        assert _get(redis_app, client, '/auth/profile').status_code == 200
+        assert _get(redis_app, client, '/auth/user_list').status_code == 200
+    finally:
+        stop()
+    # 用户列表页自身的查询之外没有加载用户的SQL
+    assert not any('FROM users' in s and 'fs_uniquifier' in s for s in statements)
+    assert not any('role_permissions' in s for s in statements)
+
+
+def test_restored_user_is_usable(redis_app):
+    """从缓存还原的用户并入会话，可读取未缓存的属性并正常提交修改"""
+    with redis_app.test_request_context():
+        login_cache.load_user('editor-uniquifier')
+        db.session.remove()
+
+        user = login_cache.load_user('editor-uniquifier')
+        assert [role.name for role in user.roles] == ['editor']
+        assert user.password == 'password'
+        assert user.has_permission('edit_content')
+        user.login_count = 5
+        db.session.commit()
+        assert db.session.get(User, user.id).login_count == 5
+
+
+@pytest.mark.parametrize('name', ['app', 'redis_app'])
+def test_uniquifier_rotation_invalidates(request, name):
+    """fs_uniquifier轮换后旧会话失效"""
+    app = request.getfixturevalue(name)
+    client = app.test_client()
+    _login(client, 'viewer-uniquifier')
+    assert _get(app, client, '/auth/profile').status_code == 200
+
+    with app.app_context():
+        user = User.query.filter_by(username='viewer').first()
+        user.fs_uniquifier = 'viewer-rotated'
+        db.session.commit()
+
+    assert _get(app, client, '/auth/profile').status_code == 302
+    _login(client, 'viewer-rotated')
+    assert _get(app, client, '/auth/profile').status_code == 200
+
+
+@pytest.mark.parametrize('name', ['app', 'redis_app'])
+def test_deactivation_invalidates(request, name):
+    app = request.getfixturevalue(name)
+    client = app.test_client()
+    _login(client, 'editor-uniquifier')
+    assert _get(app, client, '/auth/profile').status_code == 200
+
+    with app.app_context():
+        User.query.filter_by(username='editor').first().active = False
+        db.session.commit()
+
+    assert _get(app, client, '/auth/profile').status_code == 302
+
+
+def test_redis_sessions(redis_app):
+    client = redis_app.test_client()
+    _login(client, 'admin-uniquifier')
+    assert client.get('/auth/profile').status_code == 200
+
+    client_redis = redis_app.extensions['redis']
+    keys = {key.decode() for key in client_redis.keys('*')}
+    assert any(key.startswith('session:') for key in keys)
+    assert any(key.startswith('login:user:') and key.endswith(':admin-uniquifier') for key in keys)
+
+    with redis_app.app_context():
+        statements, stop = count_queries()
+    try:
+        assert _get(redis_app, client, '/auth/profile').status_code == 200
+    finally:
+        stop()
+    assert statements == []
+
+
+def test_no_process_cache_without_redis(app, client):
+    """未配置Redis时不缓存用户：其他进程中的停用（这里绕过ORM事件）在下一个请求生效"""
+    _login(client, 'editor-uniquifier')
+    assert _get(app, client, '/auth/profile').status_code == 200
+
+    with app.app_context():
+        db.session.execute(update(User).where(User.username == 'editor').values(active=False))
+        db.session.commit()
+
+    assert _get(app, client, '/auth/profile').status_code == 302
@@ -0,0 +1,101 @@
+from sqlalchemy import event
+
+from application import db, permission_cache
+from application.services.permissions import PermissionCache
+from application.models.user import User, Role, Permission
+
+
+def count_queries():
+    """统计上下文内执行的SQL语句数"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements, lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_permission_check_is_cached(app):
+    """同一版本内重复检查不访问数据库"""
+    with app.app_context():
+        editor = User.query.filter_by(username='editor').first()
+        assert editor.has_permission('edit_content') is True
+
+        statements, stop = count_queries()
+        try:
+            assert editor.has_permission('edit_content') is True
+            assert editor.has_permission('create_content') is False
+            assert editor.has_permission('no_such_permission') is False
+        finally:
+            stop()
+        assert statements == []
+
+
+def test_role_permission_change_invalidates_cache(app):
+    """角色权限变更提交后缓存失效"""
+    with app.app_context():
+        viewer = User.query.filter_by(username='viewer').first()
+        assert viewer.has_permission('edit_content') is False
+        version = permission_cache.current_version()
+
+        role = Role.query.filter_by(name='viewer').first()
+        role.permissions.append(Permission.query.filter_by(name='edit_content').first())
+        db.session.commit()
+
+        assert permission_cache.current_version() == version + 1
+        assert viewer.has_permission('edit_content') is True
+
+
+def test_user_role_change_invalidates_cache(app):
+    """用户角色变更提交后缓存失效"""
+    with app.app_context():
+        viewer = User.query.filter_by(username='viewer').first()
+        assert viewer.has_permission('create_content') is False
+
+        viewer.roles = [Role.query.filter_by(name='admin').first()]
+        # 变更未提交时按关系遍历，不污染共享缓存
+        db.session.flush()
+        assert viewer.has_permission('create_content') is True
+        db.session.commit()
+
+        assert viewer.has_permission('create_content') is True
+
+
+def test_unrelated_user_update_keeps_version(app):
+    """与权限无关的用户字段更新不递增版本号"""
+    with app.app_context():
+        version = permission_cache.current_version()
+        viewer = User.query.filter_by(username='viewer').first()
+        viewer.login_count = 5
+        db.session.commit()
+        assert permission_cache.current_version() == version
+
+
+def test_permission_object_argument(app):
+    """传入Permission对象时按名称检查"""
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        permission = Permission.query.filter_by(name='create_content').first()
+        assert admin.has_permission(permission) is True
+
+
+def test_revocation_reaches_other_processes_without_redis(app):
+    """未配置Redis时另一个进程（缓存实例）提交的撤权在下一个请求即生效"""
+    other = PermissionCache()
+    other.db = db
+    with app.app_context():
+        viewer = User.query.filter_by(username='viewer').first()
+        assert other.has_permission(viewer, 'view_content') is True
+        assert permission_cache.has_permission(viewer, 'view_content') is True
+
+    with app.app_context():
+        # “本进程”的缓存实例提交撤权，只有它自己的版本号递增
+        role = Role.query.filter_by(name='viewer').first()
+        role.permissions = []
+        db.session.commit()
+
+    with app.app_context():
+        viewer = User.query.filter_by(username='viewer').first()
+        assert other.has_permission(viewer, 'view_content') is False
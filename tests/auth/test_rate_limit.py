@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+import redis
+
+from application import create_app, rate_limiter
+from application.models.user import User
+
+LIMITS = {'security.login': {'ip': (5, 60), 'account': (3, 300)}}
+
+
+def _limited_app(app, **config):
+    settings = {key: app.config[key] for key in
+                ('SQLALCHEMY_DATABASE_URI', 'SECURITY_PASSWORD_HASH', 'SECURITY_PASSWORD_SALT')}
+    settings.update(WTF_CSRF_ENABLED=False, RATE_LIMITS=LIMITS, RATE_LIMIT_SYNC_MS=0)
+    settings.update(config)
+    return create_app(SimpleNamespace(**settings), register_admin=False)
+
+
+def _attempt(app, email, ip='10.0.0.1', forwarded_for=None):
+    client = app.test_client()
+    headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+    with app.app_context():
+        return client.post('/login', json={'email': email, 'password': 'wrong'},
+                           headers=headers, environ_base={'REMOTE_ADDR': ip})
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    """统计密码校验次数"""
+    calls = []
+    original = User.verify_and_update_password
+
+    def verify(self, password):
+        calls.append(self.email)
+        return original(self, password)
+    monkeypatch.setattr(User, 'verify_and_update_password', verify)
+    return calls
+
+
+def test_account_limit_blocks_before_password_check(app, verifications):
+    """同一账户超限后直接返回429，不再校验密码；换IP也不能绕过账户限额"""
+    limited = _limited_app(app)
+    for i in range(3):
+        assert _attempt(limited, 'admin@example.com', ip=f'10.0.0.{i}').status_code == 400
+    assert len(verifications) == 3
+
+    response = _attempt(limited, 'ADMIN@example.com ', ip='10.0.0.9')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert len(verifications) == 3
+
+    # 其他账户不受影响
+    assert _attempt(limited, 'editor@example.com', ip='10.0.0.9').status_code == 400
+
+
+def test_ip_limit_and_get_requests(app, verifications):
+    """同一IP对不同账户的尝试按IP限额拒绝，GET登录页不计数"""
+    limited = _limited_app(app)
+    client = limited.test_client()
+    with limited.app_context():
+        for _ in range(10):
+            assert client.get('/login').status_code == 200
+    statuses = [_attempt(limited, f'user{i}@example.com').status_code for i in range(7)]
+    assert statuses[:5] == [400] * 5
+    assert statuses[5:] == [429, 429]
+    assert _attempt(limited, 'user9@example.com', ip='10.0.0.2').status_code == 400
+
+
+def test_ip_limit_behind_proxy(app, verifications):
+    """配置可信代理层数后按X-Forwarded-For中的客户端地址计数，伪造的左侧地址不影响识别"""
+    proxied = _limited_app(app, RATE_LIMIT_TRUSTED_PROXIES=1)
+    statuses = [_attempt(proxied, f'user{i}@example.com', ip='10.9.9.9',
+                         forwarded_for=f'1.2.3.{i}, 203.0.113.7').status_code for i in range(6)]
+    assert statuses == [400] * 5 + [429]
+    # 经同一代理的其他客户端不受影响
+    assert _attempt(proxied, 'user9@example.com', ip='10.9.9.9',
+                    forwarded_for='203.0.113.8').status_code == 400
+
+    # 未配置可信代理时忽略X-Forwarded-For，经代理的请求共用代理地址
+    direct = _limited_app(app)
+    statuses = [_attempt(direct, f'user{i}@example.com', ip='10.9.9.9',
+                         forwarded_for=f'203.0.113.{i}').status_code for i in range(6)]
+    assert statuses == [400] * 5 + [429]
+
+
+def test_sliding_window_and_retry_after(app):
+    """上一窗口的计数按剩余比例折算，Retry-After为估算值降到限额以内的时间"""
+    limited = _limited_app(app)
+    with limited.app_context():
+        limits = limited.extensions['rate_limiter']
+        rule = [(('ip', 4, 60), '10.0.0.1')]
+        for _ in range(4):
+            assert rate_limiter.hit(limits, 'security.login', rule, now=6000.0) == (None, None)
+        # 下一窗口过去1/4后上一窗口折算为3次，可再放行一次
+        assert rate_limiter.hit(limits, 'security.login', rule, now=6059.0) == (16, 'ip')
+        # 下一窗口过去一半时，上一窗口折算为2次
+        for _ in range(2):
+            assert rate_limiter.hit(limits, 'security.login', rule, now=6090.0) == (None, None)
+        assert rate_limiter.hit(limits, 'security.login', rule, now=6090.0) == (15, 'ip')
+        assert rate_limiter.hit(limits, 'security.login', rule, now=6240.0) == (None, None)
+
+
+def test_counters_shared_through_redis(app, monkeypatch):
+    """两个worker的计数经Lua脚本汇总到Redis，同步后按集群总数限流"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)))
+    first = _limited_app(app, REDIS_URL='redis://fake')
+    second = _limited_app(app, REDIS_URL='redis://fake')
+
+    for i in range(2):
+        assert _attempt(first, 'admin@example.com', ip=f'10.0.1.{i}').status_code == 400
+    assert _attempt(second, 'admin@example.com', ip='10.0.2.1').status_code == 400
+    for worker in (first, second):
+        with worker.app_context():
+            rate_limiter.flush()
+    assert _attempt(second, 'admin@example.com', ip='10.0.2.2').status_code == 429
+
+    client = first.extensions['redis']
+    assert any(key.startswith(b'ratelimit:security.login:account:') for key in client.keys('*'))
+
+    # Redis不可用时退化为本地计数，增量保留到下次同步
+    def unavailable(*args, **kwargs):
+        raise redis.ConnectionError('Redis不可用')
+    monkeypatch.setattr(client, 'evalsha', unavailable)
+    with first.app_context():
+        assert _attempt(first, 'editor@example.com').status_code == 400
+        rate_limiter.flush()
+        windows = first.extensions['rate_limiter'].windows
+        assert sum(window.pending for window in windows.values()) == 2
@@ -0,0 +1,96 @@
+from sqlalchemy import func, select
+
+from application import db, permission_cache
+from application.models.user import Permission, Role, User, user_roles
+from application.services.seed import _generate_users, seed_data
+
+
+def _snapshot():
+    users = db.session.execute(select(User.id, User.username, User.email, User.created_at, User.fs_uniquifier)
+                               .order_by(User.id)).all()
+    links = db.session.execute(select(user_roles.c.user_id, user_roles.c.role_id)
+                               .order_by(user_roles.c.user_id, user_roles.c.role_id)).all()
+    return users, links
+
+
+def test_seed_users_roles_permissions(app):
+    """批量生成的用户可登录，角色和权限关联完整，权限缓存已失效"""
+    with app.app_context():
+        version = permission_cache.current_version()
+        result = seed_data(1200, roles=7, permissions=20, seed=1, batch_size=500, workers=0,
+                           password='password123')
+        assert (result.users, result.roles, result.permissions) == (1200, 7, 20)
+        assert User.query.count() == 1203
+        assert db.session.execute(select(func.count()).select_from(user_roles)).scalar() == 3 + result.user_roles
+        assert result.user_roles >= 1200
+        assert Role.query.filter_by(name='editorial-manager').first().permissions
+        assert permission_cache.current_version() > version
+
+        user = User.query.filter(User.username.like('%_1003')).one()
+        assert user.verify_and_update_password('password123')
+        role = user.roles[0]
+        assert user.has_permission(role.permissions[0].name) is True
+
+        # 再次生成时沿用已有的角色和权限，追加用户
+        again = seed_data(100, roles=7, permissions=20, seed=1, batch_size=500, workers=0)
+        assert (again.users, again.roles, again.permissions) == (100, 0, 0)
+        assert Permission.query.count() == 3 + 20
+        assert User.query.count() == 1303
+
+
+def test_seed_is_deterministic(app, runner):
+    """同一种子生成相同的数据，与进程数无关"""
+    with app.app_context():
+        plan = {'seed': 5, 'users': 300, 'batch_size': 100, 'first_id': 10, 'tiers': [[1, 2, 3], [4, 5]],
+                'password': 'x', 'format': 'rows'}
+        assert _generate_users(plan, 2) == _generate_users(plan, 2)
+        assert _generate_users(plan, 1) != _generate_users(plan, 2)
+
+        result = runner.invoke(args=['seed', '--users', '250', '--seed', '9', '--batch-size', '100',
+                                     '--workers', '2'])
+        assert '250个用户' in result.output
+        first = _snapshot()
+        db.session.execute(user_roles.delete().where(user_roles.c.user_id > 3))
+        db.session.execute(User.__table__.delete().where(User.id > 3))
+        db.session.commit()
+
+        seed_data(250, seed=9, batch_size=100, workers=0)
+        assert _snapshot() == first
+
+
+def test_copy_runs_in_writer_thread(app):
+    """COPY在没有应用上下文的写入线程中执行"""
+    from concurrent.futures import ThreadPoolExecutor
+    from application.services.seed import DataSeeder
+
+    copied = []
+
+    class Cursor:
+        def copy_expert(self, sql, stream):
+            copied.append((sql.split(' (')[0], stream.read()))
+
+    class Connection:
+        committed = closed = False
+
+        def cursor(self):
+            return Cursor()
+
+        def commit(self):
+            self.committed = True
+
+        def close(self):
+            self.closed = True
+
+    class Engine:
+        def __init__(self):
+            self.connection = Connection()
+
+        def raw_connection(self):
+            return self.connection
+
+    engine = Engine()
+    with ThreadPoolExecutor(max_workers=1) as writers:
+        counts = writers.submit(DataSeeder._copy, engine, (2, 3, 'users-csv', 'links-csv')).result()
+    assert counts == (2, 3)
+    assert copied == [('COPY users', 'users-csv'), ('COPY user_roles', 'links-csv')]
+    assert engine.connection.committed and engine.connection.closed
@@ -0,0 +1,105 @@
+import io
+import json
+
+from application import db, page_cache, permission_cache
+from application.models.user import User
+from application.services.user_import import import_users
+
+CSV_DATA = '''username,email,password,roles,active
+alice,alice@example.com,password123,editor,true
+bob,bob@example.com,password123,viewer;editor,
+bad name,bad@example.com,password123,,
+carol,not-an-email,password123,,
+dave,dave@example.com,short,,
+erin,erin@example.com,password123,ghost,
+alice,alice2@example.com,password123,,
+frank,admin@example.com,password123,,
+'''
+
+
+def test_import_csv_batches(app):
+    """CSV导入：合法行入库，非法行写入拒绝文件"""
+    with app.app_context():
+        version = permission_cache.current_version()
+        tags = page_cache.tag_versions(('users', 'roles'))
+        rejects = io.StringIO()
+        result = import_users(io.BytesIO(CSV_DATA.encode('utf-8')), 'csv', rejects,
+                              batch_size=3, workers=0, default_role='viewer')
+
+        assert result.total == 8
+        assert result.imported == 2
+        assert result.rejected == 6
+        assert result.rows_per_second > 0
+
+        bob = User.query.filter_by(username='bob').first()
+        assert sorted(r.name for r in bob.roles) == ['editor', 'viewer']
+        assert bob.fs_uniquifier
+        assert bob.verify_and_update_password('password123')
+        assert bob.has_permission('edit_content') is True
+        assert permission_cache.current_version() > version
+        assert all(new != old for new, old in zip(page_cache.tag_versions(('users', 'roles')), tags))
+
+        lines = rejects.getvalue().splitlines()
+        assert lines[0].startswith('line,username')
+        assert len(lines) == 7
+        assert 'password123' not in rejects.getvalue()
+
+
+def test_import_jsonl_with_process_pool(app):
+    """JSONL导入并使用进程池计算哈希"""
+    with app.app_context():
+        data = '\n'.join(json.dumps({'username': f'user{i}', 'email': f'user{i}@example.com',
+                                     'password': 'password123', 'roles': ['viewer']})
+                         for i in range(5)) + '\nnot json\n'
+        rejects = io.StringIO()
+        result = import_users(io.BytesIO(data.encode('utf-8')), 'jsonl', rejects,
+                              batch_size=2, workers=2)
+        assert result.imported == 5
+        assert result.rejected == 1
+        assert User.query.count() == 8
+        assert json.loads(rejects.getvalue())['errors'] == ['无法解析的行']
+
+
+def test_import_jsonl_rejects_malformed_roles(app):
+    """roles不是字符串或列表时只拒绝该行，不中断导入"""
+    with app.app_context():
+        rows = [{'username': 'gina', 'email': 'gina@example.com', 'password': 'password123', 'roles': 5},
+                {'username': 'hank', 'email': 'hank@example.com', 'password': 'password123', 'roles': {}},
+                {'username': 'ivan', 'email': 'ivan@example.com', 'password': 'password123', 'roles': 'viewer'}]
+        data = '\n'.join(json.dumps(row) for row in rows)
+        rejects = io.StringIO()
+        result = import_users(io.BytesIO(data.encode('utf-8')), 'jsonl', rejects, workers=0)
+        assert (result.imported, result.rejected) == (1, 2)
+        assert [json.loads(line)['errors'] for line in rejects.getvalue().splitlines()] == [['角色格式不正确']] * 2
+        assert User.query.filter_by(username='ivan').first() is not None
+
+
+def test_import_users_command(app, runner, tmp_path):
+    """import-users命令输出吞吐量并生成拒绝文件"""
+    path = tmp_path / 'users.csv'
+    path.write_text(CSV_DATA, encoding='utf-8')
+    result = runner.invoke(args=['import-users', str(path), '--workers', '0'])
+    assert result.exit_code == 0, result.output
+    assert '行/秒' in result.output
+    assert (tmp_path / 'users.csv.rejects.csv').exists()
+    with app.app_context():
+        assert db.session.query(User).filter_by(username='alice').count() == 1
+
+
+def test_import_job_removes_files_on_failure(app, tmp_path, monkeypatch):
+    """导入任务失败时也删除含明文密码的上传文件和空的拒绝文件"""
+    from application import jobs
+    from application.models.job import Job
+    from application.services import user_import
+
+    def broken_import(*args, **kwargs):
+        raise RuntimeError('数据库不可用')
+    monkeypatch.setattr(user_import, 'import_users', broken_import)
+
+    upload = tmp_path / 'upload.csv'
+    upload.write_text(CSV_DATA, encoding='utf-8')
+    rejects = tmp_path / 'rejects.csv'
+    job = jobs.submit(user_import.import_users_job, str(upload), 'csv', str(rejects))
+    assert job.status == Job.FAILED
+    assert not upload.exists()
+    assert not rejects.exists()
@@ -2,6 +2,7 @@ import pytest
 from flask import url_for
 from flask_security import url_for_security
 from flask_security.utils import login_user, logout_user
+from application.services.pagination import encode_cursor
 
 def test_profile_page_access(app, client, admin_user):
     """测试个人资料页面访问控制"""
@@ -120,4 +121,39 @@ def test_register_view(app, client):
                     print(f"{field}: {', '.join(errors)}")
         
         assert user is not None, "User was not created"
-        assert user.username == 'newuser', "Username was not saved correctly" 
\ No newline at end of file
+        assert user.username == 'newuser', "Username was not saved correctly" 
+
+
+def test_user_list_keyset_pagination(app, client, admin_user):
+    """测试用户列表键集分页"""
+    with app.app_context():
+        login_user(admin_user)
+        response = client.get(url_for('auth.user_list', limit=2))
+        assert response.status_code == 200
+        html = response.data.decode('utf-8')
+        assert '下一页' in html
+        assert html.count('/admin/user/edit/') == 2
+
+        response = client.get(url_for('auth.user_list', after='not-a-cursor'))
+        assert response.status_code == 400
+
+        # 结构正确但键值类型不符的游标
+        response = client.get(url_for('auth.user_list', after=encode_cursor([1, 2])))
+        assert response.status_code == 400
+
+
+def test_user_list_json_stream(app, client, admin_user):
+    """测试用户列表JSON流式接口"""
+    with app.app_context():
+        login_user(admin_user)
+        first = client.get(url_for('auth.user_list_json', limit=2)).get_json()
+        assert len(first['users']) == 2
+        assert first['next'] is not None
+        assert 'roles' in first['users'][0]
+
+        second = client.get(url_for('auth.user_list_json', limit=2, after=first['next'])).get_json()
+        assert len(second['users']) == 1
+        assert second['next'] is None
+
+        ids = [u['id'] for u in first['users'] + second['users']]
+        assert sorted(ids) == [1, 2, 3]
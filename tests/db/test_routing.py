@@ -0,0 +1,85 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from application import create_app, db
+from application.models.user import Role
+from application.services.db_routing import PRIMARY_UNTIL_KEY, engine_options, replica_reads
+
+
+@pytest.fixture
+def replica_app():
+    """主库和只读副本分别使用一个SQLite文件，写入不同的数据以区分读取来源"""
+    primary_fd, primary_path = tempfile.mkstemp(suffix='.db')
+    replica_fd, replica_path = tempfile.mkstemp(suffix='.db')
+    app = create_app(SimpleNamespace(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{primary_path}',
+        DATABASE_REPLICA_URLS=[f'sqlite:///{replica_path}'],
+        SECURITY_PASSWORD_HASH='plaintext',
+        SECURITY_PASSWORD_SALT='testing-salt',
+    ), register_admin=False)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        db.session.add(Role(name='primary-role'))
+        db.session.commit()
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(Role.__table__.insert().values(name='replica-role'))
+        db.session.remove()
+    yield app
+    # Flask-SQLAlchemy为每个bind在共享的db上注册metadata，移除以免影响之后创建的应用
+    db.metadatas.pop('replica_0', None)
+    for fd, path in ((primary_fd, primary_path), (replica_fd, replica_path)):
+        os.close(fd)
+        os.unlink(path)
+
+
+def _role_names():
+    return db.session.execute(select(Role.name)).scalars().all()
+
+
+def test_reads_default_to_primary(replica_app):
+    with replica_app.test_request_context():
+        assert _role_names() == ['primary-role']
+
+
+def test_replica_reads_use_replica(replica_app):
+    with replica_app.test_request_context():
+        with replica_reads():
+            assert _role_names() == ['replica-role']
+        assert _role_names() == ['primary-role']
+
+
+def test_reads_stick_to_primary_after_write(replica_app):
+    """写入后的读取留在主库，并在用户会话中记录粘滞窗口"""
+    with replica_app.test_request_context() as ctx:
+        with replica_reads():
+            db.session.add(Role(name='new-role'))
+            db.session.flush()
+            assert sorted(_role_names()) == ['new-role', 'primary-role']
+            db.session.commit()
+        assert ctx.session[PRIMARY_UNTIL_KEY] > 0
+
+        db.session.remove()
+        with replica_reads():
+            # 新会话，但粘滞窗口内仍读主库
+            assert 'new-role' in _role_names()
+
+
+def test_engine_options():
+    config = {'DB_POOL_SIZE': 10, 'DB_MAX_OVERFLOW': 5, 'DB_POOL_PRE_PING': True,
+              'DB_STATEMENT_TIMEOUT_MS': 3000}
+    options = engine_options('postgresql://localhost/cms', config)
+    assert options['pool_size'] == 10
+    assert options['max_overflow'] == 5
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args'] == {'options': '-c statement_timeout=3000'}
+
+    # 内存SQLite不接受连接池大小参数
+    options = engine_options('sqlite://', config)
+    assert 'pool_size' not in options
+    assert 'connect_args' not in options
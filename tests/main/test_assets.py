@@ -0,0 +1,77 @@
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+from flask import url_for
+
+from application import assets, create_app
+
+
+@pytest.fixture
+def built_app(app, tmp_path):
+    """构建应用和Flask-Security的静态资源后创建的应用"""
+    app.config['ASSETS_BUILD_DIR'] = str(tmp_path)
+    assets.build(app, quality=5, endpoints=['static', 'security.static'])
+    settings = {key: app.config[key] for key in
+                ('SQLALCHEMY_DATABASE_URI', 'SECURITY_PASSWORD_HASH', 'SECURITY_PASSWORD_SALT')}
+    return create_app(SimpleNamespace(ASSETS_BUILD_DIR=str(tmp_path), **settings), register_admin=False)
+
+
+def test_build_writes_fingerprinted_and_compressed_files(app, tmp_path):
+    """构建输出带内容摘要的文件名、gzip/brotli版本和清单"""
+    app.config['ASSETS_BUILD_DIR'] = str(tmp_path)
+    count, size, compressed, _ = assets.build(app, quality=5, endpoints=['static'])
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    entry = manifest['static']['css/style.css']
+    assert re.fullmatch(r'css/style\.[0-9a-f]{12}\.css', entry['path'])
+    assert set(entry['encodings']) == {'gzip', 'br'}
+    assert (tmp_path / 'static' / (entry['path'] + '.br')).stat().st_size == entry['encodings']['br']
+    assert count == 2 and compressed < size
+
+
+
+def test_partial_build_keeps_other_endpoints(app, tmp_path):
+    """只构建部分端点时，清单中其他端点的条目保留"""
+    app.config['ASSETS_BUILD_DIR'] = str(tmp_path)
+    assets.build(app, quality=5, endpoints=['static', 'security.static'])
+    before = json.loads((tmp_path / 'manifest.json').read_text())
+    assets.build(app, quality=5, endpoints=['static'])
+    assert json.loads((tmp_path / 'manifest.json').read_text()) == before
+
+def test_pages_link_fingerprinted_assets(built_app):
+    """url_for改写为带指纹的文件名，按Accept-Encoding返回预压缩版本并可永久缓存"""
+    client = built_app.test_client()
+    with built_app.app_context():
+        html = client.get('/').data.decode('utf-8')
+        path = re.search(r'href="(/static/css/style\.[0-9a-f]{12}\.css)"', html).group(1)
+
+        response = client.get(path, headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+        response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        identity = client.get(path)
+        assert 'Content-Encoding' not in identity.headers
+        assert b'body' in identity.data
+
+        response = client.get(path, headers={'If-None-Match': identity.headers['ETag']})
+        assert response.status_code == 304
+
+        # 原文件名仍由原静态视图返回
+        response = client.get('/static/css/style.css')
+        assert response.status_code == 200
+        assert 'immutable' not in response.headers.get('Cache-Control', '')
+
+
+def test_blueprint_static_files(built_app):
+    """蓝图（如Flask-Security、Flask-Admin）的静态资源同样改写"""
+    with built_app.test_request_context():
+        url = url_for('security.static', filename='js/webauthn.js')
+        assert re.fullmatch(r'/fs-static/js/webauthn\.[0-9a-f]{12}\.js', url)
+        assert url_for('security.static', filename='js/missing.js') == '/fs-static/js/missing.js'
+    client = built_app.test_client()
+    with built_app.app_context():
+        assert client.get(url).status_code == 200
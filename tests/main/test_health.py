@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from application import health
+
+
+@pytest.fixture
+def probes(app):
+    """测试内注册的探针在结束后移除，并清空结果缓存"""
+    builtin = dict(health._probes)
+    health.invalidate()
+    yield health
+    health._probes = builtin
+    health.invalidate()
+
+
+def test_live(client):
+    response = client.get('/api/health/live')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'ok'}
+
+
+def test_ready_reports_dependencies(app, client, probes):
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['status'] == 'ok'
+    assert data['cached'] is False
+    assert data['checks']['database']['status'] == 'ok'
+    assert data['checks']['database']['latency_ms'] >= 0
+    assert data['checks']['db_pool']['capacity'] > 0
+    # 未设置REDIS_URL；不发送邮件时不探测邮件服务
+    assert data['checks']['redis'] == {'status': 'skipped'}
+    assert data['checks']['mail'] == {'status': 'skipped'}
+
+
+def test_ready_results_are_cached(app, client, probes):
+    """TTL内的就绪请求复用结果，不再访问依赖"""
+    calls = []
+    probes.register('counter', lambda: lambda: calls.append(1))
+
+    assert client.get('/api/health/ready').get_json()['cached'] is False
+    assert client.get('/api/health/ready').get_json()['cached'] is True
+    assert len(calls) == 1
+
+    app.config['HEALTH_CACHE_TTL'] = 0
+    client.get('/api/health/ready')
+    assert len(calls) == 2
+
+
+def test_critical_failure_returns_503(client, probes):
+    def broken():
+        raise ConnectionError('refused')
+    probes.register('broken', lambda: broken)
+
+    response = client.get('/api/health/ready')
+    assert response.status_code == 503
+    data = response.get_json()
+    assert data['status'] == 'fail'
+    assert 'refused' in data['checks']['broken']['error']
+
+
+def test_non_critical_failure_is_degraded(client, probes):
+    def broken():
+        raise ConnectionError('refused')
+    probes.register('optional', lambda: broken, critical=False)
+
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'degraded'
+
+
+def test_probe_timeout(app, client, probes):
+    """超时的探针不阻塞响应，结束前也不会被再次提交"""
+    app.config['HEALTH_PROBE_TIMEOUT'] = 0.05
+    app.config['HEALTH_CACHE_TTL'] = 0
+    release = threading.Event()
+    started = []
+
+    def hang():
+        started.append(1)
+        release.wait(5)
+    probes.register('slow', lambda: hang)
+
+    try:
+        start = time.perf_counter()
+        response = client.get('/api/health/ready')
+        assert time.perf_counter() - start < 1
+        assert response.status_code == 503
+        assert response.get_json()['checks']['slow']['status'] == 'timeout'
+
+        client.get('/api/health/ready')
+        assert len(started) == 1
+    finally:
+        release.set()
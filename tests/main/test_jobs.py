@@ -0,0 +1,114 @@
+import io
+import time
+
+import pytest
+from celery.contrib.testing.worker import start_worker
+
+from application import db, jobs
+from application.models.job import Job
+from application.models.sheet import SheetImport
+from application.models.user import User
+from application.services.jobs import JobFailed, job_task
+from tests.sheets.test_import import _login
+
+calls = []
+
+
+@job_task('io')
+def flaky_job(job, fail_times, value):
+    """前fail_times次执行抛出连接错误"""
+    calls.append(value)
+    if len(calls) <= fail_times:
+        raise ConnectionError('broker unavailable')
+    job.set_progress(1, 1, '完成')
+    return {'value': value}
+
+
+@job_task('cpu')
+def failing_job(job):
+    raise JobFailed('输入无效')
+
+
+@pytest.fixture
+def job_app(app):
+    app.config.update(WTF_CSRF_ENABLED=False, JOB_RETRY_BACKOFF=0)
+    calls.clear()
+    return app
+
+
+def test_transient_errors_are_retried(job_app):
+    editor = User.query.filter_by(username='editor').first()
+    job = jobs.submit(flaky_job, 2, 'x', user=editor)
+    assert (job.status, job.attempts, job.result, job.error) == (Job.DONE, 3, {'value': 'x'}, None)
+    assert job.queue == 'io'
+
+    job_app.config['JOB_MAX_RETRIES'] = 1
+    job = jobs.submit(flaky_job, 10, 'y')
+    assert (job.status, job.attempts) == (Job.FAILED, 2)
+    assert job.error == 'ConnectionError: broker unavailable'
+
+    job = jobs.submit(failing_job)
+    assert (job.status, job.attempts, job.error) == (Job.FAILED, 1, '输入无效')
+
+
+def test_idempotent_submit_and_redelivery(job_app):
+    first = jobs.submit(flaky_job, 0, 'a', key='k1')
+    assert jobs.submit(flaky_job, 0, 'b', key='k1').id == first.id
+    assert calls == ['a']
+
+    # 重复投递已完成的任务不会再次执行
+    jobs.celery_app(job_app).tasks[flaky_job.name].apply(args=(first.id, 0, 'c'))
+    assert calls == ['a']
+
+    # 失败的任务释放幂等键
+    failed = jobs.submit(failing_job, key='k2')
+    retried = jobs.submit(flaky_job, 0, 'd', key='k2')
+    assert retried.id != failed.id and retried.status == Job.DONE
+
+
+def test_worker_with_memory_broker(job_app):
+    celery = jobs.celery_app(job_app)
+    celery.conf.task_always_eager = False
+    with start_worker(celery, pool='solo', perform_ping_check=False, queues=['io', 'cpu']):
+        job_id = jobs.submit(flaky_job, 1, 'w').id
+        for _ in range(100):
+            db.session.expire_all()
+            job = db.session.get(Job, job_id)
+            if job.status in Job.FINISHED:
+                break
+            time.sleep(0.05)
+    assert (job.status, job.attempts, job.progress, job.message) == (Job.DONE, 2, 1.0, '完成')
+
+
+def test_sheet_import_job_and_polling(job_app, client):
+    _login(client)
+    with job_app.app_context():
+        headers = {'Idempotency-Key': 'upload-1'}
+        response = client.post('/api/sheets/import', headers=headers, data={
+            'file': (io.BytesIO(b'a,b\n1,2\n'), 'numbers.csv')})
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        again = client.post('/api/sheets/import', headers=headers, data={
+            'file': (io.BytesIO(b'a,b\n1,2\n'), 'numbers.csv')})
+        assert again.get_json()['id'] == response.get_json()['id']
+        assert SheetImport.query.count() == 1
+
+        data = client.get(f'/api/jobs/{job_id}').get_json()
+        assert data['status'] == 'done' and data['queue'] == 'cpu'
+        assert data['result']['rows_imported'] == 2
+
+    with job_app.app_context():
+        _login(client, 'viewer-uniquifier')
+        assert client.get(f'/api/jobs/{job_id}').status_code == 404
+
+
+def test_celery_not_imported_until_first_submit():
+    """创建应用不导入celery，第一次投递任务时才创建Celery实例"""
+    import subprocess
+    import sys
+    script = ('import sys\n'
+              'from application import create_app\n'
+              'app = create_app(register_admin=False)\n'
+              'print("celery" in sys.modules, "kombu" in sys.modules, "celery" in app.extensions)')
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['False', 'False', 'False']
@@ -0,0 +1,172 @@
+import socketserver
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from flask_security.utils import send_mail
+
+from application import db, mail_outbox
+from application.models.mail import OutboxMessage
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """最小的SMTP服务端：记录连接数和收到的邮件
+
+    收件人地址以reject开头时返回550，以defer开头时返回451。
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stub')
+        recipients = []
+        for raw in self.rfile:
+            command = raw.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stub')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip('<> ')
+                if address.startswith('reject'):
+                    self.reply('550 no such user')
+                elif address.startswith('defer'):
+                    self.reply('451 try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 go ahead')
+                data = []
+                for line in self.rfile:
+                    if line.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(line)
+                self.server.messages.append((recipients, b''.join(data)))
+                self.reply('250 queued')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+@pytest.fixture
+def smtp(app):
+    server = SMTPStub()
+    state = app.extensions['mail']
+    state.server, state.port, state.suppress = '127.0.0.1', server.server_address[1], False
+    app.config.update(MAIL_OUTBOX_SENDER='none', MAIL_RATE_LIMIT=0, WTF_CSRF_ENABLED=False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _enqueue(recipients, n=1):
+    for i in range(n):
+        mail_outbox.enqueue(f'通知{i}', recipients, body='正文')
+    db.session.commit()
+
+
+def test_batch_reuses_one_connection(app, smtp):
+    _enqueue(['a@example.com'], 25)
+    assert mail_outbox.depth()['pending'] == 25
+    assert mail_outbox.send_all() == 25
+    assert smtp.connections == 1
+    assert len(smtp.messages) == 25
+    assert OutboxMessage.query.filter_by(status=OutboxMessage.SENT).count() == 25
+    assert mail_outbox.depth() == {'pending': 0, 'sending': 0, 'failed': 0}
+
+
+def test_rejections_and_retries(app, smtp):
+    app.config.update(MAIL_MAX_ATTEMPTS=2, MAIL_RETRY_BACKOFF=0)
+    _enqueue(['reject@example.com'])
+    _enqueue(['defer@example.com'])
+    _enqueue(['ok@example.com'])
+    assert mail_outbox.send_pending() == 3
+    rejected, deferred, ok = OutboxMessage.query.order_by(OutboxMessage.id).all()
+    assert (rejected.status, rejected.attempts) == (OutboxMessage.FAILED, 1)
+    assert '550' in rejected.last_error
+    assert (deferred.status, deferred.attempts) == (OutboxMessage.PENDING, 1)
+    assert ok.status == OutboxMessage.SENT
+    assert smtp.connections == 1
+
+    # 第二次仍被暂缓，达到最多尝试次数后记为失败
+    assert mail_outbox.send_all() == 1
+    assert db.session.get(OutboxMessage, deferred.id).status == OutboxMessage.FAILED
+    assert mail_outbox.depth() == {'pending': 0, 'sending': 0, 'failed': 2}
+
+
+def test_connection_failure_backs_off(app, smtp):
+    app.config.update(MAIL_RETRY_BACKOFF=60)
+    app.extensions['mail'].port = 1
+    _enqueue(['a@example.com'], 3)
+    assert mail_outbox.send_pending() == 3
+    messages = OutboxMessage.query.all()
+    assert {(m.status, m.attempts) for m in messages} == {(OutboxMessage.PENDING, 1)}
+    assert all(m.next_attempt_at > datetime.utcnow() for m in messages)
+    # 退避期间不会再次认领
+    assert mail_outbox.send_pending() == 0
+
+
+def test_rate_limit(app, smtp):
+    app.config['MAIL_RATE_LIMIT'] = 50
+    _enqueue(['a@example.com'], 6)
+    start = time.perf_counter()
+    mail_outbox.send_all()
+    assert time.perf_counter() - start >= 5 / 50 * 0.9
+    assert len(smtp.messages) == 6
+
+
+def test_security_mail_goes_through_outbox(app, client, smtp, viewer_user):
+    with app.test_request_context():
+        send_mail('密码已重置', viewer_user.email, 'reset_notice', user=viewer_user)
+    message = OutboxMessage.query.one()
+    assert message.recipients == ['viewer@example.com'] and message.template == 'reset_notice'
+    assert smtp.messages == []
+
+    metrics = client.get(app.config['METRICS_PATH']).data.decode()
+    assert 'mail_outbox_messages{status="pending"} 1.0' in metrics
+
+    mail_outbox.send_all()
+    assert smtp.messages[0][0] == ['viewer@example.com']
+
+
+def test_background_thread_sends_after_commit(app, smtp):
+    app.config['MAIL_OUTBOX_SENDER'] = 'thread'
+    _enqueue(['a@example.com'], 2)
+    for _ in range(100):
+        if len(smtp.messages) == 2:
+            break
+        time.sleep(0.05)
+    assert len(smtp.messages) == 2
+
+
+def test_background_thread_starts_on_first_request(app, client, smtp, monkeypatch):
+    """重启前积压的到期邮件在第一个请求时由后台线程发送，不必等新邮件入队"""
+    db.session.add(OutboxMessage(subject='积压', recipients=['a@example.com'], body='正文',
+                                 sender='noreply@example.com', next_attempt_at=datetime.utcnow()))
+    db.session.commit()
+    app.config['MAIL_OUTBOX_SENDER'] = 'thread'
+    monkeypatch.setattr(mail_outbox, '_thread', None)
+    assert client.get('/').status_code == 200
+    for _ in range(100):
+        if smtp.messages:
+            break
+        time.sleep(0.05)
+    assert smtp.messages[0][0] == ['a@example.com']
@@ -0,0 +1,56 @@
+import logging
+
+from flask import url_for
+from flask_security.utils import login_user, logout_user
+
+from application import metrics
+
+
+def _sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+
+def test_request_and_template_metrics(app, client):
+    """首页请求计入端点耗时与模板渲染耗时，并在/metrics导出"""
+    before = _sample('http_request_duration_seconds_count', endpoint='main.index', method='GET')
+    renders = _sample('template_render_duration_seconds_count', template='index.html')
+
+    assert client.get('/').status_code == 200
+    assert _sample('http_request_duration_seconds_count',
+                   endpoint='main.index', method='GET') == before + 1
+    assert _sample('template_render_duration_seconds_count', template='index.html') == renders + 1
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    body = response.data.decode('utf-8')
+    assert 'http_request_duration_seconds_bucket{endpoint="main.index"' in body
+    assert 'http_requests_total{endpoint="main.index",method="GET",status="200"}' in body
+    assert 'db_pool_checked_out' in body
+
+
+def test_query_metrics(app, client, admin_user):
+    """用户列表的SQL条数与耗时计入该端点"""
+    with app.app_context():
+        login_user(admin_user)
+        count = _sample('db_queries_per_request_sum', endpoint='auth.user_list')
+        requests = _sample('db_queries_per_request_count', endpoint='auth.user_list')
+        assert client.get(url_for('auth.user_list')).status_code == 200
+        logout_user()
+
+    assert _sample('db_queries_per_request_count', endpoint='auth.user_list') == requests + 1
+    assert _sample('db_queries_per_request_sum', endpoint='auth.user_list') > count
+    assert _sample('db_query_duration_seconds_count') > 0
+
+
+def test_slow_request_log(app, client, admin_user, caplog):
+    """超过阈值的请求记录警告日志和耗时最长的SQL"""
+    app.config['METRICS_SLOW_REQUEST_MS'] = 0
+    with app.app_context(), caplog.at_level(logging.WARNING):
+        login_user(admin_user)
+        client.get(url_for('auth.user_list'))
+        logout_user()
+
+    messages = [r.getMessage() for r in caplog.records if '慢请求' in r.getMessage()]
+    assert messages
+    assert 'auth.user_list' in messages[-1]
+    assert 'SELECT' in messages[-1]
@@ -0,0 +1,159 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+import redis
+
+from application import create_app, db, page_cache
+from application.models.user import Role, User
+
+
+def _login(client, uniquifier='editor-uniquifier'):
+    with client.session_transaction() as session:
+        session['_user_id'] = uniquifier
+        session['_fresh'] = True
+
+
+def _get(app, client, url):
+    # 每个请求使用新的应用上下文（g中缓存着当前用户和标签版本号）
+    with app.app_context():
+        return client.get(url)
+
+
+@pytest.fixture
+def redis_app(app, monkeypatch):
+    """使用fakeredis的应用：页面缓存存放在Redis中"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)))
+    settings = {key: app.config[key] for key in
+                ('SQLALCHEMY_DATABASE_URI', 'SECURITY_PASSWORD_HASH', 'SECURITY_PASSWORD_SALT')}
+    return create_app(SimpleNamespace(REDIS_URL='redis://fake', **settings), register_admin=False)
+
+
+def test_anonymous_pages_cached(app, client):
+    """匿名首页整页缓存，已登录用户的请求不读写整页缓存"""
+    first = _get(app, client, '/')
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+    second = _get(app, client, '/')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.data == first.data
+
+    _login(client)
+    response = _get(app, client, '/')
+    assert 'X-Cache' not in response.headers
+    assert 'editor' in response.data.decode('utf-8')
+
+
+def test_user_pages_not_cached_without_shared_backend(app, client):
+    """进程内缓存的失效到不了其他worker，未配置Redis时不缓存按用户的页面和导航"""
+    _login(client)
+    for _ in range(2):
+        assert 'X-Cache' not in _get(app, client, '/auth/profile').headers
+    with app.app_context():
+        assert not page_cache.can_cache(('users:1',))
+        assert page_cache.can_cache(())
+
+
+def test_user_pages_invalidated_on_commit(redis_app):
+    """个人资料页和导航按用户缓存，用户、角色或权限提交变更后失效"""
+    app, client = redis_app, redis_app.test_client()
+    _login(client)
+    assert _get(app, client, '/auth/profile').headers['X-Cache'] == 'MISS'
+    response = _get(app, client, '/auth/profile')
+    assert response.headers['X-Cache'] == 'HIT'
+    assert '管理后台' not in response.data.decode('utf-8')
+
+    with app.app_context():
+        editor = User.query.filter_by(username='editor').first()
+        editor.roles.append(Role.query.filter_by(name='admin').first())
+        db.session.commit()
+    response = _get(app, client, '/auth/profile')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert '管理后台' in response.data.decode('utf-8')
+
+    with app.app_context():
+        Role.query.filter_by(name='admin').first().description = '超级管理员'
+        db.session.commit()
+    response = _get(app, client, '/auth/profile')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert '超级管理员' in response.data.decode('utf-8')
+
+    # 其他用户的缓存互不影响
+    _login(client, 'viewer-uniquifier')
+    body = _get(app, client, '/auth/profile').data.decode('utf-8')
+    assert 'viewer@example.com' in body
+    assert '管理后台' not in body
+
+
+def test_concurrent_misses_render_once(app):
+    """同一个键并发未命中时只渲染一次，其余请求等待结果"""
+    renders = []
+
+    def render():
+        renders.append(1)
+        time.sleep(0.1)
+        return 'page'
+
+    results = []
+
+    def worker():
+        with app.app_context():
+            results.append(page_cache.get_or_render('page:/slow', render, timeout=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['page'] * 5
+    assert len(renders) == 1
+
+
+def test_uncacheable_render_releases_waiters(app):
+    """持锁者的结果不可缓存时，等待者立即各自渲染，而不是等到超时"""
+    app.config['CACHE_LOCK_WAIT'] = 5.0
+
+    def render():
+        time.sleep(0.1)
+        raise ValueError('不可缓存')
+
+    elapsed = []
+
+    def worker():
+        start = time.monotonic()
+        with app.app_context():
+            try:
+                page_cache.get_or_render('page:/csrf', render, timeout=60)
+            except ValueError:
+                pass
+        elapsed.append(time.monotonic() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(elapsed) == 4
+    assert max(elapsed) < 1.0
+    with app.app_context():
+        assert page_cache.get_or_render('page:/csrf', lambda: 'fresh') == 'fresh'
+        # 标记有效期内不写入缓存
+        assert page_cache.cache.get('page:/csrf') == page_cache.UNCACHEABLE
+
+
+def test_early_refresh_serves_stale_value_while_locked(app):
+    """临近过期时提前刷新；已有请求在刷新时其他请求继续返回旧值"""
+    with app.app_context():
+        cache = page_cache.cache
+        # 渲染耗时远大于剩余有效期，必然提前刷新
+        cache.set('page:/hot', ('old', time.time() + 1, 1000.0), timeout=60)
+        cache.add(page_cache.LOCK_KEY.format(key='page:/hot'), 1)
+        assert page_cache.get_or_render('page:/hot', lambda: 'new') == 'old'
+
+        cache.delete(page_cache.LOCK_KEY.format(key='page:/hot'))
+        assert page_cache.get_or_render('page:/hot', lambda: 'new') == 'new'
+        assert cache.get('page:/hot')[0] == 'new'
@@ -0,0 +1,139 @@
+import pytest
+
+from application import db, sheet_access
+from application.models.sheet import Sheet, SheetPermission
+from application.models.user import User
+from application.services.sheet_access import NONE, OWNER, READ, WRITE, SheetAccess, grant, revoke
+from tests.auth.test_permission_cache import count_queries
+from tests.sheets.test_import import _login
+
+
+@pytest.fixture
+def users(app):
+    app.config.update(WTF_CSRF_ENABLED=False)
+    return {user.username: user for user in User.query.all()}
+
+
+@pytest.fixture
+def sheet(app, users):
+    sheet = Sheet(name='共享', owner=users['editor'])
+    db.session.add(sheet)
+    db.session.commit()
+    return sheet
+
+
+def test_grant_and_revoke_invalidate_only_grantee(app, users, sheet):
+    viewer, admin = users['viewer'], users['admin']
+    assert sheet_access.level(users['editor'], sheet) == OWNER
+    assert sheet_access.level(viewer, sheet) == NONE
+    assert sheet_access.level(admin, sheet) == NONE
+    admin_version = sheet_access.user_version(admin.id)
+
+    grant(sheet, viewer, SheetPermission.WRITE)
+    db.session.commit()
+    assert sheet_access.level(viewer, sheet) == WRITE
+    assert sheet_access.user_version(admin.id) == admin_version
+
+    statements, stop = count_queries()
+    try:
+        assert sheet_access.level(viewer, sheet) == WRITE
+        assert sheet_access.level(admin, sheet) == NONE
+    finally:
+        stop()
+    assert statements == []
+
+    # 授权为写，但访客角色没有编辑权限
+    assert sheet_access.allowed(viewer, sheet, READ) is True
+    assert sheet_access.allowed(viewer, sheet, WRITE) is False
+    assert sheet_access.allowed(admin, sheet, READ) is None
+
+    assert revoke(sheet, viewer.id)
+    db.session.commit()
+    assert sheet_access.level(viewer, sheet) == NONE
+
+
+def test_revocation_reaches_other_processes_without_redis(app, users, sheet):
+    """未配置Redis时，另一个进程（另一个实例）在下一个请求中看到撤销"""
+    other = SheetAccess()
+    other.db = db
+    sheet_id, viewer_id = sheet.id, users['viewer'].id
+    grant(sheet, users['viewer'], SheetPermission.WRITE)
+    db.session.commit()
+    with app.app_context():
+        viewer, shared = db.session.get(User, viewer_id), db.session.get(Sheet, sheet_id)
+        assert other.level(viewer, shared) == WRITE
+        assert other.level(viewer, shared) == WRITE
+
+    with app.app_context():
+        assert revoke(db.session.get(Sheet, sheet_id), viewer_id)
+        db.session.commit()
+
+    with app.app_context():
+        viewer, shared = db.session.get(User, viewer_id), db.session.get(Sheet, sheet_id)
+        assert other.level(viewer, shared) == NONE
+
+
+def test_uncommitted_grant_is_not_cached(app, users, sheet):
+    grant(sheet, users['admin'], SheetPermission.READ)
+    db.session.flush()
+    assert sheet_access.level(users['admin'], sheet) == READ
+    db.session.rollback()
+    assert sheet_access.level(users['admin'], sheet) == NONE
+
+
+def test_admin_permission_overrides_acl(app, users, sheet, monkeypatch):
+    monkeypatch.setattr(sheet_access, 'admin_permission', 'create_content')
+    assert sheet_access.allowed(users['admin'], sheet, OWNER) is True
+    assert sheet_access.allowed(users['viewer'], sheet, READ) is None
+
+
+def test_accessible_sheets_is_one_query(app, users, sheet):
+    viewer = users['viewer']
+    other = Sheet(name='其他', owner=users['admin'])
+    mine = Sheet(name='我的', owner=viewer)
+    db.session.add_all([other, mine])
+    db.session.commit()
+    grant(sheet, viewer, SheetPermission.READ)
+    db.session.commit()
+    db.session.refresh(viewer)
+
+    statements, stop = count_queries()
+    try:
+        rows = sheet_access.accessible_sheets(viewer)
+    finally:
+        stop()
+    assert len(statements) == 1
+    assert sorted((s.name, permission_type) for s, permission_type in rows) == [('共享', 'read'), ('我的', 'owner')]
+
+
+def test_sheet_api_uses_acl(app, client, users, sheet):
+    _login(client, 'viewer-uniquifier')
+    with app.app_context():
+        assert client.get(f'/api/sheets/{sheet.id}/range').status_code == 404
+
+    _login(client)
+    with app.app_context():
+        response = client.post(f'/api/sheets/{sheet.id}/permissions',
+                               json={'email': 'viewer@example.com', 'permission_type': 'read'})
+        assert response.status_code == 200
+        assert client.post(f'/api/sheets/{sheet.id}/permissions',
+                           json={'email': 'viewer@example.com', 'permission_type': 'admin'}).status_code == 400
+
+    _login(client, 'viewer-uniquifier')
+    with app.app_context():
+        assert client.get(f'/api/sheets/{sheet.id}/range').status_code == 200
+        assert client.get('/api/sheets').get_json()['sheets'][0]['permission_type'] == 'read'
+        response = client.post(f'/api/sheets/{sheet.id}/ops', json={'ops': [{'cell': 'A1', 'value': 1}]})
+        assert response.status_code == 403
+        assert client.get(f'/api/sheets/{sheet.id}/permissions').status_code == 403
+
+    _login(client)
+    with app.app_context():
+        viewer_id = users['viewer'].id
+        assert client.delete(f'/api/sheets/{sheet.id}/permissions/{viewer_id}').status_code == 204
+        assert client.delete(f'/api/sheets/{sheet.id}/permissions/{viewer_id}').status_code == 404
+
+    _login(client, 'viewer-uniquifier')
+    with app.app_context():
+        assert client.get(f'/api/sheets/{sheet.id}/range').status_code == 404
+        assert client.get('/api/sheets').get_json()['sheets'] == []
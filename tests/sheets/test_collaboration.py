@@ -0,0 +1,192 @@
+import json
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+import redis
+
+from application import collaboration, create_app, db, redis_store, sheet_calculator
+from application.models.sheet import Sheet
+from application.models.user import User
+from application.services.collaboration import Collaboration
+from application.services.sheet_storage import SheetStorage
+from tests.sheets.test_import import _login
+
+
+@pytest.fixture
+def sheet(app):
+    app.config.update(WTF_CSRF_ENABLED=False, COLLAB_FLUSH_INTERVAL_MS=0)
+    owner = User.query.filter_by(username='editor').first()
+    sheet = Sheet(name='协作', owner=owner, chunk_rows=4, chunk_cols=2)
+    db.session.add(sheet)
+    db.session.commit()
+    return sheet
+
+
+@pytest.fixture
+def redis_app(app, monkeypatch):
+    """两个“worker”共用一个fakeredis服务器"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)))
+    settings = {key: app.config[key] for key in
+                ('SQLALCHEMY_DATABASE_URI', 'SECURITY_PASSWORD_HASH', 'SECURITY_PASSWORD_SALT')}
+    return create_app(SimpleNamespace(REDIS_URL='redis://fake', COLLAB_FLUSH_INTERVAL_MS=0, **settings),
+                      register_admin=False)
+
+
+def _messages(subscription):
+    result = []
+    while True:
+        message = subscription.get(timeout=0)
+        if message is None:
+            return result
+        result.append(json.loads(message))
+
+
+def test_per_cell_versions(app, sheet):
+    subscription = collaboration.subscribe(sheet)
+    try:
+        result = collaboration.submit(sheet, [(0, 0, 1, 0), (0, 1, 'a', 0)], origin='c1')
+        assert [(op['cell'], op['version']) for op in result['accepted']] == [('A1', 1), ('B1', 1)]
+
+        # 基于旧版本的并发编辑被拒绝，返回当前值和版本；其他单元格不受影响
+        result = collaboration.submit(sheet, [(0, 0, 2, 0), (1, 0, 3, 0)], origin='c2')
+        assert result['rejected'] == [{'cell': 'A1', 'row': 0, 'col': 0, 'version': 1, 'value': 1}]
+        assert [op['cell'] for op in result['accepted']] == ['A2']
+
+        messages = _messages(subscription)
+        assert [m['origin'] for m in messages] == ['c1', 'c2']
+        assert messages[1]['ops'] == [{'cell': 'A2', 'row': 1, 'col': 0, 'value': 3, 'version': 1}]
+    finally:
+        subscription.close()
+    assert collaboration.subscriber_count() == 0
+    assert SheetStorage(sheet).read_range(0, 0, 2, 2) == [[1, 'a'], [3, None]]
+
+
+def test_burst_is_coalesced(app, sheet, monkeypatch):
+    app.config.update(COLLAB_FLUSH_INTERVAL_MS=1000)
+    monkeypatch.setattr(collaboration, '_flusher', object())  # 不启动后台线程，手动写入
+    writes = []
+    original = sheet_calculator.apply
+    monkeypatch.setattr(sheet_calculator, 'apply',
+                        lambda s, cells, authors=None: writes.append(dict(cells)) or original(s, cells, authors))
+
+    # 逐字输入：同一批内合并，跨批次只保留最后的值
+    result = collaboration.submit(sheet, [(0, 0, 'h', 0), (0, 0, 'he', 0)])
+    assert [op['version'] for op in result['accepted']] == [1]
+    for version, text in enumerate(['hel', 'hell', 'hello'], start=1):
+        collaboration.submit(sheet, [(0, 0, text, version)])
+    collaboration.submit(sheet, [(2, 1, 42, 0)])
+
+    assert collaboration.flush(sheet.key, sheet.id) == 2
+    assert writes == [{(0, 0): 'hello', (2, 1): 42}]
+    assert collaboration.flush(sheet.key, sheet.id) == 0
+    assert SheetStorage(sheet).read_range(0, 0, 3, 2) == [['hello', None], [None, None], [None, 42]]
+
+
+def test_formula_results_are_broadcast(app, sheet):
+    subscription = collaboration.subscribe(sheet)
+    try:
+        collaboration.submit(sheet, [(0, 0, 5, 0), (0, 1, '=A1*2', 0)])
+        collaboration.submit(sheet, [(0, 0, 7, 1)])
+        messages = _messages(subscription)
+    finally:
+        subscription.close()
+    values = [m for m in messages if m['type'] == 'values']
+    assert [m['cells'][0]['value'] for m in values] == [10, 14]
+    # 被拒绝的公式单元格返回公式源文本
+    result = collaboration.submit(sheet, [(0, 1, 3, 0)])
+    assert result['rejected'][0]['value'] == '=A1*2'
+
+
+def test_fan_out_across_workers(redis_app):
+    with redis_app.app_context():
+        db.create_all()
+        owner = User(username='u', email='u@example.com', password='x', active=True, fs_uniquifier='u')
+        sheet = Sheet(name='共享', owner=owner)
+        db.session.add(sheet)
+        db.session.commit()
+
+        other_worker = Collaboration()
+        other_worker.db, other_worker.redis_store, other_worker.calculator = db, redis_store, sheet_calculator
+        subscription = other_worker.subscribe(sheet)
+        try:
+            result = collaboration.submit(sheet, [(0, 0, 'x', 0)], origin='w1')
+            assert result['accepted'][0]['version'] == 1
+            message = json.loads(subscription.get(timeout=5))
+            assert message['origin'] == 'w1' and message['ops'][0]['value'] == 'x'
+
+            # 另一个worker基于同一版本的编辑被拒绝
+            result = other_worker.submit(sheet, [(0, 0, 'y', 0)])
+            assert result['rejected'][0]['version'] == 1 and result['rejected'][0]['value'] == 'x'
+        finally:
+            subscription.close()
+        assert SheetStorage(sheet).get_cell(0, 0) == 'x'
+        db.session.remove()
+
+
+def test_pending_edits_survive_interrupted_flush(redis_app, monkeypatch):
+    """缓冲在提交成功后才删除：写入中途进程被终止不丢失编辑，写入期间的新编辑保留"""
+    class Killed(BaseException):
+        pass
+
+    with redis_app.app_context():
+        db.create_all()
+        owner = User(username='u', email='u@example.com', password='x', active=True, fs_uniquifier='u')
+        sheet = Sheet(name='共享', owner=owner)
+        db.session.add(sheet)
+        db.session.commit()
+        redis_app.config['COLLAB_FLUSH_INTERVAL_MS'] = 1000
+        monkeypatch.setattr(collaboration, '_flusher', object())  # 不启动后台线程，手动写入
+        collaboration.submit(sheet, [(0, 0, 'a', 0), (1, 0, 'b', 0)])
+
+        def killed(*args, **kwargs):
+            raise Killed()
+        with monkeypatch.context() as patch:
+            patch.setattr(db.session, 'commit', killed)
+            with pytest.raises(Killed):
+                collaboration.flush(sheet.key, sheet.id)
+        assert len(redis_store.client.hgetall(collaboration.PENDING_KEY.format(key=sheet.key))) == 2
+
+        original = sheet_calculator.apply
+
+        def apply(s, cells, authors=None):
+            # 写入期间A1又被编辑
+            collaboration.submit(sheet, [(0, 0, 'c', 1)])
+            return original(s, cells, authors)
+        with monkeypatch.context() as patch:
+            patch.setattr(sheet_calculator, 'apply', apply)
+            assert collaboration.flush(sheet.key, sheet.id) == 2
+        assert SheetStorage(sheet).read_range(0, 0, 2, 1) == [['a'], ['b']]
+        assert collaboration.flush(sheet.key, sheet.id) == 1
+        assert SheetStorage(sheet).get_cell(0, 0) == 'c'
+        assert collaboration.flush(sheet.key, sheet.id) == 0
+        db.session.remove()
+
+
+def test_ops_and_events_api(app, client, sheet):
+    _login(client)
+    with app.app_context():
+        events = client.get(f'/api/sheets/{sheet.id}/events')
+    assert events.mimetype == 'text/event-stream'
+    stream = (chunk.decode() for chunk in events.response)
+    assert next(stream).startswith('event: hello')
+
+    with app.app_context():
+        response = client.post(f'/api/sheets/{sheet.id}/ops', json={
+            'client': 'tab-1', 'ops': [{'cell': 'B2', 'value': 9, 'base': 0}]})
+    assert response.status_code == 200
+    assert response.get_json()['accepted'][0]['version'] == 1
+    event = next(stream)
+    assert event.startswith('data: ') and json.loads(event[6:])['origin'] == 'tab-1'
+    events.close()
+    assert collaboration.subscriber_count() == 0
+
+    with app.app_context():
+        assert client.post(f'/api/sheets/{sheet.id}/ops', json={'ops': [{'cell': 'A1:B2'}]}).status_code == 400
+        assert client.post(f'/api/sheets/{sheet.id}/ops', json={'ops': []}).status_code == 400
+    _login(client, 'viewer-uniquifier')
+    with app.app_context():
+        assert client.post(f'/api/sheets/{sheet.id}/ops', json={
+            'ops': [{'cell': 'A1', 'value': 1}]}).status_code == 404
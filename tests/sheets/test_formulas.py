@@ -0,0 +1,143 @@
+import pytest
+
+from application import db, sheet_calculator
+from application.models.sheet import Sheet, SheetFormula
+from application.models.user import User
+from application.services.formulas import (CIRCULAR, DIV0, NAME, VALUE, FormulaEngine,
+                                           FormulaSyntaxError, compile_formula)
+from application.services.sheet_storage import SheetStorage
+
+
+@pytest.fixture
+def engine():
+    engine = FormulaEngine()
+    engine.set_cells({(0, 0): 1, (1, 0): 2, (2, 0): 3, (3, 0): 'x', (4, 0): True})
+    return engine
+
+
+def _evaluate(engine, source):
+    engine.set_cells({(0, 9): source})
+    return engine.get(0, 9)
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('=1+2*3', 7),
+    ('=(1+2)*3', 9),
+    ('=-2^2', 4),
+    ('=2^3^2', 64),
+    ('=10%', 0.1),
+    ('=A1+A2*A3', 7),
+    ('=$A$2*2', 4),
+    ('="a"&A1&TRUE', 'a1TRUE'),
+    ('=A1<A2', True),
+    ('=A4="X"', True),
+    ('=IF(A1>1,1/0,"ok")', 'ok'),
+    ('=SUM(A1:A5)', 6),
+    ('=SUM(A:A, 4)', 10),
+    ('=AVERAGE(A1:A3)', 2),
+    ('=COUNT(A1:A5)', 3),
+    ('=MAX(A1:A3)-MIN(A1:A3)', 2),
+    ('=COUNTIF(A1:A5,">=2")', 2),
+    ('=COUNTIF(A1:A5,"X")', 1),
+    ('=COUNTIF(A1:A5,"<>2")', 4),
+    ('=ROUND(2.345,2)+ROUND(-0.5)', 1.35),
+    ('=AND(A1,NOT(FALSE))', True),
+    ('=1/0', DIV0),
+    ('=A4*2', VALUE),
+    ('=NOSUCH(1)', NAME),
+    ('=SUM(B1:B2)', 0),
+])
+def test_evaluate(engine, source, expected):
+    value = _evaluate(engine, source)
+    assert value == (pytest.approx(expected) if isinstance(expected, float) else expected)
+
+
+def test_syntax_errors():
+    for source in ('=1+', '=SUM(A1', '=1 2', '=@'):
+        with pytest.raises(FormulaSyntaxError):
+            compile_formula(source)
+
+
+def test_only_dirty_cells_recalculated(engine):
+    engine.set_cells({(0, 1): '=A1*10', (1, 1): '=A2*10', (0, 2): '=B1+1', (0, 3): '=SUM(A1:A2)'})
+    evaluated = []
+    for cell, formula in engine.formulas.items():
+        original = formula.evaluate
+        formula.evaluate = (lambda original, cell: lambda e: evaluated.append(cell) or original(e))(
+            original, cell)
+
+    changed = engine.set_cells({(0, 0): 5})
+    assert changed == {(0, 0): 5, (0, 1): 50, (0, 2): 51, (0, 3): 7}
+    # B1在C1之前计算，A2的公式未被重算
+    assert evaluated.index((0, 1)) < evaluated.index((0, 2))
+    assert (1, 1) not in evaluated
+
+
+def test_circular_references(engine):
+    changed = engine.set_cells({(0, 1): '=B2+1', (1, 1): '=B1+1', (2, 1): '=B1*2'})
+    assert changed[(0, 1)] == CIRCULAR and changed[(1, 1)] == CIRCULAR
+    assert engine.get(2, 1) == CIRCULAR
+    # 打破环后恢复正常
+    changed = engine.set_cells({(1, 1): 3})
+    assert (engine.get(0, 1), engine.get(2, 1)) == (4, 8)
+
+
+def test_overwriting_formula_removes_dependencies(engine):
+    engine.set_cells({(0, 1): '=A1+1'})
+    engine.set_cells({(0, 1): 100})
+    assert engine.set_cells({(0, 0): 9}) == {(0, 0): 9}
+    assert engine.get(0, 1) == 100
+
+
+def test_sheet_calculator_persists_and_reloads(app):
+    owner = User.query.filter_by(username='editor').first()
+    sheet = Sheet(name='预算', owner=owner, chunk_rows=2, chunk_cols=2)
+    db.session.add(sheet)
+    db.session.commit()
+    storage = SheetStorage(sheet)
+    storage.write_rows(0, [[10], [20], [30]])
+    db.session.commit()
+
+    sheet_calculator.apply(sheet, {(3, 0): '=SUM(A1:A3)', (0, 1): '=A4/A1', (1, 1): '=1/0'})
+    db.session.commit()
+    assert storage.read_range(3, 0, 4, 1) == [[60]]
+    assert storage.get_cell(0, 1) == 6
+    assert storage.get_cell(1, 1) == '#DIV/0!'
+    assert db.session.query(SheetFormula).count() == 3
+
+    # 丢弃进程内缓存，从数据库重新加载后继续增量计算
+    sheet_calculator._engines.clear()
+    changed = sheet_calculator.apply(sheet, {(0, 0): 0})
+    db.session.commit()
+    assert changed == {(0, 0): 0, (3, 0): 50, (0, 1): '#DIV/0!'}
+    assert storage.read_range(0, 0, 4, 2) == [[0, '#DIV/0!'], [20, '#DIV/0!'], [30, None], [50, None]]
+
+    # 用值覆盖公式后公式被删除
+    sheet_calculator.apply(sheet, {(1, 1): 'done'})
+    db.session.commit()
+    assert db.session.query(SheetFormula).count() == 2
+    assert sheet_calculator.apply(sheet, {(2, 0): 35}) == {(2, 0): 35, (3, 0): 55}
+
+
+def test_rolled_back_edits_are_not_cached(app):
+    owner = User.query.filter_by(username='editor').first()
+    sheet = Sheet(name='回滚', owner=owner)
+    db.session.add(sheet)
+    db.session.commit()
+    sheet_calculator.apply(sheet, {(0, 0): 1, (0, 1): '=A1+1'})
+    db.session.commit()
+
+    sheet_calculator.apply(sheet, {(0, 0): 5})
+    db.session.rollback()
+    assert sheet_calculator.apply(sheet, {(1, 0): 1}) == {(1, 0): 1}
+    db.session.commit()
+    assert SheetStorage(sheet).get_cell(0, 1) == 2
+
+
+def test_numpy_not_imported_at_startup():
+    """导入应用不加载numpy，首次计算区域函数时才导入"""
+    import subprocess
+    import sys
+    script = 'import sys, application; print("numpy" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
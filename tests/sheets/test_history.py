@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from application import db, sheet_calculator, sheet_history
+from application.models.sheet import Sheet, SheetHistorySegment, SheetOperation, SheetSnapshot
+from application.models.user import User
+from tests.sheets.test_import import _login
+
+
+@pytest.fixture
+def sheet(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(sheet_history, 'snapshot_interval', 4)
+    monkeypatch.setattr(sheet_history, 'hot_snapshots', 1)
+    monkeypatch.setattr(sheet_history, 'archive_dir', str(tmp_path))
+    owner = User.query.filter_by(username='editor').first()
+    sheet = Sheet(name='历史', owner=owner, chunk_rows=2, chunk_cols=2)
+    db.session.add(sheet)
+    db.session.commit()
+    return sheet
+
+
+def _edit(sheet, cells, user_id=None):
+    sheet_calculator.apply(sheet, cells, {cell: user_id for cell in cells})
+    db.session.commit()
+    return sheet.history_seq
+
+
+def test_restore_replays_from_nearest_snapshot(app, sheet):
+    states = {0: {}}
+    expected = {}
+    edits = [
+        {(0, 0): 1, (0, 1): '=A1*10'},
+        {(1, 0): 'x'},
+        {(0, 0): 2},
+        {(2, 2): True, (1, 0): None},
+        {(0, 1): 5},
+        {(3, 0): 'late'},
+    ]
+    for cells in edits:
+        seq = _edit(sheet, cells, user_id=7)
+        for (row, col), value in cells.items():
+            expected[row, col] = value
+        values = dict(expected)
+        if isinstance(values.get((0, 1)), str):
+            values[0, 1] = values[0, 0] * 10
+        states[seq] = values
+
+    # 公式的下游重算结果同样记入历史
+    assert [op.value for op in SheetOperation.query.filter_by(row=0, col=1).order_by(SheetOperation.seq)][-1:] == [5]
+    assert sheet.history_seq == 9
+    # 序号跨过4的倍数时保存快照
+    assert [s.seq for s in SheetSnapshot.query.order_by(SheetSnapshot.seq)] == [5, 8]
+
+    for seq, values in states.items():
+        version = sheet_history.restore(sheet, seq)
+        assert version.read_range(0, 0, 4, 3) == [[values.get((r, c)) for c in range(3)] for r in range(4)], seq
+    assert sheet_history.restore(sheet, 2).formulas == {(0, 1): '=A1*10'}
+    assert sheet_history.restore(sheet, 9).formulas == {}
+    with pytest.raises(ValueError):
+        sheet_history.restore(sheet, 10)
+
+
+def test_old_operations_are_archived(app, sheet, tmp_path):
+    for i in range(10):
+        _edit(sheet, {(i, 0): i})
+    segments = SheetHistorySegment.query.order_by(SheetHistorySegment.seq_start).all()
+    # 保存序号8的快照时，归档前一个快照（序号4）之前的操作
+    assert [(s.seq_start, s.seq_stop, s.operations) for s in segments] == [(0, 4, 4)]
+    assert [op.seq for op in SheetOperation.query.order_by(SheetOperation.seq)] == list(range(5, 11))
+    assert all(os.path.exists(tmp_path / s.path) for s in segments)
+
+    assert [seq for seq, *_ in sheet_history.operations(sheet, 2, 10)] == list(range(3, 11))
+    assert sheet_history.restore(sheet, 3).read_range(0, 0, 4, 1) == [[0], [1], [2], [None]]
+
+
+def test_sequence_allocation_is_atomic(app, sheet):
+    """对象上的序号过期时（其他进程已追加操作），分配基于数据库中的值，不会重复"""
+    _edit(sheet, {(0, 0): 1})
+    table = Sheet.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.id == sheet.id).values(history_seq=table.c.history_seq + 2))
+    assert sheet.history_seq == 1
+    sheet_history.record(sheet, {(1, 0): 2, (1, 1): 3})
+    assert sheet.history_seq == 5
+    db.session.commit()
+    assert [op.seq for op in SheetOperation.query.order_by(SheetOperation.seq)] == [1, 4, 5]
+
+
+def test_history_api(app, client, sheet):
+    _edit(sheet, {(0, 0): 1, (0, 1): '=A1+1'})
+    _edit(sheet, {(0, 0): 5})
+    _login(client)
+    with app.app_context():
+        index = client.get(f'/api/sheets/{sheet.id}/history').get_json()
+        old = client.get(f'/api/sheets/{sheet.id}/history/2', query_string={'range': 'A1:B1'})
+        bad = client.get(f'/api/sheets/{sheet.id}/history/99')
+    assert index['seq'] == 4 and index['snapshots'] == [{'seq': 4, 'created_at': index['snapshots'][0]['created_at']}]
+    assert old.get_json()['values'] == [[1, 2]]
+    assert old.get_json()['formulas'] == {'B1': '=A1+1'}
+    assert bad.status_code == 400
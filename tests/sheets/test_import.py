@@ -0,0 +1,129 @@
+import io
+import os
+from datetime import datetime
+
+import pytest
+from openpyxl import Workbook
+
+from application import db
+from application.models.sheet import Sheet, SheetImport
+from application.models.user import User
+from application.services.sheet_import import ColumnTypes, parse_cell, run_import
+from application.services.sheet_storage import SheetStorage
+
+
+@pytest.fixture
+def import_app(app):
+    app.config.update(WTF_CSRF_ENABLED=False, SHEET_IMPORT_BATCH_ROWS=4)
+    return app
+
+
+def _login(client, uniquifier='editor-uniquifier'):
+    with client.session_transaction() as session:
+        session['_user_id'] = uniquifier
+        session['_fresh'] = True
+
+
+def _new_import(tmp_path, filename, content, fmt='csv'):
+    path = tmp_path / filename
+    path.write_bytes(content)
+    owner = User.query.filter_by(username='editor').first()
+    sheet_import = SheetImport(sheet=Sheet(name='导入', owner=owner, chunk_rows=2, chunk_cols=2),
+                               filename=filename, format=fmt)
+    db.session.add(sheet_import)
+    db.session.commit()
+    return sheet_import, str(path)
+
+
+def test_parse_cell():
+    assert parse_cell(' 42 ') == (42, 'integer')
+    assert parse_cell('-1.5e3') == (-1500.0, 'number')
+    assert parse_cell('007') == ('007', 'text')
+    assert parse_cell('TRUE') == (True, 'bool')
+    assert parse_cell('2024-01-31') == ('2024-01-31', 'date')
+    assert parse_cell(datetime(2024, 1, 31, 8, 30)) == ('2024-01-31T08:30:00', 'date')
+    assert parse_cell('nan') == ('nan', 'text')
+    assert parse_cell('  ') == (None, None)
+
+
+def test_column_types_widen():
+    types = ColumnTypes()
+    types.update(['integer', 'integer', 'bool', None])
+    types.update(['number', 'text', 'bool'])
+    types.update([None, 'integer'])
+    assert types.result() == ['number', 'text', 'bool', 'text']
+
+
+def test_csv_import(import_app, tmp_path):
+    content = 'id,name,price,code\n1,苹果,3.5,001\n2,香蕉,,002\n3,"橙,子",4,003\n'
+    sheet_import, path = _new_import(tmp_path, 'fruit.csv', content.encode('utf-8-sig'))
+    run_import(sheet_import.id, path)
+
+    sheet_import = db.session.get(SheetImport, sheet_import.id)
+    assert sheet_import.status == SheetImport.DONE
+    assert sheet_import.rows_imported == 4
+    assert sheet_import.progress == 1.0
+    assert not os.path.exists(path)
+    sheet = sheet_import.sheet
+    assert sheet.column_types == ['integer', 'text', 'number', 'text']
+    assert SheetStorage(sheet).read_range(0, 0, 4, 4) == [
+        ['id', 'name', 'price', 'code'],
+        [1, '苹果', 3.5, '001'],
+        [2, '香蕉', None, '002'],
+        [3, '橙,子', 4, '003'],
+    ]
+
+
+def test_csv_import_gbk_semicolon(import_app, tmp_path):
+    content = '名称;数量\n' + ''.join(f'商品{i};{i}\n' for i in range(10))
+    sheet_import, path = _new_import(tmp_path, 'gbk.csv', content.encode('gbk'))
+    run_import(sheet_import.id, path)
+
+    sheet = db.session.get(SheetImport, sheet_import.id).sheet
+    assert (sheet.n_rows, sheet.n_cols) == (11, 2)
+    assert SheetStorage(sheet).read_range(9, 0, 11, 2) == [['商品8', 8], ['商品9', 9]]
+
+
+def test_xlsx_import(import_app, tmp_path):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['日期', '金额', '备注'])
+    worksheet.append([datetime(2024, 5, 1), 12.5, None])
+    worksheet.append([datetime(2024, 5, 2), 8, '退款'])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    sheet_import, path = _new_import(tmp_path, 'ledger.xlsx', buffer.getvalue(), fmt='xlsx')
+    run_import(sheet_import.id, path)
+
+    sheet = db.session.get(SheetImport, sheet_import.id).sheet
+    assert sheet.column_types == ['date', 'number', 'text']
+    assert SheetStorage(sheet).read_range(1, 0, 3, 3) == [
+        ['2024-05-01T00:00:00', 12.5, None], ['2024-05-02T00:00:00', 8, '退款']]
+
+
+def test_failed_import_is_reported(import_app, tmp_path):
+    sheet_import, path = _new_import(tmp_path, 'broken.xlsx', b'not a zip file', fmt='xlsx')
+    run_import(sheet_import.id, path)
+
+    sheet_import = db.session.get(SheetImport, sheet_import.id)
+    assert sheet_import.status == SheetImport.FAILED
+    assert sheet_import.error
+
+
+def test_upload_and_poll(import_app, client):
+    _login(client)
+    response = client.post('/api/sheets/import', data={
+        'file': (io.BytesIO(b'a,b\n1,2\n3,4\n'), 'numbers.csv')})
+    assert response.status_code == 202
+    status_url = response.headers['Location']
+
+    data = client.get(status_url).get_json()
+    assert data['status'] == 'done'
+    assert data['rows_imported'] == 3
+    assert data['column_types'] == ['integer', 'integer']
+    assert db.session.get(Sheet, data['sheet_id']).name == 'numbers'
+
+    # 其他用户看不到该导入任务
+    with import_app.app_context():
+        _login(client, 'viewer-uniquifier')
+        assert client.get(status_url).status_code == 404
@@ -0,0 +1,142 @@
+import pytest
+
+from application import db, sheet_indexes
+from application.models.sheet import Sheet, SheetColumnIndex
+from application.models.user import User
+from application.services.sheet_index import ColumnIndex, column_label, parse_range
+from application.services.sheet_storage import SheetStorage
+from tests.sheets.test_import import _login
+
+ROWS = [
+    ['名称', '价格', '有货'],
+    ['苹果', 3.5, True],
+    ['banana', 2, False],
+    ['Cherry', 12, True],
+    ['枣', None, None],
+    ['apple pie', 7.25, True],
+]
+
+
+@pytest.fixture
+def sheet(app):
+    owner = User.query.filter_by(username='editor').first()
+    sheet = Sheet(name='水果', owner=owner, chunk_rows=2, chunk_cols=2)
+    db.session.add(sheet)
+    db.session.commit()
+    SheetStorage(sheet).write_rows(0, ROWS)
+    db.session.commit()
+    return sheet
+
+
+def _get(app, client, sheet, **args):
+    with app.app_context():
+        return client.get(f'/api/sheets/{sheet.id}/range', query_string=args)
+
+
+def test_a1_addresses():
+    assert [column_label(i) for i in (0, 25, 26, 701, 702)] == ['A', 'Z', 'AA', 'ZZ', 'AAA']
+    assert parse_range('A1:Z200') == (0, 0, 200, 26)
+    assert parse_range('c5') == (4, 2, 5, 3)
+    assert parse_range('B3:A1') == (0, 0, 3, 2)
+    with pytest.raises(ValueError):
+        parse_range('A0:B2')
+
+
+def test_column_index_round_trip(app, sheet):
+    index = ColumnIndex.build(SheetStorage(sheet), 1, sheet.n_rows)
+    decoded = ColumnIndex.decode(index.encode())
+    # 数值升序，其后为文本（表头），最后为空单元格
+    assert list(decoded.rows) == [2, 1, 5, 3, 0, 4]
+    assert list(decoded.ordered(descending=True)) == [0, 3, 5, 1, 2, 4]
+    assert sorted(decoded.match('>=', 3.5, 'number')) == [1, 3, 5]
+    assert list(decoded.match('=', None, None)) == [4]
+
+
+def test_read_range(app, client, sheet):
+    _login(client)
+    response = _get(app, client, sheet, range='A2:B3')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['range'] == 'A2:B3'
+    assert data['values'] == [['苹果', 3.5], ['banana', 2]]
+    assert data['total_rows'] == 6
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    # 超出表格范围的部分被裁剪
+    data = _get(app, client, sheet, range='B5:Z200').get_json()
+    assert data['range'] == 'B5:C6'
+    assert data['values'] == [[None, None], [7.25, True]]
+
+
+def test_sort_and_filter(app, client, sheet):
+    _login(client)
+    data = _get(app, client, sheet, range='A1:B10', sort='-B', header=1).get_json()
+    assert data['rows'] == [4, 6, 2, 3, 5]
+    assert [row[0] for row in data['values']] == ['Cherry', 'apple pie', '苹果', 'banana', '枣']
+    assert data['total_rows'] == 5
+
+    data = _get(app, client, sheet, range='A1:A10', sort='A', header=1,
+                filter=['B>3', 'C=true']).get_json()
+    assert data['values'] == [['apple pie'], ['Cherry'], ['苹果']]
+
+    data = _get(app, client, sheet, range='A1:A1', filter='A~APPLE', header=1).get_json()
+    assert data['rows'] == [6]
+    assert data['total_rows'] == 1
+
+    assert _get(app, client, sheet, filter='B?3').status_code == 400
+
+
+def test_index_persisted_and_invalidated(app, client, sheet):
+    _login(client)
+    assert _get(app, client, sheet, sort='B', header=1).status_code == 200
+    stored = db.session.get(SheetColumnIndex, (sheet.id, 1))
+    assert stored.version == sheet.version
+
+    SheetStorage(sheet).set_cell(2, 1, 100)
+    db.session.commit()
+    data = _get(app, client, sheet, range='A1:A1', sort='-B', header=1).get_json()
+    assert data['values'] == [['banana']]
+    db.session.refresh(stored)
+    assert stored.version == sheet.version
+
+
+
+def test_index_persisted_without_committing_session(app, sheet):
+    """重建的索引在独立连接中保存，不提交请求会话中的其他变更"""
+    sheet.name = '未提交'
+    sheet_indexes.column_index(sheet, 1)
+    db.session.rollback()
+    assert sheet.name == '水果'
+    stored = db.session.get(SheetColumnIndex, (sheet.id, 1))
+    assert stored.version == sheet.version
+
+    # 未提交的写入产生的版本可能回滚，不保存其索引
+    SheetStorage(sheet).set_cell(2, 1, 100)
+    sheet_indexes.column_index(sheet, 1)
+    db.session.rollback()
+    db.session.refresh(stored)
+    assert stored.version == sheet.version
+
+def test_etag_revalidation(app, client, sheet):
+    _login(client)
+    response = _get(app, client, sheet, range='A1:C3')
+    etag = response.headers['ETag']
+
+    with app.app_context():
+        not_modified = client.get(f'/api/sheets/{sheet.id}/range', query_string={'range': 'A1:C3'},
+                                  headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+
+    SheetStorage(sheet).set_cell(0, 0, '品名')
+    db.session.commit()
+    with app.app_context():
+        changed = client.get(f'/api/sheets/{sheet.id}/range', query_string={'range': 'A1:C3'},
+                             headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['values'][0][0] == '品名'
+
+
+def test_other_users_cannot_read(app, client, sheet):
+    _login(client, 'viewer-uniquifier')
+    assert _get(app, client, sheet).status_code == 404
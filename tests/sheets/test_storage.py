@@ -0,0 +1,149 @@
+import pytest
+
+from application import db
+from application.models.sheet import Sheet, SheetChunk
+from application.models.user import User
+from application.services.sheet_storage import Chunk, SheetStorage
+from tests.auth.test_permission_cache import count_queries
+
+
+@pytest.fixture
+def sheet(app):
+    owner = User.query.filter_by(username='editor').first()
+    sheet = Sheet(name='测试表格', owner=owner, chunk_rows=4, chunk_cols=2)
+    db.session.add(sheet)
+    db.session.commit()
+    return sheet
+
+
+def _chunk_keys(sheet):
+    return sorted(db.session.execute(
+        db.select(SheetChunk.row_block, SheetChunk.col_block)
+        .where(SheetChunk.sheet_id == sheet.id)).all())
+
+
+def test_chunk_round_trip():
+    """各类型单元格编码后解码不变"""
+    chunk = Chunk(4, 3)
+    values = {(0, 0): 1.5, (1, 0): 42, (2, 0): -(2 ** 60), (0, 1): '中文',
+              (3, 1): '', (1, 2): True, (2, 2): False, (3, 2): 'a' * 1000}
+    for (row, col), value in values.items():
+        chunk.set(row, col, value)
+
+    decoded = Chunk.decode(chunk.encode())
+    assert decoded.get(0, 0) == 1.5
+    assert decoded.get(1, 0) == 42 and isinstance(decoded.get(1, 0), int)
+    assert decoded.get(2, 0) == float(-(2 ** 60))
+    assert decoded.get(0, 1) == '中文'
+    assert decoded.get(3, 1) is None
+    assert decoded.get(1, 2) is True and decoded.get(2, 2) is False
+    assert decoded.get(3, 2) == 'a' * 1000
+    assert decoded.get(3, 0) is None
+
+
+def test_read_range_across_chunks(app, sheet):
+    storage = SheetStorage(sheet)
+    storage.write_rows(0, [[r * 10 + c for c in range(5)] for r in range(10)])
+    db.session.commit()
+
+    assert (sheet.n_rows, sheet.n_cols) == (10, 5)
+    assert storage.read_range(3, 1, 6, 4) == [[31, 32, 33], [41, 42, 43], [51, 52, 53]]
+    # 超出已写入范围的部分为空
+    assert storage.read_range(9, 4, 11, 6) == [[94, None], [None, None]]
+    assert storage.get_cell(7, 2) == 72
+
+
+def test_single_cell_write_touches_one_chunk(app, sheet):
+    """写一个单元格只读取和更新它所在的块"""
+    storage = SheetStorage(sheet)
+    storage.write_rows(0, [[r * 10 + c for c in range(5)] for r in range(10)])
+    db.session.commit()
+    before = {(rb, cb): data for rb, cb, data in db.session.execute(
+        db.select(SheetChunk.row_block, SheetChunk.col_block, SheetChunk.data))}
+
+    statements, stop = count_queries()
+    try:
+        storage.set_cell(5, 3, 'x')
+        db.session.flush()
+    finally:
+        stop()
+    chunk_statements = [s for s in statements if 'sheet_chunks' in s]
+    assert len(chunk_statements) == 2
+    assert chunk_statements[0].lstrip().upper().startswith('SELECT')
+    assert chunk_statements[1].lstrip().upper().startswith('UPDATE')
+
+    after = {(rb, cb): data for rb, cb, data in db.session.execute(
+        db.select(SheetChunk.row_block, SheetChunk.col_block, SheetChunk.data))}
+    assert [key for key in after if after[key] != before[key]] == [(1, 1)]
+    assert storage.get_cell(5, 3) == 'x'
+
+
+def test_clearing_cells_removes_empty_chunk(app, sheet):
+    storage = SheetStorage(sheet)
+    storage.write_cells({(0, 0): 1, (5, 3): 'b'})
+    db.session.commit()
+    assert _chunk_keys(sheet) == [(0, 0), (1, 1)]
+
+    storage.write_cells({(5, 3): None})
+    db.session.commit()
+    assert _chunk_keys(sheet) == [(0, 0)]
+    assert storage.read_range(0, 0, 6, 4)[5][3] is None
+
+
+def test_writes_bump_version(app, sheet):
+    storage = SheetStorage(sheet)
+    storage.set_cell(2, 7, 1)
+    storage.set_cell(0, 0, 2)
+    db.session.commit()
+    assert (sheet.n_rows, sheet.n_cols, sheet.version) == (3, 8, 2)
+
+
+def test_version_bump_is_atomic(app, sheet):
+    """对象上的版本号过期时（其他进程已写入），递增基于数据库中的值"""
+    storage = SheetStorage(sheet)
+    storage.set_cell(0, 0, 1)
+    db.session.commit()
+    assert sheet.version == 1
+
+    with db.engine.begin() as connection:
+        connection.execute(Sheet.__table__.update().where(Sheet.__table__.c.id == sheet.id)
+                           .values(version=Sheet.__table__.c.version + 1, n_rows=20))
+    storage.set_cell(1, 0, 2)
+    assert (sheet.n_rows, sheet.version) == (20, 3)
+    db.session.commit()
+    db.session.expire(sheet)
+    assert (sheet.n_rows, sheet.n_cols, sheet.version) == (20, 1, 3)
+
+
+def test_concurrent_first_write_to_new_chunk(app, sheet, monkeypatch):
+    """读取之后其他写入者抢先插入了同一新块时，重新读改写而不是违反主键"""
+    storage = SheetStorage(sheet)
+    original = SheetStorage._load_keys
+    calls = []
+
+    def load_keys(self, keys, for_update=False):
+        result = original(self, keys, for_update)
+        if for_update and not calls:
+            other = Chunk(sheet.chunk_rows, sheet.chunk_cols)
+            other.set(1, 1, 'other')
+            with db.engine.begin() as connection:
+                connection.execute(SheetChunk.__table__.insert().values(
+                    sheet_id=sheet.id, row_block=0, col_block=0, data=other.encode()))
+        calls.append(keys)
+        return result
+    monkeypatch.setattr(SheetStorage, '_load_keys', load_keys)
+
+    storage.write_cells({(0, 0): 'mine', (4, 0): 'new'})
+    db.session.commit()
+    assert calls == [[(0, 0), (1, 0)], [(0, 0), (1, 0)]]
+    assert storage.read_range(0, 0, 5, 2) == [['mine', None], [None, 'other'], [None, None], [None, None],
+                                              ['new', None]]
+    assert _chunk_keys(sheet) == [(0, 0), (1, 0)]
+
+
+def test_chunks_deleted_with_sheet(app, sheet):
+    SheetStorage(sheet).set_cell(0, 0, 1)
+    db.session.commit()
+    db.session.delete(sheet)
+    db.session.commit()
+    assert db.session.query(SheetChunk).count() == 0
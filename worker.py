@@ -0,0 +1,13 @@
+"""Celery worker入口，任务在create_app创建的应用上下文中执行（不注册管理后台视图）
+
+io队列（邮件、导出等等待为主的任务）:
+    celery -A worker worker -Q io -P gevent -c 100
+cpu队列（导入解析、密码哈希等计算任务），每核一个进程:
+    celery -A worker worker -Q cpu -P prefork
+定时任务（发件箱重试等）:
+    celery -A worker beat
+"""
+from application import create_app
+
+app = create_app(register_admin=False)
+celery = app.extensions['jobs'].celery_app(app)